@@ -34,6 +34,7 @@ class LibraryConfigEnum(Enum):
     OBJECTIVE_CALIBRATION_DIR = dict_lib_read['objective_calibration_directory']
     
     SPECTROMETER_CALIBRATION_DIR_DEFAULT = './calibrations/spectrometers/'
+    STAGE_LATENCY_PATH_DEFAULT = './calibrations/stage_latency.json'
     
 ############################################################################################################
 # >>>>>> Data analysis specific parameters <<<<<<
@@ -36,6 +36,7 @@ if __name__ == '__main__':
 
 
 from iris import LibraryConfigEnum, DataAnalysisConfigEnum
+from iris.utils.tracing import trace_span
 
 from iris.resources.spectrometer_calibration_ui import Ui_spectrometerCalibrator
 
@@ -85,22 +86,25 @@ class SpectrometerCalibrator():
         
     def calibrate_measurement(self, measurement:pd.DataFrame):
         """
-        Calibrates the spectrometer measurement based on the calibration parameters
+        Calibrates the spectrometer measurement based on the calibration parameters. The extra
+        intensity columns (e.g., the other tracks of a multi-track readout) are calibrated like
+        the intensity column.
 
         Args:
             measurement (pd.DataFrame): The measurement data to be calibrated
         """
-        list_wavelength_raw = measurement[DataAnalysisConfigEnum.WAVELENGTH_LABEL.value].values
-        list_intensity_raw = measurement[DataAnalysisConfigEnum.INTENSITY_LABEL.value].values
+        lbl_wavelength = DataAnalysisConfigEnum.WAVELENGTH_LABEL.value
+        list_wavelength_raw = measurement[lbl_wavelength].values
         list_wavelength_cal = [self.get_wavelength(wavelength_raw)\
             for wavelength_raw in list_wavelength_raw]
-        list_intensity_cal = [self.get_intensity(wavelength_raw,intensity_raw)\
-            for wavelength_raw,intensity_raw in zip(list_wavelength_raw,list_intensity_raw)]
         
         # Reconstruct the dataframe with the calibrated values
         cal_spectrum = measurement.copy()
-        cal_spectrum[DataAnalysisConfigEnum.WAVELENGTH_LABEL.value] = list_wavelength_cal
-        cal_spectrum[DataAnalysisConfigEnum.INTENSITY_LABEL.value] = list_intensity_cal
+        cal_spectrum[lbl_wavelength] = list_wavelength_cal
+        for label in [lbl for lbl in measurement.columns if lbl != lbl_wavelength]:
+            list_intensity_raw = measurement[label].values
+            cal_spectrum[label] = [self.get_intensity(wavelength_raw,intensity_raw)\
+                for wavelength_raw,intensity_raw in zip(list_wavelength_raw,list_intensity_raw)]
         
         return cal_spectrum
         
@@ -113,7 +117,9 @@ class SpectrometerCalibrator():
             if self._pipe_mea.poll(timeout=1):
                 measurement = self._pipe_mea.recv()
                 ret = None
-                try: ret = self.calibrate_measurement(measurement)
+                try:
+                    with trace_span('calibrator.calibrate', cat='calibration'):
+                        ret = self.calibrate_measurement(measurement)
                 except Exception as e: print('ERROR SpectrometerCalibrator._auto_calibrate: ',e)
                 finally: self._pipe_mea.send(ret)
         
@@ -0,0 +1,313 @@
+"""
+Calibration of the stage timestamp offset (latency) of the stage hub.
+
+The stage hub (DataStreamer_StageCam) stamps every polled coordinate with the request time plus the
+offset 'stagehub_time_offset_ms'. The right offset depends on the stage model (reporting latency)
+and on the sensor timestamps it is compared to (camera frames or spectra), and drifts with the load.
+
+Principle:
+1. The stage is scanned at a constant speed back and forth across a sharp feature (e.g., the edge
+    of a reflective pattern) while a sensor signal (camera ROI brightness or spectrometer counts) is
+    sampled with its timestamps.
+2. Each sample is located with the stage hub interpolation, using the current offset. An offset
+    error e shifts the located edge by +v*e on the forward passes and by -v*e on the backward passes.
+3. The edge profiles of the forward and backward passes are cross-correlated (gradient of the
+    signal over the position) to measure their shift dx, so that e = dx/(v_fwd + v_bwd).
+4. The corrected offset is the current offset plus e (median over the pass pairs). It is stored
+    per stage controller (see StageLatency_Store) and applied to the stage hub.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Callable
+
+import numpy as np
+
+from iris import LibraryConfigEnum
+from iris.controllers.class_xy_stage_controller import Class_XYController
+from iris.controllers.class_camera_controller import Class_CameraController
+from iris.controllers.class_spectrometer_controller import Class_SpectrometerController
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.general import get_timestamp_us_int
+
+# Sensor signal getter: returns the signal and its timestamp [us]
+SignalGetter = Callable[[], tuple[float,int]]
+
+
+def camera_edge_signal(camera:Class_CameraController, roi_frac:float=0.1) -> SignalGetter:
+    """
+    Returns a sensor signal getter of the mean brightness of the central ROI of the camera frames,
+    timestamped at the middle of the capture
+
+    Args:
+        camera (Class_CameraController): the camera controller
+        roi_frac (float, optional): size of the ROI relative to the frame size. Defaults to 0.1.
+
+    Returns:
+        SignalGetter: the signal getter
+    """
+    assert 0 < roi_frac <= 1, 'camera_edge_signal: The ROI fraction must be in (0, 1].'
+    def get_signal() -> tuple[float,int]:
+        ts_start = get_timestamp_us_int()
+        img = camera.img_capture()
+        ts_end = get_timestamp_us_int()
+        arr = np.asarray(img.convert('L'), dtype=np.float64)
+        h, w = arr.shape
+        dh, dw = max(int(h*roi_frac/2), 1), max(int(w*roi_frac/2), 1)
+        return float(arr[h//2-dh:h//2+dh, w//2-dw:w//2+dw].mean()), (ts_start + ts_end)//2
+    return get_signal
+
+def spectrometer_edge_signal(spectrometer:Class_SpectrometerController) -> SignalGetter:
+    """
+    Returns a sensor signal getter of the total counts of the spectra, with the spectrometer timestamps
+
+    Args:
+        spectrometer (Class_SpectrometerController): the spectrometer controller
+
+    Returns:
+        SignalGetter: the signal getter
+    """
+    def get_signal() -> tuple[float,int]:
+        spectrum, timestamp, _ = spectrometer.measure_spectrum()
+        return float(np.asarray(spectrum.iloc[:, 1], dtype=np.float64).sum()), int(timestamp)
+    return get_signal
+
+
+def estimate_edge_shift_mm(pos_fwd:np.ndarray, sig_fwd:np.ndarray, pos_bwd:np.ndarray, sig_bwd:np.ndarray,
+                           num_grid:int=2048) -> float:
+    """
+    Estimates the position shift of the edge between a forward and a backward pass by the
+    cross-correlation of the signal gradients over their common position range
+
+    Args:
+        pos_fwd (np.ndarray): positions of the forward pass samples [mm]
+        sig_fwd (np.ndarray): signal of the forward pass samples
+        pos_bwd (np.ndarray): positions of the backward pass samples [mm]
+        sig_bwd (np.ndarray): signal of the backward pass samples
+        num_grid (int, optional): number of points of the resampling grid. Defaults to 2048.
+
+    Returns:
+        float: the shift of the forward edge relative to the backward edge [mm]
+    """
+    def resample(pos:np.ndarray, sig:np.ndarray, grid:np.ndarray) -> np.ndarray:
+        order = np.argsort(pos)
+        return np.interp(grid, np.asarray(pos, dtype=float)[order], np.asarray(sig, dtype=float)[order])
+
+    pos_min = max(np.min(pos_fwd), np.min(pos_bwd))
+    pos_max = min(np.max(pos_fwd), np.max(pos_bwd))
+    assert pos_max > pos_min, 'estimate_edge_shift_mm: The passes do not overlap.'
+    grid, step = np.linspace(pos_min, pos_max, num_grid, retstep=True)
+    grad_fwd = np.gradient(resample(pos_fwd, sig_fwd, grid))
+    grad_bwd = np.gradient(resample(pos_bwd, sig_bwd, grid))
+    grad_fwd -= grad_fwd.mean()
+    grad_bwd -= grad_bwd.mean()
+    assert np.any(grad_fwd) and np.any(grad_bwd), 'estimate_edge_shift_mm: No edge in the signal.'
+
+    corr = np.correlate(grad_fwd, grad_bwd, mode='full')
+    idx = int(np.argmax(np.abs(corr)))
+    lag = float(idx - (num_grid - 1))
+    if 0 < idx < len(corr) - 1:     # Sub-sample peak (parabola)
+        c0, c1, c2 = np.abs(corr[idx-1:idx+2])
+        denom = c0 - 2*c1 + c2
+        if denom != 0: lag += 0.5*(c0 - c2)/denom
+    return lag*step
+
+def estimate_speed_mm_s(timestamps_us:np.ndarray, pos:np.ndarray, central_frac:float=0.6) -> float:
+    """
+    Estimates the speed of a pass by a linear fit of the positions over the central part of the travel
+
+    Args:
+        timestamps_us (np.ndarray): timestamps of the samples [us]
+        pos (np.ndarray): positions of the samples [mm]
+        central_frac (float, optional): central fraction of the travel used. Defaults to 0.6.
+
+    Returns:
+        float: the absolute speed [mm/s]
+    """
+    pos = np.asarray(pos, dtype=float)
+    margin = (1 - central_frac)/2*np.ptp(pos)
+    mask = (pos > pos.min() + margin) & (pos < pos.max() - margin)
+    assert mask.sum() >= 2, 'estimate_speed_mm_s: Not enough samples during the travel.'
+    slope = np.polyfit(np.asarray(timestamps_us, dtype=float)[mask]/1e6, pos[mask], 1)[0]
+    return abs(float(slope))
+
+
+@dataclass
+class StageLatency_Params:
+    start_xy: tuple[float,float]    # Start of the scan, on one side of the feature [mm]
+    end_xy: tuple[float,float]      # End of the scan, on the other side of the feature [mm]
+    speed_rel: float = 5.0          # Scan speed relative to the maximum [%]
+    num_pairs: int = 3              # Number of forward/backward pass pairs
+    sample_interval_sec: float = 0.0    # Wait between the sensor samples [s]
+
+    def __post_init__(self):
+        assert np.hypot(self.end_xy[0] - self.start_xy[0], self.end_xy[1] - self.start_xy[1]) > 0,\
+            'StageLatency_Params: The start and end of the scan must differ.'
+        assert 0 < self.speed_rel <= 100, 'StageLatency_Params: The relative speed must be in (0, 100].'
+        assert self.num_pairs >= 1, 'StageLatency_Params: At least one pass pair is required.'
+
+@dataclass
+class StageLatency_Result:
+    offset_ms: float                # Calibrated stage timestamp offset [ms]
+    offset_before_ms: float         # Offset used during the calibration [ms]
+    std_ms: float                   # Standard deviation of the corrections over the pass pairs [ms]
+    speed_mm_s: float               # Mean scan speed [mm/s]
+    list_corrections_ms: list[float] = field(default_factory=list)  # Correction of each pass pair [ms]
+
+
+class StageLatency_Calibrator():
+    """
+    Calibrates the stage timestamp offset of a stage hub, see the module docstring
+    """
+    def __init__(self, ctrl_xy:Class_XYController, stage_hub:DataStreamer_StageCam, get_signal:SignalGetter):
+        """
+        Args:
+            ctrl_xy (Class_XYController): the XY stage controller (of the stage hub)
+            stage_hub (DataStreamer_StageCam): the running stage hub
+            get_signal (SignalGetter): the sensor signal getter, see camera_edge_signal() and spectrometer_edge_signal()
+        """
+        self._ctrl_xy = ctrl_xy
+        self._stage_hub = stage_hub
+        self._get_signal = get_signal
+        self._flg_stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stops the calibration after the current pass"""
+        self._flg_stop.set()
+
+    def _acquire_pass(self, target_xy:tuple[float,float], params:StageLatency_Params) -> tuple[np.ndarray,np.ndarray]:
+        """
+        Samples the sensor signal while the stage moves to the target
+
+        Returns:
+            tuple[np.ndarray,np.ndarray]: the timestamps [us] and the signal of the samples
+        """
+        thread = threading.Thread(target=self._ctrl_xy.move_direct, args=(target_xy,))
+        list_ts, list_sig = [], []
+        thread.start()
+        while thread.is_alive():
+            signal, timestamp = self._get_signal()
+            list_ts.append(timestamp)
+            list_sig.append(signal)
+            if params.sample_interval_sec > 0: time.sleep(params.sample_interval_sec)
+        thread.join()
+        return np.array(list_ts, dtype=np.int64), np.array(list_sig, dtype=float)
+
+    def _locate(self, timestamps_us:np.ndarray, params:StageLatency_Params) -> np.ndarray:
+        """Returns the positions along the scan of the samples, located by the stage hub [mm]"""
+        start, end = np.asarray(params.start_xy, dtype=float), np.asarray(params.end_xy, dtype=float)
+        direction = (end - start)/np.linalg.norm(end - start)
+        list_pos = []
+        for ts in timestamps_us:
+            coor = self._stage_hub.get_coordinates_interpolate(int(ts))
+            assert coor is not None, 'StageLatency_Calibrator: No stage coordinate for a sample.'
+            list_pos.append(float(np.dot(np.asarray(coor[:2], dtype=float) - start, direction)))
+        return np.array(list_pos)
+
+    def run(self, params:StageLatency_Params) -> StageLatency_Result:
+        """
+        Runs the calibration. The stage speed is restored at the end; the result is not applied.
+
+        Args:
+            params (StageLatency_Params): the scan parameters
+
+        Returns:
+            StageLatency_Result: the calibrated offset
+        """
+        self._flg_stop.clear()
+        offset_before_ms = float(self._stage_hub.get_measurement_offset_ms())
+        vel_before = self._ctrl_xy.get_vel_acc_relative()[1]
+        list_corrections_ms, list_speeds = [], []
+        try:
+            self._ctrl_xy.set_vel_acc_relative(vel_move=100)
+            self._ctrl_xy.move_direct(params.start_xy)
+            self._ctrl_xy.set_vel_acc_relative(vel_move=params.speed_rel)
+            for _ in range(params.num_pairs):
+                if self._flg_stop.is_set(): break
+                ts_fwd, sig_fwd = self._acquire_pass(params.end_xy, params)
+                ts_bwd, sig_bwd = self._acquire_pass(params.start_xy, params)
+                # Located right after the pair, while the stage hub still stores the coordinates
+                pos_fwd, pos_bwd = self._locate(ts_fwd, params), self._locate(ts_bwd, params)
+                speed_fwd, speed_bwd = estimate_speed_mm_s(ts_fwd, pos_fwd), estimate_speed_mm_s(ts_bwd, pos_bwd)
+                shift_mm = estimate_edge_shift_mm(pos_fwd, sig_fwd, pos_bwd, sig_bwd)
+                list_corrections_ms.append(shift_mm/(speed_fwd + speed_bwd)*1e3)
+                list_speeds.extend([speed_fwd, speed_bwd])
+        finally:
+            self._ctrl_xy.set_vel_acc_relative(vel_move=vel_before)
+        assert list_corrections_ms, 'StageLatency_Calibrator: The calibration was stopped before any pass pair.'
+
+        correction_ms = float(np.median(list_corrections_ms))
+        return StageLatency_Result(
+            offset_ms=offset_before_ms + correction_ms,
+            offset_before_ms=offset_before_ms,
+            std_ms=float(np.std(list_corrections_ms)),
+            speed_mm_s=float(np.mean(list_speeds)),
+            list_corrections_ms=[float(corr) for corr in list_corrections_ms],
+        )
+
+
+class StageLatency_Store():
+    """
+    Calibrated stage timestamp offsets per stage controller (identifier), stored in a JSON file
+    """
+    def __init__(self, path:str|None=None):
+        """
+        Args:
+            path (str|None, optional): path to the JSON file. Defaults to LibraryConfigEnum.STAGE_LATENCY_PATH_DEFAULT.
+        """
+        self._path = path if path is not None else LibraryConfigEnum.STAGE_LATENCY_PATH_DEFAULT.value
+
+    def _read(self) -> dict[str,dict]:
+        if not os.path.isfile(self._path): return {}
+        with open(self._path, 'r') as f: return json.load(f)
+
+    def get_offset_ms(self, identifier:str) -> float|None:
+        """
+        Returns the calibrated offset of a stage controller
+
+        Args:
+            identifier (str): identifier of the stage controller (get_identifier())
+
+        Returns:
+            float|None: the offset [ms], None if the controller has not been calibrated
+        """
+        entry = self._read().get(identifier)
+        return float(entry['offset_ms']) if entry is not None else None
+
+    def set_result(self, identifier:str, result:StageLatency_Result) -> None:
+        """
+        Stores the calibration result of a stage controller, replacing the previous one
+
+        Args:
+            identifier (str): identifier of the stage controller (get_identifier())
+            result (StageLatency_Result): the calibration result
+        """
+        assert isinstance(result, StageLatency_Result), 'StageLatency_Store.set_result: Expected a StageLatency_Result.'
+        dict_store = self._read()
+        dict_store[identifier] = {**asdict(result), 'calibrated': time.strftime('%Y-%m-%d %H:%M:%S')}
+        dirpath = os.path.dirname(self._path)
+        if dirpath and not os.path.isdir(dirpath): os.makedirs(dirpath, exist_ok=True)
+        with open(self._path, 'w') as f: json.dump(dict_store, f, indent=4)
+
+    def apply(self, identifier:str, stage_hub:DataStreamer_StageCam) -> float|None:
+        """
+        Applies the calibrated offset of a stage controller to a stage hub, if any
+
+        Args:
+            identifier (str): identifier of the stage controller (get_identifier())
+            stage_hub (DataStreamer_StageCam): the stage hub
+
+        Returns:
+            float|None: the applied offset [ms], None if the controller has not been calibrated
+        """
+        offset_ms = self.get_offset_ms(identifier)
+        if offset_ms is not None: stage_hub.set_measurement_offset_ms(offset_ms)
+        return offset_ms
@@ -25,6 +25,8 @@ dict_controller_options_default = {
     'stage_flipxy': False, # Flip the XY stage coordinate system
     'stage_tiling_waittime_sec': 0.2,  # Wait time after each stage movement during tiling measurements in [s]
     'stage_tiling_settle_sec': 0.3,    # Min time the stage must be stationary before image capture in [s]
+    'stage_tiling_settle_tol_mm': 0.001,   # Max coordinate change between the stage samples of a stationary stage in [mm]
+    'stage_tiling_target_tol_mm': 0.005,   # Max distance to the target of a stage settled on the target in [mm]
     # > Camera <
     'camera_index': 0,          # Index of the camera device to be used for capturing
     'videofeed_height': 250,    # Height of the video feed window
@@ -47,6 +49,8 @@ dict_controller_options_comments = {
     'stage_flipxy': 'Flip the x and y axis of the XY stage coordinate system',
     'stage_tiling_waittime_sec': 'Wait time after each stage movement during tiling measurements in seconds',
     'stage_tiling_settle_sec': 'Min time the stage must be stationary (coordinates stable) before image capture in seconds',
+    'stage_tiling_settle_tol_mm': 'Max coordinate change between the stage samples of a stationary stage in mm',
+    'stage_tiling_target_tol_mm': 'Max distance to the target of a settled stage in mm. A stationary stage within this distance of its target is settled without waiting the full stage_tiling_settle_sec',
     # > Camera <
     'camera_index': 'Index of the camera device to be used for capturing',
     'videofeed_height': 'Height of the video feed window',
@@ -124,6 +128,8 @@ class ControllerConfigEnum(Enum):
     STAGE_FLIPXY = dict_controller_options_read['stage_flipxy']
     STAGE_TILING_WAITTIME_SEC = dict_controller_options_read['stage_tiling_waittime_sec']
     STAGE_TILING_SETTLE_SEC = dict_controller_options_read['stage_tiling_settle_sec']
+    STAGE_TILING_SETTLE_TOL_MM = dict_controller_options_read['stage_tiling_settle_tol_mm']
+    STAGE_TILING_TARGET_TOL_MM = dict_controller_options_read['stage_tiling_target_tol_mm']
 
     # > Camera <
     CAMERA_INDEX = dict_controller_options_read['camera_index']
@@ -186,6 +192,13 @@ dict_controllerSpecific_default = {
     'andor_single_track_height': 1, # Height of the single track readout mode for the Andor camera in pixel. Required if 'andor_readout_mode' is set to 'single_track'
     'andor_operational_temperature': '', # Operational temperature for the Andor camera in degree Celcius. Set it to '' to disable temperature control (default)
     'andor_termination_temperature': '', # Termination temperature for the Andor camera in degree Celcius. Set it to '' to use the default termination temperature (default)
+    'andor_roi_row_min': 1, # First sensor row of the image readout ROI (1-based), clipped to the sensor
+    'andor_roi_row_max': 100000, # Last sensor row of the image readout ROI (1-based, inclusive), clipped to the sensor
+    'andor_roi_col_min': 1, # First sensor column of the image readout ROI (1-based), clipped to the sensor
+    'andor_roi_col_max': 100000, # Last sensor column of the image readout ROI (1-based, inclusive), clipped to the sensor
+    'andor_roi_bin_row': 1, # Number of binned rows of the image readout. Must divide the number of ROI rows
+    'andor_roi_bin_col': 1, # Number of binned columns of the image readout. Must divide the number of ROI columns
+    'andor_track_definitions': '', # Tracks extracted from the image readout, e.g., "sample:100-140/60-80, reference:200-240" (name:start-stop/background start-stop, 0-based rows of the ROI image, stop exclusive). The first track is the primary spectrum. Set it to '' to sum all the rows (default)
     # > PFM450 stage parameters <
     'pfm450_serial': '',    # Serial number of the PFM450 stage
     # > Physik Instrumente (PI) stage parameters <
@@ -231,6 +244,13 @@ dict_controllerSpecific_comments = {
     'andor_single_track_height': 'Height of the single track readout mode for the Andor camera in pixel. Required if "andor_readout_mode" is set to "single_track"',
     'andor_operational_temperature': 'Operational temperature for the Andor camera in degree Celcius. Set it to "" to disable temperature control (default)',
     'andor_termination_temperature': 'Termination temperature for the Andor camera in degree Celcius. Set it to "" to use the default termination temperature (default)',
+    'andor_roi_row_min': 'First sensor row of the image readout ROI (1-based), clipped to the sensor',
+    'andor_roi_row_max': 'Last sensor row of the image readout ROI (1-based, inclusive), clipped to the sensor',
+    'andor_roi_col_min': 'First sensor column of the image readout ROI (1-based), clipped to the sensor',
+    'andor_roi_col_max': 'Last sensor column of the image readout ROI (1-based, inclusive), clipped to the sensor',
+    'andor_roi_bin_row': 'Number of binned rows of the image readout. Must divide the number of ROI rows',
+    'andor_roi_bin_col': 'Number of binned columns of the image readout. Must divide the number of ROI columns',
+    'andor_track_definitions': 'Tracks extracted from the image readout, e.g., "sample:100-140/60-80, reference:200-240" (name:start-stop/background start-stop, 0-based rows of the ROI image, stop exclusive). The first track is the primary spectrum. Set it to "" to sum all the rows (default)',
     # > PFM450 stage parameters <
     'pfm450_serial': 'Serial number of the PFM450 stage',
     # > Physik Instrumente (PI) stage parameters <
@@ -285,6 +305,13 @@ class ControllerSpecificConfigEnum(Enum):
     ANDOR_SINGLE_TRACK_HEIGHT = dict_controllerSpecific_read['andor_single_track_height']
     ANDOR_OPERATIONAL_TEMPERATURE = dict_controllerSpecific_read['andor_operational_temperature']
     ANDOR_TERMINATION_TEMPERATURE = dict_controllerSpecific_read['andor_termination_temperature']
+    ANDOR_ROI_ROW_MIN = dict_controllerSpecific_read['andor_roi_row_min']
+    ANDOR_ROI_ROW_MAX = dict_controllerSpecific_read['andor_roi_row_max']
+    ANDOR_ROI_COL_MIN = dict_controllerSpecific_read['andor_roi_col_min']
+    ANDOR_ROI_COL_MAX = dict_controllerSpecific_read['andor_roi_col_max']
+    ANDOR_ROI_BIN_ROW = dict_controllerSpecific_read['andor_roi_bin_row']
+    ANDOR_ROI_BIN_COL = dict_controllerSpecific_read['andor_roi_bin_col']
+    ANDOR_TRACK_DEFINITIONS = dict_controllerSpecific_read['andor_track_definitions']
     # > PFM450 stage parameters <
     PFM450_SERIAL = dict_controllerSpecific_read['pfm450_serial']
     # > Physik Instrumente (PI) stage parameters <
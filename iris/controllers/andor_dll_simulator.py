@@ -0,0 +1,801 @@
+"""
+An offline simulator of the Andor SDK2 libraries (atmcd64d.dll and atspectrograph.dll).
+
+The simulator replaces the libraries loaded with ctypes by the Andor spectrometer controllers
+(raman_spectrometer_controller_Andor_dll*.py) when the simulation mode is enabled in the config
+file, or when the environment variable ANDOR_DLL_SIMULATOR is set to '1' before the import.
+The controllers, their DLL bindings and their wrappers are then used unchanged: the entry points
+accept the same ctypes arguments (values, byref() pointers and ctypes arrays) and return the SDK
+error codes.
+
+The camera is modelled as a state machine:
+    - initialisation/shutdown, with DRV_NOT_INITIALIZED returned before Initialize()
+    - cooler with a temperature ramp towards the set point (or the ambient temperature when the
+      cooler is off) and the matching cooling status codes
+    - read modes (full vertical binning, single track, image with binning and sub-area)
+    - acquisition modes (single, accumulate, kinetics, run till abort) with timings derived from
+      the exposure time and the vertical/horizontal shift speeds, internal and software triggers
+    - a circular buffer for GetMostRecentImage, GetNumberNewImages, GetImages and GetAcquiredData
+    - synthetic frames: bias, dark current, Raman bands on a slit image and shot/read noise
+
+The frames are generated lazily from the elapsed time, so no background thread is needed.
+Errors can be injected per entry point with AndorCamera_Simulator.inject_error().
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import ctypes
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# SDK return codes used by the simulator (see ErrorCodes in raman_spectrometer_controller_Andor_dll.py)
+DRV_ERROR_ACK = 20013
+DRV_NO_NEW_DATA = 20024
+DRV_SUCCESS = 20002
+DRV_TEMPERATURE_OFF = 20034
+DRV_TEMP_NOT_STABILIZED = 20035
+DRV_TEMPERATURE_STABILIZED = 20036
+DRV_TEMPERATURE_NOT_REACHED = 20037
+DRV_GENERAL_ERRORS = 20049
+DRV_P1INVALID = 20066
+DRV_P2INVALID = 20067
+DRV_P3INVALID = 20068
+DRV_P4INVALID = 20069
+DRV_ACQUIRING = 20072
+DRV_IDLE = 20073
+DRV_NOT_INITIALIZED = 20075
+DRV_P5INVALID = 20076
+DRV_P6INVALID = 20077
+DRV_INVALID_MODE = 20078
+DRV_NOT_AVAILABLE = 20992
+
+ATSPECTROGRAPH_SUCCESS = 20202
+ATSPECTROGRAPH_NOT_INITIALIZED = 20201
+ATSPECTROGRAPH_P2INVALID = 20267
+
+READ_MODES = {0: 'Full Vertical Binning', 3: 'Single-Track', 4: 'Image'}
+ACQUISITION_MODES = {1: 'Single', 2: 'Accumulate', 3: 'Kinetics', 5: 'RunTillAbort'}
+TRIGGER_MODES = {0: 'Internal', 10: 'Software Trigger'}
+
+
+def _get_value(arg):
+    """Returns the Python value of a ctypes argument (or of a plain Python value)"""
+    value = getattr(arg, 'value', arg)
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+def _set_pointer(pointer, value) -> None:
+    """Writes the value into a byref() pointer or a ctypes object"""
+    target = getattr(pointer, '_obj', pointer)
+    target.value = type(target.value)(value)
+
+def _as_array(arr, size:int) -> np.ndarray:
+    """Returns a numpy view of the first size elements of a ctypes array or pointer"""
+    if isinstance(arr, ctypes.Array): return np.ctypeslib.as_array(arr)[:size]
+    return np.ctypeslib.as_array(arr, shape=(size,))
+
+class AndorCamera_Simulator():
+    """
+    The state machine of a simulated Andor CCD. The methods are named after the SDK entry points
+    and return the SDK error codes.
+    """
+    def __init__(self, x_pixel:int=1024, y_pixel:int=256, serial_number:int=12345,
+                 temperature_ambient:float=20.0, temperature_range:tuple[int,int]=(-100, 20),
+                 cooling_rate_degC_per_sec:float=10.0, stabilisation_time_sec:float=2.0,
+                 buffer_size:int=256, seed:int|None=0):
+        """
+        Args:
+            x_pixel (int): number of columns of the sensor. Defaults to 1024.
+            y_pixel (int): number of rows of the sensor. Defaults to 256.
+            serial_number (int): serial number of the camera. Defaults to 12345.
+            temperature_ambient (float): ambient (and initial) temperature [degC]. Defaults to 20.0.
+            temperature_range (tuple[int,int]): valid range of the set point [degC]. Defaults to (-100, 20).
+            cooling_rate_degC_per_sec (float): maximum rate of the temperature ramp [degC/s]. Defaults to 10.0.
+            stabilisation_time_sec (float): time at the set point before the temperature is reported
+                as stabilised [s]. Defaults to 2.0.
+            buffer_size (int): number of images kept in the circular buffer. Defaults to 256.
+            seed (int|None): seed of the frame noise. Defaults to 0.
+        """
+        self._lock = threading.RLock()
+        self._event_cancel = threading.Event()
+        self._rng = np.random.default_rng(seed)
+        self._dict_injected_errors:dict[str,list[int]] = {}
+
+        # Device
+        self.x_pixel = x_pixel
+        self.y_pixel = y_pixel
+        self.serial_number = serial_number
+        self.initialized = False
+        self.list_vs_speeds_us = [8.25, 16.25, 32.25, 64.25]    # Vertical shift speeds [us/row]
+        self.list_hs_speeds_MHz = [0.1, 0.05]                   # Horizontal readout speeds [MHz]
+        self._idx_vs_speed = 0
+        self._idx_hs_speed = 0
+        self.shutter_mode = 0
+
+        # Cooler
+        self.temperature_ambient = float(temperature_ambient)
+        self.temperature_range = temperature_range
+        self.cooling_rate_degC_per_sec = float(cooling_rate_degC_per_sec)
+        self.stabilisation_time_sec = float(stabilisation_time_sec)
+        self.cooler_on = False
+        self.temperature_setpoint = int(temperature_ambient)
+        self._temperature = float(temperature_ambient)
+        self._ts_temperature = time.perf_counter()
+        self._ts_setpoint_reached:float|None = None
+
+        # Readout and acquisition settings
+        self.read_mode = 0
+        self.single_track = (y_pixel // 2, 1)                   # (centre, height) [pixel]
+        self.image_settings = (1, 1, 1, x_pixel, 1, y_pixel)    # (hbin, vbin, hstart, hend, vstart, vend)
+        self.acquisition_mode = 1
+        self.trigger_mode = 0
+        self.exposure_time_sec = 0.01
+        self.kinetic_cycle_time_sec = 0.0
+        self.num_accumulations = 1
+        self.num_kinetics = 1
+
+        # Acquisition state
+        self.acquiring = False
+        self._ts_start = 0.0
+        self._list_ts_frames:list[float] = []   # Completion times of the scheduled frames (software trigger)
+        self._num_acquired = 0                  # Number of images acquired since the start
+        self._num_waited = 0                    # Number of images reported by WaitForAcquisition
+        self._idx_retrieved = 0                 # Index of the last image retrieved with GetImages
+        self._buffer:deque[np.ndarray] = deque(maxlen=buffer_size)
+        self._series:list[np.ndarray] = []      # Images of the last series (GetAcquiredData)
+        self._signal_rate:np.ndarray|None = None
+        self._readout_signal_rate:np.ndarray|None = None
+
+    def inject_error(self, function_name:str, error_code:int, count:int=1) -> None:
+        """
+        Makes the next calls to an entry point return an error code, without changing the state
+
+        Args:
+            function_name (str): name of the entry point, e.g., 'GetImages'
+            error_code (int): the SDK error code to return
+            count (int): number of calls returning the error. Defaults to 1.
+        """
+        with self._lock:
+            self._dict_injected_errors.setdefault(function_name, []).extend([error_code] * count)
+
+    def pop_injected_error(self, function_name:str) -> int|None:
+        """Returns the next injected error code of an entry point, or None"""
+        with self._lock:
+            list_errors = self._dict_injected_errors.get(function_name)
+            if not list_errors: return None
+            return list_errors.pop(0)
+
+# >>> Models <<<
+    def _update_temperature(self) -> None:
+        """Ramps the temperature towards the set point (cooler on) or the ambient temperature (cooler off)"""
+        now = time.perf_counter()
+        target = self.temperature_setpoint if self.cooler_on else self.temperature_ambient
+        step = self.cooling_rate_degC_per_sec * (now - self._ts_temperature)
+        self._temperature = target if abs(target - self._temperature) <= step\
+            else self._temperature + np.sign(target - self._temperature) * step
+        self._ts_temperature = now
+
+        if self.cooler_on and abs(self._temperature - self.temperature_setpoint) < 0.5:
+            if self._ts_setpoint_reached is None: self._ts_setpoint_reached = now
+        else: self._ts_setpoint_reached = None
+
+    def _get_signal_rate(self) -> np.ndarray:
+        """Returns the (y, x) expected photoelectron rate of the full sensor [counts/s]"""
+        if self._signal_rate is None:
+            x = np.arange(self.x_pixel)
+            y = np.arange(self.y_pixel)
+            spectrum = 50.0 + 200.0 * np.exp(-x / (0.6 * self.x_pixel))   # Fluorescence background
+            for centre, amplitude, width in [(0.2, 3000, 3), (0.45, 8000, 4), (0.47, 2500, 6), (0.75, 5000, 5)]:
+                spectrum = spectrum + amplitude * np.exp(-0.5 * ((x - centre * self.x_pixel) / width) ** 2)
+            slit = np.exp(-0.5 * ((y - self.y_pixel / 2) / max(self.y_pixel / 16, 1)) ** 2)
+            self._signal_rate = slit[:, None] * spectrum[None, :] / slit.sum() * 100 + 0.5   # + dark current
+        return self._signal_rate
+
+    def get_image_shape(self) -> tuple[int,int]:
+        """Returns the (rows, columns) of the images of the current read mode"""
+        if self.read_mode in (0, 3): return 1, self.x_pixel
+        hbin, vbin, hstart, hend, vstart, vend = self.image_settings
+        return (vend - vstart + 1) // vbin, (hend - hstart + 1) // hbin
+
+    def _get_readout_signal_rate(self) -> np.ndarray:
+        """Returns the signal rate binned according to the read mode, as read out"""
+        rate = self._get_signal_rate()
+        if self.read_mode == 0: return rate.sum(axis=0, keepdims=True)
+        if self.read_mode == 3:
+            centre, height = self.single_track
+            start = centre - height // 2 - 1
+            return rate[start:start + height].sum(axis=0, keepdims=True)
+        hbin, vbin, hstart, hend, vstart, vend = self.image_settings
+        rows, cols = self.get_image_shape()
+        sub = rate[vstart - 1:vstart - 1 + rows * vbin, hstart - 1:hstart - 1 + cols * hbin]
+        return sub.reshape(rows, vbin, cols, hbin).sum(axis=(1, 3))
+
+    def get_readout_time_sec(self) -> float:
+        """Returns the readout time of one scan in the current read mode [s]"""
+        rows, cols = self.get_image_shape()
+        vs_us = self.list_vs_speeds_us[self._idx_vs_speed]
+        hs_MHz = self.list_hs_speeds_MHz[self._idx_hs_speed]
+        return (self.y_pixel * vs_us + rows * (self.x_pixel + cols) / hs_MHz / 2) * 1e-6
+
+    def get_timings_sec(self) -> tuple[float,float,float]:
+        """Returns the exposure, accumulation cycle and kinetic cycle times [s]"""
+        exposure = self.exposure_time_sec
+        accumulate = exposure + self.get_readout_time_sec()
+        cycle = accumulate * (self.num_accumulations if self.acquisition_mode in (2, 3) else 1)
+        kinetic = max(self.kinetic_cycle_time_sec, cycle)
+        return exposure, accumulate, kinetic
+
+    def _generate_frame(self) -> np.ndarray:
+        """Returns a synthetic (rows, columns) int32 image of the current settings"""
+        expected = self._readout_signal_rate * self.exposure_time_sec
+        num_scans = self.num_accumulations if self.acquisition_mode in (2, 3) else 1
+        noise = self._rng.standard_normal(expected.shape) * np.sqrt(num_scans * (expected + 36.0))  # Shot + read noise
+        frame = num_scans * (300.0 + expected) + noise     # 300 counts bias per scan
+        return np.clip(np.rint(frame), 0, num_scans * 65535).astype(np.int32)
+
+    def _get_series_length(self) -> int|None:
+        """Returns the number of images of the series, or None for RunTillAbort"""
+        if self.acquisition_mode == 5: return None
+        if self.acquisition_mode == 3: return self.num_kinetics
+        return 1
+
+    def _update_acquisition(self) -> None:
+        """Adds the images completed since the last update to the buffers"""
+        if not self.acquiring: return
+        now = time.perf_counter()
+        if self.trigger_mode == 10:
+            num_completed = self._num_acquired + sum(1 for ts in self._list_ts_frames if ts <= now)
+            self._list_ts_frames = [ts for ts in self._list_ts_frames if ts > now]
+        else:
+            _, _, kinetic = self.get_timings_sec()
+            num_completed = int((now - self._ts_start) / kinetic) if kinetic > 0 else self._num_acquired
+        series_length = self._get_series_length()
+        if series_length is not None: num_completed = min(num_completed, series_length)
+
+        # Only the frames that still fit in the buffer are generated
+        num_new = num_completed - self._num_acquired
+        for _ in range(min(num_new, self._buffer.maxlen)):
+            frame = self._generate_frame()
+            self._buffer.append(frame)
+            if series_length is not None: self._series.append(frame)
+        self._num_acquired = num_completed
+        if series_length is not None and num_completed >= series_length: self.acquiring = False
+
+    def _get_next_frame_time(self) -> float|None:
+        """Returns the perf_counter time at which the next image completes, or None if none is scheduled"""
+        if not self.acquiring: return None
+        if self.trigger_mode == 10: return min(self._list_ts_frames) if self._list_ts_frames else None
+        _, _, kinetic = self.get_timings_sec()
+        return self._ts_start + (self._num_acquired + 1) * kinetic
+
+    def _check_ready(self, flg_idle:bool=False) -> int:
+        """Returns DRV_NOT_INITIALIZED, DRV_ACQUIRING (if flg_idle) or DRV_SUCCESS"""
+        if not self.initialized: return DRV_NOT_INITIALIZED
+        self._update_acquisition()
+        if flg_idle and self.acquiring: return DRV_ACQUIRING
+        return DRV_SUCCESS
+
+# >>> Initialisation <<<
+    def Initialize(self, dirpath) -> int:
+        with self._lock:
+            self.initialized = True
+            return DRV_SUCCESS
+
+    def ShutDown(self) -> int:
+        with self._lock:
+            self.acquiring = False
+            self.initialized = False
+            return DRV_SUCCESS
+
+    def GetStatus(self, status) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(status, DRV_ACQUIRING if self.acquiring else DRV_IDLE)
+            return DRV_SUCCESS
+
+# >>> Device information <<<
+    def GetCameraSerialNumber(self, number) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(number, self.serial_number)
+            return DRV_SUCCESS
+
+    def GetCapabilities(self, caps) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            caps = getattr(caps, '_obj', caps)
+            caps.ulAcqModes = sum(1 << (mode - 1) for mode in ACQUISITION_MODES)
+            caps.ulReadModes = sum(1 << mode for mode in READ_MODES)
+            caps.ulTriggerModes = sum(1 << mode for mode in TRIGGER_MODES)
+            return DRV_SUCCESS
+
+    def GetDetector(self, xpixels, ypixels) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(xpixels, self.x_pixel)
+            _set_pointer(ypixels, self.y_pixel)
+            return DRV_SUCCESS
+
+# >>> Shift speeds <<<
+    def GetFastestRecommendedVSSpeed(self, index, speed) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(index, 0)
+            _set_pointer(speed, self.list_vs_speeds_us[0])
+            return DRV_SUCCESS
+
+    def GetNumberVSSpeeds(self, speeds) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(speeds, len(self.list_vs_speeds_us))
+            return DRV_SUCCESS
+
+    def GetVSSpeed(self, index, speed) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            index = _get_value(index)
+            if not 0 <= index < len(self.list_vs_speeds_us): return DRV_P1INVALID
+            _set_pointer(speed, self.list_vs_speeds_us[index])
+            return DRV_SUCCESS
+
+    def SetVSSpeed(self, index) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            index = _get_value(index)
+            if not 0 <= index < len(self.list_vs_speeds_us): return DRV_P1INVALID
+            self._idx_vs_speed = index
+            return DRV_SUCCESS
+
+    def SetVSAmplitude(self, state) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            if not 0 <= _get_value(state) <= 4: return DRV_P1INVALID
+            return DRV_SUCCESS
+
+    def GetNumberHSSpeeds(self, channel, typ, speeds) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            if _get_value(channel) != 0: return DRV_P1INVALID
+            if _get_value(typ) != 0: return DRV_P2INVALID
+            _set_pointer(speeds, len(self.list_hs_speeds_MHz))
+            return DRV_SUCCESS
+
+    def GetHSSpeed(self, channel, typ, index, speed) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            if _get_value(channel) != 0: return DRV_P1INVALID
+            if _get_value(typ) != 0: return DRV_P2INVALID
+            index = _get_value(index)
+            if not 0 <= index < len(self.list_hs_speeds_MHz): return DRV_P3INVALID
+            _set_pointer(speed, self.list_hs_speeds_MHz[index])
+            return DRV_SUCCESS
+
+    def SetHSSpeed(self, typ, index) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            if _get_value(typ) != 0: return DRV_P1INVALID
+            index = _get_value(index)
+            if not 0 <= index < len(self.list_hs_speeds_MHz): return DRV_P2INVALID
+            self._idx_hs_speed = index
+            return DRV_SUCCESS
+
+    def SetShutterEx(self, typ, mode, closingtime, openingtime, extmode) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            if _get_value(typ) not in (0, 1): return DRV_P1INVALID
+            if _get_value(mode) not in (0, 1, 2, 4, 5): return DRV_P2INVALID
+            if _get_value(closingtime) < 0: return DRV_P3INVALID
+            if _get_value(openingtime) < 0: return DRV_P4INVALID
+            if _get_value(extmode) not in (0, 1, 2, 4, 5): return DRV_P5INVALID
+            self.shutter_mode = _get_value(extmode)
+            return DRV_SUCCESS
+
+# >>> Temperature <<<
+    def GetTemperatureRange(self, mintemp, maxtemp) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            _set_pointer(mintemp, self.temperature_range[0])
+            _set_pointer(maxtemp, self.temperature_range[1])
+            return DRV_SUCCESS
+
+    def SetTemperature(self, temperature) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            temperature = _get_value(temperature)
+            if not self.temperature_range[0] <= temperature <= self.temperature_range[1]: return DRV_P1INVALID
+            self._update_temperature()
+            self.temperature_setpoint = temperature
+            self._ts_setpoint_reached = None
+            return DRV_SUCCESS
+
+    def GetTemperature(self, temperature) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            self._update_temperature()
+            _set_pointer(temperature, int(round(self._temperature)))
+            if not self.cooler_on: return DRV_TEMPERATURE_OFF
+            if self._ts_setpoint_reached is None: return DRV_TEMPERATURE_NOT_REACHED
+            if time.perf_counter() - self._ts_setpoint_reached < self.stabilisation_time_sec: return DRV_TEMP_NOT_STABILIZED
+            return DRV_TEMPERATURE_STABILIZED
+
+    def CoolerON(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            self._update_temperature()
+            self.cooler_on = True
+            return DRV_SUCCESS
+
+    def CoolerOFF(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            self._update_temperature()
+            self.cooler_on = False
+            return DRV_SUCCESS
+
+# >>> Readout settings <<<
+    def SetReadMode(self, mode) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            mode = _get_value(mode)
+            if mode in (1, 2): return DRV_NOT_AVAILABLE     # Multi/random track are not simulated
+            if mode not in READ_MODES: return DRV_P1INVALID
+            self.read_mode = mode
+            return DRV_SUCCESS
+
+    def SetImage(self, hbin, vbin, hstart, hend, vstart, vend) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            hbin, vbin, hstart, hend, vstart, vend = [_get_value(arg) for arg in (hbin, vbin, hstart, hend, vstart, vend)]
+            if not 1 <= hstart <= self.x_pixel: return DRV_P3INVALID
+            if not hstart <= hend <= self.x_pixel: return DRV_P4INVALID
+            if not 1 <= vstart <= self.y_pixel: return DRV_P5INVALID
+            if not vstart <= vend <= self.y_pixel: return DRV_P6INVALID
+            if hbin < 1 or (hend - hstart + 1) % hbin != 0: return DRV_P1INVALID
+            if vbin < 1 or (vend - vstart + 1) % vbin != 0: return DRV_P2INVALID
+            self.image_settings = (hbin, vbin, hstart, hend, vstart, vend)
+            return DRV_SUCCESS
+
+    def SetSingleTrack(self, centre, height) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            centre, height = _get_value(centre), _get_value(height)
+            if not 1 <= centre <= self.y_pixel: return DRV_P1INVALID
+            start = centre - height // 2
+            if height < 1 or start < 1 or start + height - 1 > self.y_pixel: return DRV_P2INVALID
+            self.single_track = (centre, height)
+            return DRV_SUCCESS
+
+# >>> Acquisition settings <<<
+    def SetAcquisitionMode(self, mode) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            mode = _get_value(mode)
+            if mode not in ACQUISITION_MODES: return DRV_P1INVALID
+            self.acquisition_mode = mode
+            return DRV_SUCCESS
+
+    def SetExposureTime(self, time_sec) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            time_sec = _get_value(time_sec)
+            if time_sec < 0: return DRV_P1INVALID
+            self.exposure_time_sec = float(time_sec)
+            return DRV_SUCCESS
+
+    def SetKineticCycleTime(self, time_sec) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            time_sec = _get_value(time_sec)
+            if time_sec < 0: return DRV_P1INVALID
+            self.kinetic_cycle_time_sec = float(time_sec)
+            return DRV_SUCCESS
+
+    def SetNumberAccumulations(self, number) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            number = _get_value(number)
+            if number < 1: return DRV_P1INVALID
+            self.num_accumulations = number
+            return DRV_SUCCESS
+
+    def SetNumberKinetics(self, number) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            number = _get_value(number)
+            if number < 1: return DRV_P1INVALID
+            self.num_kinetics = number
+            return DRV_SUCCESS
+
+    def GetAcquisitionTimings(self, exposure, accumulate, kinetic) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            for pointer, value in zip((exposure, accumulate, kinetic), self.get_timings_sec()):
+                _set_pointer(pointer, value)
+            return DRV_SUCCESS
+
+    def IsTriggerModeAvailable(self, mode) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            return DRV_SUCCESS if _get_value(mode) in TRIGGER_MODES else DRV_INVALID_MODE
+
+    def SetTriggerMode(self, mode) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            mode = _get_value(mode)
+            if mode not in TRIGGER_MODES: return DRV_P1INVALID
+            self.trigger_mode = mode
+            return DRV_SUCCESS
+
+# >>> Acquisition control <<<
+    def PrepareAcquisition(self) -> int:
+        with self._lock:
+            return self._check_ready(flg_idle=True)
+
+    def StartAcquisition(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            if self.trigger_mode == 10 and self.acquisition_mode != 5: return DRV_INVALID_MODE
+            self._readout_signal_rate = self._get_readout_signal_rate()
+            self.acquiring = True
+            self._ts_start = time.perf_counter()
+            self._list_ts_frames = []
+            self._num_acquired = 0
+            self._num_waited = 0
+            self._idx_retrieved = 0
+            self._buffer.clear()
+            self._series = []
+            self._event_cancel.clear()
+            return DRV_SUCCESS
+
+    def AbortAcquisition(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            if not self.acquiring: return DRV_IDLE
+            self.acquiring = False
+            return DRV_SUCCESS
+
+    def SendSoftwareTrigger(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            if self.trigger_mode != 10: return DRV_INVALID_MODE
+            if not self.acquiring: return DRV_IDLE
+            # The triggered frames are exposed and read out one after the other
+            _, _, kinetic = self.get_timings_sec()
+            ts_start = max([time.perf_counter()] + self._list_ts_frames)
+            self._list_ts_frames.append(ts_start + kinetic)
+            return DRV_SUCCESS
+
+    def WaitForAcquisition(self) -> int:
+        return self.WaitForAcquisitionTimeOut(None)
+
+    def WaitForAcquisitionTimeOut(self, timeout_ms) -> int:
+        """Returns when an image completed since the last wait, on CancelWait() or on the timeout"""
+        timeout_ms = _get_value(timeout_ms)
+        ts_timeout = None if timeout_ms is None else time.perf_counter() + timeout_ms / 1e3
+        while True:
+            with self._lock:
+                if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+                if self._num_acquired > self._num_waited:
+                    self._num_waited = self._num_acquired
+                    return DRV_SUCCESS
+                ts_next = self._get_next_frame_time()
+            if ts_next is None and ts_timeout is None: return DRV_NO_NEW_DATA   # Nothing to wait for
+            ts_wake = min(ts for ts in (ts_next, ts_timeout) if ts is not None)
+            if self._event_cancel.wait(max(ts_wake - time.perf_counter(), 0)):
+                self._event_cancel.clear()
+                return DRV_NO_NEW_DATA
+            if ts_timeout is not None and time.perf_counter() >= ts_timeout:
+                with self._lock:
+                    self._update_acquisition()
+                    if self._num_acquired > self._num_waited: continue
+                return DRV_NO_NEW_DATA
+
+    def CancelWait(self) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            self._event_cancel.set()
+            return DRV_SUCCESS
+
+# >>> Data retrieval <<<
+    def _get_pixels_per_image(self) -> int:
+        rows, cols = self.get_image_shape()
+        return rows * cols
+
+    def GetMostRecentImage(self, arr, size) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            if arr is None: return DRV_P1INVALID
+            size = _get_value(size)
+            if size != self._get_pixels_per_image(): return DRV_P2INVALID
+            if len(self._buffer) == 0: return DRV_NO_NEW_DATA
+            _as_array(arr, size)[:] = self._buffer[-1].reshape(-1)
+            return DRV_SUCCESS
+
+    def GetTotalNumberImagesAcquired(self, index) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            _set_pointer(index, self._num_acquired)
+            return DRV_SUCCESS
+
+    def _get_first_buffered(self) -> int:
+        """Returns the (1-based) index of the oldest image in the circular buffer"""
+        return self._num_acquired - len(self._buffer) + 1
+
+    def GetNumberNewImages(self, first, last) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            idx_first = max(self._idx_retrieved + 1, self._get_first_buffered())
+            if idx_first > self._num_acquired: return DRV_NO_NEW_DATA
+            _set_pointer(first, idx_first)
+            _set_pointer(last, self._num_acquired)
+            return DRV_SUCCESS
+
+    def GetImages(self, first, last, arr, size, validfirst, validlast) -> int:
+        with self._lock:
+            if (ret := self._check_ready()) != DRV_SUCCESS: return ret
+            first, last, size = _get_value(first), _get_value(last), _get_value(size)
+            if self._num_acquired == 0: return DRV_NO_NEW_DATA
+            if first > last or first < self._get_first_buffered() or last > self._num_acquired: return DRV_GENERAL_ERRORS
+            if arr is None: return DRV_P3INVALID
+            pixels = self._get_pixels_per_image()
+            if size < (last - first + 1) * pixels: return DRV_P4INVALID
+            offset = self._get_first_buffered()
+            images = np.array([self._buffer[idx - offset] for idx in range(first, last + 1)])
+            _as_array(arr, images.size)[:] = images.reshape(-1)
+            _set_pointer(validfirst, first)
+            _set_pointer(validlast, last)
+            self._idx_retrieved = max(self._idx_retrieved, last)
+            return DRV_SUCCESS
+
+    def GetAcquiredData(self, arr, size) -> int:
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            if arr is None: return DRV_P1INVALID
+            if len(self._series) == 0: return DRV_NO_NEW_DATA
+            size = _get_value(size)
+            data = np.array(self._series).reshape(-1)
+            if size != data.size: return DRV_P2INVALID
+            _as_array(arr, size)[:] = data
+            return DRV_SUCCESS
+
+    def SaveAsSif(self, path) -> int:
+        """
+        Saves the last series. The file holds a text header followed by the raw int32 images:
+        it is not readable by the Andor software.
+        """
+        with self._lock:
+            if (ret := self._check_ready(flg_idle=True)) != DRV_SUCCESS: return ret
+            path = _get_value(path)
+            dirpath = os.path.dirname(os.path.abspath(path))
+            if not path or not os.path.isdir(dirpath): return DRV_P1INVALID
+            images = list(self._series) if self._series else list(self._buffer)[-1:]
+            if len(images) == 0: return DRV_ERROR_ACK
+            rows, cols = images[0].shape
+            header = (f'Andor Technology Multi-Channel File (simulated)\n'
+                      f'serial {self.serial_number} images {len(images)} rows {rows} cols {cols} '
+                      f'exposure {self.exposure_time_sec:g} temperature {round(self._temperature)}\n')
+            with open(path, 'wb') as f:
+                f.write(header.encode('utf-8'))
+                f.write(np.array(images, dtype='<i4').tobytes())
+            return DRV_SUCCESS
+
+class _SimulatedFunction():
+    """
+    A callable entry point of a simulated library, mimicking a ctypes function pointer:
+    the argtypes/restype can be assigned and the call is forwarded to the device at call time
+    (so that the device of the library can be replaced after the bindings are made).
+    """
+    def __init__(self, library:'AndorDLL_Simulator|SpectrographDLL_Simulator', name:str):
+        self.__name__ = name
+        self._library = library
+        self.argtypes = None
+        self.restype = ctypes.c_int
+
+    def __call__(self, *args):
+        if self.argtypes is not None and len(args) != len(self.argtypes):
+            raise TypeError(f'this function takes {len(self.argtypes)} arguments ({len(args)} given)')
+        device = self._library.device
+        ret = device.pop_injected_error(self.__name__)
+        if ret is not None: return ret
+        return getattr(device, self.__name__)(*args)
+
+class AndorDLL_Simulator():
+    """
+    Drop-in replacement of ctypes.cdll.LoadLibrary(<atmcd64d.dll>), see the module docstring
+    """
+    def __init__(self, device:AndorCamera_Simulator|None=None, **kwargs):
+        """
+        Args:
+            device (AndorCamera_Simulator|None): the simulated camera. Defaults to a new one
+                created with the kwargs.
+        """
+        self.device = device if device is not None else AndorCamera_Simulator(**kwargs)
+        self._dict_functions:dict[str,_SimulatedFunction] = {}
+
+    def __getattr__(self, name:str) -> _SimulatedFunction:
+        if name.startswith('_') or 'device' not in self.__dict__ or not callable(getattr(type(self.device), name, None)):
+            raise AttributeError(f"function '{name}' not found")
+        if name not in self._dict_functions:
+            self._dict_functions[name] = _SimulatedFunction(self, name)
+        return self._dict_functions[name]
+
+class Spectrograph_Simulator():
+    """
+    The state of a simulated Andor spectrograph (a single device with a single grating)
+    """
+    def __init__(self, wavelength_nm:float=850.0):
+        self.initialized = False
+        self.wavelength_nm = wavelength_nm
+
+    def pop_injected_error(self, function_name:str) -> int|None:
+        return None
+
+    def ATSpectrographInitialize(self, dirpath) -> int:
+        self.initialized = True
+        return ATSPECTROGRAPH_SUCCESS
+
+    def ATSpectrographClose(self) -> int:
+        self.initialized = False
+        return ATSPECTROGRAPH_SUCCESS
+
+    def ATSpectrographGetNumberDevices(self, num_devices) -> int:
+        if not self.initialized: return ATSPECTROGRAPH_NOT_INITIALIZED
+        _set_pointer(num_devices, 1)
+        return ATSPECTROGRAPH_SUCCESS
+
+    def ATSpectrographGetWavelength(self, device, wavelength) -> int:
+        if not self.initialized: return ATSPECTROGRAPH_NOT_INITIALIZED
+        _set_pointer(wavelength, self.wavelength_nm)
+        return ATSPECTROGRAPH_SUCCESS
+
+    def ATSpectrographSetWavelength(self, device, wavelength) -> int:
+        if not self.initialized: return ATSPECTROGRAPH_NOT_INITIALIZED
+        wavelength = _get_value(wavelength)
+        if wavelength < 0: return ATSPECTROGRAPH_P2INVALID
+        self.wavelength_nm = float(wavelength)
+        return ATSPECTROGRAPH_SUCCESS
+
+class SpectrographDLL_Simulator(AndorDLL_Simulator):
+    """
+    Drop-in replacement of ctypes.cdll.LoadLibrary(<atspectrograph.dll>)
+    """
+    def __init__(self, device:Spectrograph_Simulator|None=None, **kwargs):
+        self.device = device if device is not None else Spectrograph_Simulator(**kwargs)
+        self._dict_functions = {}
+
+def is_simulator_requested() -> bool:
+    """
+    Returns True if the Andor libraries are to be replaced by the simulator, i.e., if the
+    simulation mode is enabled in the config file or the environment variable ANDOR_DLL_SIMULATOR is '1'
+    """
+    if os.environ.get('ANDOR_DLL_SIMULATOR') == '1': return True
+    from iris.controllers import ControllerConfigEnum
+    return bool(ControllerConfigEnum.SIMULATION_MODE.value)
+
+def test_benchmark_simulator(num_frames:int=300):
+    """
+    Measures the frame rate of a RunTillAbort series of the simulated camera in FVB mode
+    """
+    dll = AndorDLL_Simulator()
+    dll.Initialize(b'')
+    dll.SetReadMode(0)
+    dll.SetAcquisitionMode(5)
+    dll.SetExposureTime(ctypes.c_float(0.001))
+    dll.StartAcquisition()
+    arr = (ctypes.c_int32 * dll.device.x_pixel)()
+    time1 = time.perf_counter()
+    for _ in range(num_frames):
+        dll.WaitForAcquisitionTimeOut(1000)
+        dll.GetMostRecentImage(arr, dll.device.x_pixel)
+    duration = time.perf_counter() - time1
+    dll.AbortAcquisition()
+    print(f'Simulated FVB: {num_frames/duration:.1f} frames/s (kinetic cycle {dll.device.get_timings_sec()[2]*1e3:.2f} ms)')
+
+if __name__ == '__main__':
+    test_benchmark_simulator()
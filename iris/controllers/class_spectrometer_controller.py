@@ -4,8 +4,11 @@ Class definition for the Raman spectrometer controller and a guide to writing on
 
 import os
 import sys
+import threading
+import numpy as np
 import pandas as pd
 from multiprocessing import Lock
+from typing import Generator
 
 if __name__ == '__main__':
     import sys
@@ -118,6 +121,42 @@ class Class_SpectrometerController():
         })
         return (spectra, timestamp, integration_time)
     
+    def measure_spectrum_batch(self, num_frames:int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        OPTIONAL: Measures a burst of spectra in one call, using the hardware kinetic series (e.g.,
+        RunTillAbort/Kinetics circular buffer) where available, which avoids the per-spectrum call and
+        DataFrame overheads of measure_spectrum(). Controllers that do not implement it raise
+        NotImplementedError and the users (e.g., DataStreamer_Raman) fall back to measure_spectrum().
+        
+        Args:
+            num_frames (int): Number of spectra to measure
+        
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, int]: A tuple containing the following:
+                - np.ndarray: (W,) wavelength array, shared by all the spectra
+                - np.ndarray: (num_frames, W) intensity array
+                - np.ndarray: (num_frames,) int64 array of the timestamps of the spectra (microseconds), increasing
+                - int: The integration time used for the measurement in microseconds.
+        """
+        # <<<<< Insert the commands to measure a series of spectra here
+        raise NotImplementedError('measure_spectrum_batch is not implemented for this spectrometer controller.')
+    
+    def iter_spectrum_batches(self, num_frames:int, event_stop:threading.Event|None=None)\
+        -> Generator[tuple[np.ndarray, np.ndarray, np.ndarray, int], None, None]:
+        """
+        Streams bursts of spectra using measure_spectrum_batch() until the stop event is set.
+        Only usable locally (generators cannot be passed through the multiprocessing proxies).
+        
+        Args:
+            num_frames (int): Number of spectra per burst
+            event_stop (threading.Event|None): Event to stop the stream. Streams indefinitely if None.
+        
+        Yields:
+            tuple[np.ndarray, np.ndarray, np.ndarray, int]: See measure_spectrum_batch()
+        """
+        while event_stop is None or not event_stop.is_set():
+            yield self.measure_spectrum_batch(num_frames)
+    
 # Set of commands for testing/automation
     def self_test(self):
         # <<<<< Insert the self-test commands here
@@ -45,6 +45,7 @@ if __name__ == '__main__':
 
 from iris.utils.general import get_timestamp_us_int, get_timestamp_us_str
 from iris.controllers.class_spectrometer_controller import Class_SpectrometerController
+from iris.controllers.andor_dll_simulator import is_simulator_requested, AndorDLL_Simulator, SpectrographDLL_Simulator
 
 from iris import DataAnalysisConfigEnum
 from iris.controllers import ControllerSpecificConfigEnum
@@ -64,34 +65,42 @@ path_dll_spectrograph = ControllerSpecificConfigEnum.ANDOR_ATSPECTROGRAPH_DLL_PA
 
 _first_dll_load = 'ANDOR_DLL_INITIALIZED' not in os.environ
 
-_seen_paths: set[str] = set()
-list_dirpath_dll: list[str] = []
-for _p in [os.path.abspath(p) for p in os.environ.get("PATH","").split(os.pathsep) if p] + [
-    os.path.abspath("."),
-    os.path.abspath(os.path.split(path_dll_andor)[0]),
-    os.path.abspath(os.path.split(path_dll_spectrograph)[0]),
-]:
-    if _p not in _seen_paths:
-        _seen_paths.add(_p)
-        list_dirpath_dll.append(_p)
-
-list_dir_dll = []
-_dll_load_errors: set[str] = set()
-for path in list_dirpath_dll:
-    try: list_dir_dll.append(os.add_dll_directory(path))
-    except Exception as e: _dll_load_errors.add(str(e))
-
-andorDLL = ctypes.cdll.LoadLibrary(path_dll_andor)
-specDLL = ctypes.cdll.LoadLibrary(path_dll_spectrograph)
-
-for dir_dll in list_dir_dll:
-    dir_dll.close()
-
-if _first_dll_load:
-    for _err in sorted(_dll_load_errors):
-        print(_err)
-    print("Andor spectrometer: DLLs loaded successfully")
-    os.environ['ANDOR_DLL_INITIALIZED'] = '1'
+if is_simulator_requested():
+    # Offline: the simulated libraries take the place of the DLLs
+    andorDLL = AndorDLL_Simulator()
+    specDLL = SpectrographDLL_Simulator()
+    if _first_dll_load:
+        print("Andor spectrometer: Simulated DLLs loaded")
+        os.environ['ANDOR_DLL_INITIALIZED'] = '1'
+else:
+    _seen_paths: set[str] = set()
+    list_dirpath_dll: list[str] = []
+    for _p in [os.path.abspath(p) for p in os.environ.get("PATH","").split(os.pathsep) if p] + [
+        os.path.abspath("."),
+        os.path.abspath(os.path.split(path_dll_andor)[0]),
+        os.path.abspath(os.path.split(path_dll_spectrograph)[0]),
+    ]:
+        if _p not in _seen_paths:
+            _seen_paths.add(_p)
+            list_dirpath_dll.append(_p)
+
+    list_dir_dll = []
+    _dll_load_errors: set[str] = set()
+    for path in list_dirpath_dll:
+        try: list_dir_dll.append(os.add_dll_directory(path))
+        except Exception as e: _dll_load_errors.add(str(e))
+
+    andorDLL = ctypes.cdll.LoadLibrary(path_dll_andor)
+    specDLL = ctypes.cdll.LoadLibrary(path_dll_spectrograph)
+
+    for dir_dll in list_dir_dll:
+        dir_dll.close()
+
+    if _first_dll_load:
+        for _err in sorted(_dll_load_errors):
+            print(_err)
+        print("Andor spectrometer: DLLs loaded successfully")
+        os.environ['ANDOR_DLL_INITIALIZED'] = '1'
 
 #%% Andor structures
 class AndorCapabilities(ctypes.Structure):
@@ -283,10 +292,29 @@ SetNumberAccumulations = andorDLL.SetNumberAccumulations
 SetNumberAccumulations.argtypes = [ctypes.c_int] # [number of accumulations]
 SetNumberAccumulations.restype = ctypes.c_uint # DRV_SUCCESS: Number of accumulations set., DRV_NOT_INITIALIZED: System not initialized., DRV_ACQUIRING: Acquisition in progress., DRV_P1INVALID: Invalid number of accumulations.
 
+SetNumberKinetics = andorDLL.SetNumberKinetics
+SetNumberKinetics.argtypes = [ctypes.c_int] # [number of scans in the kinetic series]
+SetNumberKinetics.restype = ctypes.c_uint # DRV_SUCCESS: Series length set., DRV_NOT_INITIALIZED: System not initialized., DRV_ACQUIRING: Acquisition in progress., DRV_P1INVALID: Number in series invalid.
+
 GetMostRecentImage = andorDLL.GetMostRecentImage
 GetMostRecentImage.argtypes = [ctypes.POINTER(ctypes.c_long),ctypes.c_ulong] # [array to store the image, sized to the sensor, number of pixels]
 GetMostRecentImage.restype = ctypes.c_uint # DRV_SUCCESS: Image has been copied into array., DRV_NOT_INITIALIZED: System not initialized., DRV_ERROR_ACK: Unable to communicate with card., DRV_P1INVALID: Invalid pointer (i.e. NULL)., DRV_P2INVALID: Array size is incorrect., DRV_NO_NEW_DATA: There is no new data yet.
 
+# unsigned int WINAPI GetTotalNumberImagesAcquired(long* index)
+GetTotalNumberImagesAcquired = andorDLL.GetTotalNumberImagesAcquired
+GetTotalNumberImagesAcquired.argtypes = [ctypes.POINTER(ctypes.c_long)] # [total number of images acquired since the start of the acquisition]
+GetTotalNumberImagesAcquired.restype = ctypes.c_uint # DRV_SUCCESS: Number of acquired images returned., DRV_NOT_INITIALIZED: System not initialized.
+
+# unsigned int WINAPI GetNumberNewImages(long* first, long* last)
+GetNumberNewImages = andorDLL.GetNumberNewImages
+GetNumberNewImages.argtypes = [ctypes.POINTER(ctypes.c_long),ctypes.POINTER(ctypes.c_long)] # [index of the first and last available images not yet retrieved from the circular buffer]
+GetNumberNewImages.restype = ctypes.c_uint # DRV_SUCCESS: Image numbers returned., DRV_NOT_INITIALIZED: System not initialized., DRV_ERROR_ACK: Unable to communicate with card., DRV_NO_NEW_DATA: There is no new data yet.
+
+# unsigned int WINAPI GetImages(long first, long last, at_32* arr, unsigned long size, long* validfirst, long* validlast)
+GetImages = andorDLL.GetImages
+GetImages.argtypes = [ctypes.c_long,ctypes.c_long,ctypes.POINTER(ctypes.c_int32),ctypes.c_ulong,ctypes.POINTER(ctypes.c_long),ctypes.POINTER(ctypes.c_long)] # [first image, last image, array to store the images, total number of pixels, first and last valid images copied]
+GetImages.restype = ctypes.c_uint # DRV_SUCCESS: Images have been copied into array., DRV_NOT_INITIALIZED: System not initialized., DRV_ERROR_ACK: Unable to communicate with card., DRV_GENERAL_ERRORS: The series is out of range., DRV_P3INVALID: Invalid pointer (i.e. NULL)., DRV_P4INVALID: Array size is incorrect., DRV_NO_NEW_DATA: There is no new data yet.
+
 # unsigned int WINAPI GetAcquiredData(at_32* arr, unsigned long size)
 GetAcquiredData = andorDLL.GetAcquiredData
 GetAcquiredData.argtypes = [ctypes.POINTER(ctypes.c_int32),ctypes.c_ulong] # [array to store the data, sized to the sensor, number of pixels]
@@ -894,6 +922,17 @@ def setNumberAccumulations(num_accum:int) -> None:
     ret = SetNumberAccumulations(ctypes.c_int(int(num_accum)))
     msg = read_return_message(ret)
     if msg: raise RuntimeError(f"Failed to set number of accumulations: {msg}")
+
+def setNumberKinetics(num_kinetics:int) -> None:
+    """
+    Set the number of scans of a kinetic series ('3. Kinetics' acquisition mode).
+    
+    Args:
+        num_kinetics (int): The number of scans in the series.
+    """
+    ret = SetNumberKinetics(ctypes.c_int(int(num_kinetics)))
+    msg = read_return_message(ret)
+    if msg: raise RuntimeError(f"Failed to set number of kinetics: {msg}")
     
 def getMostRecentImage(xpixel:int, ypixel:int, total_pixels:int) -> np.ndarray:
     """
@@ -924,6 +963,70 @@ def getMostRecentImage(xpixel:int, ypixel:int, total_pixels:int) -> np.ndarray:
     elif ret == ErrorCodes.DRV_NO_NEW_DATA.value: raise BufferError("There is no new data yet")
     return np.ctypeslib.as_array(image_array).reshape((ypixel, xpixel))
 
+def getTotalNumberImagesAcquired() -> int:
+    """
+    Get the total number of images acquired since the start of the current acquisition.
+    
+    Returns:
+        int: The total number of images acquired
+    """
+    index = ctypes.c_long()
+    ret = GetTotalNumberImagesAcquired(ctypes.byref(index))
+    msg = read_return_message(ret)
+    if msg: raise RuntimeError(f"Failed to get the total number of images acquired: {msg}")
+    return index.value
+
+def getNumberNewImages() -> tuple[int,int]|None:
+    """
+    Get the range of the images in the circular buffer that have not yet been retrieved.
+    
+    Returns:
+        tuple[int,int]|None: The (1-based) index of the first and last new images, or None if there is no new data yet
+    """
+    first = ctypes.c_long()
+    last = ctypes.c_long()
+    ret = GetNumberNewImages(ctypes.byref(first), ctypes.byref(last))
+    if ret == ErrorCodes.DRV_NO_NEW_DATA.value: return None
+    msg = read_return_message(ret)
+    if msg: raise RuntimeError(f"Failed to get the number of new images: {msg}")
+    return first.value, last.value
+
+def getImages(first:int, last:int, pixels_per_image:int) -> tuple[np.ndarray,int,int]:
+    """
+    Get a series of images from the circular buffer. The retrieved images are no longer counted as new.
+    
+    Args:
+        first (int): The index of the first image to retrieve
+        last (int): The index of the last image to retrieve
+        pixels_per_image (int): The number of pixels of each image
+    
+    Raises:
+        RuntimeError("Library is not initialised")
+        RuntimeError("Unable to communicate with card")
+        IndexError("The series is out of range")
+        ValueError("Array size is incorrect.")
+        BufferError("There is no new data yet")
+    
+    Returns:
+        tuple[np.ndarray,int,int]: The (num_images, pixels_per_image) images, and the index of the first and last valid images
+    """
+    num_images = last - first + 1
+    total_pixels = num_images * pixels_per_image
+    data_array = (ctypes.c_int32 * total_pixels)()
+    validfirst = ctypes.c_long()
+    validlast = ctypes.c_long()
+    ret = GetImages(ctypes.c_long(first), ctypes.c_long(last), data_array, ctypes.c_ulong(total_pixels),
+                    ctypes.byref(validfirst), ctypes.byref(validlast))
+    if ret == ErrorCodes.DRV_NOT_INITIALIZED.value: raise RuntimeError("Library is not initialised")
+    elif ret == ErrorCodes.DRV_ERROR_ACK.value: raise RuntimeError("Unable to communicate with card")
+    elif ret == ErrorCodes.DRV_GENERAL_ERRORS.value: raise IndexError("The series is out of range")
+    elif ret == ErrorCodes.DRV_P4INVALID.value: raise ValueError("Array size is incorrect.")
+    elif ret == ErrorCodes.DRV_NO_NEW_DATA.value: raise BufferError("There is no new data yet")
+    elif read_return_message(ret): raise RuntimeError(f"Failed to get images: {read_return_message(ret)}")
+    num_valid = validlast.value - validfirst.value + 1
+    images = np.ctypeslib.as_array(data_array).reshape((num_images, pixels_per_image))[:num_valid]
+    return images, validfirst.value, validlast.value
+
 def getAcquiredData(total_pixels:int) -> np.ndarray:
     """
     Get the acquired data from the instrument.
@@ -1290,6 +1393,62 @@ class SpectrometerController_Andor(Class_SpectrometerController):
         })
         return (spectra, timestamp, self._integration_time_us)
     
+    def measure_spectrum_batch(self, num_frames:int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Measure a burst of spectra from the RunTillAbort circular buffer.
+
+        Only the frames acquired after the call are returned (the frames left in the buffer by
+        measure_spectrum(), which uses GetMostRecentImage, are skipped). Each wait retrieves all
+        the new frames at once with GetImages. The SDK does not report per-frame timestamps, so
+        they are reconstructed from the retrieval time and the kinetic cycle time.
+
+        Args:
+            num_frames (int): Number of spectra to measure
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+                - (W,) wavelength array (pixel index, to be calibrated)
+                - (num_frames, W) intensity array
+                - (num_frames,) timestamps of the measurements in microseconds
+                - Integration time used in microseconds
+        """
+        assert isinstance(num_frames, int) and num_frames > 0, 'measure_spectrum_batch: The number of frames must be a positive integer.'
+        intensities = np.empty((num_frames, self._x_pixel), dtype=np.float64)
+        timestamps = np.empty(num_frames, dtype=np.int64)
+        
+        with self._lock:
+            cycle_us = self._theoretical_wait_time_sec * 1e6
+            timeout_ms = max(500, int(self._theoretical_wait_time_sec * 1e3 * 1.5))
+            idx_next = getTotalNumberImagesAcquired() + 1   # First frame acquired after this call
+            num_collected = 0
+            while num_collected < num_frames:
+                new_images = getNumberNewImages()
+                if new_images is None or new_images[1] < idx_next:
+                    if not waitForAcquisitionTimeOut(timeout_ms):
+                        raise TimeoutError(
+                            f"No new frame arrived within {timeout_ms} ms "
+                            f"(kinetic cycle = {self._theoretical_wait_time_sec*1e3:.1f} ms)"
+                        )
+                    continue
+                
+                first = max(new_images[0], idx_next)
+                last = min(new_images[1], first + (num_frames - num_collected) - 1)
+                ts_retrieval = get_timestamp_us_int()
+                images, validfirst, validlast = getImages(first, last, self._x_pixel)
+                num_valid = images.shape[0]
+                
+                # The last frame in the buffer finished just before the retrieval; the timestamp
+                # marks the start of each frame's cycle, as in measure_spectrum()
+                idx_frames = np.arange(validfirst, validlast + 1)
+                intensities[num_collected:num_collected+num_valid] = images
+                timestamps[num_collected:num_collected+num_valid] =\
+                    ts_retrieval - ((new_images[1] - idx_frames + 1) * cycle_us).astype(np.int64)
+                num_collected += num_valid
+                idx_next = validlast + 1
+
+        wavelength = np.arange(1, self._x_pixel + 1, dtype=float)
+        return (wavelength, intensities, timestamps, self._integration_time_us)
+    
     def _test_save_last_measurement_as_sif(self, path: str) -> None:
         """
         Test function to save the last measurement as a .sif file.
@@ -34,6 +34,8 @@ if __name__ == '__main__':
 
 from iris.utils.general import get_timestamp_us_int, get_timestamp_us_str
 from iris.controllers.class_spectrometer_controller import Class_SpectrometerController
+from iris.controllers.andor_dll_simulator import is_simulator_requested, AndorDLL_Simulator, SpectrographDLL_Simulator
+from iris.data.frame_extraction import Frame_Extractor, parse_track_definitions
 
 from iris import DataAnalysisConfigEnum
 from iris.controllers import ControllerSpecificConfigEnum
@@ -43,23 +45,29 @@ from iris.controllers import ControllerSpecificConfigEnum
 path_dll_andor = ControllerSpecificConfigEnum.ANDOR_ATMCD64D_DLL_PATH.value
 path_dll_spectrograph = ControllerSpecificConfigEnum.ANDOR_ATSPECTROGRAPH_DLL_PATH.value
 
-list_dirpath_dll = [os.path.abspath(p) for p in os.environ.get("PATH","").split(os.pathsep) if p]
-list_dirpath_dll.append(os.path.abspath("."))
-list_dirpath_dll.append(os.path.abspath(os.path.split(path_dll_andor)[0]))
-list_dirpath_dll.append(os.path.abspath(os.path.split(path_dll_spectrograph)[0]))
-list_dir_dll = []
+if is_simulator_requested():
+    # Offline: the simulated libraries take the place of the DLLs
+    andorDLL = AndorDLL_Simulator()
+    specDLL = SpectrographDLL_Simulator()
+    print("Andor spectrometer: Simulated DLLs loaded")
+else:
+    list_dirpath_dll = [os.path.abspath(p) for p in os.environ.get("PATH","").split(os.pathsep) if p]
+    list_dirpath_dll.append(os.path.abspath("."))
+    list_dirpath_dll.append(os.path.abspath(os.path.split(path_dll_andor)[0]))
+    list_dirpath_dll.append(os.path.abspath(os.path.split(path_dll_spectrograph)[0]))
+    list_dir_dll = []
 
-for path in list_dirpath_dll:
-    try: list_dir_dll.append(os.add_dll_directory(path))
-    except Exception as e: print(e)
+    for path in list_dirpath_dll:
+        try: list_dir_dll.append(os.add_dll_directory(path))
+        except Exception as e: print(e)
 
-andorDLL = ctypes.cdll.LoadLibrary(path_dll_andor)
-specDLL = ctypes.cdll.LoadLibrary(path_dll_spectrograph)
+    andorDLL = ctypes.cdll.LoadLibrary(path_dll_andor)
+    specDLL = ctypes.cdll.LoadLibrary(path_dll_spectrograph)
 
-for dir_dll in list_dir_dll:
-    dir_dll.close()
+    for dir_dll in list_dir_dll:
+        dir_dll.close()
 
-print("Andor spectrometer: DLLs loaded successfully")
+    print("Andor spectrometer: DLLs loaded successfully")
 
 #%% Andor structures
 class AndorCapabilities(ctypes.Structure):
@@ -1024,6 +1032,8 @@ class SpectrometerController_Andor(Class_SpectrometerController):
         self._flg_isacquiring = threading.Event()
         self._integration_time_us:int = 0
         self._theoretical_wait_time_sec:float = 0.0
+        self._frame_extractor:Frame_Extractor|None = None   # Multi-track extraction, None for the full column sum
+        self._set_track_extraction()
         
         # Initialise the device for acquisition
         self._identifier = None
@@ -1137,6 +1147,18 @@ class SpectrometerController_Andor(Class_SpectrometerController):
 
         print(f"Binning parameters: xstart={xstart}, xend={xend}, xbin={xbin}, ystart={ystart}, yend={yend}, ybin={ybin}")
         
+    def _set_track_extraction(self):
+        """
+        Sets the extraction of the tracks from the images according to the user-defined
+        track definitions in the config.ini file (rows of the ROI image)
+        """
+        text_tracks = str(ControllerSpecificConfigEnum.ANDOR_TRACK_DEFINITIONS.value).strip()
+        if text_tracks == '': return
+        
+        tracks = parse_track_definitions(text_tracks)
+        self.set_frame_extractor(Frame_Extractor(tracks, (self._y_pixel, self._x_pixel)))
+        print(f"Track extraction: {', '.join(track.name for track in tracks)}")
+        
     def _start_acquisition(self):
         with self._lock:
             startAcquisition()
@@ -1188,6 +1210,19 @@ class SpectrometerController_Andor(Class_SpectrometerController):
         self._integration_time_us = self.get_integration_time_us()
         return self._integration_time_us
     
+    def set_frame_extractor(self, extractor:Frame_Extractor|None) -> None:
+        """
+        Sets the extractor of the tracks from the acquired images. With an extractor, the spectra
+        contain the primary track as the intensity and the other tracks as extra columns.
+        
+        Args:
+            extractor (Frame_Extractor|None): The extractor, matching the (rows, cols) of the images,
+                or None to sum all the rows into a single spectrum
+        """
+        assert extractor is None or isinstance(extractor, Frame_Extractor), 'set_frame_extractor: Invalid extractor.'
+        with self._lock:
+            self._frame_extractor = extractor
+    
     def measure_spectrum(self) -> tuple[pd.DataFrame, int, int]:
         """ 
         A function to measure the spectrum of the Raman spectrometer.
@@ -1204,6 +1239,12 @@ class SpectrometerController_Andor(Class_SpectrometerController):
             sendSoftwareTrigger()
             waitForAcquisitionTimeOut(int(self._theoretical_wait_time_sec * 1e3 * 1.5))
             intensity = getMostRecentImage(self._x_pixel,self._y_pixel,self._total_pixel)
+            extractor = self._frame_extractor
+        
+        if extractor is not None:
+            wavelength = np.arange(1,extractor.get_num_columns()+1, dtype=float)
+            spectra = extractor.to_dataframe(wavelength, extractor.extract(intensity))
+            return (spectra, timestamp, self._integration_time_us)
         
         intensity = np.sum(intensity, axis=0).reshape(-1).tolist()
         wavelength = np.arange(1,self._x_pixel+1).tolist()
@@ -1217,6 +1258,42 @@ class SpectrometerController_Andor(Class_SpectrometerController):
         })
         return (spectra, timestamp, self._integration_time_us)
     
+    def measure_spectrum_batch(self, num_frames:int) -> tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        Measures a burst of spectra. The frames are software-triggered one at a time (this read mode
+        has no free-running series), but the burst holds the lock once and collapses all the images
+        into spectra in a single vectorised step instead of building one DataFrame per frame.
+        
+        Note:
+            The bursts only carry a single spectrum per frame. With a track extractor set, this raises
+            NotImplementedError so that the users fall back to measure_spectrum(), which keeps the tracks.
+        
+        Args:
+            num_frames (int): Number of spectra to measure
+        
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray, int]: The wavelength (W,), intensities (num_frames, W),
+                timestamps (num_frames,) [us] and integration time [us]
+        
+        Raises:
+            NotImplementedError: If a track extractor is set
+        """
+        assert isinstance(num_frames, int) and num_frames > 0, 'measure_spectrum_batch: The number of frames must be a positive integer.'
+        if self._frame_extractor is not None:
+            raise NotImplementedError('measure_spectrum_batch: The multi-track extraction requires measure_spectrum().')
+        images = np.empty((num_frames, self._y_pixel, self._x_pixel), dtype=np.float64)
+        timestamps = np.empty(num_frames, dtype=np.int64)
+        with self._lock:
+            for i in range(num_frames):
+                timestamps[i] = get_timestamp_us_int()
+                sendSoftwareTrigger()
+                waitForAcquisitionTimeOut(int(self._theoretical_wait_time_sec * 1e3 * 1.5))
+                images[i] = getMostRecentImage(self._x_pixel,self._y_pixel,self._total_pixel)
+        
+        intensities = images.sum(axis=1)
+        wavelength = np.arange(1,self._x_pixel+1, dtype=float)
+        return (wavelength, intensities, timestamps, self._integration_time_us)
+    
     def _test_save_last_measurement_as_sif(self, path: str) -> None:
         """
         Test function to save the last measurement as a .sif file.
@@ -44,6 +44,7 @@ class SpectrometerController_Dummy(Class_SpectrometerController):
         self.integration_time_min = 10*1e3      # int: Stores the spectrometer's minimum allowable integration time [microsec]
         self.integration_time_max = 10000*1e3   # int: Stores the spectrometer's maximum allowable integration time [microsec]
         self.integration_time_inc = 25*1e3      # int: Stores the spectrometer's allowable integration time increment [microsec]
+        self._ts_last_batch_us = 0              # int: Timestamp of the last frame of the last burst [microsec]
         
         # Calibration related parameters
         self.bg_acq_num = 10    # Number of aquisition for the background removal
@@ -140,6 +141,40 @@ class SpectrometerController_Dummy(Class_SpectrometerController):
         
     #     return spectra
     
+    def measure_spectrum_batch(self, num_frames:int) -> tuple[np.ndarray,np.ndarray,np.ndarray,int]:
+        """
+        Performs a burst of spectrum measurements, emulating a hardware kinetic series: the frames are
+        generated in one vectorised step and spaced by the integration time.
+        
+        Args:
+            num_frames (int): Number of spectra to measure
+        
+        Returns:
+            tuple[np.ndarray,np.ndarray,np.ndarray,int]: The wavelength (W,), intensities (num_frames, W),
+                timestamps (num_frames,) [us] and integration time [us]
+        """
+        assert isinstance(num_frames, int) and num_frames > 0, 'measure_spectrum_batch: The number of frames must be a positive integer.'
+        time1_sec = get_timestamp_us_int()/1e6
+        
+        wavelength = np.linspace(800, 2000, 1000)
+        list_A = np.array([0.7,0.4,0.55,1.0,0.5])
+        list_x0 = np.array([800, 950, 1200, 1600, 1800])
+        list_sigma = np.array([10, 20, 30, 40, 50])
+        spectrum = (list_A[:,None] * np.exp(-0.5 * ((wavelength[None,:] - list_x0[:,None]) / list_sigma[:,None]) ** 2)).sum(axis=0) * 100
+        intensities = spectrum[None,:] + np.random.uniform(-5, 5, (num_frames, len(wavelength)))
+        
+        ts_start = max(int(time1_sec*1e6), self._ts_last_batch_us + 1)
+        timestamps = ts_start + np.arange(num_frames, dtype=np.int64) * max(int(self.integration_time_us), 1)
+        self._ts_last_batch_us = int(timestamps[-1])
+        
+        # Sleep for the remaining time of the series
+        integration_time_sec = self.integration_time_us/1e6
+        time2_sec = get_timestamp_us_int()/1e6
+        if (time2_sec-time1_sec) < integration_time_sec*num_frames:
+            time.sleep(integration_time_sec*num_frames - (time2_sec-time1_sec))
+        
+        return (wavelength, intensities, timestamps, self.integration_time_us)
+    
     def measure_spectrum(self) -> tuple[pd.DataFrame,int,int]:
         """
         Performs a single spectrum measurement using the spectrometer
@@ -108,7 +108,7 @@ class ZController_Dummy(Class_ZController):
                 self._coor_mm -= self._motor_step_mm
             
             error = abs(self._coor_mm - target)
-            if error < 0.02:
+            if error < self._motor_step_mm/2:
                 break
             time.sleep(self._motor_step_wait_s/(self._vel/100))
             
@@ -1,7 +1,10 @@
 from enum import Enum
 import os
+from dataclasses import dataclass
+from typing import ClassVar
 
 from iris.utils.general import read_update_config_file_section
+from iris.utils.config_schema import Class_ConfigSection, config_field, config_registry
 
 dict_save_params_default = {
     'database_id_key': "unit_id",   # Key for the measurement ID in the database
@@ -53,6 +56,10 @@ class SaveParamsEnum(Enum):
     SAVE_OPTIONS_CSV = 'csv'
     SAVE_OPTIONS_PARQUET = 'parquet'
     SAVE_OPTIONS_FEATHER = 'feather'
+    SAVE_OPTIONS_NPYCHUNKS = 'npyc'    # Directory of fixed-size .npy chunks (see MeaRMap_Handler.save_MappingUnit_chunked)
+    SAVE_OPTIONS_IMG_PNG = 'png'
+    SAVE_OPTIONS_IMG_WEBP = 'webp'  # Lossless WebP
+    SAVE_OPTIONS_IMG_NPY = 'npy'    # Raw numpy array
     SAVE_OPTIONS_DEFAULT = dict_save_params_read['default_save_ext']
     AUTOSAVE_INTERVAL_HOURS = dict_save_params_read['autosave_interval_hours']
     AUTOSAVE_ENABLED = AUTOSAVE_INTERVAL_HOURS > 0
@@ -62,6 +69,23 @@ class SaveParamsEnum(Enum):
     if not os.path.exists(AUTOSAVE_DIRPATH_MEA): os.makedirs(AUTOSAVE_DIRPATH_MEA)
     if not os.path.exists(AUTOSAVE_DIRPATH_COOR): os.makedirs(AUTOSAVE_DIRPATH_COOR)
     
+@dataclass(frozen=True)
+class ImgUnitSave_Config(Class_ConfigSection):
+    """
+    Typed parameters of the ImageMeasurementUnit saves (see MeaImg_Handler), read from config_registry
+    when a handler is created: a reload applies to the handlers created after it
+    """
+    SECTION: ClassVar[str] = 'SAVE PARAMETERS - IMAGE UNIT'
+    imgunit_image_codec: str = config_field('png', 'Image file format of the ImageMeasurementUnit saves, "webp" is lossless',
+                                            choices=(SaveParamsEnum.SAVE_OPTIONS_IMG_PNG.value, SaveParamsEnum.SAVE_OPTIONS_IMG_WEBP.value,
+                                                     SaveParamsEnum.SAVE_OPTIONS_IMG_NPY.value), reloadable=True)
+    imgunit_png_compression: int = config_field(6, 'PNG compression level of the ImageMeasurementUnit saves, lower is faster and larger',
+                                                min_value=0, max_value=9, reloadable=True)
+    imgunit_save_workers: int = config_field(0, 'Number of threads encoding the images of the ImageMeasurementUnit saves. '
+                                             'If set to 0, the number of CPUs is used', min_value=0, max_value=256, reloadable=True)
+
+config_registry.register(ImgUnitSave_Config)
+
 dict_image_processing_params = {
     'low_resolution_scale': 0.1,  # Scale for low resolution images to be used for the displays (the full resolution images will always be saved)
 }
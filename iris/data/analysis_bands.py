@@ -0,0 +1,258 @@
+"""
+Band integration and ratio channels of mapping measurements.
+
+For each band, defined as a Raman-shift window, a linear local baseline is drawn between the
+spectrum values at the window edges and subtracted. The band area (trapezoidal), centroid and
+peak maximum position are then computed for every measurement in one vectorised pass over the
+map, together with the area ratios between bands. The results are stored in the MeaRMap_Unit as
+row-wise derived heatmap channels, and only computed for the new measurements as they are appended.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.analysis_decomposition import iter_spectra_batches, DEFAULT_BATCH_SIZE
+
+
+@dataclass(frozen=True)
+class Band_Window:
+    lower: float            # Lower bound of the Raman-shift window [cm^-1]
+    upper: float            # Upper bound of the Raman-shift window [cm^-1]
+    name: str|None = None   # Name of the band, defaults to the window, e.g., '1570-1610cm⁻¹'
+
+    def __post_init__(self):
+        assert self.lower < self.upper, 'Band_Window: The lower bound must be smaller than the upper bound.'
+
+    def get_label(self) -> str:
+        return self.name if self.name else f'{self.lower:g}-{self.upper:g}cm⁻¹'
+
+@dataclass(frozen=True)
+class Band_Ratio:
+    numerator: str      # Label of the numerator band
+    denominator: str    # Label of the denominator band
+
+    def get_label(self) -> str:
+        return f'{self.numerator}/{self.denominator} ratio'
+
+BAND_CHANNELS = ('area', 'centroid', 'peak position')
+
+def get_band_channel_names(bands:list[Band_Window], ratios:list[Band_Ratio]|None=None) -> list[str]:
+    """
+    Returns the derived channel names of the bands and ratios, e.g., 'G area', 'G centroid',
+    'G peak position', 'D/G ratio'
+    """
+    list_names = [f'{band.get_label()} {channel}' for band in bands for channel in BAND_CHANNELS]
+    if ratios: list_names += [ratio.get_label() for ratio in ratios]
+    return list_names
+
+def parse_band_definitions(text:str) -> tuple[list[Band_Window],list[Band_Ratio]]:
+    """
+    Parses the band and ratio definitions from a comma-separated text, where the bands are given as
+    '[name:]lower-upper' and the ratios as 'numerator/denominator', e.g., 'D:1330-1370, G:1570-1610, D/G'
+
+    Args:
+        text (str): the definitions
+
+    Returns:
+        tuple: list of Band_Window and list of Band_Ratio
+
+    Raises:
+        ValueError: If a definition cannot be parsed or a ratio refers to an unknown band
+    """
+    bands:list[Band_Window] = []
+    ratios:list[Band_Ratio] = []
+    for token in [tok.strip() for tok in text.split(',') if tok.strip() != '']:
+        if '/' in token:
+            numerator, denominator = [part.strip() for part in token.split('/', 1)]
+            ratios.append(Band_Ratio(numerator, denominator))
+            continue
+        name, _, window = token.rpartition(':')
+        try:
+            # Split on the '-' separating the bounds (not a sign)
+            idx = window.index('-', 1)
+            lower, upper = float(window[:idx]), float(window[idx+1:])
+        except ValueError:
+            raise ValueError(f'parse_band_definitions: Invalid band definition: {token}')
+        if lower >= upper: raise ValueError(f'parse_band_definitions: The lower bound must be smaller than the upper bound: {token}')
+        bands.append(Band_Window(lower, upper, name.strip() or None))
+
+    labels = [band.get_label() for band in bands]
+    for ratio in ratios:
+        if ratio.numerator not in labels or ratio.denominator not in labels:
+            raise ValueError(f'parse_band_definitions: The ratio refers to an unknown band: {ratio.get_label()}')
+    return bands, ratios
+
+def _band_batch(x:np.ndarray, batch:np.ndarray) -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """Returns the (n,) area, centroid and peak position of a band over the (m,) axis x and the (n, m) intensities"""
+    # Linear baseline between the window edges
+    baseline = batch[:, :1] + (batch[:, -1:] - batch[:, :1]) * ((x - x[0]) / (x[-1] - x[0]))
+    y = batch - baseline
+
+    dx = np.diff(x)
+    area = ((y[:, 1:] + y[:, :-1]) * dx).sum(axis=1) / 2
+    xy = y * x
+    moment = ((xy[:, 1:] + xy[:, :-1]) * dx).sum(axis=1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroid = np.where(area != 0, moment / area, np.nan)
+
+    # Peak position refined by the vertex of the parabola through the maximum and its neighbours
+    idx = np.argmax(y, axis=1)
+    peak = x[idx].astype(np.float64)
+    if len(x) >= 3:
+        idx_c = np.clip(idx, 1, len(x) - 2)
+        rows = np.arange(len(y))
+        x0, x1, x2 = x[idx_c-1], x[idx_c], x[idx_c+1]
+        y0, y1, y2 = y[rows, idx_c-1], y[rows, idx_c], y[rows, idx_c+1]
+        denom = (x0-x1)*(x0-x2)*(x1-x2)
+        a = (x2*(y1-y0) + x1*(y0-y2) + x0*(y2-y1)) / denom
+        b = (x2*x2*(y0-y1) + x1*x1*(y2-y0) + x0*x0*(y1-y2)) / denom
+        interior = (idx == idx_c) & (a < 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vertex = -b / (2*a)
+        peak = np.where(interior & (vertex >= x0) & (vertex <= x2), vertex, peak)
+    return area, centroid, peak
+
+def compute_band_channels(source:MeaRMap_Unit|np.ndarray, bands:list[Band_Window], ratios:list[Band_Ratio]|None=None,
+                          axis_ramanshift:np.ndarray|None=None, batch_size:int=DEFAULT_BATCH_SIZE,
+                          callback_progress:Callable[[int,int],None]|None=None, start:int=0) -> dict[str,np.ndarray]:
+    """
+    Computes the band area, centroid and peak position of every band, and the area ratios, for all
+    the spectra in a single pass over the batches
+
+    Args:
+        source (MeaRMap_Unit|np.ndarray): mapping unit or (N, W) array of spectra (np.memmap supported)
+        bands (list[Band_Window]): the bands
+        ratios (list[Band_Ratio]|None): the area ratios between bands. Defaults to None.
+        axis_ramanshift (np.ndarray|None): (W,) Raman-shift axis of the spectra. Required for an array
+            source, taken from the unit otherwise.
+        batch_size (int): number of spectra per batch. Defaults to DEFAULT_BATCH_SIZE.
+        callback_progress (Callable[[int,int],None]|None): called with (num_processed, num_total)
+            after each batch. Defaults to None.
+        start (int): index of the first spectrum, e.g., to compute the channels of the measurements
+            appended to a unit only. Defaults to 0.
+
+    Returns:
+        dict[str,np.ndarray]: (N-start,) values per channel name, see get_band_channel_names(). For a unit,
+            N is the number of measurements when the iteration starts.
+            The centroid is NaN where the band area is 0, the ratio where the denominator area is 0.
+    """
+    assert len(bands) > 0 and all(isinstance(band, Band_Window) for band in bands),\
+        'compute_band_channels: The bands must be a non-empty list of Band_Window.'
+    ratios = ratios if ratios is not None else []
+    if isinstance(source, MeaRMap_Unit):
+        assert source.get_numMeasurements() > 0, 'compute_band_channels: The mapping unit has no measurements.'
+        axis_ramanshift = np.array(source.get_list_Raman_shift())
+        num_mea = source.get_numMeasurements()
+    else:
+        assert axis_ramanshift is not None, 'compute_band_channels: The Raman-shift axis is required for an array source.'
+        num_mea = source.shape[0]
+    axis_ramanshift = np.asarray(axis_ramanshift, dtype=np.float64)
+    order = np.argsort(axis_ramanshift)
+    axis_sorted = axis_ramanshift[order]
+
+    list_idx = []
+    for band in bands:
+        idx = order[(axis_sorted >= band.lower) & (axis_sorted <= band.upper)]
+        assert len(idx) >= 2, f'compute_band_channels: The band window contains less than 2 spectral points: {band.get_label()}'
+        list_idx.append(idx)
+    labels = [band.get_label() for band in bands]
+    assert len(set(labels)) == len(labels), 'compute_band_channels: The band labels must be unique.'
+    for ratio in ratios:
+        assert ratio.numerator in labels and ratio.denominator in labels,\
+            f'compute_band_channels: The ratio refers to an unknown band: {ratio.get_label()}'
+
+    # The batches are collected rather than written into preallocated arrays: measurements may
+    # be appended to a unit between the size query and the start of the iteration
+    dict_batches:dict[str,list[np.ndarray]] = {name: [] for name in get_band_channel_names(bands)}
+    num_done = 0
+    for batch in iter_spectra_batches(source, batch_size, start=start):
+        for band, idx in zip(bands, list_idx):
+            for channel, values in zip(BAND_CHANNELS, _band_batch(axis_ramanshift[idx], batch[:, idx])):
+                dict_batches[f'{band.get_label()} {channel}'].append(values)
+        num_done += batch.shape[0]
+        if callback_progress is not None: callback_progress(num_done, max(num_mea - start, num_done))
+    dict_channels = {name: np.concatenate(list_values) if list_values else np.empty(0, dtype=np.float64)
+                     for name, list_values in dict_batches.items()}
+
+    for ratio in ratios:
+        numerator = dict_channels[f'{ratio.numerator} area']
+        denominator = dict_channels[f'{ratio.denominator} area']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dict_channels[ratio.get_label()] = np.where(denominator != 0, numerator / denominator, np.nan)
+    return dict_channels
+
+class BandChannels_Calculator():
+    """
+    Computes the band channels of mapping units and stores them as row-wise derived heatmap
+    channels. The channels are computed once per definition, then only for the measurements
+    appended since (the unit extends row-wise channels with NaN on appends, and clears them when
+    its measurement data otherwise changes).
+    """
+    def __init__(self, batch_size:int=DEFAULT_BATCH_SIZE):
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._dict_definitions:dict[str,tuple[tuple,int]] = {}  # Unit ID: ((bands, ratios), number of measurements computed)
+        self.num_computations = 0   # Number of times the channels were computed over the whole unit
+        self.num_row_updates = 0    # Number of times the channels were computed for the appended measurements only
+
+    def check_uptodate(self, mappingUnit:MeaRMap_Unit, bands:list[Band_Window], ratios:list[Band_Ratio]|None=None) -> bool:
+        """
+        Returns True if the unit holds the band channels of the definitions for all its measurements
+        """
+        definition = (tuple(bands), tuple(ratios) if ratios else tuple())
+        cached = self._dict_definitions.get(mappingUnit.get_unit_id())
+        list_existing = mappingUnit.get_list_derived_channels()
+        return cached is not None and cached[0] == definition and cached[1] == mappingUnit.get_numMeasurements()\
+            and all(name in list_existing for name in get_band_channel_names(bands, ratios))
+
+    def update_unit(self, mappingUnit:MeaRMap_Unit, bands:list[Band_Window], ratios:list[Band_Ratio]|None=None,
+                    force:bool=False) -> list[str]:
+        """
+        Computes the band channels of the unit if they are not cached, or only for the measurements
+        appended since they were computed, and stores them in the unit
+
+        Args:
+            mappingUnit (MeaRMap_Unit): the mapping unit
+            bands (list[Band_Window]): the bands
+            ratios (list[Band_Ratio]|None): the area ratios between bands. Defaults to None.
+            force (bool): recompute over the whole unit even if the channels are cached. Defaults to False.
+
+        Returns:
+            list[str]: the names of the band channels
+        """
+        assert isinstance(mappingUnit, MeaRMap_Unit), 'update_unit: The mapping unit must be a MeaRMap_Unit.'
+        definition = (tuple(bands), tuple(ratios) if ratios else tuple())
+        list_names = get_band_channel_names(bands, ratios)
+        unit_id = mappingUnit.get_unit_id()
+
+        with self._lock:
+            list_existing = mappingUnit.get_list_derived_channels()
+            cached = self._dict_definitions.get(unit_id)
+            flg_cached = not force and cached is not None and cached[0] == definition\
+                and all(name in list_existing for name in list_names)
+            if flg_cached and cached[1] == mappingUnit.get_numMeasurements(): return list_names
+
+            # Appended measurements only. The unit refuses the rows if its channels were cleared meanwhile.
+            if flg_cached and cached[1] < mappingUnit.get_numMeasurements():
+                dict_channels = compute_band_channels(mappingUnit, bands, ratios, batch_size=self._batch_size, start=cached[1])
+                if mappingUnit.set_derived_channel_rows({name: dict_channels[name] for name in list_names}, cached[1]):
+                    self.num_row_updates += 1
+                    self._dict_definitions[unit_id] = (definition, cached[1] + len(dict_channels[list_names[0]]))
+                    return list_names
+
+            dict_channels = compute_band_channels(mappingUnit, bands, ratios, batch_size=self._batch_size)
+            self.num_computations += 1
+            for i, name in enumerate(list_names):
+                mappingUnit.set_derived_channel(name, dict_channels[name], notify=(i == len(list_names) - 1), rowwise=True)
+            self._dict_definitions[unit_id] = (definition, len(dict_channels[list_names[0]]))
+        return list_names
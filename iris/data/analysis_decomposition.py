@@ -0,0 +1,275 @@
+"""
+Out-of-core spectral decomposition (PCA and NMF) of mapping measurements.
+
+The spectra are streamed in batches (from a MeaRMap_Unit, a numpy array or a np.memmap, e.g., the
+intensity chunks of a chunked .npy export) so that only one batch of spectra is held in memory at
+a time. The results are the component spectra and the per-point scores, which can be stored in the
+MeaRMap_Unit as derived heatmap channels to be plotted like any other heatmap.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Literal
+
+import numpy as np
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+
+
+DEFAULT_BATCH_SIZE = 4096   # Default number of spectra processed at a time
+
+
+@dataclass
+class Decomposition_Result:
+    method: str                             # Decomposition method ('PCA' or 'NMF')
+    components: np.ndarray                  # (k, W) component spectra
+    scores: np.ndarray                      # (N, k) per-point scores (PCA: projections, NMF: abundances)
+    mean: np.ndarray|None = None            # (W,) mean spectrum (PCA only)
+    explained_variance: np.ndarray|None = None  # (k,) variance of each principal component (PCA only)
+    explained_variance_ratio: np.ndarray|None = None  # (k,) fraction of the total variance (PCA only)
+    reconstruction_error: float|None = None    # Frobenius norm of the residual (NMF only)
+
+    def get_channel_names(self, prefix:str|None=None) -> list[str]:
+        """
+        Returns the heatmap channel names of the scores, e.g., ['PC1', 'PC2', ...]
+
+        Args:
+            prefix (str|None): prefix of the channel names. Defaults to 'PC' for PCA and 'NMF' for NMF.
+        """
+        if prefix is None: prefix = 'PC' if self.method == 'PCA' else self.method
+        return [f'{prefix}{i+1}' for i in range(self.components.shape[0])]
+
+def iter_spectra_batches(source:MeaRMap_Unit|np.ndarray, batch_size:int=DEFAULT_BATCH_SIZE, start:int=0) -> Iterator[np.ndarray]:
+    """
+    Iterates over the spectra of a source in batches
+
+    Args:
+        source (MeaRMap_Unit|np.ndarray): mapping unit or (N, W) array of spectra (np.memmap supported)
+        batch_size (int): number of spectra per batch
+        start (int): index of the first spectrum. Defaults to 0.
+
+    Yields:
+        np.ndarray: (n, W) float64 array of spectra
+    """
+    assert isinstance(batch_size, int) and batch_size > 0, 'iter_spectra_batches: The batch size must be a positive integer.'
+    if isinstance(source, MeaRMap_Unit):
+        for _, _, spectra in source.iter_arr_measurements(chunk_size=batch_size, start=start):
+            yield spectra
+    elif isinstance(source, np.ndarray):
+        assert source.ndim == 2, 'iter_spectra_batches: The spectra array must be 2D (N, W).'
+        for idx in range(start, source.shape[0], batch_size):
+            yield np.asarray(source[idx:idx+batch_size], dtype=np.float64)
+    else:
+        raise TypeError('iter_spectra_batches: The source must be a MeaRMap_Unit or a numpy array.')
+
+def _get_source_shape(source:MeaRMap_Unit|np.ndarray) -> tuple[int,int]:
+    if isinstance(source, np.ndarray): return source.shape
+    num_mea = source.get_numMeasurements()
+    assert num_mea > 0, '_get_source_shape: The mapping unit has no measurements.'
+    return num_mea, len(source.get_list_wavelengths())
+
+def compute_pca(source:MeaRMap_Unit|np.ndarray, n_components:int, batch_size:int=DEFAULT_BATCH_SIZE,
+                callback_progress:Callable[[int,int],None]|None=None) -> Decomposition_Result:
+    """
+    Computes the principal component analysis of the spectra in two passes over the batches.
+
+    The first pass accumulates the mean and the (W, W) scatter matrix by merging the per-batch
+    statistics (Chan et al. pairwise update), which is numerically stable and exact. The principal
+    components are the eigenvectors of the covariance matrix. The second pass projects each batch
+    onto the components to get the scores.
+
+    Args:
+        source (MeaRMap_Unit|np.ndarray): mapping unit or (N, W) array of spectra
+        n_components (int): number of principal components to keep
+        batch_size (int): number of spectra per batch. Defaults to DEFAULT_BATCH_SIZE.
+        callback_progress (Callable[[int,int],None]|None): called with (num_processed, num_total)
+            after each batch of each pass. Defaults to None.
+
+    Returns:
+        Decomposition_Result: the components are normalised and their sign is fixed so that the
+            largest absolute loading is positive
+    """
+    num_mea, num_wvl = _get_source_shape(source)
+    assert isinstance(n_components, int) and 0 < n_components <= min(num_mea, num_wvl),\
+        'compute_pca: The number of components must be a positive integer <= min(N, W).'
+    total = 2 * num_mea
+
+    # > Pass 1: mean and scatter matrix
+    count = 0
+    mean = np.zeros(num_wvl, dtype=np.float64)
+    scatter = np.zeros((num_wvl, num_wvl), dtype=np.float64)
+    for batch in iter_spectra_batches(source, batch_size):
+        n_b = batch.shape[0]
+        mean_b = batch.mean(axis=0)
+        centred = batch - mean_b
+        scatter += centred.T @ centred
+        delta = mean_b - mean
+        scatter += np.outer(delta, delta) * (count * n_b / (count + n_b))
+        mean += delta * (n_b / (count + n_b))
+        count += n_b
+        if callback_progress is not None: callback_progress(count, total)
+
+    # Eigendecomposition (ascending order) of the covariance matrix
+    eigval, eigvec = np.linalg.eigh(scatter / max(count - 1, 1))
+    eigval = eigval[::-1]
+    components = eigvec[:, ::-1][:, :n_components].T.copy()
+
+    # Sign convention: the largest absolute loading is positive
+    idx_max = np.argmax(np.abs(components), axis=1)
+    signs = np.sign(components[np.arange(n_components), idx_max])
+    signs[signs == 0] = 1
+    components *= signs[:, None]
+
+    # > Pass 2: scores
+    scores = np.empty((count, n_components), dtype=np.float64)
+    start = 0
+    for batch in iter_spectra_batches(source, batch_size):
+        scores[start:start+batch.shape[0]] = (batch - mean) @ components.T
+        start += batch.shape[0]
+        if callback_progress is not None: callback_progress(count + start, total)
+
+    eigval = np.clip(eigval, 0, None)
+    total_variance = eigval.sum()
+    return Decomposition_Result(
+        method='PCA',
+        components=components,
+        scores=scores,
+        mean=mean,
+        explained_variance=eigval[:n_components],
+        explained_variance_ratio=eigval[:n_components] / total_variance if total_variance > 0 else np.zeros(n_components),
+    )
+
+def compute_nmf(source:MeaRMap_Unit|np.ndarray, n_components:int, batch_size:int=DEFAULT_BATCH_SIZE,
+                max_iter:int=200, tol:float=1e-4, seed:int|None=0,
+                callback_progress:Callable[[int,int],None]|None=None) -> Decomposition_Result:
+    """
+    Computes the non-negative matrix factorisation X ~ S @ C of the spectra, with the (N, k)
+    scores S and the (k, W) components C, using the multiplicative updates (Lee & Seung) for the
+    Frobenius norm. Each iteration is a single pass over the batches: the scores of a batch are
+    updated with the current components, and the statistics S^T X and S^T S needed for the
+    component update are accumulated on the way.
+
+    Note:
+        Negative intensities (e.g., from the background subtraction) are clipped to 0.
+
+    Args:
+        source (MeaRMap_Unit|np.ndarray): mapping unit or (N, W) array of spectra
+        n_components (int): number of components
+        batch_size (int): number of spectra per batch. Defaults to DEFAULT_BATCH_SIZE.
+        max_iter (int): maximum number of iterations (passes over the data). Defaults to 200.
+        tol (float): relative decrease of the reconstruction error to stop at. Defaults to 1e-4.
+        seed (int|None): random seed for the initialisation. Defaults to 0.
+        callback_progress (Callable[[int,int],None]|None): called with (iteration, max_iter)
+            after each iteration. Defaults to None.
+
+    Returns:
+        Decomposition_Result: the components are normalised to a unit maximum
+    """
+    num_mea, num_wvl = _get_source_shape(source)
+    assert isinstance(n_components, int) and 0 < n_components <= min(num_mea, num_wvl),\
+        'compute_nmf: The number of components must be a positive integer <= min(N, W).'
+    assert isinstance(max_iter, int) and max_iter > 0, 'compute_nmf: The maximum number of iterations must be a positive integer.'
+    eps = np.finfo(np.float64).eps
+
+    # Initialisation scaled to the mean intensity, so that the first updates are well conditioned
+    sum_x = 0.0
+    for batch in iter_spectra_batches(source, batch_size):
+        sum_x += np.clip(batch, 0, None).sum()
+    scale = np.sqrt(max(sum_x / (num_mea * num_wvl), eps) / n_components)
+    rng = np.random.default_rng(seed)
+    scores = rng.uniform(0.5, 1.5, (num_mea, n_components)) * scale
+    components = rng.uniform(0.5, 1.5, (n_components, num_wvl)) * scale
+
+    err_prev = np.inf
+    err = np.inf
+    for iteration in range(max_iter):
+        StX = np.zeros((n_components, num_wvl), dtype=np.float64)
+        StS = np.zeros((n_components, n_components), dtype=np.float64)
+        CCt = components @ components.T
+        sq_err = 0.0
+        start = 0
+        for batch in iter_spectra_batches(source, batch_size):
+            end = start + batch.shape[0]
+            batch = np.clip(batch, 0, None)
+            S = scores[start:end]
+
+            # Reconstruction error with the scores and components before this update
+            XCt = batch @ components.T
+            sq_err += max((batch * batch).sum() - 2 * (S * XCt).sum() + (S @ CCt * S).sum(), 0.0)
+
+            S *= XCt / np.maximum(S @ CCt, eps)
+            StX += S.T @ batch
+            StS += S.T @ S
+            start = end
+
+        components *= StX / np.maximum(StS @ components, eps)
+
+        err = np.sqrt(sq_err)
+        if callback_progress is not None: callback_progress(iteration + 1, max_iter)
+        if np.isfinite(err_prev) and err_prev - err <= tol * err_prev: break
+        err_prev = err
+
+    # Normalise the components to a unit maximum, moving the scale into the scores
+    norm = components.max(axis=1)
+    norm[norm <= 0] = 1
+    components /= norm[:, None]
+    scores *= norm[None, :]
+
+    return Decomposition_Result(
+        method='NMF',
+        components=components,
+        scores=scores,
+        reconstruction_error=float(err),
+    )
+
+def add_scores_to_unit(mappingUnit:MeaRMap_Unit, result:Decomposition_Result, prefix:str|None=None) -> list[str]:
+    """
+    Stores the scores of a decomposition as derived heatmap channels in the mapping unit
+
+    Args:
+        mappingUnit (MeaRMap_Unit): the mapping unit the decomposition was computed on
+        result (Decomposition_Result): the decomposition result
+        prefix (str|None): prefix of the channel names. See Decomposition_Result.get_channel_names().
+
+    Returns:
+        list[str]: the names of the channels added
+    """
+    assert isinstance(mappingUnit, MeaRMap_Unit), 'add_scores_to_unit: The mapping unit must be a MeaRMap_Unit.'
+    list_channels = result.get_channel_names(prefix)
+    for i, channel in enumerate(list_channels):
+        mappingUnit.set_derived_channel(channel, result.scores[:, i], notify=(i == len(list_channels) - 1))
+    return list_channels
+
+def test_benchmark_decomposition(num_mea:int=100_000, num_wvl:int=1024, n_components:int=5, batch_size:int=DEFAULT_BATCH_SIZE):
+    """
+    Benchmarks the PCA and NMF on a disk-backed (np.memmap) map of synthetic mixtures
+    """
+    import tempfile
+    rng = np.random.default_rng(0)
+    axis = np.linspace(0, 1, num_wvl)
+    pure = np.array([np.exp(-0.5*((axis-c)/0.02)**2) for c in np.linspace(0.1, 0.9, n_components)])
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        spectra = np.lib.format.open_memmap(os.path.join(dirpath, 'spectra.npy'), mode='w+', dtype=np.float32, shape=(num_mea, num_wvl))
+        for start in range(0, num_mea, batch_size):
+            n = min(batch_size, num_mea - start)
+            spectra[start:start+n] = rng.uniform(0, 1, (n, n_components)) @ pure + rng.normal(0, 0.01, (n, num_wvl))
+        spectra.flush()
+
+        time1 = time.perf_counter()
+        compute_pca(spectra, n_components, batch_size)
+        print(f'PCA ({num_mea}x{num_wvl}): {time.perf_counter()-time1:.2f} s')
+
+        time1 = time.perf_counter()
+        result = compute_nmf(spectra, n_components, batch_size, max_iter=50)
+        print(f'NMF ({num_mea}x{num_wvl}, 50 iterations): {time.perf_counter()-time1:.2f} s, residual {result.reconstruction_error:.3f}')
+        del spectra
+
+if __name__ == '__main__':
+    test_benchmark_decomposition()
@@ -0,0 +1,238 @@
+"""
+Reference-spectrum similarity maps of mapping measurements.
+
+Every spectrum of a map is scored against a library of reference spectra after resampling the
+references onto the Raman-shift axis of the map (restricted to the range covered by all the
+references). The scores are computed per batch of spectra as matrix products, and the best-match
+index and score can be stored in the MeaRMap_Unit as derived heatmap channels.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Literal
+
+import numpy as np
+
+from iris.data.measurement_Raman import MeaRaman
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.analysis_decomposition import iter_spectra_batches, DEFAULT_BATCH_SIZE
+
+
+SimilarityMetric = Literal['cosine', 'pearson', 'angle', 'nnls']
+DICT_METRIC_LABELS:dict[str,str] = {
+    'cosine': 'Cosine',
+    'pearson': 'Pearson',
+    'angle': 'Spectral angle',
+    'nnls': 'NNLS abundance',
+}
+
+
+@dataclass
+class Reference_Spectrum:
+    name: str                   # Name of the reference (e.g., the material)
+    ramanshift: np.ndarray      # (M,) Raman shift axis [cm^-1]
+    intensity: np.ndarray       # (M,) intensity
+
+    def __post_init__(self):
+        self.ramanshift = np.asarray(self.ramanshift, dtype=np.float64)
+        self.intensity = np.asarray(self.intensity, dtype=np.float64)
+        assert self.ramanshift.ndim == 1 and self.ramanshift.shape == self.intensity.shape and len(self.ramanshift) >= 2,\
+            'Reference_Spectrum: The Raman shift and intensity must be 1D arrays of the same length (>= 2).'
+        # np.interp requires an increasing axis
+        order = np.argsort(self.ramanshift)
+        self.ramanshift = self.ramanshift[order]
+        self.intensity = self.intensity[order]
+
+    @classmethod
+    def from_RamanMeasurement(cls, measurement:MeaRaman, name:str) -> 'Reference_Spectrum':
+        """
+        Creates a reference from the analysed spectrum of a Raman measurement
+
+        Args:
+            measurement (MeaRaman): the measurement
+            name (str): name of the reference
+        """
+        return cls(name=name, ramanshift=measurement.get_arr_ramanshift(), intensity=measurement.get_arr_intensity('analysed'))
+
+@dataclass
+class Similarity_Result:
+    metric: str                     # Similarity metric
+    reference_names: list[str]      # (K,) names of the references
+    scores: np.ndarray              # (N, K) score of each spectrum against each reference
+    best_index: np.ndarray          # (N,) index of the best-matching reference
+    best_score: np.ndarray          # (N,) score of the best-matching reference
+    residual: np.ndarray|None = None    # (N,) norm of the unmixing residual (NNLS only)
+
+def resample_references(references:list[Reference_Spectrum], axis_ramanshift:np.ndarray) -> tuple[np.ndarray,np.ndarray]:
+    """
+    Resamples the references onto the common part of the Raman-shift axis
+
+    Args:
+        references (list[Reference_Spectrum]): reference library
+        axis_ramanshift (np.ndarray): (W,) Raman-shift axis of the spectra
+
+    Returns:
+        tuple:
+            mask (W,): boolean mask of the axis points covered by all the references
+            refs (K, W'): references resampled onto axis_ramanshift[mask]
+    """
+    assert len(references) > 0 and all(isinstance(ref, Reference_Spectrum) for ref in references),\
+        'resample_references: The references must be a non-empty list of Reference_Spectrum.'
+    axis_ramanshift = np.asarray(axis_ramanshift, dtype=np.float64)
+    lower = max(ref.ramanshift[0] for ref in references)
+    upper = min(ref.ramanshift[-1] for ref in references)
+    mask = (axis_ramanshift >= lower) & (axis_ramanshift <= upper)
+    assert mask.sum() >= 2, 'resample_references: The references do not overlap with the Raman-shift axis of the spectra.'
+    refs = np.array([np.interp(axis_ramanshift[mask], ref.ramanshift, ref.intensity) for ref in references])
+    return mask, refs
+
+def _score_batch(batch:np.ndarray, refs:np.ndarray, metric:str, refs_prep:np.ndarray,
+                 nnls_max_iter:int, nnls_tol:float) -> tuple[np.ndarray,np.ndarray|None]:
+    """Returns the (n, K) scores of a batch of (n, W') spectra and the NNLS residual norm"""
+    eps = np.finfo(np.float64).eps
+    if metric in ('cosine', 'angle'):
+        norm = np.linalg.norm(batch, axis=1, keepdims=True)
+        cos = (batch @ refs_prep.T) / np.maximum(norm, eps)
+        if metric == 'cosine': return cos, None
+        return np.arccos(np.clip(cos, -1.0, 1.0)), None
+    elif metric == 'pearson':
+        centred = batch - batch.mean(axis=1, keepdims=True)
+        norm = np.linalg.norm(centred, axis=1, keepdims=True)
+        return (centred @ refs_prep.T) / np.maximum(norm, eps), None
+
+    # NNLS: min ||x - c @ refs||^2 s.t. c >= 0, solved for the whole batch at once with the
+    # accelerated projected gradient (FISTA) on the normal equations
+    gram, lipschitz = refs_prep, np.linalg.eigvalsh(refs_prep).max()
+    XRt = batch @ refs.T
+    coef = np.maximum(np.linalg.lstsq(gram, XRt.T, rcond=None)[0].T, 0)
+    momentum = coef.copy()
+    t = 1.0
+    for _ in range(nnls_max_iter):
+        coef_new = np.maximum(momentum - (momentum @ gram - XRt) / max(lipschitz, eps), 0)
+        t_new = (1 + np.sqrt(1 + 4*t*t)) / 2
+        momentum = coef_new + ((t - 1) / t_new) * (coef_new - coef)
+        change = np.abs(coef_new - coef).max()
+        coef, t = coef_new, t_new
+        if change <= nnls_tol * max(np.abs(coef).max(), eps): break
+    residual = np.linalg.norm(batch - coef @ refs, axis=1)
+    return coef, residual
+
+def compute_similarity(source:MeaRMap_Unit|np.ndarray, references:list[Reference_Spectrum], metric:SimilarityMetric='cosine',
+                       axis_ramanshift:np.ndarray|None=None, batch_size:int=DEFAULT_BATCH_SIZE,
+                       nnls_max_iter:int=500, nnls_tol:float=1e-6,
+                       callback_progress:Callable[[int,int],None]|None=None) -> Similarity_Result:
+    """
+    Scores every spectrum of the source against the reference library
+
+    Args:
+        source (MeaRMap_Unit|np.ndarray): mapping unit or (N, W) array of spectra (np.memmap supported)
+        references (list[Reference_Spectrum]): reference library
+        metric (SimilarityMetric): 'cosine' (cosine similarity), 'pearson' (Pearson correlation),
+            'angle' (spectral angle [rad], lower is better) or 'nnls' (non-negative least-squares
+            unmixing abundances). Defaults to 'cosine'.
+        axis_ramanshift (np.ndarray|None): (W,) Raman-shift axis of the spectra. Required for an array
+            source, taken from the unit otherwise.
+        batch_size (int): number of spectra per batch. Defaults to DEFAULT_BATCH_SIZE.
+        nnls_max_iter (int): maximum number of iterations per batch for the NNLS. Defaults to 500.
+        nnls_tol (float): relative change of the abundances to stop the NNLS at. Defaults to 1e-6.
+        callback_progress (Callable[[int,int],None]|None): called with (num_processed, num_total)
+            after each batch. Defaults to None.
+
+    Returns:
+        Similarity_Result: the best match is the highest score, except for the spectral angle (lowest)
+    """
+    assert metric in DICT_METRIC_LABELS, f'compute_similarity: The metric must be one of {list(DICT_METRIC_LABELS.keys())}.'
+    if isinstance(source, MeaRMap_Unit):
+        assert source.get_numMeasurements() > 0, 'compute_similarity: The mapping unit has no measurements.'
+        axis_ramanshift = np.array(source.get_list_Raman_shift())
+        num_mea = source.get_numMeasurements()
+    else:
+        assert axis_ramanshift is not None, 'compute_similarity: The Raman-shift axis is required for an array source.'
+        num_mea = source.shape[0]
+        assert source.shape[1] == len(axis_ramanshift), 'compute_similarity: The Raman-shift axis does not match the spectra.'
+
+    mask, refs = resample_references(references, axis_ramanshift)
+    if metric in ('cosine', 'angle'):
+        refs_prep = refs / np.maximum(np.linalg.norm(refs, axis=1, keepdims=True), np.finfo(np.float64).eps)
+    elif metric == 'pearson':
+        refs_prep = refs - refs.mean(axis=1, keepdims=True)
+        refs_prep /= np.maximum(np.linalg.norm(refs_prep, axis=1, keepdims=True), np.finfo(np.float64).eps)
+    else:
+        refs_prep = refs @ refs.T   # Gram matrix
+
+    scores = np.empty((num_mea, len(references)), dtype=np.float64)
+    residual = np.empty(num_mea, dtype=np.float64) if metric == 'nnls' else None
+    start = 0
+    for batch in iter_spectra_batches(source, batch_size):
+        end = start + batch.shape[0]
+        scores[start:end], res = _score_batch(batch[:, mask], refs, metric, refs_prep, nnls_max_iter, nnls_tol)
+        if residual is not None: residual[start:end] = res
+        start = end
+        if callback_progress is not None: callback_progress(end, num_mea)
+
+    best_index = np.argmin(scores, axis=1) if metric == 'angle' else np.argmax(scores, axis=1)
+    return Similarity_Result(
+        metric=metric,
+        reference_names=[ref.name for ref in references],
+        scores=scores,
+        best_index=best_index,
+        best_score=scores[np.arange(num_mea), best_index],
+        residual=residual,
+    )
+
+def add_similarity_to_unit(mappingUnit:MeaRMap_Unit, result:Similarity_Result, flg_per_reference:bool=True) -> list[str]:
+    """
+    Stores the best-match index and score (and optionally the score against each reference) as
+    derived heatmap channels in the mapping unit, e.g., 'Cosine best match', 'Cosine best score',
+    'Cosine: <reference name>'
+
+    Args:
+        mappingUnit (MeaRMap_Unit): the mapping unit the similarity was computed on
+        result (Similarity_Result): the similarity result
+        flg_per_reference (bool): also store the score against each reference. Defaults to True.
+
+    Returns:
+        list[str]: the names of the channels added
+    """
+    assert isinstance(mappingUnit, MeaRMap_Unit), 'add_similarity_to_unit: The mapping unit must be a MeaRMap_Unit.'
+    label = DICT_METRIC_LABELS[result.metric]
+    dict_channels = {
+        f'{label} best match': result.best_index.astype(np.float64),
+        f'{label} best score': result.best_score,
+    }
+    if flg_per_reference:
+        for i, name in enumerate(result.reference_names):
+            dict_channels[f'{label}: {name}'] = result.scores[:, i]
+    if result.residual is not None:
+        dict_channels[f'{label} residual'] = result.residual
+
+    list_channels = list(dict_channels.keys())
+    for i, channel in enumerate(list_channels):
+        mappingUnit.set_derived_channel(channel, dict_channels[channel], notify=(i == len(list_channels) - 1))
+    return list_channels
+
+def test_benchmark_similarity(num_mea:int=100_000, num_wvl:int=1024, num_refs:int=20, batch_size:int=DEFAULT_BATCH_SIZE):
+    """
+    Benchmarks the similarity metrics on a map of synthetic mixtures
+    """
+    rng = np.random.default_rng(0)
+    axis = np.linspace(200, 2000, num_wvl)
+    references = [Reference_Spectrum(f'ref{i}', axis, np.exp(-0.5*((axis-c)/15)**2))
+                  for i, c in enumerate(np.linspace(300, 1900, num_refs))]
+    refs = np.array([ref.intensity for ref in references])
+    spectra = rng.uniform(0, 1, (num_mea, num_refs)) @ refs + rng.normal(0, 0.01, (num_mea, num_wvl))
+
+    for metric in DICT_METRIC_LABELS:
+        time1 = time.perf_counter()
+        compute_similarity(spectra, references, metric, axis_ramanshift=axis, batch_size=batch_size)
+        duration = time.perf_counter() - time1
+        print(f'{metric}: {num_mea/duration:.0f} spectra/s ({num_mea}x{num_wvl}, {num_refs} references)')
+
+if __name__ == '__main__':
+    test_benchmark_similarity()
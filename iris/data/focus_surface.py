@@ -0,0 +1,322 @@
+"""
+Focus-surface models fitted on reference (X, Y, Z) focus points, used to assign the Z-coordinates
+of mapping coordinates.
+
+Unlike a piecewise interpolation on the triangulation of the references (scipy griddata), the
+models are defined everywhere and therefore extrapolate outside the convex hull of the references:
+- tilted plane: least-squares Z = a*X + b*Y + c
+- polynomial: least-squares polynomial of a low order, with a RANSAC rejection of the outliers
+    (e.g., a failed autofocus at one of the references)
+- thin-plate spline: radial basis function interpolation (optionally smoothed) with an affine
+    trend, which becomes a plane far from the references
+
+Each fit reports the per-reference residuals and a cross-validated error (leave-one-out for up to
+20 references, 5-fold otherwise), and evaluates vectorised on large sets of coordinates.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import time
+from typing import Literal
+
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+
+
+FocusSurfaceMethod = Literal['plane', 'polynomial', 'tps']
+
+EVALUATION_CHUNK_SIZE = 262_144     # Number of coordinates evaluated at once
+LEAVE_ONE_OUT_MAX_REFS = 20         # Cross-validation: leave-one-out up to this number of references, k-fold above
+NUM_FOLDS = 5
+OUTLIER_THRESHOLD_SIGMA = 4.0       # RANSAC inlier threshold in standard deviations of the residuals (automatic threshold)
+
+def _as_xy(x:np.ndarray|list, y:np.ndarray|list|None=None) -> np.ndarray:
+    """Converts the coordinates into an (N, 2) float array, from an (N, >=2) array or X and Y arrays"""
+    if y is None:
+        xy = np.asarray(x, dtype=np.float64)
+        assert xy.ndim == 2 and xy.shape[1] >= 2, '_as_xy: The coordinates must be an (N, 2) or (N, 3) array.'
+        return xy[:, :2]
+    return np.stack([np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel()], axis=1)
+
+class Class_FocusSurface():
+    """
+    Base class of the focus-surface models. The subclasses implement _fit() and _evaluate().
+    """
+    min_references = 3
+
+    def __init__(self):
+        self._flg_fitted = False
+        self._residuals:np.ndarray|None = None
+        self._inliers:np.ndarray|None = None
+        self._ref_xy:np.ndarray|None = None
+        self._ref_z:np.ndarray|None = None
+
+    def _fit(self, xy:np.ndarray, z:np.ndarray) -> np.ndarray:
+        """Fits the model and returns the boolean inlier mask of the references"""
+        raise NotImplementedError
+
+    def _evaluate(self, xy:np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _new_instance(self) -> 'Class_FocusSurface':
+        """Returns an unfitted model with the same settings, for the cross-validation"""
+        raise NotImplementedError
+
+    def fit(self, references:np.ndarray|list) -> 'Class_FocusSurface':
+        """
+        Fits the surface on the reference points
+
+        Args:
+            references (np.ndarray|list): (N, 3) reference coordinates [X, Y, Z]
+
+        Returns:
+            Class_FocusSurface: self
+
+        Raises:
+            ValueError: If there are too few (finite) references or they are degenerate (e.g., collinear)
+        """
+        references = np.asarray(references, dtype=np.float64)
+        if references.ndim != 2 or references.shape[1] < 3:
+            raise ValueError('fit: The references must be an (N, 3) array of [X, Y, Z].')
+        references = references[np.all(np.isfinite(references[:, :3]), axis=1)]
+        if len(references) < self.min_references:
+            raise ValueError(f'fit: At least {self.min_references} finite references are required, got {len(references)}.')
+        xy, z = references[:, :2], references[:, 2]
+
+        self._inliers = self._fit(xy, z)
+        self._ref_xy, self._ref_z = xy, z
+        self._residuals = z - self._evaluate(xy)
+        self._flg_fitted = True
+        return self
+
+    def evaluate(self, x:np.ndarray|list, y:np.ndarray|list|None=None) -> np.ndarray:
+        """
+        Evaluates the surface
+
+        Args:
+            x (np.ndarray|list): (N, 2) or (N, 3) coordinates, or the X coordinates (any shape) if y is given
+            y (np.ndarray|list|None): Y coordinates with the shape of x. Defaults to None.
+
+        Returns:
+            np.ndarray: (N,) Z values, or the shape of x if y is given
+        """
+        assert self._flg_fitted, 'evaluate: The surface has not been fitted.'
+        shape = np.shape(x) if y is not None else (len(x),)
+        xy = _as_xy(x, y)
+        z = np.empty(len(xy), dtype=np.float64)
+        for start in range(0, len(xy), EVALUATION_CHUNK_SIZE):
+            z[start:start+EVALUATION_CHUNK_SIZE] = self._evaluate(xy[start:start+EVALUATION_CHUNK_SIZE])
+        return z.reshape(shape)
+
+    def get_residuals(self) -> np.ndarray:
+        """Returns the residuals (measured - fitted) at the references, outliers included"""
+        assert self._flg_fitted, 'get_residuals: The surface has not been fitted.'
+        return self._residuals.copy()
+
+    def get_inlier_mask(self) -> np.ndarray:
+        """Returns the boolean mask of the references used for the fit (all True unless rejected)"""
+        assert self._flg_fitted, 'get_inlier_mask: The surface has not been fitted.'
+        return self._inliers.copy()
+
+    def get_rms_residual(self) -> float:
+        """Returns the RMS residual of the inlier references"""
+        return float(np.sqrt(np.mean(self.get_residuals()[self._inliers]**2)))
+
+    def cross_validate(self) -> float:
+        """
+        Computes the cross-validated RMS error of the surface at the inlier references: each
+        reference is predicted by the surface fitted without it (leave-one-out) or without its fold
+        (k-fold above LEAVE_ONE_OUT_MAX_REFS references)
+
+        Returns:
+            float: the RMS error, NaN if the folds are too small to be fitted
+        """
+        assert self._flg_fitted, 'cross_validate: The surface has not been fitted.'
+        num_refs = len(self._ref_z)
+        if num_refs <= LEAVE_ONE_OUT_MAX_REFS: folds = np.arange(num_refs)
+        else: folds = np.random.default_rng(0).permutation(num_refs) % NUM_FOLDS
+
+        errors = np.full(num_refs, np.nan)
+        for fold in np.unique(folds):
+            test = folds == fold
+            try: model = self._new_instance().fit(np.column_stack([self._ref_xy[~test], self._ref_z[~test]]))
+            except (ValueError, np.linalg.LinAlgError): continue
+            errors[test] = self._ref_z[test] - model.evaluate(self._ref_xy[test])
+        errors = errors[self._inliers]
+        if np.any(np.isnan(errors)): return float('nan')
+        return float(np.sqrt(np.mean(errors**2)))
+
+class FocusSurface_Plane(Class_FocusSurface):
+    """Least-squares tilted plane Z = a*X + b*Y + c"""
+    def __init__(self):
+        super().__init__()
+        self._coefficients = np.zeros(3)
+
+    def _fit(self, xy:np.ndarray, z:np.ndarray) -> np.ndarray:
+        matrix = np.column_stack([xy, np.ones(len(xy))])
+        self._coefficients, _, rank, _ = np.linalg.lstsq(matrix, z, rcond=None)
+        if rank < 3: raise ValueError('fit: The references are collinear, the plane is undefined.')
+        return np.ones(len(z), dtype=bool)
+
+    def _evaluate(self, xy:np.ndarray) -> np.ndarray:
+        return xy @ self._coefficients[:2] + self._coefficients[2]
+
+    def _new_instance(self) -> 'FocusSurface_Plane':
+        return FocusSurface_Plane()
+
+    def get_coefficients(self) -> tuple[float,float,float]:
+        """Returns the (a, b, c) coefficients of Z = a*X + b*Y + c"""
+        return tuple(float(val) for val in self._coefficients)
+
+class FocusSurface_Polynomial(Class_FocusSurface):
+    """
+    Least-squares polynomial surface of a low order in X and Y, with RANSAC outlier rejection
+    """
+    def __init__(self, order:int=2, ransac:bool=True, threshold:float|None=None, num_iterations:int=200,
+                 seed:int=0):
+        """
+        Args:
+            order (int): order of the polynomial (1: plane, 2: quadratic, 3: cubic). Defaults to 2.
+            ransac (bool): reject the outliers with RANSAC. Defaults to True.
+            threshold (float|None): inlier threshold on the absolute residual, in the unit of Z. If
+                None, it is OUTLIER_THRESHOLD_SIGMA times the standard deviation of the residuals,
+                estimated robustly from the median residual of the best candidate.
+                Defaults to None.
+            num_iterations (int): number of RANSAC candidates. Defaults to 200.
+            seed (int): seed of the random candidate selection. Defaults to 0.
+        """
+        super().__init__()
+        assert isinstance(order, int) and 1 <= order <= 3, 'FocusSurface_Polynomial: The order must be 1, 2 or 3.'
+        assert threshold is None or threshold > 0, 'FocusSurface_Polynomial: The threshold must be positive.'
+        self._order = order
+        self._ransac = ransac
+        self._threshold = threshold
+        self._num_iterations = num_iterations
+        self._seed = seed
+        self._exponents = [(i, j) for i in range(order+1) for j in range(order+1-i)]
+        self.min_references = len(self._exponents)
+        self._centre = np.zeros(2)
+        self._scale = 1.0
+        self._coefficients = np.zeros(len(self._exponents))
+
+    def _design_matrix(self, xy:np.ndarray) -> np.ndarray:
+        # Normalised coordinates for the conditioning of the higher orders
+        u = (xy - self._centre) / self._scale
+        return np.stack([u[:, 0]**i * u[:, 1]**j for i, j in self._exponents], axis=1)
+
+    def _solve(self, matrix:np.ndarray, z:np.ndarray) -> np.ndarray|None:
+        coefficients, _, rank, _ = np.linalg.lstsq(matrix, z, rcond=None)
+        return coefficients if rank == matrix.shape[1] else None
+
+    def _fit(self, xy:np.ndarray, z:np.ndarray) -> np.ndarray:
+        self._centre = xy.mean(axis=0)
+        self._scale = max(float(np.abs(xy - self._centre).max()), np.finfo(np.float64).eps)
+        matrix = self._design_matrix(xy)
+        num_terms = matrix.shape[1]
+
+        inliers = np.ones(len(z), dtype=bool)
+        if self._ransac and len(z) > num_terms:
+            rng = np.random.default_rng(self._seed)
+            best_score, best_coefficients = None, None
+            for _ in range(self._num_iterations):
+                sample = rng.choice(len(z), num_terms, replace=False)
+                coefficients = self._solve(matrix[sample], z[sample])
+                if coefficients is None: continue   # Degenerate sample
+                residuals = np.abs(z - matrix @ coefficients)
+                # Fixed threshold: number of inliers. Otherwise: least median of the residuals
+                score = -np.sum(residuals <= self._threshold) if self._threshold else np.median(residuals)
+                if best_score is None or score < best_score: best_score, best_coefficients = score, coefficients
+            # Inliers of the best candidate, refined by refitting on the inliers
+            coefficients = best_coefficients
+            for _ in range(3):
+                if coefficients is None: break
+                residuals = np.abs(z - matrix @ coefficients)
+                threshold = self._threshold
+                if threshold is None:
+                    # Robust scale of the candidate first, then the standard deviation of the inliers
+                    num_inliers = int(inliers.sum())
+                    if num_inliers == len(z): scale = 1.4826 * (1 + 5 / (len(z) - num_terms)) * np.median(residuals)
+                    else: scale = np.sqrt(np.sum(residuals[inliers]**2) / max(num_inliers - num_terms, 1))
+                    threshold = max(OUTLIER_THRESHOLD_SIGMA * scale, 1e-9 * max(float(np.ptp(z)), 1.0))
+                inliers = residuals <= threshold
+                coefficients = self._solve(matrix[inliers], z[inliers])
+
+        coefficients = self._solve(matrix[inliers], z[inliers])
+        if coefficients is None: raise ValueError('fit: The references are degenerate for the polynomial order.')
+        self._coefficients = coefficients
+        return inliers
+
+    def _evaluate(self, xy:np.ndarray) -> np.ndarray:
+        return self._design_matrix(xy) @ self._coefficients
+
+    def _new_instance(self) -> 'FocusSurface_Polynomial':
+        return FocusSurface_Polynomial(self._order, self._ransac, self._threshold, self._num_iterations, self._seed)
+
+class FocusSurface_TPS(Class_FocusSurface):
+    """
+    Thin-plate spline radial basis function surface with an affine trend
+    """
+    def __init__(self, smoothing:float=0.0):
+        """
+        Args:
+            smoothing (float): smoothing parameter, 0 interpolates the references exactly. Defaults to 0.0.
+        """
+        super().__init__()
+        assert smoothing >= 0, 'FocusSurface_TPS: The smoothing must be non-negative.'
+        self._smoothing = smoothing
+        self._interpolator:RBFInterpolator|None = None
+
+    def _fit(self, xy:np.ndarray, z:np.ndarray) -> np.ndarray:
+        if np.linalg.matrix_rank(xy - xy.mean(axis=0)) < 2:
+            raise ValueError('fit: The references are collinear, the thin-plate spline is undefined.')
+        self._interpolator = RBFInterpolator(xy, z, kernel='thin_plate_spline', smoothing=self._smoothing, degree=1)
+        return np.ones(len(z), dtype=bool)
+
+    def _evaluate(self, xy:np.ndarray) -> np.ndarray:
+        return self._interpolator(xy)
+
+    def _new_instance(self) -> 'FocusSurface_TPS':
+        return FocusSurface_TPS(self._smoothing)
+
+def fit_focus_surface(references:np.ndarray|list, method:FocusSurfaceMethod='tps', **kwargs) -> Class_FocusSurface:
+    """
+    Fits a focus surface on the reference points
+
+    Args:
+        references (np.ndarray|list): (N, 3) reference coordinates [X, Y, Z]
+        method (FocusSurfaceMethod): 'plane', 'polynomial' or 'tps'. Defaults to 'tps'.
+        **kwargs: settings of the model, see FocusSurface_Polynomial and FocusSurface_TPS
+
+    Returns:
+        Class_FocusSurface: the fitted surface
+
+    Raises:
+        ValueError: If the method is unknown or the references cannot be fitted
+    """
+    dict_models = {'plane': FocusSurface_Plane, 'polynomial': FocusSurface_Polynomial, 'tps': FocusSurface_TPS}
+    if method not in dict_models: raise ValueError(f'fit_focus_surface: Unknown method {method}, choose from {list(dict_models)}.')
+    return dict_models[method](**kwargs).fit(references)
+
+def test_benchmark_focus_surface(num_refs:int=25, num_targets:int=1_000_000):
+    """
+    Benchmarks the fit and the evaluation of the focus surfaces
+    """
+    rng = np.random.default_rng(0)
+    refs = rng.uniform(0, 10, (num_refs, 2))
+    refs = np.column_stack([refs, 0.01*refs[:, 0] - 0.02*refs[:, 1] + 0.001*refs[:, 0]**2])
+    targets = rng.uniform(-2, 12, (num_targets, 2))
+    for method in ['plane', 'polynomial', 'tps']:
+        time1 = time.perf_counter()
+        surface = fit_focus_surface(refs, method)
+        time2 = time.perf_counter()
+        surface.evaluate(targets)
+        time3 = time.perf_counter()
+        print(f'{method}: fit {(time2-time1)*1e3:.1f} ms, evaluation of {num_targets} coordinates {time3-time2:.2f} s,'
+              f' CV error {surface.cross_validate():.2e}')
+
+if __name__ == '__main__':
+    test_benchmark_focus_surface()
@@ -0,0 +1,220 @@
+"""
+Extraction of multiple spectra from the 2D frames of a CCD (multi-track readout done in software).
+
+Each track is a band of sensor rows summed into one spectrum, optionally with a background band
+(e.g., rows between the tracks) whose per-column mean is scaled to the track height and subtracted.
+The tracks are combined into two row-selection matrices, so the spectra of a whole batch of
+frames are obtained with matrix products. Hot pixels are excluded from the sums and the sums are
+rescaled per column to the full track height. The columns can be binned after the extraction.
+
+The first track is the primary spectrum (the intensity column of the measurement dataframe), the
+other tracks are stored as extra intensity columns named after the tracks. MeaRMap_Unit lists
+them as spectral channels, which can be plotted as heatmaps.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from iris import DataAnalysisConfigEnum
+
+
+@dataclass(frozen=True)
+class Track_Definition:
+    name: str                               # Name of the track, used as the spectral channel name
+    row_start: int                          # First row of the track (0-based, inclusive)
+    row_stop: int                           # Last row of the track (0-based, exclusive)
+    background: tuple[tuple[int,int],...] = ()  # (start, stop) row ranges of the background bands
+
+    def __post_init__(self):
+        assert isinstance(self.name, str) and self.name != '', 'Track_Definition: The name must be a non-empty string.'
+        assert 0 <= self.row_start < self.row_stop, 'Track_Definition: The rows must satisfy 0 <= row_start < row_stop.'
+        assert all(0 <= start < stop for start, stop in self.background),\
+            'Track_Definition: The background ranges must satisfy 0 <= start < stop.'
+
+    def get_height(self) -> int:
+        return self.row_stop - self.row_start
+
+def parse_track_definitions(text:str) -> list[Track_Definition]:
+    """
+    Parses the track definitions from a comma-separated text, where each track is given as
+    'name:start-stop' with optional background bands 'name:start-stop/bgstart-bgstop/...'
+    (0-based rows, stop exclusive), e.g., 'sample:100-140/60-80, reference:200-240/250-260'
+
+    Args:
+        text (str): the definitions
+
+    Returns:
+        list[Track_Definition]: the tracks
+
+    Raises:
+        ValueError: If a definition cannot be parsed or the names are not unique
+    """
+    def parse_range(text_range:str) -> tuple[int,int]:
+        start, stop = [int(val) for val in text_range.split('-')]
+        if not 0 <= start < stop: raise ValueError
+        return start, stop
+
+    list_tracks:list[Track_Definition] = []
+    for token in [tok.strip() for tok in text.split(',') if tok.strip() != '']:
+        name, _, ranges = token.partition(':')
+        try:
+            list_ranges = [parse_range(tok.strip()) for tok in ranges.split('/')]
+            list_tracks.append(Track_Definition(name.strip(), *list_ranges[0], background=tuple(list_ranges[1:])))
+        except (ValueError, AssertionError):
+            raise ValueError(f'parse_track_definitions: Invalid track definition: {token}')
+    names = [track.name for track in list_tracks]
+    if len(set(names)) != len(names): raise ValueError('parse_track_definitions: The track names must be unique.')
+    return list_tracks
+
+def detect_hot_pixels(dark_frames:np.ndarray, n_sigma:float=8.0) -> np.ndarray:
+    """
+    Detects the hot pixels from a stack of dark frames: pixels whose temporal median exceeds the
+    median of the sensor by more than n_sigma robust standard deviations (from the MAD)
+
+    Args:
+        dark_frames (np.ndarray): (rows, cols) or (n, rows, cols) dark frames
+        n_sigma (float): detection threshold. Defaults to 8.0.
+
+    Returns:
+        np.ndarray: (rows, cols) boolean mask, True for the hot pixels
+    """
+    dark_frames = np.asarray(dark_frames, dtype=np.float32)
+    dark = np.median(dark_frames, axis=0) if dark_frames.ndim == 3 else dark_frames
+    median = np.median(dark)
+    sigma = 1.4826 * np.median(np.abs(dark - median))
+    return dark > median + n_sigma * max(sigma, np.finfo(np.float32).eps)
+
+class Frame_Extractor():
+    """
+    Extracts the spectra of the tracks from CCD frames of a fixed shape
+    """
+    def __init__(self, tracks:list[Track_Definition], frame_shape:tuple[int,int],
+                 hot_pixel_mask:np.ndarray|None=None, column_bin:int=1):
+        """
+        Args:
+            tracks (list[Track_Definition]): the tracks. The first one is the primary spectrum.
+            frame_shape (tuple[int,int]): (rows, cols) of the frames
+            hot_pixel_mask (np.ndarray|None): (rows, cols) boolean mask of the pixels to exclude.
+                Defaults to None.
+            column_bin (int): number of adjacent columns summed after the extraction. Must divide
+                the number of columns. Defaults to 1.
+        """
+        assert len(tracks) > 0 and all(isinstance(track, Track_Definition) for track in tracks),\
+            'Frame_Extractor: The tracks must be a non-empty list of Track_Definition.'
+        names = [track.name for track in tracks]
+        assert len(set(names)) == len(names), 'Frame_Extractor: The track names must be unique.'
+        rows, cols = frame_shape
+        assert all(track.row_stop <= rows and all(stop <= rows for _, stop in track.background) for track in tracks),\
+            'Frame_Extractor: A track or background band is outside the frame.'
+        assert isinstance(column_bin, int) and column_bin >= 1 and cols % column_bin == 0,\
+            'Frame_Extractor: The column binning must be a positive integer dividing the number of columns.'
+
+        self._tracks = list(tracks)
+        self._frame_shape = (rows, cols)
+        self._column_bin = column_bin
+
+        # Row-selection matrices of the tracks (first block) and of their backgrounds (second block)
+        num_tracks = len(tracks)
+        selection = np.zeros((2 * num_tracks, rows), dtype=np.float32)
+        for i, track in enumerate(tracks):
+            selection[i, track.row_start:track.row_stop] = 1
+            for start, stop in track.background: selection[num_tracks + i, start:stop] = 1
+        self._selection = selection
+        self._has_background = np.array([len(track.background) > 0 for track in tracks])
+        heights = np.array([track.get_height() for track in tracks], dtype=np.float32)[:, None]
+
+        # Per track and column scale factors, compensating for the excluded hot pixels
+        if hot_pixel_mask is not None:
+            hot_pixel_mask = np.asarray(hot_pixel_mask, dtype=bool)
+            assert hot_pixel_mask.shape == self._frame_shape, 'Frame_Extractor: The hot pixel mask does not match the frame shape.'
+            self._valid = (~hot_pixel_mask).astype(np.float32)
+            counts = selection @ self._valid
+        else:
+            self._valid = None
+            counts = np.repeat(selection.sum(axis=1, keepdims=True), cols, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._scale_track = np.where(counts[:num_tracks] > 0, heights / counts[:num_tracks], np.nan).astype(np.float32)
+            self._scale_background = np.where(counts[num_tracks:] > 0, heights / counts[num_tracks:], 0).astype(np.float32)
+        self._scale_background[~self._has_background] = 0
+
+    def get_track_names(self) -> list[str]:
+        return [track.name for track in self._tracks]
+
+    def get_num_columns(self) -> int:
+        """Returns the number of spectral points of the extracted spectra"""
+        return self._frame_shape[1] // self._column_bin
+
+    def extract(self, frames:np.ndarray) -> np.ndarray:
+        """
+        Extracts the spectra of the tracks
+
+        Args:
+            frames (np.ndarray): (rows, cols) frame or (n, rows, cols) frames
+
+        Returns:
+            np.ndarray: (num_tracks, cols/column_bin) or (n, num_tracks, cols/column_bin) spectra.
+                The columns where all the pixels of a track are hot are NaN.
+        """
+        frames = np.asarray(frames)
+        flg_single = frames.ndim == 2
+        if flg_single: frames = frames[None]
+        assert frames.shape[1:] == self._frame_shape, 'extract: The frame shape does not match the extractor.'
+
+        frames = frames.astype(np.float32, copy=False)
+        if self._valid is not None: frames = frames * self._valid
+        sums = np.matmul(self._selection, frames)      # (n, 2*num_tracks, cols)
+        num_tracks = len(self._tracks)
+        spectra = sums[:, :num_tracks] * self._scale_track - sums[:, num_tracks:] * self._scale_background
+        if self._column_bin > 1:
+            spectra = spectra.reshape(spectra.shape[0], num_tracks, -1, self._column_bin).sum(axis=3)
+        spectra = spectra.astype(np.float64)
+        return spectra[0] if flg_single else spectra
+
+    def to_dataframe(self, wavelength:np.ndarray, spectra:np.ndarray) -> pd.DataFrame:
+        """
+        Converts the spectra of one frame into a measurement dataframe: the wavelength, the
+        primary track as the intensity and the other tracks as extra columns named after the tracks
+
+        Args:
+            wavelength (np.ndarray): (W,) wavelength of the spectral points
+            spectra (np.ndarray): (num_tracks, W) spectra from extract()
+
+        Returns:
+            pd.DataFrame: the measurement dataframe
+        """
+        lbl_wavelength = DataAnalysisConfigEnum.WAVELENGTH_LABEL.value
+        lbl_intensity = DataAnalysisConfigEnum.INTENSITY_LABEL.value
+        assert spectra.shape == (len(self._tracks), len(wavelength)), 'to_dataframe: The spectra do not match the tracks and wavelength.'
+        dict_columns = {lbl_wavelength: np.asarray(wavelength, dtype=np.float64), lbl_intensity: spectra[0]}
+        for track, spectrum in zip(self._tracks[1:], spectra[1:]):
+            dict_columns[track.name] = spectrum
+        return pd.DataFrame(dict_columns)
+
+def test_benchmark_frame_extraction(num_frames:int=200, frame_shape:tuple[int,int]=(512, 2048), num_tracks:int=4):
+    """
+    Benchmarks the extraction of the tracks from full frames, with and without a hot pixel mask
+    """
+    rng = np.random.default_rng(0)
+    frames = rng.integers(300, 2000, (num_frames, *frame_shape), dtype=np.uint16)
+    height = frame_shape[0] // (2 * num_tracks)
+    tracks = [Track_Definition(f'track{i}', 2*i*height, (2*i+1)*height, background=(((2*i+1)*height, (2*i+2)*height),))
+              for i in range(num_tracks)]
+    mask = rng.uniform(size=frame_shape) < 1e-3
+    for label, extractor in [('no mask', Frame_Extractor(tracks, frame_shape)),
+                             ('hot pixel mask', Frame_Extractor(tracks, frame_shape, hot_pixel_mask=mask))]:
+        time1 = time.perf_counter()
+        for i in range(0, num_frames, 16): extractor.extract(frames[i:i+16])
+        duration = time.perf_counter() - time1
+        print(f'{label}: {num_frames/duration:.0f} frames/s ({frame_shape[0]}x{frame_shape[1]}, {num_tracks} tracks)')
+
+if __name__ == '__main__':
+    test_benchmark_frame_extraction()
@@ -0,0 +1,274 @@
+"""
+Compositing of a mapping measurement heatmap (MeaRMap_Unit) over the stitched image of an image
+measurement (MeaImg_Unit).
+
+Redrawing the overlay from scratch re-stitches the image and re-converts every mapping coordinate
+from the stage to the measurement frame of reference (laser position) for every wavelength, colour
+map or opacity change. The overlay plotter keeps the overlay as layers instead:
+- Background layer: the stitched image and its extent, cached until the image unit, its tiles,
+    placement, blending or calibration (ImgMea_Cal) change
+- Coordinates: the measurement coordinates of the mapping points, cached until the stage
+    coordinates or the calibration change
+- Heatmap layer: the collection of the heatmap plot. When only the data (wavelength, channel),
+    the colour limits, the colour map or the opacity change, only the collection's array, norm,
+    colour map and alpha are updated. Any other change (plotter, points, background, marker size)
+    redraws the layers.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import json
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+from matplotlib.collections import Collection, PolyCollection
+from matplotlib.colorbar import Colorbar
+from matplotlib.tri import Triangulation
+
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.measurement_RamanMap import MeaRMap_Plotter, MeaRMap_Unit, PlotterOptions, PlotterParams,\
+    PlotterExtraParamsBase, PlotterExtParams_Scattering
+
+from iris.gui import AppPlotEnum
+
+
+@dataclass
+class PlotterParams_Overlay(PlotterParams):
+    """
+    Dataclass for the overlay plotter parameters, the mapping unit coordinates are in the stage
+    frame of reference and are converted to the measurement frame of reference of the image unit
+    """
+    img_unit:MeaImg_Unit|None=None
+    low_res:bool=True       # Stitch the low resolution images
+    show_image:bool=True    # Show the stitched image under the heatmap
+    alpha:float|None=None   # Opacity of the heatmap, None for opaque
+    cmap:str|None=None      # Colour map of the heatmap, None for AppPlotEnum.PLT_COLOUR_MAP
+
+@dataclass
+class _HeatmapLayer:
+    """
+    Heatmap layer of the overlay plot
+    """
+    key:tuple               # Structure of the plot, a different key requires a redraw
+    collection:Collection   # Heatmap collection
+    triangulation:Triangulation|None=None   # Triangulation of a flat-shaded interpolation plot
+
+class MeaRMap_OverlayPlotter(MeaRMap_Plotter):
+    """
+    Heatmap plotter overlaying the heatmap on the stitched image of an image unit, given with the
+    PlotterParams_Overlay. Other parameters plot the heatmap as MeaRMap_Plotter.
+    """
+    def __init__(self):
+        super().__init__()
+        self._params_overlay:PlotterParams_Overlay|None = None
+
+        self._background_key:tuple|None = None
+        self._background:tuple[Image.Image,tuple[float,float,float,float]]|None = None
+
+        self._coor_key:tuple|None = None
+        self._coor_stage:tuple[np.ndarray,np.ndarray]|None = None
+        self._coor_mea:tuple[list[float],list[float]]|None = None
+
+        self._layer:_HeatmapLayer|None = None
+        self._dict_counts = {'stitch':0, 'coordinates':0, 'redraw':0, 'update':0}
+
+    def get_cache_counts(self) -> dict[str,int]:
+        """
+        Returns the number of image stitches, coordinate conversions, full redraws and layer updates
+
+        Returns:
+            dict[str,int]: Counts with the keys 'stitch', 'coordinates', 'redraw' and 'update'
+        """
+        return dict(self._dict_counts)
+
+    def clear_cache(self) -> None:
+        """
+        Clears the cached background, coordinates and heatmap layer, the next plot is redrawn
+        """
+        self._background_key = None
+        self._background = None
+        self._coor_key = None
+        self._coor_stage = None
+        self._coor_mea = None
+        self._layer = None
+
+    @staticmethod
+    def _get_calibration_signature(img_unit:MeaImg_Unit) -> str:
+        """
+        Returns a signature of the calibration of the image unit, changing with any of its parameters
+        """
+        cal_id, dict_cal = img_unit.get_calibration_asdict()
+        return json.dumps([cal_id, dict_cal], sort_keys=True, default=str)
+
+    def _get_background(self, img_unit:MeaImg_Unit, low_res:bool, cal_signature:str)\
+        -> tuple[Image.Image,tuple[float,float,float,float]]:
+        """
+        Returns the stitched image of the image unit and its extent, stitched only if the unit changed
+
+        Args:
+            img_unit (MeaImg_Unit): Image unit
+            low_res (bool): Stitch the low resolution images
+            cal_signature (str): Calibration signature of the image unit
+
+        Returns:
+            tuple[Image.Image,tuple[float,float,float,float]]: Stitched image, extent (left,right,bottom,top) [mm]
+        """
+        key = (img_unit.get_IdName()[0], low_res, img_unit.get_numMeasurements(), cal_signature,
+               id(img_unit.get_stitch_blending()), tuple(map(tuple, img_unit.get_tile_offsets())))
+        if key == self._background_key and self._background is not None: return self._background
+
+        img_stitched, limit_min, limit_max = img_unit.get_image_all_stitched(low_res=low_res)
+        extent = (
+            min(limit_min[0],limit_max[0]),
+            max(limit_max[0],limit_min[0]),
+            min(limit_min[1],limit_max[1]),
+            max(limit_max[1],limit_min[1])
+        )
+        self._background_key = key
+        self._background = (img_stitched, extent)
+        self._dict_counts['stitch'] += 1
+        return self._background
+
+    def _retrieve_heatmap_data(self, mapping_unit:MeaRMap_Unit|None, wavelength:float|None, channel:str|None=None,
+                               spectral_channel:str|None=None):
+        """
+        Retrieves the heatmap data, with the coordinates converted to the measurement frame of
+        reference of the image unit when overlaying
+        """
+        x_val, y_val, intensity = super()._retrieve_heatmap_data(mapping_unit, wavelength, channel, spectral_channel)
+        params = self._params_overlay
+        if params is None or not isinstance(params.img_unit, MeaImg_Unit): return x_val, y_val, intensity
+
+        img_unit = params.img_unit
+        arr_x = np.asarray(x_val, dtype=float)
+        arr_y = np.asarray(y_val, dtype=float)
+        key = (img_unit.get_IdName()[0], self._get_calibration_signature(img_unit))
+        if key != self._coor_key or self._coor_stage is None\
+            or not np.array_equal(arr_x, self._coor_stage[0]) or not np.array_equal(arr_y, self._coor_stage[1]):
+            list_coor_mea = [img_unit.convert_stg2mea((x,y)) for x,y in zip(x_val,y_val)]
+            self._coor_key = key
+            self._coor_stage = (arr_x, arr_y)
+            self._coor_mea = ([coor[0] for coor in list_coor_mea], [coor[1] for coor in list_coor_mea])
+            self._dict_counts['coordinates'] += 1
+        assert self._coor_mea is not None
+        return list(self._coor_mea[0]), list(self._coor_mea[1]), intensity
+
+    def overlay_image(self, image: Image.Image, extent:tuple[float,float,float,float],
+                      callback=None) -> None:
+        """
+        Overlay an image on the heatmap plot
+
+        Args:
+            image (Image.Image): Image object to overlay
+            extent (tuple): Extent of the image in the plot (left,right,bottom,top) coordinates
+            callback (Callable|None): Function called after the overlay. Default is None
+        """
+        assert isinstance(image,Image.Image), "Invalid image object."
+        assert isinstance(extent,tuple) and len(extent)==4, "Invalid extent object."
+
+        ax = self._ax
+
+        # Get current min and max values
+        x_min, x_max = ax.get_xlim()
+        y_min, y_max = ax.get_ylim()
+
+        x_min_all = min(x_min, min(extent[0], extent[1]))
+        y_min_all = min(y_min, min(extent[2], extent[3]))
+        x_max_all = max(x_max, max(extent[0], extent[1]))
+        y_max_all = max(y_max, max(extent[2], extent[3]))
+
+        ax.imshow(image, extent=extent, interpolation='lanczos')
+
+        ax.set_xlim(x_min_all, x_max_all)
+        ax.set_ylim(y_min_all, y_max_all)
+        ax.set_aspect(AppPlotEnum.PLT_ASPECT.value)
+
+        # Callback function
+        if callback is not None: callback()
+
+    def _get_collection(self) -> Collection|None:
+        """
+        Returns the heatmap collection of the plot, None if there is none (e.g., empty plot)
+        """
+        if len(self._ax.collections) == 0 or not isinstance(self._cbar, Colorbar): return None
+        collection = self._ax.collections[0]
+        return collection if self._cbar.mappable is collection else None
+
+    def _set_layer_data(self, layer:_HeatmapLayer, intensity:np.ndarray, clim:tuple|None) -> None:
+        """
+        Sets the heatmap data and colour limits of the heatmap layer
+
+        Args:
+            layer (_HeatmapLayer): Heatmap layer
+            intensity (np.ndarray): Intensity of the mapping points
+            clim (tuple|None): Colour limits (min,max), None values for the data limits
+        """
+        intensity = np.asarray(intensity, dtype=float)
+        if layer.triangulation is not None:
+            # Flat shading: one colour per triangle, the mean of its vertices' values (as tripcolor)
+            intensity = intensity[layer.triangulation.get_masked_triangles()].mean(axis=1)
+        layer.collection.set_array(intensity)
+        layer.collection.autoscale()
+        if isinstance(clim,tuple) and len(clim) == 2:
+            layer.collection.set_clim(vmin=clim[0],vmax=clim[1])
+
+    def _set_layer_style(self, layer:_HeatmapLayer, params:PlotterParams_Overlay) -> None:
+        """
+        Sets the colour map and opacity of the heatmap layer and its colour bar
+        """
+        layer.collection.set_cmap(params.cmap if params.cmap is not None else AppPlotEnum.PLT_COLOUR_MAP.value)
+        layer.collection.set_alpha(params.alpha)
+        if isinstance(self._cbar, Colorbar): self._cbar.update_normal(layer.collection)
+
+    def plot_heatmap(self, plotter:PlotterOptions, params:PlotterParams, params_extra:PlotterExtraParamsBase|None = None) -> None:
+        """
+        Plots the heatmap, overlaid on the stitched image of the image unit if the parameters are
+        PlotterParams_Overlay. Only the heatmap layer is updated if the plot structure is unchanged.
+        """
+        if not isinstance(params, PlotterParams_Overlay) or not isinstance(params.img_unit, MeaImg_Unit):
+            self._params_overlay = None
+            self._layer = None
+            super().plot_heatmap(plotter, params, params_extra)
+            return
+
+        assert params.alpha is None or 0.0 <= params.alpha <= 1.0, 'The heatmap opacity must be between 0 and 1'
+        self._params_overlay = params
+        img_unit = params.img_unit
+        cal_signature = self._get_calibration_signature(img_unit)
+        background = self._get_background(img_unit, params.low_res, cal_signature)\
+            if params.show_image and img_unit.check_measurement_exist() else None
+
+        try: x_val, y_val, intensity = self._retrieve_heatmap_data(
+            params.mapping_unit, params.wavelength, params.channel, params.spectral_channel)
+        except ValueError: x_val = y_val = intensity = None
+
+        marker_size = params_extra.marker_size if isinstance(params_extra, PlotterExtParams_Scattering) else None
+        key = (plotter, id(params.mapping_unit), self._coor_key, id(self._coor_mea), marker_size,
+               id(background), tuple(self._fig.get_size_inches()))
+
+        layer = self._layer
+        if layer is not None and intensity is not None and layer.key == key\
+            and self._get_collection() is layer.collection:
+            self._set_layer_data(layer, intensity, params.clim)
+            self._set_layer_style(layer, params)
+            self._ax.set_title(params.title)
+            self._dict_counts['update'] += 1
+            return
+
+        # Redraw the heatmap and the background
+        self._layer = None
+        super().plot_heatmap(plotter, params, params_extra)
+        collection = self._get_collection()
+        if collection is not None and x_val is not None:
+            triangulation = None
+            if plotter == PlotterOptions.interpolation and isinstance(collection, PolyCollection):
+                triangulation = Triangulation(x_val, y_val)
+            self._layer = _HeatmapLayer(key=key, collection=collection, triangulation=triangulation)
+            self._set_layer_style(self._layer, params)
+        if background is not None: self.overlay_image(image=background[0], extent=background[1])
+        self._dict_counts['redraw'] += 1
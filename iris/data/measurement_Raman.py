@@ -491,6 +491,12 @@ class MeaRaman():
             lbl_wvl: wavelength,
             lbl_int: avg_intensity
         })
+        
+        # Extra intensity columns (e.g., the other tracks of a multi-track acquisition) are averaged too
+        list_extra = [col for col in spectra_list[0].columns if col not in (lbl_wvl, lbl_int)
+                      and all(col in spectra.columns for spectra in spectra_list)]
+        for col in list_extra:
+            avg_spectra[col] = np.mean(np.vstack([spectra[col].values for spectra in spectra_list]), axis=0)
         return avg_spectra
     
     def copy(self) -> Self: # type: ignore
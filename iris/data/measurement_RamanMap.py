@@ -20,10 +20,13 @@ from dataclasses import dataclass
 from typing import TypedDict
 
 import dill
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import sqlite3 as sql
 import json
 import uuid
-from typing import Callable, Self
+from typing import Callable, Self, Literal
 from enum import Enum
 
 import matplotlib
@@ -42,6 +45,8 @@ if __name__ == '__main__':
 from iris.utils.general import convert_wavelength_to_ramanshift, convert_ramanshift_to_wavelength, thread_assign,\
     get_timestamp_us_int, get_timestamp_us_str, get_timestamp_sec
 from iris.data.measurement_Raman import MeaRaman
+from iris.utils.tracing import traced
+from iris.data.scan_qa import ScanQA_Report, save_scan_qa_database, load_scan_qa_database
 
 from iris import DataAnalysisConfigEnum as DAEnum
 from iris.data import SaveParamsEnum
@@ -129,9 +134,33 @@ class MeaRMap_Unit():
         assert all([key in self._dict_measurement_types.keys() for key in self._dict_measurement.keys()]),\
             'mapping_measurement_unit: The measurement keys are not the same as the measurement types.'
         
+        # Derived heatmap channels: per-measurement values computed from the spectra (e.g., PCA scores).
+        # They are not saved and are cleared whenever the measurement data changes, except for the
+        # row-wise channels (each value computed from its own measurement only, e.g., band areas),
+        # which are extended with NaN when measurements are appended, see set_derived_channel_rows().
+        self._dict_derived_channels:dict[str,np.ndarray] = {}
+        self._set_derived_rowwise:set[str] = set()
+        
+        # Acquisition quality report of the scan that produced the unit (see iris.data.scan_qa), saved with the unit
+        self._scan_qa:ScanQA_Report|None = None
+        
         # Observer setup
         self._list_observers = []
         
+    def __setstate__(self, state:dict) -> None:
+        """
+        Restores a pickled unit, adding the attributes introduced after it was pickled. The lock is
+        recreated: a lock restored by dill may not be acquirable
+        
+        Args:
+            state (dict): the pickled attributes of the unit
+        """
+        self.__dict__.update(state)
+        self._lock_measurement = threading.RLock()
+        self.__dict__.setdefault('_dict_derived_channels', {})
+        self.__dict__.setdefault('_set_derived_rowwise', set())
+        self.__dict__.setdefault('_scan_qa', None)
+        
     def get_laser_params(self) -> tuple[float,float]:
         """
         Returns the laser wavelength and power metadata
@@ -213,7 +242,9 @@ class MeaRMap_Unit():
         assert all([key in dict_measurement.keys() for key in self._dict_measurement.keys()]),\
             'set_dict_measurements: The input dictionary keys are not the same as the stored data keys.'
         
-        with self._lock_measurement: self._dict_measurement = dict_measurement
+        with self._lock_measurement:
+            self._dict_measurement = dict_measurement
+            self._dict_derived_channels.clear()
         self._flg_measurement_exist = True
         
         if self.check_measurement_and_metadata_exist(): self._notify_observers()
@@ -267,7 +298,52 @@ class MeaRMap_Unit():
             ])  # (N, W)
 
         return coords, spectra, wavenumbers, wavelengths
-        
+
+    def iter_arr_measurements(self, chunk_size:int=4096, start:int=0):
+        """
+        Iterates over the measurement data in chunks of consecutive measurements, yielding
+        numpy arrays in the same layout as get_arr_measurements() but never holding more
+        than one chunk of spectra in memory at a time.
+
+        The measurement lists are snapshotted (references only) at the start of the
+        iteration, so measurements appended during the iteration are not included.
+
+        Args:
+            chunk_size (int): maximum number of measurements per chunk. Defaults to 4096.
+            start (int): index of the first measurement to iterate over. Defaults to 0.
+
+        Yields:
+            tuple:
+                start (int): index of the first measurement in the chunk
+                coords (n, 4): float64 array of [timestamp, x, y, z] per measurement
+                spectra (n, W): float64 array of intensities per measurement
+        """
+        assert isinstance(chunk_size, int) and chunk_size > 0, 'iter_arr_measurements: The chunk size must be a positive integer.'
+        assert isinstance(start, int) and start >= 0, 'iter_arr_measurements: The start index must be a non-negative integer.'
+
+        with self._lock_measurement:
+            list_ts = list(self._dict_measurement[self._label_ts])
+            list_x = list(self._dict_measurement[self._label_x])
+            list_y = list(self._dict_measurement[self._label_y])
+            list_z = list(self._dict_measurement[self._label_z])
+            list_avemea = list(self._dict_measurement[self._label_avemea])
+
+        num_mea = len(list_ts)
+        for start in range(start, num_mea, chunk_size):
+            end = min(start + chunk_size, num_mea)
+            coords = np.array([
+                list_ts[start:end],
+                list_x[start:end],
+                list_y[start:end],
+                list_z[start:end],
+            ], dtype=np.float64).T  # (n, 4)
+
+            spectra = np.empty((end - start, len(list_avemea[start])), dtype=np.float64)
+            for i, df in enumerate(list_avemea[start:end]):
+                spectra[i] = df[self._dflabel_intensity].to_numpy(dtype=np.float64)
+
+            yield start, coords, spectra
+
     def get_dict_types(self) -> tuple[dict,dict]:
         """
         Returns the dictionary of the data types stored in the class
@@ -436,11 +512,13 @@ class MeaRMap_Unit():
         with self._lock_measurement:
             for key in dict_measurement.keys():
                 self._dict_measurement[key].append(dict_measurement[key])
+            self._extend_derived_channels()
             
         self._flg_measurement_exist = True
         
         self._notify_observers()
         
+    @traced('mapunit.append', cat='saving')
     def append_ramanmeasurement_data(self,timestamp:int,coor:tuple[float,float,float],measurement:MeaRaman):
         """
         Appends the measurement data into the list of stored measurements.
@@ -472,6 +550,7 @@ class MeaRMap_Unit():
             self._dict_measurement[self._label_z].append(coor[2])
             self._dict_measurement[self._label_listmea].append(measurement.get_raw_list())
             self._dict_measurement[self._label_avemea].append(measurement.get_analysed())
+            self._extend_derived_channels()
         
         self._flg_measurement_exist = True
         
@@ -505,6 +584,7 @@ class MeaRMap_Unit():
             self._dict_measurement[self._label_y].append(coor[1])
             self._dict_measurement[self._label_z].append(coor[2])
             self._dict_measurement[self._label_avemea].append(measurement_df)
+            self._extend_derived_channels()
         
         self._flg_measurement_exist = True
         
@@ -537,6 +617,7 @@ class MeaRMap_Unit():
                 If None, clears all measurements. Defaults to None.
         """
         with self._lock_measurement:
+            self._dict_derived_channels.clear()
             if list_timestamp is None:
                 for key in self._dict_measurement.keys():
                     self._dict_measurement[key] = []
@@ -792,13 +873,33 @@ class MeaRMap_Unit():
         """
         return (self._label_x,self._label_y,self._label_z,self._dflabel_wavelength,self._dflabel_intensity)
     
-    def get_heatmap_table(self, wavelength: float) -> pd.DataFrame:
+    def get_list_spectral_channels(self) -> list[str]:
+        """
+        Returns the names of the extra intensity columns of the measurement dataframes, i.e., the
+        spectra of the other tracks of a multi-track acquisition (the primary spectrum being the
+        intensity column)
+        
+        Returns:
+            list[str]: list of the spectral channel names
+        """
+        if not self._flg_measurement_exist: return []
+        with self._lock_measurement:
+            if not self._dict_measurement[self._label_avemea]: return []
+            df:pd.DataFrame = self._dict_measurement[self._label_avemea][-1]
+            return [str(col) for col in df.columns if col not in (self._dflabel_wavelength, self._dflabel_intensity)]
+    
+    def get_heatmap_table(self, wavelength: float, spectral_channel:str|None=None) -> pd.DataFrame:
         """
         Returns a dataframe containing the x, y, z coordinates and the intensity
         values at the specified wavelength for all measurements.
         
         Args:
             wavelength (float): Wavelength to extract the intensity values from.
+            spectral_channel (str|None): Spectral channel (see get_list_spectral_channels()) to extract
+                the values from instead of the intensity. Defaults to None.
+        
+        Raises:
+            KeyError: If the spectral channel does not exist
         """
         if not self._dict_measurement[self._label_avemea]:
             return pd.DataFrame()
@@ -822,7 +923,9 @@ class MeaRMap_Unit():
         # 3. Heavy Extraction (Outside the lock)
         sample_df = ave_mea_snapshot[-1]
         wvl_idx = sample_df[self._dflabel_wavelength].tolist().index(closest_wavelength)
-        int_col_idx = sample_df.columns.get_loc(self._dflabel_intensity)
+        if spectral_channel is not None and spectral_channel not in self.get_list_spectral_channels():
+            raise KeyError(f'get_heatmap_table: The spectral channel does not exist: {spectral_channel}')
+        int_col_idx = sample_df.columns.get_loc(self._dflabel_intensity if spectral_channel is None else spectral_channel)
         
         # This loop takes time, but it doesn't block the hardware anymore!
         intensities = [df.iat[wvl_idx, int_col_idx] for df in ave_mea_snapshot]
@@ -835,6 +938,152 @@ class MeaRMap_Unit():
             self._dflabel_intensity: intensities
         })
     
+    def _extend_derived_channels(self) -> None:
+        """
+        Updates the derived channels after measurements are appended (to be called under the
+        measurement lock): the row-wise channels are extended with NaN, the others are cleared
+        """
+        num_mea = len(self._dict_measurement[self._label_ts])
+        for channel in list(self._dict_derived_channels.keys()):
+            values = self._dict_derived_channels[channel]
+            if channel not in self._set_derived_rowwise: self._dict_derived_channels.pop(channel)
+            elif len(values) < num_mea:
+                self._dict_derived_channels[channel] = np.concatenate([values, np.full(num_mea-len(values), np.nan)])
+        
+    def set_derived_channel(self, channel:str, values:np.ndarray, notify:bool=True, rowwise:bool=False) -> None:
+        """
+        Stores a derived heatmap channel, i.e., one value per measurement computed from the spectra
+        (e.g., PCA scores, band areas). The channel is cleared when the measurement data changes.
+        
+        Args:
+            channel (str): name of the channel, replaces any existing channel with the same name
+            values (np.ndarray): (N,) array of values, in the same order as the measurements
+            notify (bool): notify the observers of the change. Defaults to True.
+            rowwise (bool): each value depends only on its own measurement. The channel is then kept
+                when measurements are appended, with NaN for the new measurements until they are set
+                with set_derived_channel_rows(). The values may then cover only the first measurements
+                (e.g., computed before measurements were appended), the others being NaN. Defaults to False.
+        """
+        assert isinstance(channel, str) and channel != '', 'set_derived_channel: The channel name must be a non-empty string.'
+        values = np.asarray(values, dtype=np.float64)
+        with self._lock_measurement:
+            num_mea = len(self._dict_measurement[self._label_ts])
+            if rowwise and values.ndim == 1 and len(values) < num_mea:
+                values = np.concatenate([values, np.full(num_mea-len(values), np.nan)])
+            assert values.shape == (num_mea,),\
+                'set_derived_channel: The number of values does not match the number of measurements.'
+            self._dict_derived_channels[channel] = values
+            if rowwise: self._set_derived_rowwise.add(channel)
+            else: self._set_derived_rowwise.discard(channel)
+        if notify: self._notify_observers()
+        
+    def set_derived_channel_rows(self, dict_values:dict[str,np.ndarray], start:int, notify:bool=True) -> bool:
+        """
+        Sets the values of row-wise derived channels for the measurements from a given index,
+        e.g., for the measurements appended since the channels were computed
+        
+        Args:
+            dict_values (dict[str,np.ndarray]): (n,) array of values per channel name, for the
+                measurements start to start+n
+            start (int): index of the first measurement
+            notify (bool): notify the observers of the change. Defaults to True.
+        
+        Returns:
+            bool: False if a channel no longer exists (cleared by a change in the measurement data)
+                or is not row-wise, in which case nothing is set
+        """
+        assert isinstance(start, int) and start >= 0, 'set_derived_channel_rows: The start index must be a non-negative integer.'
+        with self._lock_measurement:
+            for channel, values in dict_values.items():
+                if channel not in self._dict_derived_channels or channel not in self._set_derived_rowwise: return False
+                if start + len(values) > len(self._dict_derived_channels[channel]): return False
+            for channel, values in dict_values.items():
+                # Copy on write: the arrays returned by get_derived_channel are never modified
+                arr = self._dict_derived_channels[channel].copy()
+                arr[start:start+len(values)] = values
+                self._dict_derived_channels[channel] = arr
+        if notify: self._notify_observers()
+        return True
+        
+    def get_derived_channel(self, channel:str) -> np.ndarray:
+        """
+        Returns the values of a derived heatmap channel
+        
+        Args:
+            channel (str): name of the channel
+        
+        Returns:
+            np.ndarray: (N,) array of values, in the same order as the measurements
+            
+        Raises:
+            KeyError: If the channel does not exist (or has been cleared by a change in the measurement data)
+        """
+        with self._lock_measurement:
+            if channel not in self._dict_derived_channels:
+                raise KeyError(f'get_derived_channel: The channel does not exist: {channel}')
+            return self._dict_derived_channels[channel]
+        
+    def get_list_derived_channels(self) -> list[str]:
+        """
+        Returns the list of the derived heatmap channel names
+        
+        Returns:
+            list[str]: list of the channel names
+        """
+        with self._lock_measurement:
+            return list(self._dict_derived_channels.keys())
+        
+    def remove_derived_channel(self, channel:str|None=None) -> None:
+        """
+        Removes a derived heatmap channel
+        
+        Args:
+            channel (str|None): name of the channel to remove. Removes all channels if None. Defaults to None.
+        """
+        with self._lock_measurement:
+            if channel is None: self._dict_derived_channels.clear()
+            else: self._dict_derived_channels.pop(channel, None)
+            if channel is None: self._set_derived_rowwise.clear()
+            else: self._set_derived_rowwise.discard(channel)
+        self._notify_observers()
+        
+    def set_scan_qa(self, report:ScanQA_Report|None) -> None:
+        """
+        Attaches the acquisition quality report of the scan to the unit
+        
+        Args:
+            report (ScanQA_Report|None): the report, None to remove it
+        """
+        assert report is None or isinstance(report, ScanQA_Report), 'set_scan_qa: Expected a ScanQA_Report or None.'
+        self._scan_qa = report
+        
+    def get_scan_qa(self) -> ScanQA_Report|None:
+        """
+        Returns the acquisition quality report of the scan, None if there is none
+        """
+        return self._scan_qa
+        
+    def get_heatmap_table_channel(self, channel:str) -> pd.DataFrame:
+        """
+        Returns a dataframe containing the x, y, z coordinates and the values of a derived
+        heatmap channel for all measurements, in the same format as get_heatmap_table().
+        
+        Args:
+            channel (str): name of the derived channel
+        """
+        with self._lock_measurement:
+            values = self.get_derived_channel(channel)
+            x_coor = list(self._dict_measurement[self._label_x])
+            y_coor = list(self._dict_measurement[self._label_y])
+            z_coor = list(self._dict_measurement[self._label_z])
+        
+        return pd.DataFrame({
+            self._label_x: x_coor,
+            self._label_y: y_coor,
+            self._label_z: z_coor,
+            self._dflabel_intensity: values,
+        })
+    
     def add_observer(self, observer: Callable) -> None:
         """
         Adds an observer to the list of observers.
@@ -893,6 +1142,7 @@ class MeaRMap_Unit():
             except: pass
         self._dict_measurement.clear()
         self._dict_measurement_types.clear()
+        self._dict_derived_channels.clear()
         
         self._notify_observers()
     
@@ -951,6 +1201,16 @@ class MeaRMap_Hub():
         
         self._lock = threading.RLock()  # Lock for thread safety
         
+    def __setstate__(self, state:dict) -> None:
+        """
+        Restores a pickled hub, recreating the lock: a lock restored by dill may not be acquirable
+        
+        Args:
+            state (dict): the pickled attributes of the hub
+        """
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        
     def add_observer(self,callback:Callable) -> None:
         """
         Adds a callback to be called when the mapping measurement is updated.
@@ -1353,11 +1613,23 @@ class MeaRMap_Handler():
             SaveParamsEnum.SAVE_OPTIONS_TXT.value: 'text files',
             SaveParamsEnum.SAVE_OPTIONS_PARQUET.value: 'parquet files',
             SaveParamsEnum.SAVE_OPTIONS_FEATHER.value: 'feather files',
+            SaveParamsEnum.SAVE_OPTIONS_NPYCHUNKS.value: 'chunked npy directories',
         }
         
+        # Chunked array export parameters
+        self._chunked_format = 'iris-npyc'      # Format identifier stored in the chunked export metadata
+        self._chunked_version = '0.1.0-2026.10.19'  # Version of the chunked export format
+        self._chunked_metafile = 'metadata.json'    # Metadata file name, written last to mark a complete export
+        self._default_chunk_size = 4096         # Default number of measurements per chunk
+        
+        # External (csv/txt/parquet/feather) export parameters
+        self._default_export_batch_size = 1000  # Default number of measurements per record batch
+        self._label_accumulation = 'Accumulation'   # Column numbering the raw spectra in the 'wide' layout
+        
         self._default_extension = SaveParamsEnum.DEFAULT_SAVE_EXT.value
         self._default_extension = SaveParamsEnum.SAVE_OPTIONS_CSV.value if self._default_extension not in self._dict_extensions.keys() else self._default_extension
         
+    @traced('db.save_metadata', cat='saving')
     def _save_MappingMeasurementUnit_metadata_database(self,mappingUnit:MeaRMap_Unit,conn:sql.Connection) -> None:
         """
         Saves the mappingUnit data into a database.
@@ -1426,6 +1698,7 @@ class MeaRMap_Handler():
         conn.commit()
         return
         
+    @traced('db.save_measurements', cat='saving')
     def _save_MappingMeasurementUnit_measurement_database(
         self,mappingUnit:MeaRMap_Unit,conn:sql.Connection,conn_path:str) -> None:
         """
@@ -1572,11 +1845,104 @@ class MeaRMap_Handler():
         """
         return self._dict_extensions.copy()
         
+    def _get_MappingUnit_ext_schema(self,mappingUnit:MeaRMap_Unit,flg_saveraw:bool,
+                                    layout:Literal['long','wide']) -> pa.Schema:
+        """
+        Returns the pyarrow schema of the external save file for a given MappingUnit.
+        
+        Args:
+            mappingUnit (MeaRMap_Unit): The MappingUnit to be saved
+            flg_saveraw (bool): flag to save the raw data
+            layout (Literal['long','wide']): 'long' for one row per (measurement, wavelength), 'wide' for
+                one row per spectrum with one column per wavelength
+        
+        Returns:
+            pa.Schema: schema of the record batches
+        """
+        mea_id_key,lbl_x,lbl_y,lbl_z,lbl_listmea,_ = mappingUnit.get_keys_dict_measurement()
+        _,_,_,lbl_wavelength,lbl_intensity = mappingUnit.get_labels()
+        
+        # The measurement IDs (timestamps) are stored as strings, as in the MappingUnit and the previous exports
+        list_fields = [pa.field(mea_id_key, pa.string())] + [pa.field(lbl, pa.float64()) for lbl in (lbl_x,lbl_y,lbl_z)]
+        if layout == 'long':
+            list_fields.append(pa.field(lbl_wavelength, pa.float64()))
+            if flg_saveraw:
+                list_rawmea = mappingUnit.get_dict_measurements(copy=True)[lbl_listmea]
+                max_raw = max([len(list_df) if list_df else 1 for list_df in list_rawmea])
+                list_fields.extend([pa.field(lbl_intensity + f'_{j+1}', pa.float64()) for j in range(max_raw)])
+            else:
+                list_fields.append(pa.field(lbl_intensity, pa.float64()))
+        elif layout == 'wide':
+            if flg_saveraw: list_fields.append(pa.field(self._label_accumulation, pa.int64()))
+            list_fields.extend([pa.field(str(wvl), pa.float64()) for wvl in mappingUnit.get_list_wavelengths()])
+        else:
+            raise ValueError('_get_MappingUnit_ext_schema: The layout is not recognised: {}'.format(layout))
+        return pa.schema(list_fields)
+    
+    def _iter_MappingUnit_recordbatches(self,mappingUnit:MeaRMap_Unit,schema:pa.Schema,flg_saveraw:bool,
+                                        layout:Literal['long','wide'],batch_size:int):
+        """
+        Iterates over the measurements of a MappingUnit in batches of consecutive measurements
+        and converts each batch into a pyarrow RecordBatch following the given schema.
+        
+        Args:
+            mappingUnit (MeaRMap_Unit): The MappingUnit to be saved
+            schema (pa.Schema): schema from _get_MappingUnit_ext_schema()
+            flg_saveraw (bool): flag to save the raw data. Measurements without raw data use the averaged spectrum.
+            layout (Literal['long','wide']): layout of the output, see _get_MappingUnit_ext_schema()
+            batch_size (int): number of measurements per batch
+        
+        Yields:
+            tuple[int, pa.RecordBatch]: number of measurements converted so far and the record batch
+        """
+        dict_mea = mappingUnit.get_dict_measurements(copy=True)
+        mea_id_key,lbl_x,lbl_y,lbl_z,lbl_listmea,lbl_avemea = mappingUnit.get_keys_dict_measurement()
+        _,_,_,lbl_wavelength,lbl_intensity = mappingUnit.get_labels()
+        num_mea = len(dict_mea[mea_id_key])
+        num_intensity = len(schema) - 5 if layout == 'long' else None
+        
+        for start in range(0, num_mea, batch_size):
+            end = min(start + batch_size, num_mea)
+            list_ts = [str(ts) for ts in dict_mea[mea_id_key][start:end]]
+            list_coor = [dict_mea[lbl][start:end] for lbl in (lbl_x,lbl_y,lbl_z)]
+            
+            # Spectra of every measurement in the batch: averaged spectrum, or the list of raw spectra
+            if flg_saveraw:
+                list_spectra = [list_df if list_df else [df_avg] for list_df,df_avg in
+                                zip(dict_mea[lbl_listmea][start:end],dict_mea[lbl_avemea][start:end])]
+            else:
+                list_spectra = [[df_avg] for df_avg in dict_mea[lbl_avemea][start:end]]
+            
+            if layout == 'long':
+                arr_len = np.array([len(list_df[0]) for list_df in list_spectra])
+                list_arrays = [np.repeat(np.array(list_ts, dtype=object), arr_len)]
+                list_arrays.extend([np.repeat(np.array(coor, dtype=np.float64), arr_len) for coor in list_coor])
+                list_arrays.append(np.concatenate([list_df[0][lbl_wavelength].to_numpy(dtype=np.float64) for list_df in list_spectra]))
+                for j in range(num_intensity):
+                    list_arrays.append(np.concatenate([
+                        list_df[j][lbl_intensity].to_numpy(dtype=np.float64) if j < len(list_df) else np.full(length, np.nan)
+                        for list_df,length in zip(list_spectra,arr_len)]))
+            else:
+                arr_len = np.array([len(list_df) for list_df in list_spectra])
+                list_arrays = [np.repeat(np.array(list_ts, dtype=object), arr_len)]
+                list_arrays.extend([np.repeat(np.array(coor, dtype=np.float64), arr_len) for coor in list_coor])
+                if flg_saveraw: list_arrays.append(np.concatenate([np.arange(1, length+1) for length in arr_len]))
+                arr_intensity = np.array([df[lbl_intensity].to_numpy(dtype=np.float64) for list_df in list_spectra for df in list_df])
+                list_arrays.extend(arr_intensity.T)
+            
+            yield end, pa.RecordBatch.from_arrays([pa.array(arr, type=field.type, from_pandas=True)
+                                                   for arr,field in zip(list_arrays,schema)], schema=schema)
+    
     @thread_assign
-    def save_MappingUnit_ext(self,mappingUnit:MeaRMap_Unit,filepath:str,flg_saveraw:bool,extension:str)\
-        -> threading.Thread:
+    @traced('file.save_unit', cat='saving')
+    def save_MappingUnit_ext(self,mappingUnit:MeaRMap_Unit,filepath:str,flg_saveraw:bool,extension:str,
+                             layout:Literal['long','wide']='long',batch_size:int|None=None,
+                             callback_progress:Callable[[int,int],None]|None=None,
+                             event_cancel:threading.Event|None=None) -> threading.Thread:
         """
-        Saves a given MappingMeasurement_Unit object into a tab delimited .csv file.
+        Saves a given MappingMeasurement_Unit object into a tab delimited .csv/.txt, parquet or feather file.
+        The measurements are converted and written in batches of measurements (pyarrow RecordBatch),
+        so that the whole table is never held in memory.
 
         Raises:
             AssertionError: If the input data type is not correct or the measurement data does not exist.
@@ -1586,6 +1952,14 @@ class MeaRMap_Handler():
             filepath (str): path to the file to be saved
             flg_saveraw (bool): flag to save the raw data. Defaults to False.
             extension (str): extension of the file to be saved
+            layout (Literal['long','wide']): 'long' for one row per (measurement, wavelength) with the raw
+                spectra as separate intensity columns, 'wide' for one row per spectrum with one column per
+                wavelength (and an accumulation column numbering the raw spectra). Defaults to 'long'.
+            batch_size (int|None): number of measurements per batch. Defaults to None (uses the handler default).
+            callback_progress (Callable[[int,int],None]|None): called after every batch with the number of
+                measurements saved and the total number of measurements. Defaults to None (prints the progress).
+            event_cancel (threading.Event|None): event to cancel the saving process. The partially written
+                files are removed when cancelled. Defaults to None.
 
         Returns:
             threading.Thread: thread of the saving process
@@ -1593,101 +1967,207 @@ class MeaRMap_Handler():
         assert isinstance(mappingUnit, MeaRMap_Unit), 'save_mapping_unit_txt: The input data type is not correct. Expected mapping_measurement_unit object.'
         assert mappingUnit.check_measurement_and_metadata_exist(), 'save_mapping_unit_txt: The measurement data does not exist.'
 
-        dict_meta = mappingUnit.get_dict_unit_metadata().copy()
-        dict_mea_ori = mappingUnit.get_dict_measurements()
-        dict_mea = dict_mea_ori.copy()
-        _,dict_meatypes = mappingUnit.get_dict_types()
-        dict_meatypes = dict_meatypes.copy()
-
-        _,_,_,lbl_wavelength,lbl_intensity = mappingUnit.get_labels()
-
-        # Remove the list of dataframes from the output
-        list_pop = []
-        for key in dict_mea.keys():
-            if dict_meatypes[key] == list[pd.DataFrame]:
-                list_pop.append(key)
-                list_mea_key = key
-            elif dict_meatypes[key] == pd.DataFrame:
-                list_pop.append(key)
-                mea_key = key
-                
-        [dict_mea.pop(key) for key in list_pop]
-        [dict_meatypes.pop(key) for key in list_pop]
-        
-        list_df = []
-        num_measurements = mappingUnit.get_numMeasurements()
-        for i in range(num_measurements):
-            # > Create a new dataframe for the combined measurements
-            mea_combined = pd.DataFrame()
-            size = dict_mea_ori[mea_key][i].shape[0]
-            for key, value_list in dict_mea_ori.items():
-                if key != mea_key and key != list_mea_key:
-                    mea_combined[key] = [value_list[i]] * size
-                    
-            # > Add the wavelength and intensity columns from each raw measurements
-            if flg_saveraw:
-                # > Extract the raw measurements
-                list_mea = dict_mea_ori[list_mea_key][i]
-                
-                size = list_mea[0].shape[0]
-            
-                mea_combined[lbl_wavelength] = list_mea[0][lbl_wavelength]
-                for j,mea in enumerate(list_mea):
-                    lbl_intensity_mod = lbl_intensity + f'_{j+1}'
-                    mea_combined[lbl_intensity_mod] = mea[lbl_intensity]
-            else:
-                mea_combined[lbl_wavelength] = dict_mea_ori[mea_key][i][lbl_wavelength]
-                mea_combined[lbl_intensity] = dict_mea_ori[mea_key][i][lbl_intensity]
-                
-            list_df.append(mea_combined)
-            
-            # Progress bar report
-            # print('Percentage of conversion: {}%'.format(i/num_measurements*100))
-            if i % 1000 == 0:
-                print('Save to .txt progress: Conversion {}% {} of {}'.format(int(i/num_measurements*100),i,num_measurements))
-                
-        print('Save to .txt progress: Conversion 100% {} of {}'.format(num_measurements,num_measurements))
-        print('Save to .txt progress: Concatenating the dataframes')
-
-        df_save = pd.concat(list_df, axis=0, ignore_index=True)
-
-        print('Save to .txt progress: Saving the data')
-        def report_save(flg:threading.Event,filepath):
-            while not flg.is_set():
-                print(f'{time.ctime()} - Still saving the data to {filepath}')
-                time.sleep(5)
-                
-        flg_done = threading.Event()
-        threading.Thread(target=report_save, args=(flg_done,filepath)).start()
+        if extension == SaveParamsEnum.SAVE_OPTIONS_NPYCHUNKS.value:
+            time1 = time.time()
+            self.save_MappingUnit_chunked(mappingUnit,filepath,flg_saveraw)
+            print(f'DONE! Saved to {filepath}; Time taken: {time.time()-time1} s')
+            print('-----------------------------------------------------------------\n')
+            return
+        
+        if batch_size is None: batch_size = self._default_export_batch_size
+        assert isinstance(batch_size, int) and batch_size > 0, 'save_mapping_unit_txt: The batch size must be a positive integer.'
+        
+        flg_text = extension == SaveParamsEnum.SAVE_OPTIONS_CSV.value or extension == SaveParamsEnum.SAVE_OPTIONS_TXT.value
+        if not flg_text and extension not in [SaveParamsEnum.SAVE_OPTIONS_PARQUET.value, SaveParamsEnum.SAVE_OPTIONS_FEATHER.value]:
+            raise ValueError('save_mapping_unit_txt: The extension is not recognised: {}'.format(extension))
         
-        if extension != SaveParamsEnum.SAVE_OPTIONS_CSV.value and extension != SaveParamsEnum.SAVE_OPTIONS_TXT.value:
+        if not flg_text:
             filepath_metadata = os.path.splitext(filepath)[0] + '_metadata.txt'
         else:
             filepath_metadata = filepath
         
         # Save the metadata
+        dict_meta = mappingUnit.get_dict_unit_metadata().copy()
         with open(filepath_metadata, 'w') as f:
             f.write('METADATA\n')
             for key, value in dict_meta.items():
                 f.write(f'{key}: {value}\n')
             f.write('\n')
-            
-        # Save the data via pandas
-        time1 = time.time()
         
-        if extension == SaveParamsEnum.SAVE_OPTIONS_CSV.value or extension == SaveParamsEnum.SAVE_OPTIONS_TXT.value:
-            df_save.to_csv(filepath, mode='a', sep='\t', index=False)
+        # Set up the writer for the requested format
+        time1 = time.time()
+        num_mea = mappingUnit.get_numMeasurements()
+        schema = self._get_MappingUnit_ext_schema(mappingUnit,flg_saveraw,layout)
+        if flg_text:
+            file_text = open(filepath, 'ab')
+            file_text.write(('\t'.join(schema.names) + '\n').encode())
+            writer = pa_csv.CSVWriter(file_text, schema, write_options=pa_csv.WriteOptions(
+                include_header=False, delimiter='\t', quoting_style='none'))
         elif extension == SaveParamsEnum.SAVE_OPTIONS_PARQUET.value:
-            df_save.to_parquet(filepath)
-        elif extension == SaveParamsEnum.SAVE_OPTIONS_FEATHER.value:
-            df_save.to_feather(filepath)
+            writer = pq.ParquetWriter(filepath, schema)
         else:
-            raise ValueError('save_mapping_unit_txt: The extension is not recognised: {}'.format(extension))
-        flg_done.set()
+            writer = pa.ipc.new_file(filepath, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+        
+        # Stream the batches into the file
+        flg_cancelled = False
+        try:
+            for num_done, batch in self._iter_MappingUnit_recordbatches(mappingUnit,schema,flg_saveraw,layout,batch_size):
+                if event_cancel is not None and event_cancel.is_set():
+                    flg_cancelled = True
+                    break
+                writer.write_batch(batch)
+                if callback_progress is not None: callback_progress(num_done,num_mea)
+                else: print('Save to .{} progress: {}% {} of {}'.format(extension,int(num_done/num_mea*100),num_done,num_mea))
+        finally:
+            writer.close()
+            if flg_text: file_text.close()
+            
+        if flg_cancelled:
+            for path in set([filepath, filepath_metadata]):
+                if os.path.exists(path): os.remove(path)
+            print(f'CANCELLED! Saving to {filepath} was cancelled and the partial files were removed')
+            return
 
         print(f'DONE! Saved to {filepath}; Time taken: {time.time()-time1} s')
         print('-----------------------------------------------------------------\n')
         
+    @traced('file.save_unit_chunked', cat='saving')
+    def save_MappingUnit_chunked(self,mappingUnit:MeaRMap_Unit,dirpath:str,flg_saveraw:bool=False,
+                                 chunk_size:int|None=None) -> None:
+        """
+        Saves a given MappingMeasurement_Unit into a directory of fixed-size .npy chunks.
+        The spectra are streamed from the unit chunk by chunk so that the memory overhead
+        of the export is bounded by the chunk size rather than the map size.
+        
+        Directory layout:
+            - metadata.json: format info, labels, chunk size and the unit metadata (written last)
+            - wavelengths.npy: (W,) float64 wavelength axis shared by all measurements
+            - coords_XXXXX.npy: (n, 4) float64 array of [timestamp, x, y, z] per chunk
+            - intensity_XXXXX.npy: (n, W) float64 array of the averaged spectra per chunk
+            - raw_XXXXX.npy, rawcount_XXXXX.npy: (sum of raw counts, W) float64 array of the raw
+                spectra and (n,) int64 array of the number of raw spectra per measurement (only if flg_saveraw)
+        
+        Args:
+            mappingUnit (MeaRMap_Unit): The MappingUnit to be saved
+            dirpath (str): path to the directory to save the chunks into. Will be created if it does not exist.
+            flg_saveraw (bool): flag to also save the raw spectra. Defaults to False.
+            chunk_size (int|None): number of measurements per chunk. Defaults to None (uses the handler default).
+        
+        Raises:
+            AssertionError: If the input data type is not correct, the measurement data does not exist,
+                or the directory exists and is not a previous chunked export or an empty directory.
+        """
+        assert isinstance(mappingUnit, MeaRMap_Unit), 'save_MappingUnit_chunked: The input data type is not correct. Expected mapping_measurement_unit object.'
+        assert mappingUnit.check_measurement_and_metadata_exist(), 'save_MappingUnit_chunked: The measurement data does not exist.'
+        if chunk_size is None: chunk_size = self._default_chunk_size
+        assert isinstance(chunk_size, int) and chunk_size > 0, 'save_MappingUnit_chunked: The chunk size must be a positive integer.'
+        
+        # Prepare the save directory, only overwriting a previous chunked export
+        if os.path.isdir(dirpath) and os.listdir(dirpath):
+            assert os.path.isfile(os.path.join(dirpath,self._chunked_metafile)),\
+                'save_MappingUnit_chunked: The save directory is not empty and is not a chunked export.'
+            shutil.rmtree(dirpath)
+        os.makedirs(dirpath, exist_ok=True)
+        
+        _,_,_,lbl_wavelength,lbl_intensity = mappingUnit.get_labels()
+        _,_,_,_,lbl_listmea,_ = mappingUnit.get_keys_dict_measurement()
+        wavelengths = np.array(mappingUnit.get_list_wavelengths(), dtype=np.float64)
+        np.save(os.path.join(dirpath,'wavelengths.npy'), wavelengths)
+        
+        # Raw spectra references are snapshotted separately as the unit iterator only covers the averaged spectra
+        if flg_saveraw: list_rawmea = mappingUnit.get_dict_measurements(copy=True)[lbl_listmea]
+        
+        num_mea = 0
+        num_chunks = 0
+        for start, coords, spectra in mappingUnit.iter_arr_measurements(chunk_size):
+            assert spectra.shape[1] == len(wavelengths),\
+                'save_MappingUnit_chunked: The measurements do not share the same wavelength axis.'
+            np.save(os.path.join(dirpath,f'coords_{num_chunks:05d}.npy'), coords)
+            np.save(os.path.join(dirpath,f'intensity_{num_chunks:05d}.npy'), spectra)
+            
+            if flg_saveraw:
+                list_chunk_raw = [list_df if list_df is not None else [] for list_df in list_rawmea[start:start+len(coords)]]
+                arr_rawcount = np.array([len(list_df) for list_df in list_chunk_raw], dtype=np.int64)
+                arr_raw = np.empty((int(arr_rawcount.sum()), len(wavelengths)), dtype=np.float64)
+                i = 0
+                for list_df in list_chunk_raw:
+                    for df in list_df:
+                        arr_raw[i] = df[lbl_intensity].to_numpy(dtype=np.float64)
+                        i += 1
+                np.save(os.path.join(dirpath,f'rawcount_{num_chunks:05d}.npy'), arr_rawcount)
+                np.save(os.path.join(dirpath,f'raw_{num_chunks:05d}.npy'), arr_raw)
+                
+            num_mea += len(coords)
+            num_chunks += 1
+            
+        # Write the metadata last so that an interrupted export is not mistaken for a complete one
+        dict_meta = {
+            'format': self._chunked_format,
+            'version': self._chunked_version,
+            'chunk_size': chunk_size,
+            'num_measurements': num_mea,
+            'num_chunks': num_chunks,
+            'flg_saveraw': bool(flg_saveraw),
+            'label_wavelength': lbl_wavelength,
+            'label_intensity': lbl_intensity,
+            'unit_metadata': mappingUnit.get_dict_unit_metadata(),
+        }
+        with open(os.path.join(dirpath,self._chunked_metafile), 'w') as f:
+            json.dump(dict_meta, f, indent=4)
+            
+    def load_MappingUnit_chunked(self,dirpath:str,flg_readraw:bool=True) -> MeaRMap_Unit:
+        """
+        Loads a MappingMeasurement_Unit saved with save_MappingUnit_chunked().
+        
+        Args:
+            dirpath (str): path to the chunked export directory
+            flg_readraw (bool): flag to read the raw spectra, if they were saved. Defaults to True.
+        
+        Returns:
+            MeaRMap_Unit: the reconstructed MappingUnit
+            
+        Raises:
+            AssertionError: If the directory is not a complete chunked export.
+        """
+        metapath = os.path.join(dirpath,self._chunked_metafile)
+        assert os.path.isfile(metapath), 'load_MappingUnit_chunked: The directory is not a complete chunked export.'
+        with open(metapath, 'r') as f:
+            dict_meta = json.load(f)
+        assert dict_meta['format'] == self._chunked_format, 'load_MappingUnit_chunked: The chunked export format is not recognised.'
+        
+        dict_unit_metadata = dict_meta['unit_metadata']
+        mappingUnit = MeaRMap_Unit(unit_name=dict_unit_metadata[self._unit_name_key],
+                                   unit_id=dict_unit_metadata[self._unit_id_key])
+        mappingUnit.set_dict_metadata(dict_unit_metadata)
+        
+        lbl_wavelength = dict_meta['label_wavelength']
+        lbl_intensity = dict_meta['label_intensity']
+        mea_id_key,lbl_x,lbl_y,lbl_z,lbl_listmea,lbl_avemea = mappingUnit.get_keys_dict_measurement()
+        flg_readraw = flg_readraw and dict_meta['flg_saveraw']
+        
+        wavelengths = np.load(os.path.join(dirpath,'wavelengths.npy'))
+        dict_mea = {key: [] for key in (mea_id_key,lbl_x,lbl_y,lbl_z,lbl_listmea,lbl_avemea)}
+        for i in range(dict_meta['num_chunks']):
+            coords = np.load(os.path.join(dirpath,f'coords_{i:05d}.npy'))
+            spectra = np.load(os.path.join(dirpath,f'intensity_{i:05d}.npy'))
+            dict_mea[mea_id_key].extend([int(ts) for ts in coords[:,0]])
+            dict_mea[lbl_x].extend(coords[:,1].tolist())
+            dict_mea[lbl_y].extend(coords[:,2].tolist())
+            dict_mea[lbl_z].extend(coords[:,3].tolist())
+            dict_mea[lbl_avemea].extend([pd.DataFrame({lbl_wavelength: wavelengths, lbl_intensity: spec}) for spec in spectra])
+            
+            if not flg_readraw:
+                dict_mea[lbl_listmea].extend([[] for _ in range(len(coords))])
+                continue
+            arr_rawcount = np.load(os.path.join(dirpath,f'rawcount_{i:05d}.npy'))
+            arr_raw = np.load(os.path.join(dirpath,f'raw_{i:05d}.npy'))
+            idx_split = np.cumsum(arr_rawcount)[:-1]
+            dict_mea[lbl_listmea].extend([[pd.DataFrame({lbl_wavelength: wavelengths, lbl_intensity: spec}) for spec in arr]
+                                          for arr in np.split(arr_raw, idx_split)])
+        
+        mappingUnit.set_dict_measurements(dict_mea)
+        return mappingUnit
+        
     def save_MappingMeasurementHub_prompt(self,saveDirPath:str|None=None,savename:str|None=None):
         """
         Prompts the user to save the data into a database or pickle file
@@ -1766,6 +2246,9 @@ class MeaRMap_Handler():
         for measurement_unit in list_measurement_units:
             self._save_MappingMeasurementUnit_metadata_database(measurement_unit,conn)    
             self._save_MappingMeasurementUnit_measurement_database(measurement_unit,conn,savepath)
+            report = measurement_unit.get_scan_qa()
+            if report is not None:
+                save_scan_qa_database(conn,measurement_unit.get_unit_id(),report,self._table_prefix)
             
         conn.close()
     
@@ -2016,6 +2499,8 @@ class MeaRMap_Handler():
             mappingUnit = MeaRMap_Unit(unit_name=unit_name, unit_id=unit_id)
             mappingUnit = self._load_MappingMeasurementUnit_metadata_database(unit_id, conn, mappingUnit)
             mappingUnit = self._load_MappingMeasurementUnit_measurement_database(unit_id, conn, loadpath, mappingUnit, flg_readraw)
+            scan_qa = load_scan_qa_database(conn, unit_id, self._table_prefix_load)
+            if scan_qa is not None: mappingUnit.set_scan_qa(scan_qa[0])
             mapping_measurement.append_mapping_unit(mappingUnit)
         conn.close()
         return mapping_measurement
@@ -2188,6 +2673,8 @@ class PlotterParams():
     mapping_unit:MeaRMap_Unit|None=None
     wavelength:float|None=None
     clim:tuple[float|None,float|None]|None=None
+    channel:str|None=None   # Derived heatmap channel to plot instead of the intensity at the wavelength
+    spectral_channel:str|None=None  # Spectral channel (e.g., another track) to take the intensity at the wavelength from
     title = '2D Mapping'
     
 class MeaRMap_Plotter:
@@ -2256,7 +2743,7 @@ class MeaRMap_Plotter:
         mapping_unit = params.mapping_unit
         wavelength = params.wavelength
         title = params.title
-        try: x_val, y_val, _ = self._retrieve_heatmap_data(mapping_unit, wavelength)
+        try: x_val, y_val, _ = self._retrieve_heatmap_data(mapping_unit, wavelength, params.channel, params.spectral_channel)
         except ValueError:
             x_val = [0,1]
             y_val = [0,1]
@@ -2302,7 +2789,7 @@ class MeaRMap_Plotter:
         clim = params.clim
         title = params.title
         
-        try: x_val, y_val, intensity = self._retrieve_heatmap_data(mapping_unit, wavelength)
+        try: x_val, y_val, intensity = self._retrieve_heatmap_data(mapping_unit, wavelength, params.channel, params.spectral_channel)
         except ValueError as e: pass; return
         except Exception as e: print(f'Error in plot_heatmap_interp: {e}'); return
         
@@ -2338,10 +2825,19 @@ class MeaRMap_Plotter:
                 list(clim).sort()
             self._cbar.mappable.set_clim(vmin=clim[0],vmax=clim[1])
 
-    def _retrieve_heatmap_data(self, mapping_unit:MeaRMap_Unit|None, wavelength:float|None):
-        if isinstance(mapping_unit,MeaRMap_Unit) and wavelength is not None:    
+    def _retrieve_heatmap_data(self, mapping_unit:MeaRMap_Unit|None, wavelength:float|None, channel:str|None=None,
+                               spectral_channel:str|None=None):
+        if isinstance(mapping_unit,MeaRMap_Unit) and channel is not None:
+            try: df_plot:pd.DataFrame = mapping_unit.get_heatmap_table_channel(channel)
+            except KeyError as e: raise ValueError(f'_retrieve_heatmap_data: {e}')
+            label_x,label_y,_,_,label_intensity = mapping_unit.get_labels()
+            x_val = df_plot[label_x].tolist()
+            y_val = df_plot[label_y].tolist()
+            intensity = df_plot[label_intensity].to_numpy()
+        elif isinstance(mapping_unit,MeaRMap_Unit) and wavelength is not None:    
             # Retrieve the measurement data
-            df_plot:pd.DataFrame = mapping_unit.get_heatmap_table(wavelength)
+            try: df_plot:pd.DataFrame = mapping_unit.get_heatmap_table(wavelength, spectral_channel)
+            except KeyError as e: raise ValueError(f'_retrieve_heatmap_data: {e}')
             label_x,label_y,_,_,label_intensity = mapping_unit.get_labels()
             
             # Convert the x-coordinate and y-coordinate into string to prevent any issues
@@ -2378,7 +2874,7 @@ class MeaRMap_Plotter:
         title = params.title
         size = params_extra.marker_size
         
-        try: x_val, y_val, intensity = self._retrieve_heatmap_data(mapping_unit, wavelength)
+        try: x_val, y_val, intensity = self._retrieve_heatmap_data(mapping_unit, wavelength, params.channel, params.spectral_channel)
         except ValueError as e: print(f'Error in plot_heatmap_scatter: {e}'); return
         
         try:
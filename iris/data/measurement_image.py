@@ -30,6 +30,8 @@ import PySide6.QtWidgets as qw
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 
 import sqlite3 as sql
 import json
@@ -37,12 +39,15 @@ import glob
 import uuid
 
 from iris.utils.general import get_timestamp_us_str, thread_assign
+from iris.utils.config_schema import config_registry
 
 from typing import Callable
 
 from iris.controllers import ControllerConfigEnum
 from iris.data.calibration_objective import ImgMea_Cal, ImgMea_Cal_Hub
-from iris.data import SaveParamsEnum, ImageProcessingParamsEnum
+from iris.data.mosaic_registration import MosaicRegistration_Params, MosaicRegistration_Result, register_mosaic
+from iris.data.mosaic_blending import MosaicBlending_Params, blend_mosaic, prepare_flatfield
+from iris.data import SaveParamsEnum, ImageProcessingParamsEnum, ImgUnitSave_Config
 
 class MeaImg_Unit():
     """
@@ -76,7 +81,7 @@ class MeaImg_Unit():
         self._calibration:ImgMea_Cal|None = calibration
         self._exposure_time_ms:float = float(exposure_time_ms)
 
-        self._list_metadata_keys = ['id','name','calibration_id','calibration_dict','exposure_time_ms']
+        self._list_metadata_keys = ['id','name','calibration_id','calibration_dict','exposure_time_ms','tile_offsets_pixel']
         
         # Stitched image parameters
         self._flg_mat_calculated:bool = False    # Flag to check if the rotation correction matrix is calculated
@@ -102,6 +107,8 @@ class MeaImg_Unit():
         }
         
         self._list_lowResImg = []   # List to store the low resolution images
+        self._list_tile_offsets_pixel:list[tuple[float,float]] = []    # Registration-refined tile placement offsets (full resolution)
+        self._blending_params:MosaicBlending_Params|None = None     # Seam blending of the stitched image, None for plain pasting
         
         assert set(self._dict_measurements.keys()) == set(self._dict_measurements_types.keys()), 'Measurement keys must match the measurement types'
         
@@ -111,6 +118,7 @@ class MeaImg_Unit():
             'calibration_id':str,
             'calibration_dict':dict,
             'exposure_time_ms':float,
+            'tile_offsets_pixel':list,
         }
         
         self._idname_keys = ['id','name']   # Keys for the ID and name to access the metadata
@@ -124,6 +132,7 @@ class MeaImg_Unit():
                 'calibration_id':self._calibration.id,
                 'calibration_dict':self._calibration.get_calibration_asdict(),
                 'exposure_time_ms':self._exposure_time_ms,
+                'tile_offsets_pixel':[list(offset) for offset in self._list_tile_offsets_pixel],
             }
             assert set(self._metadata.keys()) == set(self._metadata_types.keys()), 'Metadata keys must match the metadata types'
         
@@ -189,7 +198,8 @@ class MeaImg_Unit():
             dict_meta (dict): Metadata dictionary
         """
         # For backward compatibility, the exposure_time_ms key is not required in the metadata dictionary, but if it is present, it will be used to set the exposure time of the unit. This is because the exposure time is an important parameter that should be stored in the metadata for future reference, but it was not included in the initial implementation of the MeaImg_Unit class.
-        required_keys = {k for k in self._metadata_types if k != 'exposure_time_ms'}
+        # The same goes for the tile_offsets_pixel key (registration-refined tile placement)
+        required_keys = {k for k in self._metadata_types if k not in ['exposure_time_ms','tile_offsets_pixel']}
         assert required_keys.issubset(dict_meta.keys()), 'Metadata keys must match the metadata types'
 
         self._unitID = dict_meta['id']
@@ -201,6 +211,7 @@ class MeaImg_Unit():
         self._calibration = cal
         self._flg_mat_calculated = False
         self._exposure_time_ms = float(dict_meta.get('exposure_time_ms', 0.0))
+        self._list_tile_offsets_pixel = [(float(x),float(y)) for x,y in dict_meta.get('tile_offsets_pixel', None) or []]
 
         self.refresh_metadata()
         
@@ -215,6 +226,7 @@ class MeaImg_Unit():
             'calibration_id':self._calibration.id,
             'calibration_dict':self._calibration.get_calibration_asdict(),
             'exposure_time_ms':self._exposure_time_ms,
+            'tile_offsets_pixel':[list(offset) for offset in self._list_tile_offsets_pixel],
         }
         
     def get_metadata_types(self) -> dict:
@@ -274,6 +286,7 @@ class MeaImg_Unit():
             'calibration_id': cal_scaled.id,
             'calibration_dict': cal_scaled.get_calibration_asdict(),
             'exposure_time_ms': self._exposure_time_ms,
+            'tile_offsets_pixel': [[x*scale, y*scale] for x, y in self._list_tile_offsets_pixel],
         })
 
         dict_mea_orig = self.get_dict_measurement()
@@ -432,39 +445,25 @@ class MeaImg_Unit():
         
         return img_with_scalebar
         
-    def get_image_all_stitched(self, low_res:bool=False, scalebar:bool=False) -> tuple[Image.Image,tuple[float,float],tuple[float,float]]:
+    def _get_stitch_conversion(self, low_res:bool) -> tuple[float,tuple[int,int,int,int],tuple[float,float]]:
         """
-        Stitches all the images taken
+        Calculates the rotation and crop converting the images to the stage frame of reference
         
         Args:
-            low_res (bool): Flag to use the low resolution images. Default is False
-            scalebar (bool): Flag to add a scalebar to the stitched image. Default is False
+            low_res (bool): Flag to use the low resolution images
         
         Returns:
-            tuple[Image.Image,tuple[float,float],tuple[float,float]]:
-                Stitched image, image min limits in mm (xmin,ymin) [mm],
-                image max limits in mm (xmax,ymax) [mm]
-        
-        NOTE:
-            - Note that the shown image is rotated according to the calibration parameters.
-                i.e., the image shown is now aligned with the stage frame of reference's axes
-                such that another coordinate rotation correction needs to be done when converting
-                the coordinats between the image and the stage frame of reference. For this reason,
-                the rotation angle is stored internally.
+            tuple[float,tuple[int,int,int,int],tuple[float,float]]: Rotation angle [deg], crop box
+                (left,upper,right,lower) [pixel] and the stage coordinate shift due to the crop [mm]
         """
         assert len(self._dict_measurements['timestamp']) > 0, 'No images taken'
-        assert self.check_calibration_exist(), 'Calibration parameters are not set'
         assert isinstance(self._calibration, ImgMea_Cal), 'Calibration is not set'
         
         cal = self._calibration
         
-    # > Get the measurements
         if low_res: list_images = self._list_lowResImg
         else: list_images = self._dict_measurements['image']
         
-        list_coorx_mm = self._dict_measurements['coor_x']
-        list_coory_mm = self._dict_measurements['coor_y']
-        
         # Calculate the rotation angle
         # print(f'Stored rotation angle [rad]: {cal.rotation_rad}')
         rot_deg = -cal.rotation_rad*180/np.pi
@@ -495,18 +494,60 @@ class MeaImg_Unit():
         coor_shift_stage = self.convert_imgpt2stg(frame_coor_mm=(0,0),\
             coor_pixel=coor_shift_pixel,correct_rot=True,low_res=low_res)
         
-        list_coorx_mm = [coor+coor_shift_stage[0] for coor in list_coorx_mm]
-        list_coory_mm = [coor+coor_shift_stage[1] for coor in list_coory_mm]
+        return rot_deg, crop_coor, coor_shift_stage
         
-    # > Rotate and crop the images
-        list_images_converted = []
-        for img in list_images:
-            img_rot_crop:Image.Image = img.copy()
-            img_rot_crop = img_rot_crop.rotate(-rot_deg,expand=False,center=(0,0)) if rot_deg != 0 else img_rot_crop
-            img_rot_crop = img_rot_crop.crop(crop_coor)
-            list_images_converted.append(img_rot_crop)
-            
-        list_images = list_images_converted
+    def get_stitch_image(self, index:int, low_res:bool=False) -> Image.Image:
+        """
+        Returns an image rotated and cropped to the stage frame of reference, as placed in the
+        stitched image
+        
+        Args:
+            index (int): Index of the measurement
+            low_res (bool): Flag to use the low resolution image. Default is False
+        
+        Returns:
+            Image.Image: Rotated and cropped image
+        """
+        img = self._list_lowResImg[index] if low_res else self._dict_measurements['image'][index]
+        return self._convert_stitch_image(img, low_res=low_res)
+        
+    def _convert_stitch_image(self, img:Image.Image, low_res:bool) -> Image.Image:
+        """
+        Rotates and crops an image of the measurement size to the stage frame of reference
+        
+        Args:
+            img (Image.Image): Image of the (low resolution) measurement size
+            low_res (bool): Flag for the low resolution size
+        
+        Returns:
+            Image.Image: Rotated and cropped image
+        """
+        rot_deg, crop_coor, _ = self._get_stitch_conversion(low_res=low_res)
+        img_rot_crop = img.rotate(-rot_deg,expand=False,center=(0,0)) if rot_deg != 0 else img
+        return img_rot_crop.crop(crop_coor)
+        
+    def _get_tiles_nominal_placement(self, low_res:bool) -> tuple[list[tuple[float,float]],list[tuple[int,int]],tuple[int,int]]:
+        """
+        Calculates the nominal placement of the images in the stitched image from the stage coordinates
+        
+        Args:
+            low_res (bool): Flag to use the low resolution images
+        
+        Returns:
+            tuple[list[tuple[float,float]],list[tuple[int,int]],tuple[int,int]]:
+                Stage coordinates of the images corrected for the cropping [mm], their (unshifted)
+                pixel placement in the stitched image [pixel] and the size of the rotated and
+                cropped images (width,height) [pixel]
+        """
+        assert len(self._dict_measurements['timestamp']) > 0, 'No images taken'
+        assert self.check_calibration_exist(), 'Calibration parameters are not set'
+        assert isinstance(self._calibration, ImgMea_Cal), 'Calibration is not set'
+        
+        _, crop_coor, coor_shift_stage = self._get_stitch_conversion(low_res=low_res)
+        size_rot_crop = (crop_coor[2]-crop_coor[0], crop_coor[3]-crop_coor[1])
+        
+        list_coorx_mm = [coor+coor_shift_stage[0] for coor in self._dict_measurements['coor_x']]
+        list_coory_mm = [coor+coor_shift_stage[1] for coor in self._dict_measurements['coor_y']]
         
     # > Stitch the image
         # Calculate each image location in the stitched image (in pixel coordinates)
@@ -530,26 +571,71 @@ class MeaImg_Unit():
             for coor in list_coor_mm]
         list_coor_min_pixel = [(coor[0]*x_flip,coor[1]*y_flip) for coor in list_coor_min_pixel]
         
-        img_limit_coor_min_pixel = (min([coor[0] for coor in list_coor_min_pixel]),\
-            min([coor[1] for coor in list_coor_min_pixel]))
+        return list_coor_min_mm, list_coor_min_pixel, size_rot_crop
+        
+    def get_stitch_layout(self, low_res:bool=False, refined:bool=True)\
+        -> tuple[list[Image.Image],list[tuple[int,int]],tuple[int,int],tuple[float,float]]:
+        """
+        Calculates the layout of the stitched image, i.e., the rotated and cropped images and their
+        placement, without stitching them
+        
+        Args:
+            low_res (bool): Flag to use the low resolution images. Default is False
+            refined (bool): Flag to place the tiles with the registration-refined offsets, if
+                registered (see register_tile_placement). Default is True
+        
+        Returns:
+            tuple[list[Image.Image],list[tuple[int,int]],tuple[int,int],tuple[float,float]]:
+                Rotated and cropped images, their placement (top-left pixel) in the stitched image,
+                the stitched image size (width,height) [pixel] and the stage coordinate of its
+                0,0 pixel (xmin,ymin) [mm]
+        """
+        list_coor_pixel_rel, _, size_stitched, coor_min_mm = self.get_stitch_placement(low_res=low_res, refined=refined)
+        list_images = [self.get_stitch_image(i, low_res=low_res) for i in range(self.get_numMeasurements())]
+        return list_images, list_coor_pixel_rel, size_stitched, coor_min_mm
+        
+    def get_stitch_placement(self, low_res:bool=False, refined:bool=True)\
+        -> tuple[list[tuple[int,int]],tuple[int,int],tuple[int,int],tuple[float,float]]:
+        """
+        Calculates the placement of the rotated and cropped images (see get_stitch_image) in the
+        stitched image, without converting the images
+        
+        Args:
+            low_res (bool): Flag to use the low resolution images. Default is False
+            refined (bool): Flag to place the tiles with the registration-refined offsets, if
+                registered (see register_tile_placement). Default is True
+        
+        Returns:
+            tuple[list[tuple[int,int]],tuple[int,int],tuple[int,int],tuple[float,float]]:
+                Placement (top-left pixel) of the images in the stitched image, the size of the
+                images and of the stitched image (width,height) [pixel] and the stage coordinate
+                of the 0,0 pixel of the stitched image (xmin,ymin) [mm]
+        """
+        assert len(self._dict_measurements['timestamp']) > 0, 'No images taken'
+        assert self.check_calibration_exist(), 'Calibration parameters are not set'
+        
+        list_coor_min_mm, list_coor_min_pixel, size_rot_crop = self._get_tiles_nominal_placement(low_res=low_res)
+        
+        # Refine the placement with the registered tile offsets
+        list_coor_place_pixel = list_coor_min_pixel
+        if refined and self.check_tile_offsets_exist():
+            scale = self._lres_scale if low_res else 1.0
+            list_coor_place_pixel = [(coor[0]+offset[0]*scale,coor[1]+offset[1]*scale)
+                                     for coor,offset in zip(list_coor_min_pixel,self._list_tile_offsets_pixel)]
+        
+        img_limit_coor_min_pixel = (min([coor[0] for coor in list_coor_place_pixel]),\
+            min([coor[1] for coor in list_coor_place_pixel]))
         
         # Calculate the relative pixel coordinates, rounded to integers so PIL paste()
         # places tiles exactly — fractional coords cause 1-pixel black gaps between tiles
         list_coor_pixel_rel = [(
             round(coor[0]-img_limit_coor_min_pixel[0]),
             round(coor[1]-img_limit_coor_min_pixel[1])
-            ) for coor in list_coor_min_pixel]
+            ) for coor in list_coor_place_pixel]
         
-        # Generate an empty image 
-        img_wid = max([abs(coor[0]) for coor in list_coor_pixel_rel]) + img_rot_crop.size[0]
-        img_hei = max([abs(coor[1]) for coor in list_coor_pixel_rel]) + img_rot_crop.size[1]
-        img_stitched = Image.new('RGB',(img_wid,img_hei))
-        
-        # Paste the images onto the empty image
-        for i in range(len(list_images)):
-            img = list_images[i]
-            coor_pixel = list_coor_pixel_rel[i]
-            img_stitched.paste(img,coor_pixel)
+        # Size of the stitched image
+        img_wid = max([abs(coor[0]) for coor in list_coor_pixel_rel]) + size_rot_crop[0]
+        img_hei = max([abs(coor[1]) for coor in list_coor_pixel_rel]) + size_rot_crop[1]
         
     # > Calculate the image limits in mm
         # Note to myself:
@@ -561,14 +647,56 @@ class MeaImg_Unit():
         # This minimum coordinate is also the reference coordinate to be returned (i.e., the stage coordinate
         # of the stitched image, corresponding to the 0,0 pixel of the stitched image)
         
-        # Similarly, the maximum coordinates of the image is the maximum coordinates of the img_rot_crop
-        # i.e., the image shape
-        
+        # (the refined placement is relative to the stage coordinates, i.e., the nominal placement)
         mea_coor = list_coor_min_mm[0]
-        mea_coor_pixel = list_coor_pixel_rel[0]
+        mea_coor_pixel = (round(list_coor_min_pixel[0][0]-img_limit_coor_min_pixel[0]),
+                          round(list_coor_min_pixel[0][1]-img_limit_coor_min_pixel[1]))
         neg = (-mea_coor_pixel[0],-mea_coor_pixel[1])
         img_limit_coor_min_mm = self.convert_imgpt2stg(frame_coor_mm=mea_coor,coor_pixel=neg,correct_rot=True,
                                                        low_res=low_res)
+        return list_coor_pixel_rel, size_rot_crop, (img_wid,img_hei), img_limit_coor_min_mm
+        
+    def get_image_all_stitched(self, low_res:bool=False, scalebar:bool=False, refined:bool=True,
+                               blend:bool=True) -> tuple[Image.Image,tuple[float,float],tuple[float,float]]:
+        """
+        Stitches all the images taken
+        
+        Args:
+            low_res (bool): Flag to use the low resolution images. Default is False
+            scalebar (bool): Flag to add a scalebar to the stitched image. Default is False
+            refined (bool): Flag to place the tiles with the registration-refined offsets, if
+                registered (see register_tile_placement). Default is True
+            blend (bool): Flag to blend the seams and equalise the illumination, if set (see
+                set_stitch_blending). Default is True
+        
+        Returns:
+            tuple[Image.Image,tuple[float,float],tuple[float,float]]:
+                Stitched image, image min limits in mm (xmin,ymin) [mm],
+                image max limits in mm (xmax,ymax) [mm]
+        
+        NOTE:
+            - Note that the shown image is rotated according to the calibration parameters.
+                i.e., the image shown is now aligned with the stage frame of reference's axes
+                such that another coordinate rotation correction needs to be done when converting
+                the coordinats between the image and the stage frame of reference. For this reason,
+                the rotation angle is stored internally.
+        """
+        assert len(self._dict_measurements['timestamp']) > 0, 'No images taken'
+        assert self.check_calibration_exist(), 'Calibration parameters are not set'
+        assert isinstance(self._calibration, ImgMea_Cal), 'Calibration is not set'
+        
+        list_images, list_coor_pixel_rel, (img_wid,img_hei), img_limit_coor_min_mm = self.get_stitch_layout(
+            low_res=low_res, refined=refined)
+        
+        if blend and self._blending_params is not None:
+            img_stitched = self._blend_stitch_images(list_images, list_coor_pixel_rel, (img_wid,img_hei), low_res)
+        else:
+            # Paste the images onto an empty image
+            img_stitched = Image.new('RGB',(img_wid,img_hei))
+            for img, coor_pixel in zip(list_images, list_coor_pixel_rel):
+                img_stitched.paste(img,coor_pixel)
+        
+        # The maximum coordinates of the image is the stage coordinate of the far corner of the image
         img_limit_coor_max_mm = self.convert_imgpt2stg(frame_coor_mm=img_limit_coor_min_mm,coor_pixel=(img_wid,img_hei),
                                                        correct_rot=True,low_res=low_res)
         
@@ -576,12 +704,136 @@ class MeaImg_Unit():
         
         return img_stitched, img_limit_coor_min_mm, img_limit_coor_max_mm
         
+    def _blend_stitch_images(self, list_images:list[Image.Image], list_coor_pixel:list[tuple[int,int]],
+                             size:tuple[int,int], low_res:bool) -> Image.Image:
+        """
+        Composites the rotated and cropped images with the blending parameters set
+        
+        Args:
+            list_images (list[Image.Image]): Rotated and cropped images
+            list_coor_pixel (list[tuple[int,int]]): Placement (top-left pixel) of the images
+            size (tuple[int,int]): Size of the stitched image (width,height) [pixel]
+            low_res (bool): Flag for the low resolution images
+        
+        Returns:
+            Image.Image: Stitched image
+        """
+        params = self._blending_params
+        assert isinstance(params, MosaicBlending_Params), 'Blending parameters are not set'
+        
+        # The pixel sizes are given at the full resolution
+        if low_res:
+            scale = self._lres_scale
+            params = replace(params, min_overlap_px=max(1,round(params.min_overlap_px*scale)),
+                feather_px=None if params.feather_px is None else max(1,round(params.feather_px*scale)))
+        
+        img_stitched, _ = blend_mosaic(list_images, list_coor_pixel, size, params, self.get_stitch_flatfield(low_res))
+        return img_stitched
+        
+    def get_stitch_flatfield(self, low_res:bool=False) -> Image.Image|None:
+        """
+        Returns the flatfield of the blending parameters, rotated and cropped as the images placed
+        in the stitched image (see get_stitch_image)
+        
+        Args:
+            low_res (bool): Flag for the low resolution images. Default is False
+        
+        Returns:
+            Image.Image|None: Flatfield ('F' mode, see mosaic_blending.prepare_flatfield), None if
+                the blending is not set or has no flatfield
+        """
+        params = self._blending_params
+        if params is None or params.flatfield is None: return None
+        img_raw = self._list_lowResImg[0] if low_res else self._dict_measurements['image'][0]
+        return self._convert_stitch_image(prepare_flatfield(params.flatfield, img_raw.size), low_res=low_res)
+        
+    def set_stitch_blending(self, params:MosaicBlending_Params|None) -> None:
+        """
+        Sets the seam blending and illumination equalisation of the stitched image (see mosaic_blending)
+        
+        Args:
+            params (MosaicBlending_Params|None): Blending parameters, None to paste the images
+        """
+        assert params is None or isinstance(params, MosaicBlending_Params), 'Blending parameters must be a MosaicBlending_Params object or None'
+        self._blending_params = params
+        
+    def get_stitch_blending(self) -> MosaicBlending_Params|None:
+        """
+        Returns the seam blending parameters of the stitched image
+        
+        Returns:
+            MosaicBlending_Params|None: Blending parameters, None if the images are pasted
+        """
+        return self._blending_params
+        
+    def register_tile_placement(self, params:MosaicRegistration_Params|None=None) -> MosaicRegistration_Result:
+        """
+        Refines the tile placement of the stitched image by registering the overlapping tiles
+        (phase correlation of their overlaps and global least-squares placement, see
+        mosaic_registration.register_mosaic). The refined offsets are stored in the unit,
+        the stage coordinates are left unchanged.
+        
+        Args:
+            params (MosaicRegistration_Params|None): Registration parameters. Default parameters if None
+        
+        Returns:
+            MosaicRegistration_Result: Registration result
+        """
+        assert self.check_readyForProcessing(), 'Unit is not ready for processing'
+        
+        _, list_coor_pixel, _ = self._get_tiles_nominal_placement(low_res=False)
+        list_tiles = [np.asarray(self.get_stitch_image(i).convert('L')) for i in range(self.get_numMeasurements())]
+        result = register_mosaic(list_tiles, list_coor_pixel, params)
+        self.set_tile_offsets(result.offsets_pixel)
+        return result
+        
+    def set_tile_offsets(self, list_offsets_pixel:list[tuple[float,float]]) -> None:
+        """
+        Sets the registration-refined tile placement offsets
+        
+        Args:
+            list_offsets_pixel (list[tuple[float,float]]): Offset (x,y) of every tile to add to its
+                placement in the (full resolution) stitched image [pixel]
+        """
+        assert len(list_offsets_pixel) == self.get_numMeasurements(), 'There must be one offset per measurement'
+        assert all([len(offset) == 2 for offset in list_offsets_pixel]), 'Offsets must be (x,y) pairs'
+        
+        self._list_tile_offsets_pixel = [(float(x),float(y)) for x,y in list_offsets_pixel]
+        self.refresh_metadata()
+        
+    def get_tile_offsets(self) -> list[tuple[float,float]]:
+        """
+        Returns the registration-refined tile placement offsets
+        
+        Returns:
+            list[tuple[float,float]]: Offset (x,y) of every tile [pixel], empty if not registered
+        """
+        return list(self._list_tile_offsets_pixel)
+        
+    def clear_tile_offsets(self) -> None:
+        """
+        Clears the registration-refined tile placement offsets
+        """
+        self._list_tile_offsets_pixel = []
+        if isinstance(self._calibration, ImgMea_Cal): self.refresh_metadata()
+        
+    def check_tile_offsets_exist(self) -> bool:
+        """
+        Checks if the tile placement offsets are registered for all the measurements
+        
+        Returns:
+            bool: True if there is one offset per measurement, False otherwise (e.g., not registered
+                or measurements added since)
+        """
+        return len(self._list_tile_offsets_pixel) > 0 and len(self._list_tile_offsets_pixel) == self.get_numMeasurements()
+        
     def reset_measurement(self):
         """
         Deletes all stored measurement in the _dict_measurements
         """
         for key in self._dict_measurements.keys():
             self._dict_measurements[key].clear()
+        self.clear_tile_offsets()
         
     def reprocess_lowres_images(self):
         """
@@ -1078,7 +1330,16 @@ class MeaImg_Handler():
     """
     Handles the saving of image measurements to a database
     """
-    def __init__(self):
+    def __init__(self, codec:str|None=None, png_compression:int|None=None, num_workers:int|None=None):
+        """
+        Args:
+            codec (str|None): Image file format of the saves, 'png', 'webp' (lossless) or 'npy' (raw
+                numpy array). Default (None) is ImgUnitSave_Config.imgunit_image_codec
+            png_compression (int|None): PNG compression level (0-9). Default (None) is
+                ImgUnitSave_Config.imgunit_png_compression
+            num_workers (int|None): Number of threads encoding the images, 0 for the number of CPUs.
+                Default (None) is ImgUnitSave_Config.imgunit_save_workers
+        """
         # Save parameters
         self._save_parameters = {
             'table_label_measurement':'measurement',    # Label for the measurement table
@@ -1092,6 +1353,17 @@ class MeaImg_Handler():
         }
         
         self._table_prefix = SaveParamsEnum.IMGUNIT_DB_PREFIX.value    # Prefix for the database tables
+        
+        # Image encoding parameters
+        self._list_codecs = [SaveParamsEnum.SAVE_OPTIONS_IMG_PNG.value, SaveParamsEnum.SAVE_OPTIONS_IMG_WEBP.value,
+                             SaveParamsEnum.SAVE_OPTIONS_IMG_NPY.value]
+        config:ImgUnitSave_Config = config_registry.get(ImgUnitSave_Config)
+        self._codec = codec if codec is not None else config.imgunit_image_codec
+        self._png_compression = png_compression if png_compression is not None else config.imgunit_png_compression
+        num_workers = num_workers if num_workers is not None else config.imgunit_save_workers
+        self._num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        assert self._codec in self._list_codecs, f'Image codec must be one of {self._list_codecs}'
+        assert 0 <= self._png_compression <= 9, 'PNG compression level must be between 0 and 9'
         # self._defaultDirPath = SaveParamsEnum.DEFAULT_SAVE_PATH.value
         # assert os.path.exists(self._defaultDirPath), 'Default directory path does not exist'
         # assert os.path.isdir(self._defaultDirPath), 'Default directory path is not a directory'
@@ -1353,43 +1625,86 @@ class MeaImg_Handler():
     def save_ImageMeasurementUnit_database(\
         self,unit:MeaImg_Unit,conn:sql.Connection,conn_path:str):
         """
-        Saves the measurements to a database connected.
+        Saves the measurements to a database connected, in a single transaction. If the unit is
+        already in the database, its metadata are updated and only the measurements added since
+        (i.e., with new timestamps) are saved. The image files are written before the rows
+        referencing them and deleted if the transaction is rolled back.
 
         Args:
             unit (ImageMeasurement_Unit): Unit to be saved
             conn (sql.Connection): Connection to the database
             conn_path (str): Path to the database
         """
-        self._save_ImageMeasurementUnit_metadata_database(unit,conn)
-        self._save_ImageMeasurementUnit_measurement_database(unit,conn,conn_path)
+        list_imagepaths = []
+        try:
+            with conn:  # Commits on success, rolls back on error
+                self._save_ImageMeasurementUnit_metadata_database(unit,conn)
+                self._save_ImageMeasurementUnit_measurement_database(unit,conn,conn_path,list_imagepaths)
+        except BaseException:
+            # No row references the images written in the rolled back transaction
+            for imagepath in list_imagepaths:
+                if os.path.exists(imagepath): os.remove(imagepath)
+            raise
         
-    def _save_image_to_png(self,saveDirPath:str,image:Image.Image,id) -> str:
+    def _get_image_relpath(self,saveDirPath:str,id:str) -> tuple[str,str]:
         """
-        Saves an image to a PNG file and returns the relative path
+        Returns the path of an image file in the save directory, with the codec extension
         
         Args:
-            saveDirPath (str): Path to the directory to save the image
-            image (Image.Image): Image to be saved
+            saveDirPath (str): Path to the directory of the database
+            id (str): ID (file name) of the image
+            
+        Returns:
+            tuple[str,str]: Absolute and relative (to the save directory) paths
         """
-        assert isinstance(saveDirPath, str), 'Save directory path must be a string'
-        assert not os.path.exists(saveDirPath) or (os.path.exists(saveDirPath) and os.path.isdir(saveDirPath)),\
-            'Save directory path is not a directory'
-        assert isinstance(image, Image.Image), 'Image must be an Image.Image object'
-        
-        # Save the image to a PNG file
         subdirpath = os.path.join(saveDirPath,self._save_parameters['folder_sublevel'])
-        if not os.path.exists(subdirpath): os.makedirs(subdirpath)
-        imagepath = os.path.join(subdirpath,'{}.png'.format(id))
-        image.save(imagepath,bitmap_format='png')
+        imagepath = os.path.join(subdirpath,'{}.{}'.format(id,self._codec))
         
         relpath = os.path.relpath(imagepath,saveDirPath)
         relpath = r'.\{}'.format(relpath).replace('\\','/')
+        return imagepath, relpath
+        
+    def _encode_image(self,image:Image.Image,imagepath:str) -> None:
+        """
+        Writes an image to a file with the codec set (thread-safe, the encoders release the GIL)
+        
+        Args:
+            image (Image.Image): Image to be saved
+            imagepath (str): Path of the file
+        """
+        if self._codec == SaveParamsEnum.SAVE_OPTIONS_IMG_PNG.value:
+            image.save(imagepath,format='PNG',compress_level=self._png_compression)
+        elif self._codec == SaveParamsEnum.SAVE_OPTIONS_IMG_WEBP.value:
+            # Fastest lossless effort: the higher ones are several times slower for a few % smaller files
+            image.save(imagepath,format='WEBP',lossless=True,method=0)
+        elif self._codec == SaveParamsEnum.SAVE_OPTIONS_IMG_NPY.value:
+            np.save(imagepath,np.asarray(image))
+        else: raise ValueError('Image codec not recognized')
+        
+    def _save_images(self,list_images:list[Image.Image],list_imagepaths:list[str]) -> None:
+        """
+        Writes images to files in parallel with the codec set
+        
+        Args:
+            list_images (list[Image.Image]): Images to be saved
+            list_imagepaths (list[str]): Paths of the files
+        """
+        assert all([isinstance(image, Image.Image) for image in list_images]), 'Images must be Image.Image objects'
+        assert len(list_images) == len(list_imagepaths), 'Number of images and paths must match'
+        
+        for dirpath in set([os.path.dirname(path) for path in list_imagepaths]):
+            if not os.path.exists(dirpath): os.makedirs(dirpath)
         
-        return relpath
+        if self._num_workers == 1 or len(list_images) <= 1:
+            for image,imagepath in zip(list_images,list_imagepaths): self._encode_image(image,imagepath)
+            return
+        with ThreadPoolExecutor(max_workers=self._num_workers) as executor:
+            # list() to raise the encoding errors here
+            list(executor.map(self._encode_image,list_images,list_imagepaths))
         
     def _save_ImageMeasurementUnit_measurement_database(
         self,unit:MeaImg_Unit,conn:sql.Connection,
-        conn_path:str) -> None:
+        conn_path:str,list_written:list[str]|None=None) -> None:
         """
         Saves the measurements to a database connected
 
@@ -1397,6 +1712,8 @@ class MeaImg_Handler():
             unit (ImageMeasurement_Unit): Image measurement unit object to save
             conn (sql.Connection): Connection to the database
             conn_path (str): Path to the database
+            list_written (list[str]|None): Extended with the paths of the image files before they
+                are written, to delete them if the transaction is rolled back. Default is None
             
         Raises:
             AssertionError: Unit is not an ImageMeasurement_Unit object
@@ -1435,23 +1752,31 @@ class MeaImg_Handler():
         conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'\
             .format(table_name,query_keys))
         
-        # Insert the measurements into the table
+        # Only save the measurements not in the table yet (incremental saves)
+        cursor = conn.cursor()
+        cursor.execute('SELECT timestamp FROM {}'.format(table_name))
+        set_existing_timestamps = set([str(row[0]) for row in cursor.fetchall()])
+        
         keys = list(dict_mea.keys())
         n_rows = len(dict_mea[keys[0]])
         single_image = (n_rows == 1)
-
+        list_idx_new = [i for i in range(n_rows) if str(dict_mea['timestamp'][i]) not in set_existing_timestamps]
+        if len(list_idx_new) == 0: return
+        
+        image_keys = [k for k in dict_mea.keys() if dict_mea_types[k] == Image.Image]
+        
         # Pre-check for path conflicts when saving a single image without UUID suffix
         if single_image:
-            image_keys = [k for k in dict_mea.keys() if dict_mea_types[k] == Image.Image]
-            if image_keys:
-                subdirpath = os.path.join(saveDirPath, self._save_parameters['folder_sublevel'])
-                for key in image_keys:
-                    candidate = os.path.join(subdirpath, '{}.png'.format(unitName))
-                    if os.path.exists(candidate):
-                        raise FileExistsError(
-                            'Image file already exists at: {}'.format(candidate))
-
-        for i in range(n_rows):
+            for key in image_keys:
+                candidate,_ = self._get_image_relpath(saveDirPath,unitName)
+                if os.path.exists(candidate):
+                    raise FileExistsError(
+                        'Image file already exists at: {}'.format(candidate))
+
+        list_images = []
+        list_imagepaths = []
+        list_rows = []
+        for i in list_idx_new:
             # Use plain unit name for single-image units; add UUID suffix for multi-image units
             unique_id = unitName if single_image else '{}_{}'.format(unitName,uuid.uuid4().hex)
             list_values = []
@@ -1463,17 +1788,20 @@ class MeaImg_Handler():
                 elif dict_mea_types[key] in [list,tuple,dict]:
                     list_values.append(json.dumps(dict_mea[key][i]))
                 elif dict_mea_types[key] == Image.Image:
-                    image = dict_mea[key][i]
-                    imagepath = self._save_image_to_png(saveDirPath,image,unique_id)
-                    list_values.append(imagepath)
+                    imagepath,relpath = self._get_image_relpath(saveDirPath,unique_id)
+                    list_images.append(dict_mea[key][i])
+                    list_imagepaths.append(imagepath)
+                    list_values.append(relpath)
                 else:
                     raise TypeError('Measurement type not recognized')
-            
-            query_values = ', '.join(['?' for _ in range(len(list_values))])
-            conn.execute('INSERT INTO {} VALUES ({})'.format(table_name,query_values),list_values)
+            list_rows.append(list_values)
+        
+        # Encode the images in parallel, then insert all the rows at once
+        if list_written is not None: list_written.extend(list_imagepaths)
+        self._save_images(list_images,list_imagepaths)
         
-        # Commit the changes and close the connection
-        conn.commit()
+        query_values = ', '.join(['?' for _ in range(len(keys))])
+        conn.executemany('INSERT INTO {} VALUES ({})'.format(table_name,query_values),list_rows)
         return
         
     def _save_ImageMeasurementUnit_metadata_database(self,unit:MeaImg_Unit,conn:sql.Connection) -> None:
@@ -1502,33 +1830,40 @@ class MeaImg_Handler():
         table_metadata = self._table_prefix + self._new_save_parameters['meta_table']
         
         # Create the table for the metadata and calibration parameters
-        query_keys = ''
+        dict_columns = {}
         list_values_metadata = []
         for key in meta_dict.keys():
             if meta_types_dict[key] in [int,float]:
-                query_keys += ', {} REAL'.format(key)
+                dict_columns[key] = 'REAL'
                 list_values_metadata.append(meta_dict[key])
             elif meta_types_dict[key] == str:
-                query_keys += ', {} TEXT'.format(key)
+                dict_columns[key] = 'TEXT'
                 list_values_metadata.append(meta_dict[key])
             elif meta_types_dict[key] in [list,tuple,dict]:
-                query_keys += ', {} TEXT'.format(key)
+                dict_columns[key] = 'TEXT'
                 list_values_metadata.append(json.dumps(meta_dict[key]))
             else:
                 raise TypeError('Metadata type not recognized')
             
-        if query_keys == '': raise AssertionError('No metadata found')
+        if len(dict_columns) == 0: raise AssertionError('No metadata found')
             
-        query_keys = query_keys[2:]
+        query_keys = ', '.join(['{} {}'.format(key,col_type) for key,col_type in dict_columns.items()])
         cursor.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(table_metadata,query_keys))
         
+        # Add the metadata columns missing from a table created by an older version (e.g., tile_offsets_pixel)
+        list_existing = [row[1] for row in cursor.execute('PRAGMA table_info({})'.format(table_metadata)).fetchall()]
+        for key,col_type in dict_columns.items():
+            if key not in list_existing:
+                cursor.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table_metadata,key,col_type))
+        
+        # Replace the metadata of the unit if already saved (incremental saves)
+        cursor.execute('DELETE FROM {} WHERE id = ?'.format(table_metadata),(meta_dict['id'],))
+        
         # Prepare the values for insertion
         query_keys = ', '.join(meta_dict.keys())
         query_metadata_values = ', '.join(['?' for _ in range(len(meta_dict.keys()))])
         query = 'INSERT INTO {} ({}) VALUES ({})'.format(table_metadata,query_keys,query_metadata_values)
         cursor.execute(query, list_values_metadata)
-        
-        conn.commit()
         return
         
     def load_ImageMeasurementHub_database(self,loadpath:str,hub:MeaImg_Hub|None=None) -> None:
@@ -1565,13 +1900,13 @@ class MeaImg_Handler():
         
         unit = MeaImg_Unit(None,None,reconstruct=True)
         metadata_types = unit.get_metadata_types()
-        key_dict = [key for key in metadata_types.keys() if metadata_types[key] == dict]
+        key_dict = [key for key in metadata_types.keys() if metadata_types[key] in [list,tuple,dict]]
         
         for row in rows:
             row:sql.Row
             dict_row = dict(row)
             for key in key_dict:
-                dict_row[key] = json.loads(dict_row[key])
+                if key in dict_row: dict_row[key] = json.loads(dict_row[key])
             unit = MeaImg_Unit(None,None,reconstruct=True)
             unit.set_metadata_fromfile(dict_row)
             unit = self.load_ImageMeasurementUnit_database(unit,unit.get_IdName()[0],
@@ -1625,7 +1960,10 @@ class MeaImg_Handler():
                 elif dict_types[key] == Image.Image:
                     imagepath = dict_row[key]
                     imagepath = os.path.join(os.path.dirname(conn_path),imagepath)
-                    image = Image.open(imagepath)
+                    if imagepath.endswith('.'+SaveParamsEnum.SAVE_OPTIONS_IMG_NPY.value):
+                        image = Image.fromarray(np.load(imagepath))
+                    else:
+                        image = Image.open(imagepath)
                     dict_mea[key].append(image)
                 else:
                     raise TypeError('Measurement type not recognized')
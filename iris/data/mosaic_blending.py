@@ -0,0 +1,210 @@
+"""
+Seam blending and illumination equalisation of image mosaics.
+
+Hard-pasting the tiles of an image mosaic (MeaImg_Unit) shows the vignetting and the exposure
+differences between the tiles as a grid. The blending compositor:
+1. Optionally divides every tile by a flatfield (the reference normalisation array of the camera
+    flatfield correction, see DataStreamer_StageCam), removing the vignetting
+2. Compensates the exposure differences with a gain per tile and channel, solved from the ratios
+    of the mean intensities of the overlaps by a weighted least-squares in the log domain (as the
+    registration offsets, see mosaic_registration.solve_global_placement): the gains equalise the
+    overlaps and have a geometric mean of 1 over every connected group of tiles
+3. Feathers the tiles over the overlaps: every pixel is the average of the tiles covering it,
+    weighted by a linear ramp decreasing towards the tile edges
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from dataclasses import dataclass
+from typing import Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from iris.data.mosaic_registration import find_overlapping_pairs, solve_global_placement
+
+BLEND_MIN_FLATFIELD = 1e-3      # Flatfield values below this (e.g., outside a rotated flatfield) are ignored
+BLEND_MIN_INTENSITY = 1.0       # Overlaps with a mean intensity (0-255) below this are not used for the gains
+
+
+@dataclass
+class MosaicBlending_Params:
+    """
+    Parameters of the mosaic blending
+
+    Args:
+        feather_px (int|None): Width of the linear weight ramp at the tile edges [pixel], None to
+            ramp over the whole tile (from the edges to the centre)
+        gain_compensation (bool): Flag to compensate the exposure differences between the tiles
+        min_overlap_px (int): Minimum overlap width and height [pixel] for a pair to be used in
+            the gain compensation
+        flatfield (np.ndarray|None): Flatfield reference normalisation array (height,width[,channels])
+            of the raw camera images, None to skip the flatfield correction
+    """
+    feather_px:int|None = None
+    gain_compensation:bool = True
+    min_overlap_px:int = 8
+    flatfield:np.ndarray|None = None
+
+    def __post_init__(self):
+        assert self.feather_px is None or self.feather_px > 0, 'Feather width must be positive or None'
+        assert self.min_overlap_px > 0, 'Minimum overlap must be positive'
+        assert self.flatfield is None or (isinstance(self.flatfield, np.ndarray) and self.flatfield.ndim in (2, 3)),\
+            'Flatfield must be a 2D or 3D array or None'
+
+
+def prepare_flatfield(flatfield:np.ndarray, size:tuple[int,int]) -> Image.Image:
+    """
+    Converts a flatfield reference array into a single channel float image of the raw image size,
+    normalised to a mean of 1
+
+    Args:
+        flatfield (np.ndarray): Flatfield reference normalisation array (height,width[,channels])
+        size (tuple[int,int]): Size (width,height) of the raw images [pixel]
+
+    Returns:
+        Image.Image: Flatfield ('F' mode) to divide the raw images by
+    """
+    arr = np.asarray(flatfield, dtype=np.float32)
+    if arr.ndim == 3: arr = arr.mean(axis=2)
+    if arr.shape != (size[1], size[0]): arr = cv2.resize(arr, size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray((arr/arr.mean()).astype(np.float32))
+
+
+def calculate_feather_weights(size:tuple[int,int], feather_px:int|None) -> np.ndarray:
+    """
+    Calculates the blending weight of every pixel of a tile, a linear ramp from the tile edges
+
+    Args:
+        size (tuple[int,int]): Tile size (width,height) [pixel]
+        feather_px (int|None): Width of the ramp [pixel], None to ramp up to the tile centre
+
+    Returns:
+        np.ndarray: Weights (height,width), in (0,1]
+    """
+    wid, hei = size
+    dist_x = np.minimum(np.arange(wid), np.arange(wid)[::-1]).astype(np.float32) + 0.5
+    dist_y = np.minimum(np.arange(hei), np.arange(hei)[::-1]).astype(np.float32) + 0.5
+    if feather_px is None:
+        ramp_x, ramp_y = dist_x/dist_x.max(), dist_y/dist_y.max()
+    else:
+        ramp_x, ramp_y = np.minimum(dist_x/feather_px, 1), np.minimum(dist_y/feather_px, 1)
+    return ramp_y[:,None]*ramp_x[None,:]
+
+
+def calculate_blend_weights(size:tuple[int,int], params:MosaicBlending_Params, flatfield:Image.Image|None=None)\
+    -> tuple[np.ndarray,np.ndarray|None]:
+    """
+    Calculates the blending weights of the tile pixels and the flatfield to divide the tiles by
+
+    Args:
+        size (tuple[int,int]): Tile size (width,height) [pixel]
+        params (MosaicBlending_Params): Blending parameters
+        flatfield (Image.Image|None): Flatfield ('F' mode) of the tile size (see prepare_flatfield),
+            None to skip the flatfield correction. Default is None
+
+    Returns:
+        tuple[np.ndarray,np.ndarray|None]: Weights (height,width), zero for the pixels without a
+            flatfield, and the flatfield (height,width,1) or None
+    """
+    assert flatfield is None or flatfield.size == size, 'Flatfield must have the tile size'
+    weights = calculate_feather_weights(size, params.feather_px)
+    if flatfield is None: return weights, None
+    arr_ff = np.asarray(flatfield, dtype=np.float32)
+    valid = arr_ff > BLEND_MIN_FLATFIELD
+    # The pixels without a flatfield (e.g., the corners of a rotated flatfield) are not blended
+    return np.where(valid, weights, 0), np.where(valid, arr_ff, 1)[..., None]
+
+
+def _overlap_slices(xy_i:tuple[int,int], xy_j:tuple[int,int], size:tuple[int,int])\
+    -> tuple[tuple[slice,slice],tuple[slice,slice]]:
+    """Returns the (rows,cols) slices of the overlap of two tiles, in the tile i and tile j pixels"""
+    x0, x1 = max(xy_i[0], xy_j[0]), min(xy_i[0], xy_j[0]) + size[0]
+    y0, y1 = max(xy_i[1], xy_j[1]), min(xy_i[1], xy_j[1]) + size[1]
+    return (slice(y0 - xy_i[1], y1 - xy_i[1]), slice(x0 - xy_i[0], x1 - xy_i[0])),\
+        (slice(y0 - xy_j[1], y1 - xy_j[1]), slice(x0 - xy_j[0], x1 - xy_j[0]))
+
+
+def solve_tile_gains(list_tiles:Sequence[np.ndarray], list_xy:list[tuple[int,int]], params:MosaicBlending_Params)\
+    -> np.ndarray:
+    """
+    Solves the gain of every tile and channel equalising the mean intensities of the overlaps:
+    g_i*I_ij = g_j*I_ji with I_ij the mean intensity of the tile i over the overlap with the tile j,
+    solved in the log domain weighted by the overlap areas
+
+    Args:
+        list_tiles (Sequence[np.ndarray]): Tiles (height,width,channels) of the same size, e.g.,
+            a sequence loading the tiles on access
+        list_xy (list[tuple[int,int]]): Placement (x,y) of the top-left corner of every tile [pixel]
+        params (MosaicBlending_Params): Blending parameters
+
+    Returns:
+        np.ndarray: Gains (num_tiles,channels), with a geometric mean of 1 over every connected
+            group of tiles and 1 for the tiles not overlapping any other
+    """
+    hei, wid, _ = list_tiles[0].shape
+    list_pairs, list_deltas, list_weights = [], [], []
+    for i, j in find_overlapping_pairs(list_xy, (wid, hei), params.min_overlap_px):
+        sl_i, sl_j = _overlap_slices(list_xy[i], list_xy[j], (wid, hei))
+        mean_i = list_tiles[i][sl_i].mean(axis=(0, 1))
+        mean_j = list_tiles[j][sl_j].mean(axis=(0, 1))
+        if min(mean_i.min(), mean_j.min()) < BLEND_MIN_INTENSITY: continue
+        list_pairs.append((i, j))
+        list_deltas.append(np.log(mean_i) - np.log(mean_j))
+        list_weights.append((sl_i[0].stop - sl_i[0].start)*(sl_i[1].stop - sl_i[1].start))
+
+    if not list_pairs: return np.ones((len(list_tiles), list_tiles[0].shape[2]))
+    log_gains = solve_global_placement(len(list_tiles), np.array(list_pairs), np.array(list_deltas),
+                                       np.array(list_weights, dtype=float))
+    return np.exp(log_gains)
+
+
+def blend_mosaic(list_images:list[Image.Image], list_xy:list[tuple[int,int]], size:tuple[int,int],
+                 params:MosaicBlending_Params, flatfield:Image.Image|None=None) -> tuple[Image.Image,np.ndarray]:
+    """
+    Composites the tiles of a mosaic with feathered seams, after the flatfield correction and the
+    gain compensation
+
+    Args:
+        list_images (list[Image.Image]): Tiles of the same size
+        list_xy (list[tuple[int,int]]): Placement (x,y) of the top-left corner of every tile [pixel]
+        size (tuple[int,int]): Size (width,height) of the mosaic [pixel]
+        params (MosaicBlending_Params): Blending parameters
+        flatfield (Image.Image|None): Flatfield ('F' mode) of the tile size, as converted with the
+            tiles (see prepare_flatfield), None to skip the flatfield correction. Default is None
+
+    Returns:
+        tuple[Image.Image,np.ndarray]: Blended mosaic (RGB) and the gains (num_tiles,3)
+    """
+    assert len(list_images) == len(list_xy) > 0, 'Number of images and placements must match and be non-zero'
+    assert all(img.size == list_images[0].size for img in list_images), 'All the images must have the same size'
+    assert flatfield is None or flatfield.size == list_images[0].size, 'Flatfield must have the image size'
+
+    list_tiles = [np.asarray(img.convert('RGB'), dtype=np.float32) for img in list_images]
+    weights, arr_ff = calculate_blend_weights(list_images[0].size, params, flatfield)
+    if arr_ff is not None: list_tiles = [tile/arr_ff for tile in list_tiles]
+
+    if params.gain_compensation: gains = solve_tile_gains(list_tiles, list_xy, params)
+    else: gains = np.ones((len(list_tiles), 3))
+
+    wid, hei = size
+    accum = np.zeros((hei, wid, 3), dtype=np.float32)
+    accum_weight = np.zeros((hei, wid), dtype=np.float32)
+    tile_hei, tile_wid = weights.shape
+    for tile, gain, (px, py) in zip(list_tiles, gains, list_xy):
+        # Part of the tile within the mosaic
+        x0, y0 = max(px, 0), max(py, 0)
+        x1, y1 = min(px + tile_wid, wid), min(py + tile_hei, hei)
+        if x1 <= x0 or y1 <= y0: continue
+        sl_tile = (slice(y0 - py, y1 - py), slice(x0 - px, x1 - px))
+        accum[y0:y1, x0:x1] += tile[sl_tile]*(weights[sl_tile][..., None]*gain.astype(np.float32))
+        accum_weight[y0:y1, x0:x1] += weights[sl_tile]
+
+    np.divide(accum, accum_weight[..., None], out=accum, where=accum_weight[..., None] > 0)
+    np.clip(accum, 0, 255, out=accum)
+    return Image.fromarray(np.round(accum).astype(np.uint8)), gains
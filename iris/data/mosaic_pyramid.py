@@ -0,0 +1,508 @@
+"""
+Multi-resolution tile pyramid of the stitched image of an image unit (MeaImg_Unit).
+
+The stitched image of a large mosaic is never built: the pyramid splits it into square tiles at
+power-of-two levels (level 0 at the full resolution, level L downsampled by 2^L, up to the level
+fitting in a single tile). A tile is rendered on request by a MosaicRenderer directly from the unit's
+rotated and cropped images overlapping it (box-downsampled on the level grid), cached on disk and
+kept in a bounded in-memory LRU cache. The renderer converts the images on request too and only
+keeps the most recently used ones. With the seam blending of the unit set (see
+MeaImg_Unit.set_stitch_blending), the tiles are composited as in the stitched image (flatfield,
+gains solved once over the whole mosaic, feathered seams). A viewer only requests the tiles visible at its current zoom level
+(see get_visible_tiles and select_level), so the memory use does not grow with the mosaic size.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import hashlib
+import json
+import math
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_blending import MosaicBlending_Params, calculate_blend_weights, solve_tile_gains
+
+PYRAMID_TILE_PX = 256               # Tile size [pixel]
+PYRAMID_MAX_TILES_MEMORY = 256      # Maximum number of tiles kept in memory
+PYRAMID_CACHE_DIR_DEFAULT = os.path.join(tempfile.gettempdir(), 'iris_mosaic_pyramid')
+RENDERER_MAX_IMAGES_MEMORY = 16     # Maximum number of converted (rotated and cropped) images kept in memory
+
+
+def calculate_num_levels(size:tuple[int,int], tile_px:int) -> int:
+    """
+    Calculates the number of levels of a pyramid, the last one fitting in a single tile
+
+    Args:
+        size (tuple[int,int]): Size (width,height) of the full resolution image [pixel]
+        tile_px (int): Tile size [pixel]
+
+    Returns:
+        int: Number of levels
+    """
+    assert tile_px > 0, 'Tile size must be positive'
+    return max(1, math.ceil(math.log2(max(size)/tile_px)) + 1)
+
+
+class MosaicRenderer():
+    """
+    Renders any region of the stitched image of an image unit, at any power-of-two downsampling
+    level, without building the stitched image. The images overlapping the region are converted
+    (rotated and cropped, see MeaImg_Unit.get_stitch_image) on request and the most recently used
+    ones are kept in a bounded LRU cache. The seam blending of the unit, if set, is applied with the
+    parameters set when the renderer is created
+    """
+    def __init__(self, unit:MeaImg_Unit, refined:bool=True, max_images_memory:int=RENDERER_MAX_IMAGES_MEMORY):
+        """
+        Args:
+            unit (MeaImg_Unit): Image unit to render
+            refined (bool): Place the images with the registration-refined offsets, if registered.
+                Default is True
+            max_images_memory (int): Maximum number of converted images kept in memory.
+                Default is RENDERER_MAX_IMAGES_MEMORY
+        """
+        assert isinstance(unit, MeaImg_Unit), 'Unit must be an image measurement unit object'
+        assert unit.check_readyForProcessing(), 'Unit is not ready for processing'
+
+        self._unit = unit
+        self._list_coor_pixel, self._size_image, self._size, self._coor_min_mm = unit.get_stitch_placement(
+            low_res=False, refined=refined)
+        self._arr_coor_pixel = np.array(self._list_coor_pixel, dtype=np.int64).reshape(-1, 2)
+
+        self._lock = threading.Lock()
+        self._max_images_memory = 1
+        self.set_max_images_memory(max_images_memory)
+        self._dict_images:OrderedDict[int,np.ndarray] = OrderedDict()   # LRU cache of the converted images
+
+        # Seam blending, the gains are solved on the first blended render
+        self._blending:MosaicBlending_Params|None = unit.get_stitch_blending()
+        self._weights, self._arr_ff = None, None
+        if self._blending is not None:
+            self._weights, self._arr_ff = calculate_blend_weights(self._size_image, self._blending,
+                                                                  unit.get_stitch_flatfield())
+        self._lock_gains = threading.Lock()
+        self._gains:np.ndarray|None = None
+
+    def get_image_size(self) -> tuple[int,int]:
+        """Returns the size (width,height) of the full resolution stitched image [pixel]"""
+        return self._size
+
+    def get_coor_min_mm(self) -> tuple[float,float]:
+        """Returns the stage coordinate of the 0,0 pixel of the stitched image [mm]"""
+        return self._coor_min_mm
+
+    def get_placement(self) -> tuple[list[tuple[int,int]],tuple[int,int]]:
+        """
+        Returns the placement of the images in the stitched image
+
+        Returns:
+            tuple[list[tuple[int,int]],tuple[int,int]]: Top-left pixel of every image and the
+                size (width,height) of the images [pixel]
+        """
+        return list(self._list_coor_pixel), self._size_image
+
+    def set_max_images_memory(self, max_images_memory:int) -> None:
+        """
+        Sets the maximum number of converted images kept in memory
+
+        Args:
+            max_images_memory (int): Maximum number of images
+        """
+        assert max_images_memory > 0, 'Maximum number of images in memory must be positive'
+        with self._lock: self._max_images_memory = max_images_memory
+
+    def get_blending(self) -> MosaicBlending_Params|None:
+        """Returns the seam blending parameters applied, None if the images are pasted"""
+        return self._blending
+
+    def get_num_images_memory(self) -> int:
+        """Returns the number of converted images kept in memory"""
+        with self._lock: return len(self._dict_images)
+
+    def get_images_overlapping(self, rect:tuple[int,int,int,int]) -> list[int]:
+        """
+        Returns the images overlapping a region of the stitched image, in the stitching order
+
+        Args:
+            rect (tuple[int,int,int,int]): Region (xmin,ymin,xmax,ymax) in full resolution pixels,
+                the max excluded
+
+        Returns:
+            list[int]: Indices of the images
+        """
+        coor = self._arr_coor_pixel
+        wid, hei = self._size_image
+        mask = (coor[:,0] < rect[2]) & (coor[:,0] + wid > rect[0]) & (coor[:,1] < rect[3]) & (coor[:,1] + hei > rect[1])
+        return np.flatnonzero(mask).tolist()
+
+    def _get_image(self, index:int) -> np.ndarray:
+        """
+        Returns a converted image, from the LRU cache or converted
+
+        Args:
+            index (int): Index of the image
+
+        Returns:
+            np.ndarray: RGB image (height,width,3)
+        """
+        with self._lock:
+            if index in self._dict_images:
+                self._dict_images.move_to_end(index)
+                return self._dict_images[index]
+
+        img = np.asarray(self._unit.get_stitch_image(index).convert('RGB'))
+        with self._lock:
+            self._dict_images[index] = img
+            while len(self._dict_images) > self._max_images_memory: self._dict_images.popitem(last=False)
+        return img
+
+    def _get_blend_tile(self, index:int) -> np.ndarray:
+        """Returns a converted image divided by the flatfield, as blended (height,width,3) float32"""
+        tile = np.asarray(self._get_image(index), dtype=np.float32)
+        return tile if self._arr_ff is None else tile/self._arr_ff
+
+    def _get_gains(self) -> np.ndarray:
+        """
+        Returns the gains of the images, solved over the whole mosaic on the first call (see
+        mosaic_blending.solve_tile_gains)
+
+        Returns:
+            np.ndarray: Gains (num_images,3)
+        """
+        assert self._blending is not None, 'Blending parameters are not set'
+        with self._lock_gains:
+            if self._gains is None:
+                if self._blending.gain_compensation:
+                    self._gains = solve_tile_gains(_BlendTile_Sequence(self), self._list_coor_pixel, self._blending)
+                else:
+                    self._gains = np.ones((len(self._list_coor_pixel), 3))
+            return self._gains
+
+    def render_region(self, level:int, x0:int, y0:int, x1:int, y1:int) -> np.ndarray:
+        """
+        Renders a region of the stitched image downsampled by 2^level. At the downsampled levels,
+        every image is box-downsampled on the level grid and blended by its coverage of the level
+        pixels, such that the region matches the downsampled stitched image. With the seam blending
+        set, see _render_region_blended
+
+        Args:
+            level (int): Downsampling level
+            x0 (int): Left edge of the region [level pixel]
+            y0 (int): Top edge of the region [level pixel]
+            x1 (int): Right edge of the region, excluded [level pixel]
+            y1 (int): Bottom edge of the region, excluded [level pixel]
+
+        Returns:
+            np.ndarray: RGB region (y1-y0,x1-x0,3), zero where no image is placed
+        """
+        assert level >= 0, 'Level must be non-negative'
+        assert x1 > x0 and y1 > y0, 'Region must not be empty'
+        if self._blending is not None: return self._render_region_blended(level, x0, y0, x1, y1)
+        factor = 2**level
+        wid, hei = self._size_image
+        list_index = self.get_images_overlapping((x0*factor, y0*factor, x1*factor, y1*factor))
+
+        if factor == 1:
+            region = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+            for index in list_index:
+                px, py = self._list_coor_pixel[index]
+                i0, i1 = max(px, x0), min(px + wid, x1)
+                j0, j1 = max(py, y0), min(py + hei, y1)
+                region[j0 - y0:j1 - y0, i0 - x0:i1 - x0] = self._get_image(index)[j0 - py:j1 - py, i0 - px:i1 - px]
+            return region
+
+        region = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.float32)
+        for index in list_index:
+            px, py = self._list_coor_pixel[index]
+            # Level pixels covered (partially) by the image, within the region
+            i0, i1 = max(px//factor, x0), min(-(-(px + wid)//factor), x1)
+            j0, j1 = max(py//factor, y0), min(-(-(py + hei)//factor), y1)
+            if i1 <= i0 or j1 <= j0: continue
+            # Mean of the image pixels of every level pixel, zero outside the image
+            sx0, sy0 = i0*factor - px, j0*factor - py
+            cx0, cx1 = max(sx0, 0), min(i1*factor - px, wid)
+            cy0, cy1 = max(sy0, 0), min(j1*factor - py, hei)
+            block = np.zeros(((j1 - j0)*factor, (i1 - i0)*factor, 3), dtype=np.uint8)
+            block[cy0 - sy0:cy1 - sy0, cx0 - sx0:cx1 - sx0] = self._get_image(index)[cy0:cy1, cx0:cx1]
+            mean = cv2.resize(block, (i1 - i0, j1 - j0), interpolation=cv2.INTER_AREA).reshape(j1 - j0, i1 - i0, 3)
+            # Fraction of every level pixel covered by the image
+            edge_x = np.arange(i0, i1 + 1)*factor
+            edge_y = np.arange(j0, j1 + 1)*factor
+            cover_x = (np.minimum(edge_x[1:], px + wid) - np.maximum(edge_x[:-1], px)).clip(0)/factor
+            cover_y = (np.minimum(edge_y[1:], py + hei) - np.maximum(edge_y[:-1], py)).clip(0)/factor
+            coverage = (cover_y[:,None]*cover_x[None,:])[...,None].astype(np.float32)
+            dest = region[j0 - y0:j1 - y0, i0 - x0:i1 - x0]
+            dest[...] = mean + (1 - coverage)*dest
+        np.round(region, out=region)
+        return np.clip(region, 0, 255, out=region).astype(np.uint8)
+
+    def _render_region_blended(self, level:int, x0:int, y0:int, x1:int, y1:int) -> np.ndarray:
+        """
+        Renders a region of the stitched image downsampled by 2^level with the seam blending, see
+        mosaic_blending.blend_mosaic: every image is divided by the flatfield, multiplied by its gain
+        and weighted by its feathering weights. At the full resolution, the region matches the blended
+        stitched image. At the downsampled levels, the weighted images and the weights are box-downsampled
+        on the level grid before the normalisation, i.e., the level pixels are the weighted mean of the
+        full resolution pixels they cover
+
+        Args:
+            level (int): Downsampling level
+            x0 (int): Left edge of the region [level pixel]
+            y0 (int): Top edge of the region [level pixel]
+            x1 (int): Right edge of the region, excluded [level pixel]
+            y1 (int): Bottom edge of the region, excluded [level pixel]
+
+        Returns:
+            np.ndarray: RGB region (y1-y0,x1-x0,3), zero where no image is placed
+        """
+        assert self._weights is not None, 'Blending parameters are not set'
+        factor = 2**level
+        wid, hei = self._size_image
+        list_index = self.get_images_overlapping((x0*factor, y0*factor, x1*factor, y1*factor))
+        gains = self._get_gains() if list_index else None
+
+        accum = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.float32)
+        accum_weight = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        for index in list_index:
+            px, py = self._list_coor_pixel[index]
+            gain = gains[index].astype(np.float32)
+            if factor == 1:
+                i0, i1 = max(px, x0), min(px + wid, x1)
+                j0, j1 = max(py, y0), min(py + hei, y1)
+                sl_tile = (slice(j0 - py, j1 - py), slice(i0 - px, i1 - px))
+                weights = self._weights[sl_tile]
+                accum[j0 - y0:j1 - y0, i0 - x0:i1 - x0] += self._get_blend_tile(index)[sl_tile]*(weights[..., None]*gain)
+                accum_weight[j0 - y0:j1 - y0, i0 - x0:i1 - x0] += weights
+                continue
+            # Level pixels covered (partially) by the image, within the region
+            i0, i1 = max(px//factor, x0), min(-(-(px + wid)//factor), x1)
+            j0, j1 = max(py//factor, y0), min(-(-(py + hei)//factor), y1)
+            if i1 <= i0 or j1 <= j0: continue
+            # Sums of the weighted image and of the weights over every level pixel, zero outside the image
+            sx0, sy0 = i0*factor - px, j0*factor - py
+            cx0, cx1 = max(sx0, 0), min(i1*factor - px, wid)
+            cy0, cy1 = max(sy0, 0), min(j1*factor - py, hei)
+            weights = self._weights[cy0:cy1, cx0:cx1]
+            block = np.zeros(((j1 - j0)*factor, (i1 - i0)*factor, 4), dtype=np.float32)
+            block[cy0 - sy0:cy1 - sy0, cx0 - sx0:cx1 - sx0, :3] =\
+                self._get_blend_tile(index)[cy0:cy1, cx0:cx1]*(weights[..., None]*gain)
+            block[cy0 - sy0:cy1 - sy0, cx0 - sx0:cx1 - sx0, 3] = weights
+            mean = cv2.resize(block, (i1 - i0, j1 - j0), interpolation=cv2.INTER_AREA).reshape(j1 - j0, i1 - i0, 4)
+            accum[j0 - y0:j1 - y0, i0 - x0:i1 - x0] += mean[..., :3]
+            accum_weight[j0 - y0:j1 - y0, i0 - x0:i1 - x0] += mean[..., 3]
+
+        np.divide(accum, accum_weight[..., None], out=accum, where=accum_weight[..., None] > 0)
+        np.clip(accum, 0, 255, out=accum)
+        return np.round(accum).astype(np.uint8)
+
+
+class _BlendTile_Sequence(Sequence):
+    """Images of a renderer as blended (see MosaicRenderer._get_blend_tile), converted on access"""
+    def __init__(self, renderer:MosaicRenderer):
+        self._renderer = renderer
+
+    def __len__(self) -> int:
+        return len(self._renderer.get_placement()[0])
+
+    def __getitem__(self, index:int) -> np.ndarray:
+        if not 0 <= index < len(self): raise IndexError(index)
+        return self._renderer._get_blend_tile(index)
+
+
+class MosaicPyramid():
+    """
+    Lazily generated tile pyramid of the stitched image of an image unit, cached on disk
+    """
+    def __init__(self, unit:MeaImg_Unit, cache_dir:str|None=None, tile_px:int=PYRAMID_TILE_PX,
+                 max_tiles_memory:int=PYRAMID_MAX_TILES_MEMORY, refined:bool=True):
+        """
+        Args:
+            unit (MeaImg_Unit): Image unit to display
+            cache_dir (str|None): Directory of the disk cache, a temporary directory if None.
+                Default is None
+            tile_px (int): Tile size [pixel]. Default is PYRAMID_TILE_PX
+            max_tiles_memory (int): Maximum number of tiles kept in memory. Default is PYRAMID_MAX_TILES_MEMORY
+            refined (bool): Place the images with the registration-refined offsets, if registered.
+                Default is True
+        """
+        assert isinstance(unit, MeaImg_Unit), 'Unit must be an image measurement unit object'
+        assert unit.check_readyForProcessing(), 'Unit is not ready for processing'
+        assert tile_px > 0, 'Tile size must be positive'
+        assert max_tiles_memory > 0, 'Maximum number of tiles in memory must be positive'
+
+        self._tile_px = tile_px
+        self._max_tiles_memory = max_tiles_memory
+        self._renderer = MosaicRenderer(unit, refined=refined)
+        self._size = self._renderer.get_image_size()
+        self._num_levels = calculate_num_levels(self._size, tile_px)
+
+        # Disk cache, specific to the layout and the content (images and blending) such that a changed
+        # unit is never served stale tiles
+        list_coor_pixel, size_image = self._renderer.get_placement()
+        dict_mea = unit.get_dict_measurement()
+        blending = self._renderer.get_blending()
+        if blending is not None:
+            flatfield = None if blending.flatfield is None else\
+                hashlib.sha1(np.ascontiguousarray(blending.flatfield)).hexdigest()
+            blending = [blending.feather_px, blending.gain_compensation, blending.min_overlap_px, flatfield]
+        layout = json.dumps([unit.get_IdName()[0], tile_px, self._size, size_image, list_coor_pixel,
+                             [str(ts) for ts in dict_mea['timestamp']], [img.size for img in dict_mea['image']], blending])
+        key = hashlib.sha1(layout.encode()).hexdigest()[:16]
+        self._cache_dir = os.path.join(cache_dir or PYRAMID_CACHE_DIR_DEFAULT, f'{unit.get_IdName()[0]}_{key}')
+
+        self._lock = threading.Lock()
+        self._dict_tiles:OrderedDict[tuple[int,int,int],Image.Image] = OrderedDict()   # LRU in-memory cache
+
+    def get_tile_size(self) -> int:
+        """Returns the tile size [pixel]"""
+        return self._tile_px
+
+    def get_num_levels(self) -> int:
+        """Returns the number of levels, the last one fitting in a single tile"""
+        return self._num_levels
+
+    def get_image_size(self) -> tuple[int,int]:
+        """Returns the size (width,height) of the full resolution stitched image [pixel]"""
+        return self._size
+
+    def get_coor_min_mm(self) -> tuple[float,float]:
+        """Returns the stage coordinate of the 0,0 pixel of the stitched image [mm]"""
+        return self._renderer.get_coor_min_mm()
+
+    def get_level_size(self, level:int) -> tuple[int,int]:
+        """
+        Returns the size of the stitched image at a level
+
+        Args:
+            level (int): Pyramid level
+
+        Returns:
+            tuple[int,int]: Size (width,height) [pixel]
+        """
+        assert 0 <= level < self._num_levels, 'Level out of range'
+        return tuple(math.ceil(size/2**level) for size in self._size)
+
+    def get_grid_size(self, level:int) -> tuple[int,int]:
+        """
+        Returns the number of tiles at a level
+
+        Args:
+            level (int): Pyramid level
+
+        Returns:
+            tuple[int,int]: Number of columns and rows
+        """
+        return tuple(math.ceil(size/self._tile_px) for size in self.get_level_size(level))
+
+    def select_level(self, scale:float) -> int:
+        """
+        Selects the coarsest level with at least as many pixels as displayed
+
+        Args:
+            scale (float): Displayed size of a full resolution pixel [screen pixel]
+
+        Returns:
+            int: Pyramid level
+        """
+        assert scale > 0, 'Scale must be positive'
+        if scale >= 1: return 0
+        return min(int(math.floor(math.log2(1/scale) + 1e-9)), self._num_levels - 1)
+
+    def get_visible_tiles(self, level:int, rect:tuple[float,float,float,float]) -> list[tuple[int,int,int]]:
+        """
+        Returns the tiles of a level intersecting a region of the stitched image
+
+        Args:
+            level (int): Pyramid level
+            rect (tuple[float,float,float,float]): Region (xmin,ymin,xmax,ymax) in full resolution pixels
+
+        Returns:
+            list[tuple[int,int,int]]: Tiles (level,col,row), row by row
+        """
+        num_cols, num_rows = self.get_grid_size(level)
+        span = self._tile_px*2**level
+        col0, row0 = max(int(rect[0]//span), 0), max(int(rect[1]//span), 0)
+        col1, row1 = min(int(math.ceil(rect[2]/span)), num_cols), min(int(math.ceil(rect[3]/span)), num_rows)
+        return [(level, col, row) for row in range(row0, row1) for col in range(col0, col1)]
+
+    def get_num_tiles_memory(self) -> int:
+        """Returns the number of tiles kept in memory"""
+        with self._lock: return len(self._dict_tiles)
+
+    def get_cache_dir(self) -> str:
+        """Returns the directory of the disk cache of this pyramid"""
+        return self._cache_dir
+
+    def clear_cache(self, disk:bool=False) -> None:
+        """
+        Clears the in-memory cache
+
+        Args:
+            disk (bool): Also deletes the disk cache directory of this pyramid. Default is False
+
+        Note:
+            The disk cache must not be cleared while tiles are being loaded from another thread
+        """
+        with self._lock: self._dict_tiles.clear()
+        if disk: shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+    def get_tile(self, level:int, col:int, row:int) -> Image.Image:
+        """
+        Returns a tile, from the memory or disk cache or rendered
+
+        Args:
+            level (int): Pyramid level
+            col (int): Tile column
+            row (int): Tile row
+
+        Returns:
+            Image.Image: Tile, cropped at the image edges
+        """
+        num_cols, num_rows = self.get_grid_size(level)
+        assert 0 <= col < num_cols and 0 <= row < num_rows, 'Tile out of range'
+        key = (level, col, row)
+        with self._lock:
+            if key in self._dict_tiles:
+                self._dict_tiles.move_to_end(key)
+                return self._dict_tiles[key]
+
+        filepath = os.path.join(self._cache_dir, str(level), f'{col}_{row}.png')
+        if os.path.isfile(filepath):
+            with Image.open(filepath) as img: tile = img.convert('RGB')
+        else:
+            tile = self._render_tile(level, col, row)
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            tile.save(filepath)
+
+        with self._lock:
+            self._dict_tiles[key] = tile
+            while len(self._dict_tiles) > self._max_tiles_memory: self._dict_tiles.popitem(last=False)
+        return tile
+
+    def _render_tile(self, level:int, col:int, row:int) -> Image.Image:
+        """
+        Renders a tile from the images overlapping it (see MosaicRenderer.render_region)
+
+        Args:
+            level (int): Pyramid level
+            col (int): Tile column
+            row (int): Tile row
+
+        Returns:
+            Image.Image: Tile
+        """
+        lvl_wid, lvl_hei = self.get_level_size(level)
+        x0, y0 = col*self._tile_px, row*self._tile_px
+        x1, y1 = min(x0 + self._tile_px, lvl_wid), min(y0 + self._tile_px, lvl_hei)
+        return Image.fromarray(self._renderer.render_region(level, x0, y0, x1, y1))
@@ -0,0 +1,306 @@
+"""
+Registration-refined tile placement of image mosaics.
+
+The tiles of an image mosaic (MeaImg_Unit) are placed from the stage coordinates they were taken
+at, so the stage repeatability errors show as seams. The registration refines the placement:
+1. The overlapping tile pairs are found from the nominal (stage-coordinate) placements
+2. The offset between every pair is measured by phase correlation of their downsampled grayscale
+    overlaps, refined to sub-pixel with an upsampled DFT around the correlation peak
+3. The per-tile offsets are solved by a global weighted least-squares over all the pairs, with the
+    weak pairs and the pairs inconsistent with the solution rejected iteratively
+
+The offsets are relative to the nominal placements and zero-mean over every connected group of
+tiles, such that the mosaic stays on average where the stage coordinates put it.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import lsqr
+
+PC_UPSAMPLE = 20            # Upsampling factor of the sub-pixel peak refinement (1/PC_UPSAMPLE pixel)
+PC_MIN_SIZE_PX = 8          # Minimum size of a downsampled overlap to be correlated
+PC_NUM_REFINE = 1           # Number of re-correlations after compensating the measured shift
+LSQR_TOL = 1e-12            # Tolerance of the sparse least-squares (lsqr) of the global placement
+LSQR_MAX_ITER = 100_000     # Maximum number of lsqr iterations of the global placement
+
+
+@dataclass
+class MosaicRegistration_Params:
+    """
+    Parameters of the mosaic registration
+
+    Args:
+        downsample (float): Downsampling factor of the overlaps for the phase correlation (0 < x <= 1)
+        min_overlap_px (int): Minimum overlap width and height [pixel] for a pair to be registered
+        min_response (float): Minimum phase correlation peak (0-1) for a pair to be used
+        max_shift_frac (float): Maximum measured shift relative to the overlap size
+        outlier_sigma (float): Robust z-score of the residual above which a pair is rejected
+        min_outlier_px (float): Minimum residual [pixel] for a pair to be rejected
+        max_iterations (int): Maximum number of solve/reject iterations
+    """
+    downsample:float = 0.5
+    min_overlap_px:int = 32
+    min_response:float = 0.2
+    max_shift_frac:float = 0.25
+    outlier_sigma:float = 3.0
+    min_outlier_px:float = 1.0
+    max_iterations:int = 5
+
+    def __post_init__(self):
+        assert 0 < self.downsample <= 1, 'Downsample factor must be between 0 (exclusive) and 1 (inclusive)'
+        assert self.min_overlap_px > 0, 'Minimum overlap must be positive'
+        assert 0 < self.max_shift_frac < 0.5, 'Maximum shift fraction must be between 0 and 0.5'
+        assert self.max_iterations > 0, 'Maximum number of iterations must be positive'
+
+
+@dataclass
+class MosaicRegistration_Result:
+    """
+    Result of the mosaic registration
+
+    Args:
+        offsets_pixel (list[tuple[float,float]]): Offset (x,y) of every tile to add to its nominal placement [pixel]
+        list_pairs (list[tuple[int,int]]): Tile pairs used in the final solution
+        num_pairs_overlap (int): Number of overlapping tile pairs
+        num_pairs_rejected (int): Number of overlapping pairs rejected (weak correlation or outlier)
+        rms_residual_pixel (float): RMS residual of the used pairs [pixel]
+    """
+    offsets_pixel:list[tuple[float,float]] = field(default_factory=list)
+    list_pairs:list[tuple[int,int]] = field(default_factory=list)
+    num_pairs_overlap:int = 0
+    num_pairs_rejected:int = 0
+    rms_residual_pixel:float = 0.0
+
+
+def find_overlapping_pairs(list_xy:np.ndarray|list, size:tuple[int,int], min_overlap_px:int)\
+    -> list[tuple[int,int]]:
+    """
+    Finds the tile pairs overlapping by at least min_overlap_px in both directions
+
+    Args:
+        list_xy (np.ndarray|list): Nominal placement (x,y) of the top-left corner of every tile [pixel]
+        size (tuple[int,int]): Tile size (width,height) [pixel]
+        min_overlap_px (int): Minimum overlap width and height [pixel]
+
+    Returns:
+        list[tuple[int,int]]: Overlapping pairs (i,j) with i < j
+    """
+    xy = np.asarray(list_xy, dtype=float).reshape(-1,2)
+    overlap_x = size[0] - np.abs(xy[:,None,0] - xy[None,:,0])
+    overlap_y = size[1] - np.abs(xy[:,None,1] - xy[None,:,1])
+    mask = np.triu((overlap_x >= min_overlap_px) & (overlap_y >= min_overlap_px), k=1)
+    return [(int(i), int(j)) for i, j in zip(*np.nonzero(mask))]
+
+
+def _upsampled_dft(data:np.ndarray, region_size:int, upsample:int, offset:tuple[float,float]) -> np.ndarray:
+    """
+    Evaluates the inverse DFT of the data on a (region_size x region_size) grid, upsampled by
+    upsample, starting at offset (y,x) of the upsampled grid
+    """
+    ny, nx = data.shape
+    freq_y = np.fft.ifftshift(np.arange(ny)) - ny//2
+    freq_x = np.fft.ifftshift(np.arange(nx)) - nx//2
+    kernel_y = np.exp(-2j*np.pi/(ny*upsample)*np.outer(np.arange(region_size) - offset[0], freq_y))
+    kernel_x = np.exp(-2j*np.pi/(nx*upsample)*np.outer(freq_x, np.arange(region_size) - offset[1]))
+    return kernel_y @ data @ kernel_x
+
+
+def _phase_correlate_once(img_ref:np.ndarray, img_mov:np.ndarray, upsample:int) -> tuple[float,float,float]:
+    """Single phase correlation, see phase_correlate"""
+    window = np.outer(np.hanning(img_ref.shape[0]), np.hanning(img_ref.shape[1]))
+    freq_ref = np.fft.fft2((img_ref - img_ref.mean())*window)
+    freq_mov = np.fft.fft2((img_mov - img_mov.mean())*window)
+    cross = freq_ref*np.conj(freq_mov)
+    cross /= np.maximum(np.abs(cross), 1e-12)
+
+    # > Integer peak, wrapped to negative shifts <
+    corr = np.fft.ifft2(cross).real
+    peak_y, peak_x = np.unravel_index(np.argmax(corr), corr.shape)
+    ny, nx = corr.shape
+    shift_y = peak_y - ny if peak_y > ny//2 else peak_y
+    shift_x = peak_x - nx if peak_x > nx//2 else peak_x
+
+    # > Sub-pixel refinement on an upsampled grid of +-0.75 pixel around the peak <
+    region_size = int(np.ceil(upsample*1.5))
+    centre = region_size//2
+    corr_up = _upsampled_dft(np.conj(cross), region_size, upsample,
+                             (centre - shift_y*upsample, centre - shift_x*upsample)).conj().real
+    up_y, up_x = np.unravel_index(np.argmax(corr_up), corr_up.shape)
+    shift_y = shift_y + (up_y - centre)/upsample
+    shift_x = shift_x + (up_x - centre)/upsample
+    return float(shift_x), float(shift_y), float(corr.max())
+
+
+def phase_correlate(img_ref:np.ndarray, img_mov:np.ndarray, upsample:int=PC_UPSAMPLE,
+                    num_refine:int=PC_NUM_REFINE) -> tuple[float,float,float]:
+    """
+    Measures the translation between two images of the same size by phase correlation
+
+    Args:
+        img_ref (np.ndarray): Reference grayscale image
+        img_mov (np.ndarray): Moved grayscale image
+        upsample (int): Upsampling factor of the sub-pixel peak refinement
+        num_refine (int): Number of re-correlations after shifting the moved image back by the
+            measured shift (the apodisation window biases the larger shifts towards zero)
+
+    Returns:
+        tuple[float,float,float]: Shift (dx,dy) [pixel] such that img_mov(p) = img_ref(p + shift),
+            and the correlation peak (0-1) of the first correlation
+    """
+    assert img_ref.shape == img_mov.shape, 'Images must have the same shape'
+    img_ref = img_ref.astype(np.float32)
+    img_mov = img_mov.astype(np.float32)
+    shift_x, shift_y, response = _phase_correlate_once(img_ref, img_mov, upsample)
+    for _ in range(num_refine):
+        mat = np.float32([[1, 0, shift_x], [0, 1, shift_y]])
+        img_back = cv2.warpAffine(img_mov, mat, img_mov.shape[::-1], flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REFLECT)
+        res_x, res_y, _ = _phase_correlate_once(img_ref, img_back, upsample)
+        shift_x, shift_y = shift_x + res_x, shift_y + res_y
+    return shift_x, shift_y, response
+
+
+def _downsample(img:np.ndarray, downsample:float) -> np.ndarray:
+    """Downsamples a grayscale image by area averaging"""
+    img = img.astype(np.float32)
+    if downsample == 1: return img
+    size = (max(1, round(img.shape[1]*downsample)), max(1, round(img.shape[0]*downsample)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+def measure_pair_offset(tile_i:np.ndarray, tile_j:np.ndarray, xy_i:tuple[float,float], xy_j:tuple[float,float],
+                        params:MosaicRegistration_Params) -> tuple[float,float,float]|None:
+    """
+    Measures the placement error of tile j relative to tile i from their overlap
+
+    Args:
+        tile_i (np.ndarray): Grayscale image of tile i
+        tile_j (np.ndarray): Grayscale image of tile j, of the same size
+        xy_i (tuple[float,float]): Nominal placement of tile i [pixel]
+        xy_j (tuple[float,float]): Nominal placement of tile j [pixel]
+        params (MosaicRegistration_Params): Registration parameters
+
+    Returns:
+        tuple[float,float,float]|None: Error (dx,dy) [pixel] of tile j minus that of tile i, i.e.,
+            the offset to add to the relative placement, and the correlation peak. None if the
+            overlap is too small or the shift is out of the valid range
+    """
+    hei, wid = tile_i.shape[:2]
+    x0, x1 = max(xy_i[0], xy_j[0]), min(xy_i[0], xy_j[0]) + wid
+    y0, y1 = max(xy_i[1], xy_j[1]), min(xy_i[1], xy_j[1]) + hei
+    ov_wid, ov_hei = int(x1 - x0), int(y1 - y0)
+    if min(ov_wid, ov_hei) < params.min_overlap_px: return None
+
+    # Crops of the overlap in each tile (integer starts) and their actual placement
+    ui = (min(max(round(x0 - xy_i[0]), 0), wid - ov_wid), min(max(round(y0 - xy_i[1]), 0), hei - ov_hei))
+    uj = (min(max(round(x0 - xy_j[0]), 0), wid - ov_wid), min(max(round(y0 - xy_j[1]), 0), hei - ov_hei))
+    crop_i = _downsample(tile_i[ui[1]:ui[1]+ov_hei, ui[0]:ui[0]+ov_wid], params.downsample)
+    crop_j = _downsample(tile_j[uj[1]:uj[1]+ov_hei, uj[0]:uj[0]+ov_wid], params.downsample)
+    if min(crop_i.shape) < PC_MIN_SIZE_PX: return None
+
+    dx, dy, response = phase_correlate(crop_i, crop_j)
+    dx, dy = dx*ov_wid/crop_i.shape[1], dy*ov_hei/crop_i.shape[0]   # Actual (rounded) downsampling
+    if abs(dx) > params.max_shift_frac*ov_wid or abs(dy) > params.max_shift_frac*ov_hei: return None
+
+    # crop_j(p) = crop_i(p + shift): shift = (placement_j + err_j) - (placement_i + err_i)
+    dx -= (xy_j[0] + uj[0]) - (xy_i[0] + ui[0])
+    dy -= (xy_j[1] + uj[1]) - (xy_i[1] + ui[1])
+    return dx, dy, response
+
+
+def solve_global_placement(num_tiles:int, pairs:np.ndarray, deltas:np.ndarray, weights:np.ndarray) -> np.ndarray:
+    """
+    Solves the tile offsets from the pairwise measurements by weighted least squares, with the
+    offsets zero-mean over every connected group of tiles
+
+    Args:
+        num_tiles (int): Number of tiles
+        pairs (np.ndarray): Pairs (i,j), shape (M,2)
+        deltas (np.ndarray): Measured offset of tile j minus that of tile i, shape (M,2), or (M,D)
+            for any other D-dimensional pairwise difference
+        weights (np.ndarray): Weight of every pair, shape (M,)
+
+    Returns:
+        np.ndarray: Offsets (x,y) of every tile, shape (N,2) (or (N,D)). Isolated tiles have zero offsets
+    """
+    offsets = np.zeros((num_tiles, deltas.shape[1]))
+    if len(pairs) == 0: return offsets
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:,0], pairs[:,1])), shape=(num_tiles, num_tiles))
+    num_groups, labels = connected_components(graph, directed=False)
+
+    # Sparse system: two entries per pair and one zero-mean constraint row per group
+    num_pairs = len(pairs)
+    sqrt_w = np.sqrt(weights)
+    rows = np.concatenate([np.arange(num_pairs), np.arange(num_pairs), num_pairs + labels])
+    cols = np.concatenate([pairs[:,1], pairs[:,0], np.arange(num_tiles)])
+    vals = np.concatenate([sqrt_w, -sqrt_w, np.ones(num_tiles)])
+    mat_A = coo_matrix((vals, (rows, cols)), shape=(num_pairs + num_groups, num_tiles)).tocsr()
+    vec_b = np.zeros((num_pairs + num_groups, deltas.shape[1]))
+    vec_b[:num_pairs] = deltas*sqrt_w[:,None]
+    for dim in range(deltas.shape[1]):
+        offsets[:,dim] = lsqr(mat_A, vec_b[:,dim], atol=LSQR_TOL, btol=LSQR_TOL, iter_lim=LSQR_MAX_ITER)[0]
+    return offsets
+
+
+def register_mosaic(list_tiles:list[np.ndarray], list_xy:list[tuple[float,float]],
+                    params:MosaicRegistration_Params|None=None) -> MosaicRegistration_Result:
+    """
+    Registers the tiles of a mosaic to refine their nominal placements
+
+    Args:
+        list_tiles (list[np.ndarray]): Grayscale images of the tiles, all of the same size
+        list_xy (list[tuple[float,float]]): Nominal placement (x,y) of the top-left corner of every tile [pixel]
+        params (MosaicRegistration_Params|None): Registration parameters. Default parameters if None
+
+    Returns:
+        MosaicRegistration_Result: Per-tile offsets and the registration statistics
+    """
+    assert len(list_tiles) == len(list_xy), 'Number of tiles and placements must match'
+    assert len(list_tiles) > 0, 'No tiles to register'
+    assert all(tile.shape == list_tiles[0].shape for tile in list_tiles), 'Tiles must all have the same size'
+    if params is None: params = MosaicRegistration_Params()
+
+    num_tiles = len(list_tiles)
+    hei, wid = list_tiles[0].shape[:2]
+    list_overlaps = find_overlapping_pairs(list_xy, (wid, hei), params.min_overlap_px)
+
+    list_pairs, list_deltas, list_resp = [], [], []
+    for i, j in list_overlaps:
+        ret = measure_pair_offset(list_tiles[i], list_tiles[j], list_xy[i], list_xy[j], params)
+        if ret is None or ret[2] < params.min_response: continue
+        list_pairs.append((i, j))
+        list_deltas.append(ret[:2])
+        list_resp.append(ret[2])
+    pairs = np.array(list_pairs, dtype=int).reshape(-1,2)
+    deltas = np.array(list_deltas, dtype=float).reshape(-1,2)
+    weights = np.array(list_resp, dtype=float)
+
+    # > Solve and reject the inconsistent pairs until none is left <
+    active = np.ones(len(pairs), dtype=bool)
+    offsets = solve_global_placement(num_tiles, pairs, deltas, weights)
+    for _ in range(params.max_iterations):
+        if not active.any(): break
+        residuals = np.linalg.norm(offsets[pairs[:,1]] - offsets[pairs[:,0]] - deltas, axis=1)
+        threshold = max(params.outlier_sigma*1.4826*float(np.median(residuals[active])), params.min_outlier_px)
+        active_new = active & (residuals <= threshold)
+        if np.array_equal(active_new, active): break
+        active = active_new
+        offsets = solve_global_placement(num_tiles, pairs[active], deltas[active], weights[active])
+
+    residuals = np.linalg.norm(offsets[pairs[active,1]] - offsets[pairs[active,0]] - deltas[active], axis=1)
+    return MosaicRegistration_Result(
+        offsets_pixel=[(float(x), float(y)) for x, y in offsets],
+        list_pairs=[(int(i), int(j)) for i, j in pairs[active]],
+        num_pairs_overlap=len(list_overlaps),
+        num_pairs_rejected=len(list_overlaps) - int(active.sum()),
+        rms_residual_pixel=float(np.sqrt(np.mean(residuals**2))) if len(residuals) else 0.0,
+    )
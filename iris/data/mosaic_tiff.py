@@ -0,0 +1,187 @@
+"""
+Export of the stitched image of an image unit (MeaImg_Unit) as a pyramidal tiled TIFF.
+
+The stitched image is never built: the full resolution level is rendered strip by strip (one row
+of tiles) by a MosaicRenderer and streamed to the file, the downsampled levels being stored as
+SubIFDs of the full resolution image (the layout read by QuPath, OpenSlide/libvips, napari, etc.).
+Every downsampled level is 2x2 box-downsampled from the strips of the previous one while these are
+written, into a temporary memory-mapped file read back strip by strip when its turn comes. Only a
+strip and the converted images overlapping it are held in memory at any time. The seam blending
+of the unit, if set, is applied as in the stitched image (see MosaicRenderer). The pixel
+size from the unit's calibration (ImgMea_Cal) is written in the resolution tags, and the pixel
+size and stage coordinate of the 0,0 pixel in the JSON image description.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import tempfile
+from typing import Iterator
+
+import numpy as np
+import tifffile
+
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_pyramid import MosaicRenderer, calculate_num_levels
+
+TIFF_TILE_PX = 256                  # Tile size [pixel], must be a multiple of 16
+TIFF_COMPRESSION = 'zlib'           # Compression of the tiles (lossless)
+
+
+def _iter_strips_rendered(renderer:MosaicRenderer, size:tuple[int,int], tile_px:int) -> Iterator[np.ndarray]:
+    """
+    Yields the strips of the full resolution level, rendered from the images
+
+    Args:
+        renderer (MosaicRenderer): Renderer of the stitched image
+        size (tuple[int,int]): Size (width,height) of the stitched image [pixel]
+        tile_px (int): Tile size [pixel]
+
+    Yields:
+        np.ndarray: Strip (tile_px,num_cols*tile_px,3), zero-padded at the image edges
+    """
+    wid, hei = size
+    num_cols = -(-wid//tile_px)
+    for y0 in range(0, hei, tile_px):
+        strip = np.zeros((tile_px, num_cols*tile_px, 3), dtype=np.uint8)
+        y1 = min(y0 + tile_px, hei)
+        strip[:y1 - y0, :wid] = renderer.render_region(0, 0, y0, wid, y1)
+        yield strip
+
+
+def _iter_strips_array(arr:np.ndarray, tile_px:int) -> Iterator[np.ndarray]:
+    """
+    Yields the strips of a level stored in an array (e.g., memory-mapped)
+
+    Args:
+        arr (np.ndarray): Level (height,width,3)
+        tile_px (int): Tile size [pixel]
+
+    Yields:
+        np.ndarray: Strip (tile_px,num_cols*tile_px,3), zero-padded at the image edges
+    """
+    hei, wid = arr.shape[:2]
+    num_cols = -(-wid//tile_px)
+    for y0 in range(0, hei, tile_px):
+        strip = np.zeros((tile_px, num_cols*tile_px, 3), dtype=np.uint8)
+        y1 = min(y0 + tile_px, hei)
+        strip[:y1 - y0, :wid] = arr[y0:y1]
+        yield strip
+
+
+def _downsample_strip(strip:np.ndarray) -> np.ndarray:
+    """
+    Box-downsamples a strip by 2, the zero padding at the image edges being averaged in as the
+    renderer does (see MosaicRenderer.render_region)
+
+    Args:
+        strip (np.ndarray): Strip (height,width,3), of even height and width
+
+    Returns:
+        np.ndarray: Downsampled strip (height/2,width/2,3)
+    """
+    hei, wid = strip.shape[:2]
+    total = strip.reshape(hei//2, 2, wid//2, 2, 3).sum(axis=(1,3), dtype=np.uint16)
+    return ((total + 2)//4).astype(np.uint8)
+
+
+def _iter_level_tiles(strips:Iterator[np.ndarray], tile_px:int, arr_next:np.ndarray|None) -> Iterator[np.ndarray]:
+    """
+    Yields the tiles of a pyramid level, row by row, and downsamples its strips into the next level
+
+    Args:
+        strips (Iterator[np.ndarray]): Strips of the level, see _iter_strips_rendered
+        tile_px (int): Tile size [pixel]
+        arr_next (np.ndarray|None): Next level (height,width,3) to fill, None for the last level
+
+    Yields:
+        np.ndarray: Tile (tile_px,tile_px,3), zero-padded at the image edges
+    """
+    half = tile_px//2
+    for row, strip in enumerate(strips):
+        # Downsampled first, the writer does not exhaust the iterator after the last tile
+        if arr_next is not None:
+            hei_next, wid_next = arr_next.shape[:2]
+            y0 = row*half
+            y1 = min(y0 + half, hei_next)
+            if y1 > y0: arr_next[y0:y1] = _downsample_strip(strip)[:y1 - y0, :wid_next]
+        for col in range(strip.shape[1]//tile_px):
+            yield np.ascontiguousarray(strip[:, col*tile_px:(col + 1)*tile_px])
+
+
+def write_mosaic_tiff(unit:MeaImg_Unit, filepath:str, tile_px:int=TIFF_TILE_PX,
+                      compression:str|None=TIFF_COMPRESSION, refined:bool=True) -> str:
+    """
+    Writes the stitched image of an image unit as a pyramidal tiled (Big)TIFF, streaming it strip
+    by strip. The downsampled levels are downsampled from the previous level, not rendered again
+
+    Args:
+        unit (MeaImg_Unit): Image unit to export
+        filepath (str): Path of the TIFF file
+        tile_px (int): Tile size [pixel], a multiple of 16. Default is TIFF_TILE_PX
+        compression (str|None): Compression of the tiles (see tifffile), None for uncompressed.
+            Default is TIFF_COMPRESSION
+        refined (bool): Place the images with the registration-refined offsets, if registered.
+            Default is True
+
+    Returns:
+        str: Path of the TIFF file
+    """
+    assert isinstance(unit, MeaImg_Unit), 'Unit must be an image measurement unit object'
+    assert unit.check_readyForProcessing(), 'Unit is not ready for processing'
+    assert tile_px > 0 and tile_px % 16 == 0, 'Tile size must be a positive multiple of 16'
+
+    renderer = MosaicRenderer(unit, refined=refined)
+    size = renderer.get_image_size()
+    num_levels = calculate_num_levels(size, tile_px)
+
+    # Keep all the images overlapping a strip in memory, such that every image is converted once
+    # (the strips are rendered from top to bottom)
+    max_images = max(len(renderer.get_images_overlapping((0, y0, size[0], y0 + tile_px)))
+                     for y0 in range(0, size[1], tile_px))
+    renderer.set_max_images_memory(max(max_images, 1))
+
+    _, dict_cal = unit.get_calibration_asdict()
+    scale_x_pixelPerMm = abs(dict_cal['scale_x_pixelPerMm'])
+    scale_y_pixelPerMm = abs(dict_cal['scale_y_pixelPerMm'])
+    metadata = {
+        'unit_id': unit.get_IdName()[0],
+        'unit_name': unit.get_IdName()[1],
+        'pixel_size_x_um': 1e3/scale_x_pixelPerMm,
+        'pixel_size_y_um': 1e3/scale_y_pixelPerMm,
+        'coor_min_mm': list(renderer.get_coor_min_mm()),
+        'num_levels': num_levels,
+    }
+
+    with tempfile.TemporaryDirectory(prefix='iris_mosaic_tiff_') as dirpath, \
+            tifffile.TiffWriter(filepath, bigtiff=True) as tif:
+        strips = _iter_strips_rendered(renderer, size, tile_px)
+        for level in range(num_levels):
+            factor = 2**level
+            lvl_size = tuple(-(-length//factor) for length in size)
+            if level == 0: kwargs = {'subifds': num_levels - 1, 'metadata': metadata}
+            else: kwargs = {'subfiletype': 1, 'metadata': None}
+            # Next level, downsampled from this one while written
+            arr_next = None
+            if level < num_levels - 1:
+                next_size = tuple(-(-length//(2*factor)) for length in size)
+                arr_next = np.memmap(os.path.join(dirpath, f'level{level + 1}.raw'), dtype=np.uint8,
+                                     mode='w+', shape=(next_size[1], next_size[0], 3))
+            tif.write(
+                _iter_level_tiles(strips, tile_px, arr_next),
+                shape=(lvl_size[1], lvl_size[0], 3),
+                dtype=np.uint8,
+                tile=(tile_px, tile_px),
+                photometric='rgb',
+                compression=compression,
+                resolution=(scale_x_pixelPerMm*10/factor, scale_y_pixelPerMm*10/factor),
+                resolutionunit='CENTIMETER',
+                **kwargs)
+            if arr_next is not None:
+                arr_next.flush()
+                strips = _iter_strips_array(arr_next, tile_px)
+        del strips, arr_next    # Closes the memory maps before the directory is deleted
+    return filepath
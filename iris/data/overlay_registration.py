@@ -0,0 +1,380 @@
+"""
+Automatic refinement of the image calibration (ImgMea_Cal) aligning a mapping measurement heatmap
+with the stitched image of an image measurement (see iris.data.heatmap_overlay).
+
+The heatmap (one channel, e.g., the intensity at a wavelength) is rasterised, and the alignment
+maximises the normalised mutual information (NMI) between the raster and the stitched image
+sampled under it. NMI does not assume a linear (or any monotonic) relation between the Raman
+intensity and the image brightness, only that the image structures explain the heatmap.
+
+The refined parameters are those of the manual fine-tuning (Wdg_Calibration_Finetuning):
+- Laser offset correction: translates the heatmap, no re-stitching needed
+- Scale and rotation corrections of the image: re-stitch the image (cached per scale/rotation)
+
+Search (coarse-to-fine):
+1. On a coarse raster (cells and image pixels coarse_factor times larger), an exhaustive grid
+    over the offset, scale and rotation ranges
+2. On the fine raster, a pattern search from the best coarse candidates, with the steps halved
+    every round. The offset is re-optimised for every scale and rotation step, as they also move
+    the image content under the heatmap (about the stitching origin, not the heatmap).
+
+The confidence of the fit compares the best coarse offset with the second best local maximum of
+the coarse NMI surface (at the best scale and rotation): 1 for a unique peak, 0 for an
+ambiguous alignment (e.g., a periodic or featureless sample).
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import copy
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+import cv2
+from scipy.interpolate import LinearNDInterpolator
+from scipy.ndimage import map_coordinates, maximum_filter
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+
+REG_MIN_OVERLAP_RATIO = 0.5     # Minimum ratio of the heatmap raster overlapping the image for a valid alignment
+REG_MAX_ITERATIONS = 50         # Maximum number of pattern search moves per refinement round
+REG_NUM_CANDIDATES = 3          # Number of best coarse grid candidates refined
+REG_CONFIDENCE_LOW = 0.3        # Confidence below which the fit should be reviewed before applying it
+
+@dataclass
+class OverlayRegistration_Params:
+    """
+    Search parameters of the overlay registration
+    """
+    max_offset_ratio:float=0.25 # Offset search range, ratio of the heatmap span (largest side)
+    max_scale_ratio:float=0.05  # Scale search range, relative (e.g., 0.05 for 95% to 105%)
+    max_rotation_deg:float=2.0  # Rotation search range [deg]
+    num_scale_steps:int=5       # Number of scales of the coarse grid
+    num_rotation_steps:int=5    # Number of rotations of the coarse grid
+    coarse_factor:int=4         # Size ratio of the coarse grid search raster cells to the refinement ones
+    num_refine_rounds:int=4     # Number of refinement rounds, the search steps are halved every round
+    raster_cells:int=96         # Number of raster cells along the largest side of the heatmap (refinement)
+    num_bins:int=32             # Number of histogram bins of the NMI
+    low_res:bool=True           # Stitch the low resolution images (image units only)
+
+    def __post_init__(self):
+        assert self.max_offset_ratio >= 0 and self.max_scale_ratio >= 0 and self.max_rotation_deg >= 0,\
+            'OverlayRegistration_Params: The search ranges must be non-negative.'
+        assert self.num_scale_steps >= 1 and self.num_rotation_steps >= 1 and self.coarse_factor >= 1\
+            and self.num_refine_rounds >= 1, 'OverlayRegistration_Params: The numbers of steps, rounds and the coarse factor must be positive.'
+        assert self.raster_cells >= 8 and self.num_bins >= 2,\
+            'OverlayRegistration_Params: At least 8 raster cells and 2 histogram bins are required.'
+
+@dataclass
+class OverlayRegistration_Result:
+    """
+    Fitted calibration correction of the overlay registration
+    """
+    offset_x_mm:float   # Correction of the laser offset in x [mm]
+    offset_y_mm:float   # Correction of the laser offset in y [mm]
+    scale:float         # Relative correction of the image scale (pixel/mm), 1 for none
+    rotation_rad:float  # Correction of the image rotation [rad]
+    nmi_initial:float   # NMI before the correction (1: independent, 2: fully dependent)
+    nmi:float           # NMI after the correction
+    confidence:float    # Confidence of the fit (0: ambiguous, 1: unique), see REG_CONFIDENCE_LOW
+
+    def get_summary(self) -> str:
+        """
+        Returns a summary of the correction
+        """
+        return (f'Laser offset correction: ({self.offset_x_mm*1e3:.1f}, {self.offset_y_mm*1e3:.1f}) µm\n'
+                f'Scale correction: {(self.scale-1)*100:+.2f}%\n'
+                f'Rotation correction: {np.rad2deg(self.rotation_rad):+.3f}°\n'
+                f'NMI: {self.nmi_initial:.4f} -> {self.nmi:.4f}\n'
+                f'Confidence: {self.confidence:.2f}' + (' (low, please review)' if self.confidence < REG_CONFIDENCE_LOW else ''))
+
+    def get_corrected_calibration(self, cal:ImgMea_Cal) -> ImgMea_Cal:
+        """
+        Returns a copy of the calibration with the correction applied
+
+        Args:
+            cal (ImgMea_Cal): Calibration the registration was performed with
+
+        Returns:
+            ImgMea_Cal: Corrected calibration
+        """
+        assert isinstance(cal, ImgMea_Cal) and cal.check_calibration_set(), 'The calibration must be set'
+        cal_new = ImgMea_Cal(id=cal.id)
+        cal_new.set_calibration_params(
+            scale_x_pixelPerMm=float(cal.scale_x_pixelPerMm*self.scale),
+            scale_y_pixelPerMm=float(cal.scale_y_pixelPerMm*self.scale),
+            laser_coor_x_mm=float(cal.laser_coor_x_mm+self.offset_x_mm),
+            laser_coor_y_mm=float(cal.laser_coor_y_mm+self.offset_y_mm),
+            rotation_rad=float(cal.rotation_rad+self.rotation_rad),
+            flip_y=cal.flip_y,
+        )
+        return cal_new
+
+def compute_nmi(arr1:np.ndarray, arr2:np.ndarray, num_bins:int=32) -> float:
+    """
+    Computes the normalised mutual information (H(1)+H(2))/H(1,2) of two paired samples
+
+    Args:
+        arr1 (np.ndarray): First sample
+        arr2 (np.ndarray): Second sample, of the same size
+        num_bins (int): Number of histogram bins of each sample. Default is 32
+
+    Returns:
+        float: NMI, 1 for independent samples and 2 for fully dependent ones
+    """
+    assert np.size(arr1) == np.size(arr2), 'The samples must be of the same size'
+    def quantise(arr:np.ndarray) -> np.ndarray:
+        arr = np.ravel(arr).astype(float)
+        vmin, vmax = arr.min(), arr.max()
+        if vmax <= vmin: return np.zeros(arr.shape, dtype=int)
+        return np.clip(((arr-vmin)/(vmax-vmin)*num_bins).astype(int), 0, num_bins-1)
+    def entropy(p:np.ndarray) -> float:
+        p = p[p > 0]
+        return float(-np.sum(p*np.log(p)))
+
+    if np.size(arr1) == 0: return 1.0
+    joint = np.bincount(quantise(arr1)*num_bins + quantise(arr2), minlength=num_bins**2).reshape(num_bins, num_bins)
+    joint = joint/joint.sum()
+    h_joint = entropy(joint)
+    if h_joint == 0: return 1.0
+    return (entropy(joint.sum(axis=1)) + entropy(joint.sum(axis=0)))/h_joint
+
+def rasterise_heatmap(x_mm:np.ndarray, y_mm:np.ndarray, values:np.ndarray, cell_mm:float)\
+    -> tuple[np.ndarray,np.ndarray,np.ndarray]:
+    """
+    Rasterises the heatmap points by linear interpolation, the cells outside of the convex hull
+    of the points are discarded
+
+    Args:
+        x_mm (np.ndarray): x coordinates of the points [mm]
+        y_mm (np.ndarray): y coordinates of the points [mm]
+        values (np.ndarray): Values of the points
+        cell_mm (float): Size of the raster cells [mm]
+
+    Returns:
+        tuple[np.ndarray,np.ndarray,np.ndarray]: x, y coordinates [mm] and values of the raster cells
+    """
+    assert cell_mm > 0, 'The cell size must be positive'
+    points = np.column_stack([x_mm, y_mm]).astype(float)
+    grid_x = np.arange(points[:,0].min(), points[:,0].max() + cell_mm/2, cell_mm)
+    grid_y = np.arange(points[:,1].min(), points[:,1].max() + cell_mm/2, cell_mm)
+    mesh_x, mesh_y = np.meshgrid(grid_x, grid_y)
+    raster = LinearNDInterpolator(points, np.asarray(values, dtype=float))(mesh_x, mesh_y)
+    valid = np.isfinite(raster)
+    return mesh_x[valid], mesh_y[valid], raster[valid]
+
+def register_overlay(render:Callable[[float,float],tuple[np.ndarray,tuple[float,float,float,float]]],
+                     x_mm:np.ndarray, y_mm:np.ndarray, values:np.ndarray,
+                     params:OverlayRegistration_Params|None=None) -> OverlayRegistration_Result:
+    """
+    Finds the heatmap offset and the image scale and rotation corrections maximising the NMI
+    between the heatmap and the image
+
+    Args:
+        render (Callable[[float,float],tuple[np.ndarray,tuple[float,float,float,float]]]): Renders
+            the image for a scale and rotation correction (scale, rotation_rad), returning the
+            grayscale image (height,width) and its extent (left,right,bottom,top) [mm], with the
+            first row at the top (as imshow)
+        x_mm (np.ndarray): x coordinates of the heatmap points, in the image frame of reference [mm]
+        y_mm (np.ndarray): y coordinates of the heatmap points [mm]
+        values (np.ndarray): Heatmap values of the points
+        params (OverlayRegistration_Params|None): Search parameters. Default (None) is OverlayRegistration_Params()
+
+    Returns:
+        OverlayRegistration_Result: Fitted correction
+    """
+    params = params if params is not None else OverlayRegistration_Params()
+    assert isinstance(params, OverlayRegistration_Params), 'Invalid registration parameters'
+    x_mm, y_mm, values = (np.asarray(arr, dtype=float).ravel() for arr in (x_mm, y_mm, values))
+    assert len(x_mm) == len(y_mm) == len(values) >= 3, 'At least 3 heatmap points are required'
+    valid = np.isfinite(x_mm) & np.isfinite(y_mm) & np.isfinite(values)
+    x_mm, y_mm, values = x_mm[valid], y_mm[valid], values[valid]
+    span = max(np.ptp(x_mm), np.ptp(y_mm))
+    assert span > 0, 'The heatmap points must span an area'
+
+    img_base, extent_base = render(1.0, 0.0)
+    pixel_mm = abs(extent_base[1]-extent_base[0])/img_base.shape[1]
+    dict_cell = {False: max(pixel_mm, span/params.raster_cells)}
+    dict_cell[True] = dict_cell[False]*params.coarse_factor
+    dict_raster = {coarse: rasterise_heatmap(x_mm, y_mm, values, cell) for coarse, cell in dict_cell.items()}
+
+    dict_images:dict[tuple,tuple[np.ndarray,tuple[float,float,float,float]]] = {}
+    def get_image(coarse:bool, scale:float, rot:float) -> tuple[np.ndarray,tuple[float,float,float,float]]:
+        """Returns the rendered image (downsampled to the raster cells if coarse) and its extent, cached"""
+        key = (coarse, round(scale, 9), round(rot, 12))
+        if key not in dict_images:
+            key_fine = (False, key[1], key[2])
+            if key_fine not in dict_images:
+                img, extent = render(scale, rot)
+                dict_images[key_fine] = (np.asarray(img, dtype=np.float32), extent)
+            img, extent = dict_images[key_fine]
+            factor = dict_cell[True]/(abs(extent[1]-extent[0])/img.shape[1])
+            if coarse and factor > 1:
+                size = (max(1, round(img.shape[1]/factor)), max(1, round(img.shape[0]/factor)))
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            dict_images[key] = (img, extent)
+        return dict_images[key]
+
+    def evaluate(coarse:bool, scale:float, rot:float, dx:float, dy:float) -> float:
+        """Returns the NMI of the heatmap raster offset by (dx,dy) [mm] and the image rendered at (scale,rot)"""
+        img, (left, right, bottom, top) = get_image(coarse, scale, rot)
+        rx, ry, rv = dict_raster[coarse]
+        col = (rx + dx - left)/(right - left)*img.shape[1] - 0.5
+        row = (top - ry - dy)/(top - bottom)*img.shape[0] - 0.5
+        sampled = map_coordinates(img, [row, col], order=1, mode='constant', cval=np.nan, prefilter=False)
+        overlap = np.isfinite(sampled)
+        if overlap.sum() < max(3, REG_MIN_OVERLAP_RATIO*len(rv)): return -np.inf
+        return compute_nmi(rv[overlap], sampled[overlap], params.num_bins)
+
+    # > Coarse grid search <
+    max_offset = params.max_offset_ratio*span
+    max_rot = np.deg2rad(params.max_rotation_deg)
+    num_offsets = int(np.ceil(max_offset/dict_cell[True]))
+    arr_offset = np.arange(-num_offsets, num_offsets+1)*dict_cell[True]
+    arr_scale = 1 + np.linspace(-params.max_scale_ratio, params.max_scale_ratio, params.num_scale_steps)\
+        if params.num_scale_steps > 1 else np.array([1.0])
+    arr_rot = np.linspace(-max_rot, max_rot, params.num_rotation_steps) if params.num_rotation_steps > 1 else np.array([0.0])
+
+    list_coarse = []    # (NMI, scale, rotation, dx, dy, NMI surface of the offsets)
+    for scale in arr_scale:
+        for rot in arr_rot:
+            surface = np.array([[evaluate(True, scale, rot, dx, dy) for dx in arr_offset] for dy in arr_offset])
+            idx = np.unravel_index(np.argmax(surface), surface.shape)
+            list_coarse.append((surface[idx], scale, rot, arr_offset[idx[1]], arr_offset[idx[0]], surface))
+    list_coarse.sort(key=lambda result: result[0], reverse=True)
+    confidence = _get_peak_confidence(list_coarse[0][5])
+
+    # > Pattern search refinement <
+    def refine_offset(scale:float, rot:float, dx:float, dy:float, step:float) -> tuple[float,float,float]:
+        """Pattern search of the offset at a scale and rotation, returns (NMI, dx, dy)"""
+        current = evaluate(False, scale, rot, dx, dy)
+        for _ in range(REG_MAX_ITERATIONS):
+            list_candidates = [(dx+sx*step, dy+sy*step) for sx in (-1,0,1) for sy in (-1,0,1) if (sx,sy) != (0,0)]
+            list_nmi = [evaluate(False, scale, rot, *cand) for cand in list_candidates]
+            idx = int(np.argmax(list_nmi))
+            if list_nmi[idx] <= current: break
+            current = list_nmi[idx]
+            dx, dy = list_candidates[idx]
+        return current, dx, dy
+
+    def refine(scale:float, rot:float, dx:float, dy:float) -> tuple[float,float,float,float,float]:
+        """
+        Pattern search of all the parameters from the coarse grid steps, returns (NMI, scale, rotation, dx, dy).
+        The scale and rotation move the image content about the stitching origin, i.e., also translate it
+        under the heatmap: the offset is re-optimised for every scale and rotation.
+        """
+        step_scale = (arr_scale[1]-arr_scale[0])/2 if len(arr_scale) > 1 else 0.0
+        step_rot = (arr_rot[1]-arr_rot[0])/2 if len(arr_rot) > 1 else 0.0
+        step_offset = dict_cell[True]/2
+        list_ds = (-1,0,1) if step_scale > 0 else (0,)
+        list_dr = (-1,0,1) if step_rot > 0 else (0,)
+        current = -np.inf
+        for _ in range(params.num_refine_rounds):
+            current, dx, dy = refine_offset(scale, rot, dx, dy, step_offset)
+            for _ in range(REG_MAX_ITERATIONS):
+                list_candidates = [(scale+ds*step_scale, rot+dr*step_rot) for ds in list_ds for dr in list_dr if (ds,dr) != (0,0)]
+                list_candidates = [cand for cand in list_candidates if abs(cand[0]-1) <= params.max_scale_ratio + 1e-12
+                                   and abs(cand[1]) <= max_rot + 1e-12]
+                if len(list_candidates) == 0: break
+                list_results = [(refine_offset(*cand, dx, dy, step_offset), cand) for cand in list_candidates]
+                (nmi, dx_cand, dy_cand), cand = max(list_results, key=lambda result: result[0][0])
+                if nmi <= current: break
+                current, dx, dy = nmi, dx_cand, dy_cand
+                scale, rot = cand
+            step_offset /= 2; step_scale /= 2; step_rot /= 2
+        return current, scale, rot, dx, dy
+
+    # The coarse grid cannot resolve small scale and rotation differences: the best coarse
+    # candidates are all refined
+    list_refined = [refine(*result[1:5]) for result in list_coarse[:REG_NUM_CANDIDATES]]
+    _, scale, rot, dx, dy = max(list_refined, key=lambda result: result[0])
+
+    return OverlayRegistration_Result(
+        offset_x_mm=float(dx), offset_y_mm=float(dy), scale=float(scale), rotation_rad=float(rot),
+        nmi_initial=float(evaluate(False, 1.0, 0.0, 0.0, 0.0)), nmi=float(evaluate(False, scale, rot, dx, dy)),
+        confidence=confidence,
+    )
+
+def _get_peak_confidence(surface:np.ndarray) -> float:
+    """
+    Returns the confidence of the maximum of an NMI surface: 1 - (second - median)/(best - median),
+    with second the second highest local maximum, clipped to [0,1]
+    """
+    finite = np.isfinite(surface)
+    if finite.sum() < 2: return 0.0
+    arr = np.where(finite, surface, np.nanmin(surface[finite]))
+    best, median = arr.max(), np.median(arr[finite])
+    if best <= median: return 0.0
+    is_peak = (arr == maximum_filter(arr, size=3, mode='nearest')) & finite
+    list_peaks = np.sort(arr[is_peak])[::-1]
+    second = list_peaks[1] if len(list_peaks) > 1 else median
+    return float(np.clip(1 - (max(second, median) - median)/(best - median), 0.0, 1.0))
+
+def refine_overlay_calibration(img_unit:MeaImg_Unit, x_stage_mm:np.ndarray, y_stage_mm:np.ndarray, values:np.ndarray,
+                               params:OverlayRegistration_Params|None=None) -> OverlayRegistration_Result:
+    """
+    Refines the calibration of an image unit aligning its stitched image with a heatmap, see
+    register_overlay. The image unit is not modified.
+
+    Args:
+        img_unit (MeaImg_Unit): Image unit, with its calibration set
+        x_stage_mm (np.ndarray): x stage coordinates of the heatmap points [mm]
+        y_stage_mm (np.ndarray): y stage coordinates of the heatmap points [mm]
+        values (np.ndarray): Heatmap values of the points (e.g., intensity at a wavelength)
+        params (OverlayRegistration_Params|None): Search parameters. Default (None) is OverlayRegistration_Params()
+
+    Returns:
+        OverlayRegistration_Result: Fitted correction, see OverlayRegistration_Result.get_corrected_calibration
+    """
+    assert isinstance(img_unit, MeaImg_Unit) and img_unit.check_measurement_exist(), 'The image unit must contain images'
+    params = params if params is not None else OverlayRegistration_Params()
+    cal = img_unit.get_ImageMeasurement_Calibration()
+    list_coor = [img_unit.convert_stg2mea((x,y)) for x,y in zip(x_stage_mm, y_stage_mm)]
+    x_mea = np.array([coor[0] for coor in list_coor])
+    y_mea = np.array([coor[1] for coor in list_coor])
+
+    unit_render = copy.copy(img_unit)   # Shares the images, with its own calibration
+    def render(scale:float, rot:float) -> tuple[np.ndarray,tuple[float,float,float,float]]:
+        correction = OverlayRegistration_Result(0.0, 0.0, scale, rot, 0.0, 0.0, 0.0)
+        unit_render.set_calibration_ImageMeasurement_Calibration(correction.get_corrected_calibration(cal))
+        img, limit_min, limit_max = unit_render.get_image_all_stitched(low_res=params.low_res)
+        extent = (min(limit_min[0],limit_max[0]), max(limit_min[0],limit_max[0]),
+                  min(limit_min[1],limit_max[1]), max(limit_min[1],limit_max[1]))
+        return np.asarray(img.convert('L'), dtype=np.float32), extent
+
+    return register_overlay(render, x_mea, y_mea, values, params)
+
+def refine_overlay_calibration_mapping(img_unit:MeaImg_Unit, mapping_unit:MeaRMap_Unit, wavelength:float|None,
+                                       channel:str|None=None, spectral_channel:str|None=None,
+                                       params:OverlayRegistration_Params|None=None) -> OverlayRegistration_Result:
+    """
+    Refines the calibration of an image unit aligning its stitched image with a heatmap of a mapping
+    unit, see refine_overlay_calibration. The heatmap points are taken from the mapping unit's
+    heatmap table (MeaRMap_Unit.get_heatmap_table or get_heatmap_table_channel).
+
+    Args:
+        img_unit (MeaImg_Unit): Image unit, with its calibration set
+        mapping_unit (MeaRMap_Unit): Mapping unit of the heatmap
+        wavelength (float|None): Wavelength of the heatmap, ignored for a derived channel
+        channel (str|None): Derived heatmap channel, None for the intensity at the wavelength. Default is None
+        spectral_channel (str|None): Spectral channel of the intensity, None for the primary one. Default is None
+        params (OverlayRegistration_Params|None): Search parameters. Default (None) is OverlayRegistration_Params()
+
+    Returns:
+        OverlayRegistration_Result: Fitted correction, see OverlayRegistration_Result.get_corrected_calibration
+    """
+    assert isinstance(mapping_unit, MeaRMap_Unit), 'The mapping unit must be a MeaRMap_Unit object'
+    if channel is not None: df = mapping_unit.get_heatmap_table_channel(channel)
+    else:
+        assert wavelength is not None, 'A wavelength is required for the intensity heatmap'
+        df = mapping_unit.get_heatmap_table(wavelength, spectral_channel)
+    assert len(df) > 0, 'The mapping unit has no measurement'
+    label_x, label_y, _, _, label_intensity = mapping_unit.get_labels()
+    return refine_overlay_calibration(img_unit, df[label_x].to_numpy(dtype=float), df[label_y].to_numpy(dtype=float),
+                                      df[label_intensity].to_numpy(dtype=float), params)
@@ -0,0 +1,380 @@
+"""
+Post-scan acquisition quality report of a mapping run.
+
+During the scan, the ScanQA_Recorder collects the timings of every point (stage move, spectrum
+acquisition and storage into the mapping unit), the measurement timestamps and the flags of the
+stage-coordinate interpolation, and the duration and length of every continuous scan line. After
+the scan, compute_report() summarises them:
+- the duty cycle (time spent acquiring spectra over the scan duration) and the dead time
+- the measurement timestamp interval, its jitter and its gaps, with the estimated number of
+    dropped spectra in the gaps
+- the points whose move, acquisition or storage took abnormally long (robust outliers)
+- the speed of each scan line, with the abnormally slow lines
+- the number of stored spectra whose coordinates were clamped, waited for or interpolated over a
+    stage reporting gap
+
+The report is attached to the mapping unit (MeaRMap_Unit.set_scan_qa) and saved with it in the
+database, together with a rendered summary figure (see save_scan_qa_database).
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import io
+import json
+import sqlite3 as sql
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from enum import IntFlag
+
+import numpy as np
+from matplotlib.figure import Figure
+
+QA_OUTLIER_SIGMA = 5.0          # Robust z-score above which a timing is an outlier
+QA_OUTLIER_MIN_REL = 0.1        # Minimum robust spread relative to the median (identical timings)
+QA_OUTLIER_MIN_SEC = 0.002      # Minimum robust spread [s]
+QA_GAP_FACTOR = 2.5             # Timestamp interval (relative to the median) above which it is a gap
+QA_SLOW_LINE_FACTOR = 0.8       # Line speed (relative to the median) below which a line is slow
+QA_TABLE_NAME = 'scanqa'        # Database table, after the mapping unit table prefix
+
+
+class ScanQA_Flag(IntFlag):
+    """
+    Flags of the stage-coordinate interpolation of a stored spectrum
+    """
+    NONE = 0
+    CLAMPED = 1     # Requested before the recorded stage history, the first coordinate is used
+    WAITED = 2      # Requested ahead of the recorded stage history, waited for the stage hub
+    GAP = 4         # Interpolated across a stage reporting gap (longer than the maximum interval)
+
+
+@dataclass
+class ScanQA_Report:
+    """
+    Statistics of a mapping run, see compute_report(). The timings are in [s], relative to the
+    start of the recording, and the timestamp intervals in [ms].
+    """
+    scan_type: str = ''
+    num_points: int = 0
+    num_spectra: int = 0
+    duration_sec: float = 0.0
+    acquisition_sec: float = 0.0
+    dead_time_sec: float = 0.0
+    duty_cycle: float = 0.0
+    # > Per-point timings (mean and maximum) and outliers (point indices) <
+    move_mean_sec: float = 0.0
+    move_max_sec: float = 0.0
+    acquisition_mean_sec: float = 0.0
+    acquisition_max_sec: float = 0.0
+    storage_mean_sec: float = 0.0
+    storage_max_sec: float = 0.0
+    move_outliers: list[int] = field(default_factory=list)
+    acquisition_outliers: list[int] = field(default_factory=list)
+    storage_outliers: list[int] = field(default_factory=list)
+    # > Measurement timestamps <
+    interval_median_ms: float = 0.0
+    interval_jitter_ms: float = 0.0
+    timestamp_gaps: list[int] = field(default_factory=list)   # Index of the spectrum after each gap
+    estimated_dropped_spectra: int = 0
+    # > Scan lines <
+    line_speed_mean_mm_s: float = 0.0
+    line_speed_cv: float = 0.0
+    slow_lines: list[int] = field(default_factory=list)
+    # > Stage coordinate interpolation <
+    num_clamped: int = 0
+    num_waited: int = 0
+    num_stage_gaps: int = 0
+    # > Raw records, see ScanQA_Recorder <
+    records: dict[str,list] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, dict_report:dict) -> 'ScanQA_Report':
+        keys = set(cls.__dataclass_fields__)
+        return cls(**{key: value for key, value in dict_report.items() if key in keys})
+
+    def get_list_issues(self) -> list[str]:
+        """Returns the detected issues as text, empty if none"""
+        list_issues = []
+        if self.move_outliers: list_issues.append(f'Slow stage moves at points {self.move_outliers}')
+        if self.acquisition_outliers: list_issues.append(f'Slow acquisitions at points {self.acquisition_outliers}')
+        if self.storage_outliers: list_issues.append(f'Slow storage at points {self.storage_outliers}')
+        if self.timestamp_gaps:
+            list_issues.append(f'{len(self.timestamp_gaps)} timestamp gap(s), ~{self.estimated_dropped_spectra} spectra dropped')
+        if self.slow_lines: list_issues.append(f'Slow scan lines {self.slow_lines}')
+        if self.num_clamped: list_issues.append(f'{self.num_clamped} spectra before the stage history (coordinates clamped)')
+        if self.num_stage_gaps: list_issues.append(f'{self.num_stage_gaps} spectra interpolated over stage reporting gaps')
+        return list_issues
+
+    def get_summary(self) -> str:
+        """Returns a short text summary of the report"""
+        lines = [
+            f'{self.scan_type} scan: {self.num_points} points, {self.num_spectra} spectra in {self.duration_sec:.1f} s',
+            f'Duty cycle {100*self.duty_cycle:.1f}% (dead time {self.dead_time_sec:.1f} s)',
+            f'Timestamp interval {self.interval_median_ms:.1f} ms, jitter {self.interval_jitter_ms:.2f} ms',
+        ]
+        if self.line_speed_mean_mm_s > 0:
+            lines.append(f'Line speed {self.line_speed_mean_mm_s:.3f} mm/s (CV {100*self.line_speed_cv:.1f}%)')
+        return '\n'.join(lines + (self.get_list_issues() or ['No issue detected']))
+
+
+class ScanQA_Recorder():
+    """
+    Thread-safe collector of the scan timings, shared by the acquisition and the storage workers.
+    The times are taken from time.perf_counter().
+    """
+    def __init__(self, scan_type:str=''):
+        self.scan_type = scan_type
+        self._time_zero = time.perf_counter()
+        self._time_end:float|None = None
+        self._lock = threading.Lock()
+        self._dict_records:dict[str,list] = {
+            'move': [],         # (point index, start, end)
+            'acquisition': [],  # (point index, start, end, timestamp [us])
+            'storage': [],      # (timestamp [us], start, end, ScanQA_Flag, integration time [ms])
+            'line': [],         # (line index, start, end, x0, y0, x1, y1) [mm]
+        }
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._time_zero
+
+    def _append(self, kind:str, record:tuple) -> None:
+        with self._lock: self._dict_records[kind].append(record)
+
+    @contextmanager
+    def time_move(self, idx:int):
+        """Times the stage move to a point"""
+        start = self._now()
+        yield
+        self._append('move', (int(idx), start, self._now()))
+
+    @contextmanager
+    def time_acquisition(self, idx:int):
+        """Times the acquisition at a point. Yields a list to append the measurement timestamp [us] to."""
+        start = self._now()
+        list_ts = []
+        yield list_ts
+        self._append('acquisition', (int(idx), start, self._now(), int(list_ts[0]) if list_ts else None))
+
+    def record_storage(self, timestamp_us:int, start:float, flag:int=ScanQA_Flag.NONE, int_time_ms:float=0.0) -> None:
+        """
+        Records the storage of a spectrum, from start (see get_time()) until now.
+
+        Args:
+            timestamp_us (int): measurement timestamp [us]
+            start (float): start of the storage, from get_time()
+            flag (int, optional): ScanQA_Flag of the coordinate interpolation. Defaults to NONE.
+            int_time_ms (float, optional): integration time [ms]. Defaults to 0.0.
+        """
+        self._append('storage', (int(timestamp_us), start, self._now(), int(flag), float(int_time_ms)))
+
+    def record_line(self, idx:int, start:float, xy_start:tuple[float,float], xy_end:tuple[float,float]) -> None:
+        """Records a scan line from start (see get_time()) until now, between the XY positions [mm]"""
+        self._append('line', (int(idx), start, self._now(), float(xy_start[0]), float(xy_start[1]),
+                              float(xy_end[0]), float(xy_end[1])))
+
+    def get_time(self) -> float:
+        """Returns the current time of the recorder [s]"""
+        return self._now()
+
+    def finish(self) -> None:
+        """Marks the end of the scan"""
+        self._time_end = self._now()
+
+    def get_records(self) -> dict[str,list]:
+        with self._lock: return {kind: list(records) for kind, records in self._dict_records.items()}
+
+    def compute_report(self) -> ScanQA_Report:
+        """Computes the report from the records so far"""
+        return compute_report(self.get_records(), self.scan_type, self._time_end)
+
+
+def _get_outliers(values:np.ndarray) -> np.ndarray:
+    """Returns the mask of the abnormally high values (robust z-score)"""
+    if len(values) < 3: return np.zeros(len(values), dtype=bool)
+    median = np.median(values)
+    spread = max(1.4826*np.median(np.abs(values - median)), QA_OUTLIER_MIN_REL*abs(median), QA_OUTLIER_MIN_SEC)
+    return values > median + QA_OUTLIER_SIGMA*spread
+
+
+def compute_report(records:dict[str,list], scan_type:str='', time_end:float|None=None) -> ScanQA_Report:
+    """
+    Computes the statistics of a scan from its records (see ScanQA_Recorder).
+
+    Args:
+        records (dict[str,list]): the records per kind ('move', 'acquisition', 'storage', 'line')
+        scan_type (str, optional): type of the scan, e.g., 'discrete' or 'continuous'. Defaults to ''.
+        time_end (float|None, optional): end of the scan [s]. Defaults to the last record.
+
+    Returns:
+        ScanQA_Report: the report
+    """
+    report = ScanQA_Report(scan_type=scan_type, records={kind: [list(rec) for rec in recs] for kind, recs in records.items()})
+    arr_move = np.array([rec[:3] for rec in records.get('move', [])], dtype=float).reshape(-1, 3)
+    arr_acq = np.array([rec[:3] for rec in records.get('acquisition', [])], dtype=float).reshape(-1, 3)
+    arr_store = np.array([rec[:5] for rec in records.get('storage', [])], dtype=float).reshape(-1, 5)
+    arr_line = np.array(records.get('line', []), dtype=float).reshape(-1, 7)
+
+    list_starts = [arr[:, 1] for arr in (arr_move, arr_acq, arr_store, arr_line) if len(arr)]
+    list_ends = [arr[:, 2] for arr in (arr_move, arr_acq, arr_store, arr_line) if len(arr)]
+    if not list_starts: return report
+    time_start = min(arr.min() for arr in list_starts)
+    time_end = time_end if time_end is not None else max(arr.max() for arr in list_ends)
+    report.duration_sec = float(time_end - time_start)
+    report.num_points = int(max(len(arr_acq), len(arr_line)))
+    report.num_spectra = int(max(len(arr_store), len(arr_acq)))
+
+    # > Duty cycle: acquisition time (or integration time of the stored spectra) over the duration <
+    if len(arr_acq): report.acquisition_sec = float(np.sum(arr_acq[:, 2] - arr_acq[:, 1]))
+    else: report.acquisition_sec = float(np.sum(arr_store[:, 4])/1e3)
+    report.dead_time_sec = max(report.duration_sec - report.acquisition_sec, 0.0)
+    report.duty_cycle = report.acquisition_sec/report.duration_sec if report.duration_sec > 0 else 0.0
+
+    # > Per-point timings and their outliers <
+    for kind, arr, indices in [('move', arr_move, arr_move[:, 0]), ('acquisition', arr_acq, arr_acq[:, 0]),
+                               ('storage', arr_store, np.arange(len(arr_store)))]:
+        if not len(arr): continue
+        durations = arr[:, 2] - arr[:, 1]
+        setattr(report, f'{kind}_mean_sec', float(durations.mean()))
+        setattr(report, f'{kind}_max_sec', float(durations.max()))
+        setattr(report, f'{kind}_outliers', [int(idx) for idx in indices[_get_outliers(durations)]])
+
+    # > Measurement timestamps: interval, jitter and gaps <
+    list_ts = [rec[0] for rec in records.get('storage', [])] or\
+        [rec[3] for rec in records.get('acquisition', []) if rec[3] is not None]
+    timestamps = np.sort(np.array(list_ts, dtype=np.int64))
+    if len(timestamps) >= 3:
+        intervals = np.diff(timestamps)/1e3
+        median = float(np.median(intervals))
+        mask_gap = intervals > QA_GAP_FACTOR*median if median > 0 else np.zeros(len(intervals), dtype=bool)
+        report.interval_median_ms = median
+        report.interval_jitter_ms = float(np.std(intervals[~mask_gap])) if (~mask_gap).any() else 0.0
+        report.timestamp_gaps = [int(idx) + 1 for idx in np.flatnonzero(mask_gap)]
+        if median > 0: report.estimated_dropped_spectra = int(np.sum(np.round(intervals[mask_gap]/median) - 1))
+
+    # > Scan lines: speed and slow lines <
+    if len(arr_line):
+        durations = arr_line[:, 2] - arr_line[:, 1]
+        speeds = np.hypot(arr_line[:, 5] - arr_line[:, 3], arr_line[:, 6] - arr_line[:, 4])/np.maximum(durations, 1e-9)
+        report.line_speed_mean_mm_s = float(speeds.mean())
+        report.line_speed_cv = float(speeds.std()/speeds.mean()) if speeds.mean() > 0 else 0.0
+        report.slow_lines = [int(idx) for idx in arr_line[speeds < QA_SLOW_LINE_FACTOR*np.median(speeds), 0]]
+
+    # > Stage coordinate interpolation flags <
+    flags = arr_store[:, 3].astype(int) if len(arr_store) else np.zeros(0, dtype=int)
+    report.num_clamped = int(np.sum(flags & ScanQA_Flag.CLAMPED > 0))
+    report.num_waited = int(np.sum(flags & ScanQA_Flag.WAITED > 0))
+    report.num_stage_gaps = int(np.sum(flags & ScanQA_Flag.GAP > 0))
+    return report
+
+
+def plot_scan_qa(report:ScanQA_Report) -> Figure:
+    """
+    Renders the summary figure of a report: the per-point timings, the timestamp intervals with
+    their gaps, the line speeds and the text summary.
+
+    Args:
+        report (ScanQA_Report): the report
+
+    Returns:
+        Figure: the figure
+    """
+    fig = Figure(figsize=(10, 7), layout='constrained')
+    ax_timing, ax_interval, ax_line, ax_text = fig.subplots(2, 2).ravel()
+    records = report.records
+
+    for kind, color in [('move', 'tab:blue'), ('acquisition', 'tab:green'), ('storage', 'tab:orange')]:
+        arr = np.array([rec[:3] for rec in records.get(kind, [])], dtype=float).reshape(-1, 3)
+        if not len(arr): continue
+        idx = arr[:, 0] if kind != 'storage' else np.arange(len(arr))
+        ax_timing.plot(idx, 1e3*(arr[:, 2] - arr[:, 1]), '.', color=color, label=kind)
+        outliers = getattr(report, f'{kind}_outliers')
+        if outliers:
+            mask = np.isin(idx, outliers)
+            ax_timing.plot(idx[mask], 1e3*(arr[mask, 2] - arr[mask, 1]), 'x', color='red', markersize=8)
+    ax_timing.set_xlabel('Point / spectrum index')
+    ax_timing.set_ylabel('Duration [ms]')
+    ax_timing.set_title('Per-point timings (x: outliers)')
+    if ax_timing.has_data(): ax_timing.legend(loc='upper right')
+
+    list_ts = [rec[0] for rec in records.get('storage', [])] or\
+        [rec[3] for rec in records.get('acquisition', []) if rec[3] is not None]
+    if len(list_ts) >= 2:
+        intervals = np.diff(np.sort(np.array(list_ts, dtype=np.int64)))/1e3
+        ax_interval.plot(np.arange(1, len(intervals) + 1), intervals, '.-', color='tab:gray')
+        if report.timestamp_gaps:
+            gaps = np.array(report.timestamp_gaps)
+            ax_interval.plot(gaps, intervals[gaps - 1], 'o', color='red', label='gap')
+            ax_interval.legend(loc='upper right')
+    ax_interval.set_xlabel('Spectrum index')
+    ax_interval.set_ylabel('Timestamp interval [ms]')
+    ax_interval.set_title(f'Timestamps: jitter {report.interval_jitter_ms:.2f} ms')
+
+    arr_line = np.array(records.get('line', []), dtype=float).reshape(-1, 7)
+    if len(arr_line):
+        speeds = np.hypot(arr_line[:, 5] - arr_line[:, 3], arr_line[:, 6] - arr_line[:, 4])/np.maximum(arr_line[:, 2] - arr_line[:, 1], 1e-9)
+        colors = ['red' if idx in report.slow_lines else 'tab:blue' for idx in arr_line[:, 0].astype(int)]
+        ax_line.bar(arr_line[:, 0], speeds, color=colors)
+    ax_line.set_xlabel('Line index')
+    ax_line.set_ylabel('Speed [mm/s]')
+    ax_line.set_title('Scan line speed (red: slow)')
+
+    ax_text.axis('off')
+    ax_text.text(0, 1, report.get_summary(), va='top', ha='left', family='monospace', fontsize=8, wrap=True)
+    return fig
+
+
+def render_scan_qa_png(report:ScanQA_Report) -> bytes:
+    """Returns the summary figure of a report as PNG bytes"""
+    buffer = io.BytesIO()
+    plot_scan_qa(report).savefig(buffer, format='png', dpi=100)
+    return buffer.getvalue()
+
+
+def save_scan_qa_database(conn:sql.Connection, unit_id:str, report:ScanQA_Report, table_prefix:str='') -> None:
+    """
+    Saves a report with its summary figure into the database of the mapping unit, replacing any
+    previous report of the unit.
+
+    Args:
+        conn (sql.Connection): connection to the database
+        unit_id (str): ID of the mapping unit
+        report (ScanQA_Report): the report
+        table_prefix (str, optional): prefix of the mapping unit tables. Defaults to ''.
+    """
+    assert isinstance(report, ScanQA_Report), 'save_scan_qa_database: Expected a ScanQA_Report.'
+    table = table_prefix + QA_TABLE_NAME
+    cursor = conn.cursor()
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} (unit_id TEXT PRIMARY KEY, report TEXT, figure_png BLOB)')
+    cursor.execute(f'INSERT OR REPLACE INTO {table} (unit_id, report, figure_png) VALUES (?, ?, ?)',
+                   (unit_id, json.dumps(report.to_dict()), render_scan_qa_png(report)))
+    conn.commit()
+
+
+def load_scan_qa_database(conn:sql.Connection, unit_id:str, table_prefix:str='') -> tuple[ScanQA_Report,bytes]|None:
+    """
+    Loads the report of a mapping unit from its database.
+
+    Args:
+        conn (sql.Connection): connection to the database
+        unit_id (str): ID of the mapping unit
+        table_prefix (str, optional): prefix of the mapping unit tables. Defaults to ''.
+
+    Returns:
+        tuple[ScanQA_Report,bytes]|None: the report and its PNG figure, None if the unit has no report
+    """
+    table = table_prefix + QA_TABLE_NAME
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+    if cursor.fetchone() is None: return None
+    cursor.execute(f'SELECT report, figure_png FROM {table} WHERE unit_id = ?', (unit_id,))
+    row = cursor.fetchone()
+    if row is None: return None
+    return ScanQA_Report.from_dict(json.loads(row[0])), row[1]
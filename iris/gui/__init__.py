@@ -1,7 +1,10 @@
 from enum import Enum
 import os
+from dataclasses import dataclass
+from typing import ClassVar
 
 from iris.utils.general import read_update_config_file_section
+from iris.utils.config_schema import Class_ConfigSection, config_field, config_registry
 
 ########################################################################################################################
 # >>> Raman measurement related parameters <<<
@@ -45,6 +48,44 @@ class AppRamanEnum(Enum):
     AUTOSAVE_FREQ_DISCRETE = dict_appConfig_read['autosave_freq_discreet'] # Autosave frequency for the discrete measurements coordinates (NOT the actual data!). e.g., 10 means the remaining unscanned coordinates are saved every 10 measurements
     AUTOSAVE_FREQ_CONTINUOUS = dict_appConfig_read['autosave_freq_continuous'] # Autosave frequency for the continuous measurements coordinates (NOT the actual data!). e.g., 10 means the remaining unscanned coordinates are saved every 10 measurements
     
+@dataclass(frozen=True)
+class AppZTracking_Config(Class_ConfigSection):
+    """
+    Typed parameters of the feed-forward Z tracking along the continuous scan lines (see
+    iris.utils.z_tracking), read from config_registry when a scan starts
+    """
+    SECTION: ClassVar[str] = 'APP - Z TRACKING'
+    continuous_z_tracking: bool = config_field(False, 'Feed-forward Z tracking of the focus surface along the continuous scan lines',
+                                               reloadable=True)
+    z_tracking_latency_ms: float = config_field(50.0, 'Latency of the Z stage, the Z commands are issued this much ahead of the XY trajectory',
+                                                unit='ms', min_value=0.0, max_value=5000.0, reloadable=True)
+    z_tracking_max_update_hz: float = config_field(10.0, 'Maximum rate of the Z commands to protect the Z stage',
+                                                   unit='Hz', min_value=0.1, max_value=1000.0, reloadable=True)
+    z_tracking_deadband_um: float = config_field(0.5, 'Minimum change of the Z target to issue a Z command',
+                                                 unit='um', min_value=0.0, max_value=1000.0, reloadable=True)
+
+config_registry.register(AppZTracking_Config)
+
+########################################################################################################################
+# >>> Data hub parameters <<<
+########################################################################################################################
+
+@dataclass(frozen=True)
+class AppDataHub_Config(Class_ConfigSection):
+    """
+    Typed parameters of the mapping data hubs, all reloadable while the app is running
+    (read them from config_registry at the point of use)
+    """
+    SECTION: ClassVar[str] = 'APP - DATA HUB'
+    datahubplus_max_freq_hz: float = config_field(1.0, 'Maximum update frequency for the DataHubPlus treeview',
+                                                  unit='Hz', min_value=0.01, max_value=100.0, reloadable=True)
+    datahub_offloadcheck_interval_sec: float = config_field(10.0, 'Minimum interval between the memory checks for the auto-offloading',
+                                                            unit='s', min_value=0.1, max_value=3600.0, reloadable=True)
+    datahub_offload_minmemory_gb: float = config_field(1.0, 'Minimum available memory, under which the auto-offloading is triggered',
+                                                       unit='GB', min_value=0.0, max_value=1024.0, reloadable=True)
+
+config_registry.register(AppDataHub_Config)
+
 ########################################################################################################################
 # >>> Plotter parameters <<<
 ########################################################################################################################
@@ -19,6 +19,7 @@ from iris.utils.general import get_timestamp_us_str
 from iris import LibraryConfigEnum
 from iris.data.measurement_image import MeaImg_Unit, MeaImg_Hub, MeaImg_Handler
 from iris.data.calibration_objective import ImgMea_Cal, ImgMea_Cal_Hub
+from iris.data.mosaic_tiff import write_mosaic_tiff
 
 from iris.resources.dataHub_image_ui import Ui_dataHub_image
 from iris.resources.objectives_ui import Ui_wdg_objectives
@@ -230,10 +231,12 @@ class Image_SaverLoader_Worker(QObject):
     msg_save_db = 'ImageMeasurementHub saved successfully (.db): '
     msg_load_db = 'ImageMeasurementHub loaded successfully (.db): '
     msg_save_png = 'ImageMeasurementUnit saved successfully as PNG: '
+    msg_save_tiff = 'ImageMeasurementUnit saved successfully as pyramidal TIFF: '
     
     msg_error_save = 'Error saving ImageMeasurementHub (.db): '
     msg_error_load = 'Error loading ImageMeasurementHub (.db): '
     msg_error_save_png = 'Error saving ImageMeasurementUnit as PNG: '
+    msg_error_save_tiff = 'Error saving ImageMeasurementUnit as pyramidal TIFF: '
     
     def __init__(self):
         super().__init__()
@@ -322,6 +325,22 @@ class Image_SaverLoader_Worker(QObject):
             self.finished.emit(f'{self.msg_save_png} {unit.get_IdName()[1]}')
         except Exception as e:
             self.error.emit(f'{self.msg_error_save_png} {unit.get_IdName()[1]}: {str(e)}')
+            
+    @Slot(MeaImg_Unit,str)
+    def save_ImageMeasurementUnit_tiff(self, unit:MeaImg_Unit, dirpath:str):
+        """
+        Save the stitched image of the ImageMeasurement_Unit as a pyramidal tiled TIFF file in the
+        specified directory, streamed without building the stitched image (see mosaic_tiff).
+        
+        Args:
+            unit (ImageMeasurement_Unit): ImageMeasurement_Unit object to save
+            dirpath (str): Directory to save the TIFF file
+        """
+        try:
+            write_mosaic_tiff(unit, os.path.join(dirpath, f'{unit.get_IdName()[1]}.tif'))
+            self.finished.emit(f'{self.msg_save_tiff} {unit.get_IdName()[1]}')
+        except Exception as e:
+            self.error.emit(f'{self.msg_error_save_tiff} {unit.get_IdName()[1]}: {str(e)}')
 
 class Wdg_DataHub_Image(qw.QWidget):
     """
@@ -333,6 +352,7 @@ class Wdg_DataHub_Image(qw.QWidget):
     sig_save_with_options = Signal(MeaImg_Hub, str, str, float, bool, bool)
     sig_load = Signal(MeaImg_Hub, str)
     sig_save_png = Signal(MeaImg_Unit, str, float, bool)
+    sig_save_tiff = Signal(MeaImg_Unit, str)
     sig_updateTree = Signal()
     
     def __init__(self, main, getter_ImageHub: Callable[[], MeaImg_Hub]|None=None, **kwargs) -> None:
@@ -407,6 +427,7 @@ class Wdg_DataHub_Image(qw.QWidget):
         self.sig_save_with_options.connect(self._worker.save_ImageMeasurementHub_with_options)
         self.sig_load.connect(self._worker.load_ImageMeasurementHub)
         self.sig_save_png.connect(self._worker.save_ImageMeasurementUnit_png)
+        self.sig_save_tiff.connect(self._worker.save_ImageMeasurementUnit_tiff)
         
         self._worker.finished.connect(self._handle_worker_finished)
         self._worker.error.connect(self._handle_worker_error)
@@ -434,7 +455,7 @@ class Wdg_DataHub_Image(qw.QWidget):
             self._flg_issaved = True
             self.reset_buttons('load')
             self.sig_updateTree.emit()
-        elif msg.startswith(self._worker.msg_save_png):
+        elif msg.startswith(self._worker.msg_save_png) or msg.startswith(self._worker.msg_save_tiff):
             self.reset_buttons('save_png')
         else: raise ValueError('Unknown finished message from worker.')
         
@@ -452,7 +473,7 @@ class Wdg_DataHub_Image(qw.QWidget):
             self.reset_buttons('save')
         elif error_msg.startswith(self._worker.msg_error_load):
             self.reset_buttons('load')
-        elif error_msg.startswith(self._worker.msg_error_save_png):
+        elif error_msg.startswith(self._worker.msg_error_save_png) or error_msg.startswith(self._worker.msg_error_save_tiff):
             self.reset_buttons('save_png')
         else: raise ValueError('Unknown error message from worker.')
         
@@ -536,21 +557,28 @@ class Wdg_DataHub_Image(qw.QWidget):
     @Slot()
     def export_selected_as_png(self):
         """
-        Exports the selected ImageMeasurement_Units as PNG files.
+        Exports the selected ImageMeasurement_Units as PNG files, or as pyramidal TIFF files for
+        large mosaics.
         """
         self.disable_buttons('save_png')
-        self._btn_save_png.setText('Saving to .png ...')
         
-        res = qw.QInputDialog.getDouble(
-            self, 'Export Resolution', 'Enter the resolution (percentage) for the PNG export:', 100, 0.1, 100, 1
-        )
-        if not res[1]: self.reset_buttons('save_png'); return
+        list_formats = ['PNG', 'Pyramidal TIFF (large mosaics)']
+        fmt = qw.QInputDialog.getItem(self, 'Export Format', 'Select the export format:', list_formats, 0, False)
+        if not fmt[1]: self.reset_buttons('save_png'); return
+        flg_tiff = fmt[0] == list_formats[1]
+        self._btn_save_png.setText('Saving to .tif ...' if flg_tiff else 'Saving to .png ...')
         
-        resolution = res[0]
+        resolution = 100.0
+        if not flg_tiff:
+            res = qw.QInputDialog.getDouble(
+                self, 'Export Resolution', 'Enter the resolution (percentage) for the PNG export:', 100, 0.1, 100, 1
+            )
+            if not res[1]: self.reset_buttons('save_png'); return
+            resolution = res[0]
         
-        # Prompt for the directory to save the PNG files
+        # Prompt for the directory to save the files
         dirpath = qw.QFileDialog.getExistingDirectory(
-            self, 'Select the folder to save the PNG files'
+            self, 'Select the folder to save the {} files'.format('TIFF' if flg_tiff else 'PNG')
         )
         if not os.path.isdir(dirpath):
             qw.QMessageBox.critical(self, 'Error', 'Invalid folder selected.'); self.reset_buttons('save_png')
@@ -565,7 +593,8 @@ class Wdg_DataHub_Image(qw.QWidget):
         for item in selections:
             unit_id = item.text(0)
             unit = self.ImageHub.get_ImageMeasurementUnit(unit_id=unit_id)
-            self.sig_save_png.emit(unit, dirpath, resolution, self._widget.chk_scalebar.isChecked())
+            if flg_tiff: self.sig_save_tiff.emit(unit, dirpath)
+            else: self.sig_save_png.emit(unit, dirpath, resolution, self._widget.chk_scalebar.isChecked())
             
     def append_ImageMeasurementUnit(self, unit:MeaImg_Unit, flg_nameprompt:bool=True):
         """
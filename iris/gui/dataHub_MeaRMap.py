@@ -34,9 +34,8 @@ from iris.resources.dataHubPlus_Raman_ui import Ui_DataHubPlus_mapping
 from iris.resources.dataHub_Raman_partialLoad_ui import Ui_dataHub_Raman_partialLoad
 from iris.resources.dialog_multiRename_ui import Ui_Dialog_MultiRename
 
-DATAHUBPLUS_MAX_FREQ_HZ = 1.0 # Maximum update frequency for the DataHubPlus treeview in Hertz
-DATAHUB_OFFLOADCHECK_INTERVAL_SEC = 10.0  # Minimum interval between offload checks in seconds
-DATAHUB_OFFLOAD_MINMEMORY_GB = 1.0  # Minimum available memory in GB, under which offloading is triggered
+from iris.gui import AppDataHub_Config
+from iris.utils.config_schema import config_registry
 
 class Dlg_PartialLoad(qw.QDialog, Ui_dataHub_Raman_partialLoad):
     """Dialog that lists all mapping units from a .db file as checkable items."""
@@ -105,8 +104,12 @@ class DataHub_Worker(QObject):
     autosave_success = "Autosaved the data successfully."
     autosave_error = "Error in autosaving the data: "
     
+    save_cancelled = "Saving cancelled."
+    
     sig_delete_done = Signal()
     sig_delete_error = Signal(str)
+    
+    sig_save_ext_progress = Signal(int,int)  # Emitted during the external save with (number of measurements saved, total)
 
     def __init__(self, mapping_hub:MeaRMap_Hub):
         super().__init__()
@@ -114,6 +117,7 @@ class DataHub_Worker(QObject):
         self._handler = MeaRMap_Handler()
         
         self._flg_issaved = True
+        self._event_cancel_save_ext = threading.Event()  # Set to cancel an ongoing external save
 
     @Slot(str,str)
     def save_database(self,savedirpath:str,savename:str) -> None:
@@ -235,19 +239,32 @@ class DataHub_Worker(QObject):
                 filepath += f".{extension}"
                 
             unit = self._mappinghub.get_MappingUnit(unit_id)
+            self._event_cancel_save_ext.clear()
             thread = self._handler.save_MappingUnit_ext(
                 mappingUnit=unit,
                 filepath=filepath,
                 flg_saveraw=flg_saveraw,
                 extension=extension,
+                callback_progress=self.sig_save_ext_progress.emit,
+                event_cancel=self._event_cancel_save_ext,
             )
             thread.join()
-            self.sig_saveload_done.emit(self.save_success)
+            if self._event_cancel_save_ext.is_set(): self.sig_saveload_done.emit(self.save_cancelled)
+            else: self.sig_saveload_done.emit(self.save_success)
         except AssertionError as e:
             self.sig_saveload_done.emit(self.save_error + str(e))
         except Exception as e:
             self.sig_saveload_done.emit(self.save_error + str(e))
     
+    def cancel_save_unit_ext(self) -> None:
+        """
+        Cancels the ongoing external save of a MappingMeasurement_Unit.
+        
+        Note:
+            To be called directly (not through a queued signal) as the worker thread is busy during the save.
+        """
+        self._event_cancel_save_ext.set()
+    
     @Slot(str)
     def load_database(self, loadpath: str) -> None:
         """
@@ -345,6 +362,7 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         # Save parameters
         self._sessionid = get_timestamp_us_str()
         self._flg_issaving_db = False
+        self._flg_issaving_ext = False  # Indicate if a MappingUnit is being saved externally
         self._flg_issaved_db = True   # Indicate if the stored data has been saved
         self._list_pickled = []    # List of pickled files
         self._temp_savedir = SaveParamsEnum.DEFAULT_SAVE_PATH.value + r'\temp'
@@ -390,6 +408,7 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         
         self._worker.sig_saveload_done.connect(self._reset_reenable_saveload_buttons)
         self.sig_save_ext.connect(self._worker.save_unit_ext)
+        self._worker.sig_save_ext_progress.connect(self._update_save_ext_progress)
         self.sig_save_db.connect(self._worker.save_database)
         self.sig_autosave_db.connect(self._worker.autosave_database)
         self.sig_autosave_db_delete.connect(self._worker.autosave_database_delete)
@@ -451,7 +470,8 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         """
         Check the system memory and offload data if necessary
         """
-        if time.time() - self._last_autoOffloadCheck_time < DATAHUB_OFFLOADCHECK_INTERVAL_SEC: return
+        config:AppDataHub_Config = config_registry.get(AppDataHub_Config)   # Reloadable parameters
+        if time.time() - self._last_autoOffloadCheck_time < config.datahub_offloadcheck_interval_sec: return
         if not self._widget.chk_autoOffload.isChecked(): return
         if self._flg_issaving_db: return
         if self._flg_issaved_db: return
@@ -460,7 +480,7 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         self._last_autoOffloadCheck_time = time.time()
         # print(f'{get_timestamp_sec()}: Available memory: {memory.available / (1024**3):.2f} GB of {memory.total / (1024**3):.2f} GB')
         # Check if the memory available is below 1GB
-        if memory.available / (1024**3) < DATAHUB_OFFLOAD_MINMEMORY_GB:
+        if memory.available / (1024**3) < config.datahub_offload_minmemory_gb:
             qw.QMessageBox.warning(
                 self,
                 "Low system memory",
@@ -699,8 +719,15 @@ class Wdg_DataHub_Mapping(qw.QWidget):
     @Slot()
     def _save_unit_ext(self) -> None:
         """
-        Save the selected MappingMeasurement_Unit in the treeview to a text file
+        Save the selected MappingMeasurement_Unit in the treeview to a text file,
+        or cancel the ongoing save if one is running
         """
+        if self._flg_issaving_ext:
+            self._btn_save_ext.setEnabled(False)
+            self._btn_save_ext.setText("Cancelling...")
+            self._worker.cancel_save_unit_ext()
+            return
+        
         self._btn_save_ext.setEnabled(False)
         self._btn_save_ext.setText("Saving...")
         
@@ -725,8 +752,24 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         
         save_ext = save_ext.split('(')[1].split('*.')[1].split(')')[0]
         
+        # The button is re-enabled to cancel the save while it is running
+        self._flg_issaving_ext = True
+        self._btn_save_ext.setText("Cancel saving")
+        self._btn_save_ext.setEnabled(True)
         self.sig_save_ext.emit(list_ids[0], save_path, save_ext)
         
+    @Slot(int,int)
+    def _update_save_ext_progress(self, num_saved:int, num_total:int) -> None:
+        """
+        Shows the progress of the external save on the save button
+        
+        Args:
+            num_saved (int): Number of measurements saved
+            num_total (int): Total number of measurements to save
+        """
+        if not self._flg_issaving_ext or not self._btn_save_ext.isEnabled(): return
+        self._btn_save_ext.setText(f"Cancel saving ({int(num_saved/num_total*100)}%)")
+        
     def _start_autosave(self):
         """
         Start the autosave timer
@@ -811,6 +854,7 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         
     @Slot()
     def _reset_reenable_saveload_buttons(self):
+        self._flg_issaving_ext = False
         list_widgets = get_all_widgets_from_layout(self._widget.lyt_saveload)
         list_buttons = [wdg for wdg in list_widgets if isinstance(wdg, qw.QPushButton)]
         
@@ -852,6 +896,8 @@ class Wdg_DataHub_Mapping(qw.QWidget):
         elif message == DataHub_Worker.save_success:
             qw.QMessageBox.information(None, "Save/Load operation", message)
             self._flg_issaved_db = True
+        elif message == DataHub_Worker.save_cancelled:
+            qw.QMessageBox.information(None, "Save/Load operation", message)
         elif message == DataHub_Worker.load_success:
             qw.QMessageBox.information(None, "Save/Load operation", message)
             self._flg_issaved_db = False
@@ -1266,7 +1312,7 @@ class Wdg_DataHub_Mapping_Plus(qw.QWidget):
         # If the widget is not visible, do not update
         if not self.isVisible(): return
         if self._isupdating_tree: return
-        if time.time() - self._last_update < 1.0 / DATAHUBPLUS_MAX_FREQ_HZ:
+        if time.time() - self._last_update < 1.0 / config_registry.get(AppDataHub_Config).datahubplus_max_freq_hz:
             QTimer.singleShot(1000, self.update_tree_unit)
             return
         
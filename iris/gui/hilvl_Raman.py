@@ -23,7 +23,9 @@ if __name__ == '__main__':
 
 import threading
 import time
-from iris.utils.general import messagebox_request_input, get_all_widgets
+from typing import Callable
+from contextlib import nullcontext
+from iris.utils.general import messagebox_request_input, get_all_widgets, get_timestamp_us_int
 
 from iris.gui.motion_video import Wdg_MotionController, Motion_GoToCoor_Worker
 from iris.gui.raman import Wdg_SpectrometerController, RamanMeasurement_Worker, AcquisitionParams, Enum_ContinuousMeasurementTrigger as EnumTrig, Syncer_Raman
@@ -37,11 +39,17 @@ from iris.gui.submodules.heatmap_plotter_MeaRMap import Wdg_MappingMeasurement_P
 from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Hub, MeaRMap_Handler
 from iris.data.measurement_Raman import MeaRaman,MeaRaman_Handler
 from iris.data.measurement_coordinates import MeaCoor_mm, List_MeaCoor_Hub
+from iris.data.focus_surface import Class_FocusSurface, fit_focus_surface
+from iris.utils.z_tracking import FeedForward_ZController
+from iris.utils.tracing import trace_span, traced
+from iris.data.scan_qa import ScanQA_Recorder, ScanQA_Flag
 
 from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
 from iris.multiprocessing.dataStreamer_Raman import DataStreamer_Raman
 
-from iris.gui import AppRamanEnum
+from iris.gui import AppRamanEnum, AppZTracking_Config
+from iris.utils.config_schema import config_registry
+from iris.controllers import Controller_Z
 
 from iris.resources.hilvl_Raman_ui import Ui_Hilvl_Raman
 
@@ -86,6 +94,16 @@ class Hilvl_MeasurementStorer_Worker(QObject):
         super().__init__()
         self._ds_stage = datastreamer_stage
         self._isrunning = True
+        self._scan_qa:ScanQA_Recorder|None = None
+        
+    def set_scan_qa_recorder(self, recorder:ScanQA_Recorder|None) -> None:
+        """
+        Sets the recorder of the storage timings and coordinate interpolation flags of the scan
+        
+        Args:
+            recorder (ScanQA_Recorder|None): The recorder, None to disable the recording
+        """
+        self._scan_qa = recorder
         
     @Slot(MeaRMap_Unit, queue.Queue)
     def set_save_params(
@@ -135,6 +153,7 @@ class Hilvl_MeasurementStorer_Worker(QObject):
                 self.sig_finished.emit()
     
     @Slot()
+    @traced('storer.autosave', cat='saving')
     def _autosave_measurement(self):
         """
         A function to automatically grabs the measurement data form the
@@ -157,11 +176,15 @@ class Hilvl_MeasurementStorer_Worker(QObject):
                 return
             
             try:
+                recorder = self._scan_qa
+                time_start = recorder.get_time() if recorder is not None else 0.0
+                flag = ScanQA_Flag.NONE
                 if isinstance(result,MeaRaman):
                     mea = result
                     # mea = mea.copy()
                     ts = mea.get_latest_timestamp()
-                    coor = self._ds_stage.get_coordinates_interpolate(ts)
+                    if recorder is not None: coor, flag = self._ds_stage.get_coordinates_interpolate_flagged(ts)
+                    else: coor = self._ds_stage.get_coordinates_interpolate(ts)
                 else:
                     mea, coor = result
                     # mea = mea.copy()
@@ -174,6 +197,8 @@ class Hilvl_MeasurementStorer_Worker(QObject):
                     coor=coor,
                     measurement=mea
                 )
+                if recorder is not None:
+                    recorder.record_storage(ts, time_start, flag, mea.get_metadata().get('integration_time_ms') or 0.0)
             except Exception as e:
                 self.sig_error.emit(f'Error in autosaver: {e}')
             
@@ -244,6 +269,83 @@ class Hilvl_MeasurementAcq_Worker(QObject):
         self.mapping_hub = mapping_hub
         self._syncer = syncer_raman
         self._event_isacquiring = event_isacquiring
+        
+        # Feed-forward Z tracking along the continuous scan lines
+        self._z_tracking_getter_xy:Callable[[],tuple[float,float]|None]|None = None
+        self._z_tracking_ctrl_z:Controller_Z|None = None
+        self._focus_surface:Class_FocusSurface|None = None
+        
+        # Acquisition quality recording of the scan
+        self._scan_qa:ScanQA_Recorder|None = None
+    
+    def set_scan_qa_recorder(self, recorder:ScanQA_Recorder|None) -> None:
+        """
+        Sets the recorder of the move and acquisition timings (discrete scans) or of the scan lines
+        (continuous scans) of the next scan
+
+        Args:
+            recorder (ScanQA_Recorder|None): The recorder, None to disable the recording
+        """
+        self._scan_qa = recorder
+    
+    def set_z_tracking_controllers(self, getter_xy:Callable[[],tuple[float,float]|None], ctrl_z:Controller_Z) -> None:
+        """
+        Sets the XY position getter and the Z stage controller used by the Z tracking of the
+        continuous scans (see AppZTracking_Config)
+        
+        Args:
+            getter_xy (Callable[[],tuple[float,float]|None]): Returns the current XY position [mm]
+            ctrl_z (Controller_Z): The Z stage controller
+        """
+        self._z_tracking_getter_xy = getter_xy
+        self._z_tracking_ctrl_z = ctrl_z
+        
+    def set_focus_surface(self, surface:Class_FocusSurface|None) -> None:
+        """
+        Sets the focus surface tracked along the continuous scan lines, e.g., the surface of a focus
+        map (FocusMap_Result.surface) or one fitted on reference points (see focus_surface). The
+        surface is kept for the next scans until it is reset.
+        
+        Args:
+            surface (Class_FocusSurface|None): The fitted focus surface, None to fit the surface on
+                the Z-coordinates of the scan line ends
+        """
+        assert surface is None or isinstance(surface, Class_FocusSurface), 'set_focus_surface: Expected a Class_FocusSurface or None'
+        self._focus_surface = surface
+        
+    def _init_z_tracker(self, mapping_coordinates_ends:list[tuple[float,float,float]]) -> FeedForward_ZController|None:
+        """
+        Initialises the feed-forward Z controller for the continuous scan if the Z tracking is enabled.
+        The focus surface set with set_focus_surface is tracked. Without one, the surface is fitted on
+        the Z-coordinates of the scan line ends (e.g., from a focus map, see FocusMap_Result.apply), which
+        only constrains the focus at the line ends: the focus variations along the lines are then
+        interpolated, not tracked.
+        
+        Args:
+            mapping_coordinates_ends (list[tuple[float,float,float]]): The scan line end coordinates
+            
+        Returns:
+            FeedForward_ZController|None: The Z controller, None if the tracking is disabled or not possible
+        """
+        config:AppZTracking_Config = config_registry.get(AppZTracking_Config)
+        if not config.continuous_z_tracking: return None
+        if self._z_tracking_getter_xy is None or self._z_tracking_ctrl_z is None:
+            print('Z tracking: The stage controllers are not set, the Z tracking is disabled.')
+            return None
+        surface = self._focus_surface
+        if surface is None:
+            try: surface = fit_focus_surface(mapping_coordinates_ends, 'tps')
+            except ValueError as e:
+                print(f'Z tracking: The focus surface could not be fitted on the scan lines, the Z tracking is disabled: {e}')
+                return None
+        return FeedForward_ZController(
+            surface=surface,
+            getter_xy=self._z_tracking_getter_xy,
+            ctrl_z=self._z_tracking_ctrl_z,
+            latency_sec=config.z_tracking_latency_ms/1e3,
+            max_update_hz=config.z_tracking_max_update_hz,
+            deadband_mm=config.z_tracking_deadband_um/1e3,
+        )
     
     def _calculate_time_remaining(self, points_done:int, total_points:int, time_elapsed:float) -> str:
         """
@@ -301,6 +403,9 @@ class Hilvl_MeasurementAcq_Worker(QObject):
         total_points = len(mapping_coordinates)
         self._event_isacquiring.set()
         msg = self.msg_mea_finished
+        recorder = self._scan_qa
+        time_move = recorder.time_move if recorder is not None else lambda i: nullcontext()
+        time_acquisition = recorder.time_acquisition if recorder is not None else lambda i: nullcontext([])
         for i, coor in enumerate(mapping_coordinates):
             try:
                 # time1 = time.time()
@@ -312,12 +417,13 @@ class Hilvl_MeasurementAcq_Worker(QObject):
                 event_finish = threading.Event()
                 # print('\nMoving to coordinates:',coor)
                 # print('Emitting _sig_gotocor signal...')
-                self._sig_gotocor.emit(
-                    (float(coor[0]),float(coor[1]),float(coor[2])),
-                    event_finish
-                )
-                # print('Waiting for movement to complete...')
-                event_finish.wait(10)
+                with trace_span('scan.move', cat='motion', point=i), time_move(i):
+                    self._sig_gotocor.emit(
+                        (float(coor[0]),float(coor[1]),float(coor[2])),
+                        event_finish
+                    )
+                    # print('Waiting for movement to complete...')
+                    event_finish.wait(10)
                 # time2 = time.time()
                 
                 if not event_finish.is_set(): raise TimeoutError('Failed to reach the target coordinate. Movement to coordinates timed out.')
@@ -325,10 +431,12 @@ class Hilvl_MeasurementAcq_Worker(QObject):
                 
                 # Trigger the acquisition and wait for the return queue to be filled
                 # print('Emitting _sig_acquire_discrete_mea signal...')
-                self._sig_acquire_discrete_mea.emit(params,q_mea)
-                
-                # print('Waiting for measurement to be acquired...')
-                mea:MeaRaman = q_mea.get(timeout=accumulation * int_time/1000 * 10) # Waits up to 10x the integration time for the measurement
+                with trace_span('scan.acquire', cat='acquisition', point=i), time_acquisition(i) as list_ts:
+                    self._sig_acquire_discrete_mea.emit(params,q_mea)
+                    
+                    # print('Waiting for measurement to be acquired...')
+                    mea:MeaRaman = q_mea.get(timeout=accumulation * int_time/1000 * 10) # Waits up to 10x the integration time for the measurement
+                    if isinstance(mea,MeaRaman): list_ts.append(mea.get_latest_timestamp())
                 
                 if not isinstance(mea,MeaRaman): raise TypeError('Invalid measurement data received from acquisition queue.')
                 
@@ -355,6 +463,7 @@ class Hilvl_MeasurementAcq_Worker(QObject):
                 self.sig_progress_update_str.emit(progress_msg)
         
         self._event_isacquiring.clear()
+        if recorder is not None: recorder.finish()
         self.emit_finish_signals(msg)
         return
 
@@ -405,12 +514,17 @@ class Hilvl_MeasurementAcq_Worker(QObject):
             coor_mea=mapping_coordinates_ends[0],
         )
         
+        z_tracker = self._init_z_tracker(mapping_coordinates_ends)
+        
         msg = self.msg_mea_finished
         for i, coor in enumerate(mapping_coordinates_ends):
             try:
                 if not self._event_isacquiring.is_set(): msg = self.msg_mea_cancelled; break
-                self._execute_scan_continuous_step(mapping_speed_param, q_mea_out, event_finish_setvel, event_finish_goto, q_trig, i, coor)
+                with trace_span('scan.line_step', cat='motion', step=i):
+                    self._execute_scan_continuous_step(mapping_speed_param, q_mea_out, event_finish_setvel, event_finish_goto, q_trig, i, coor,
+                                                       z_tracker=z_tracker)
             except Exception as e:
+                if z_tracker is not None: z_tracker.stop()
                 self.sig_error_during_mea.emit(self.msg_mea_error + str(e))
                 print('Error in run_scan_continuous:',e)
             finally:
@@ -426,6 +540,7 @@ class Hilvl_MeasurementAcq_Worker(QObject):
         q_trig.put(EnumTrig.FINISH)
         
         self._event_isacquiring.clear()
+        if self._scan_qa is not None: self._scan_qa.finish()
         self.emit_finish_signals(msg)
 
     def _execute_scan_continuous_step(
@@ -437,6 +552,7 @@ class Hilvl_MeasurementAcq_Worker(QObject):
         q_trig:queue.Queue,
         coor_idx:int,
         coor:tuple,
+        z_tracker:FeedForward_ZController|None=None,
         ) -> None:
         """
         Executes a single step in the continuous mapping measurement.
@@ -449,17 +565,29 @@ class Hilvl_MeasurementAcq_Worker(QObject):
             q_trig (queue.Queue): Queue to send the measurement trigger commands
             i (int): The index of the current coordinate
             coor (tuple): The target coordinate
+            z_tracker (FeedForward_ZController|None): The Z controller tracking the focus surface along
+                the scan lines (odd indices), in which case Z is left to the tracker during the line
+                and the line starts are moved to the surface. Defaults to None.
         """ 
         # Go to the requested coordinates
         # time1 = time.time()
         # print(f'\nMoving to coordinates: {coor} (Index {coor_idx}), distance from last: {math.dist(self._last_coor, coor) if hasattr(self, "_last_coor") else "N/A"}')
+        coor_prev = getattr(self, '_last_coor', None)
         self._last_coor = coor
+        coor_goto = (float(coor[0]),float(coor[1]),float(coor[2]))
+        flg_tracking = z_tracker is not None and coor_idx%2 == 1
+        if flg_tracking:
+            coor_goto = (coor_goto[0], coor_goto[1], None)  # Z is driven by the tracker
+            z_tracker.start()
+        elif z_tracker is not None:
+            coor_goto = (coor_goto[0], coor_goto[1], z_tracker.get_target_z(coor_goto[0], coor_goto[1]))
         event_finish_goto.clear()
-        self._sig_gotocor.emit(
-                    (float(coor[0]),float(coor[1]),float(coor[2])),
-                    event_finish_goto
-                )
+        time_line = self._scan_qa.get_time() if self._scan_qa is not None else 0.0
+        self._sig_gotocor.emit(coor_goto, event_finish_goto)
         event_finish_goto.wait()
+        if flg_tracking: z_tracker.stop()
+        if self._scan_qa is not None and coor_idx%2 == 1 and coor_prev is not None:   # Scan line (acquisition)
+            self._scan_qa.record_line(coor_idx//2, time_line, coor_prev[:2], coor[:2])
         # time2 = time.time()
             
         event_finish_setvel.clear()
@@ -723,6 +851,8 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
         # Parameters
         self._list_sel_mapCoor = []
         self._flg_meaCancelled = False # Flag to indicate if the measurement was cancelled
+        self._scan_qa:ScanQA_Recorder|None = None   # Acquisition quality recorder of the ongoing scan
+        self._scan_qa_unit:MeaRMap_Unit|None = None # Mapping unit of the ongoing scan
         
         # >> Mapping options widgets setup <<
         self._btn_discrete = wdg.btn_discrete
@@ -819,6 +949,11 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
         """
         pass
     
+    def _get_current_xy(self) -> tuple[float,float]|None:
+        """Returns the current XY stage position [mm] from the stage hub, None if not available"""
+        coor = self._stageHub.get_coordinates_closest(get_timestamp_us_int())
+        return None if coor is None else (coor[0], coor[1])
+    
     def _init_workers_connections(self):
         """
         Initialises the workers and their connections
@@ -846,6 +981,9 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
             )
             # Set the parent to prevent garbage collection
             self._worker_manager.setParent(self)
+        self._worker_hilvlacq.set_z_tracking_controllers(
+            getter_xy=self._get_current_xy,
+            ctrl_z=self.motion_controller.ctrl_z)
         self._worker_autoMeaStorer = Hilvl_MeasurementStorer_Worker(
             datastreamer_stage=self._stageHub,
         )
@@ -1317,6 +1455,7 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
         self.enable_widgets()
         self.statbar.showMessage('Mapping measurement complete')
         self.statbar.setStyleSheet("") # Reset to default
+        self._report_scan_qa()
         
         if msg == self._worker_hilvlacq.msg_mea_cancelled:
             self._list_sel_mapCoor.clear()
@@ -1336,6 +1475,21 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
             self.initiate_mapping(method=self._last_mappingmethod)
         else: raise ValueError("Invalid mapping completion message")
 
+    def _report_scan_qa(self) -> None:
+        """
+        Computes the acquisition quality report of the last scan and attaches it to its mapping unit,
+        to be saved with it
+        """
+        recorder = self._scan_qa
+        if recorder is None or self._scan_qa_unit is None: return
+        self._scan_qa = None
+        try:
+            report = recorder.compute_report()
+            self._scan_qa_unit.set_scan_qa(report)
+            print(f"Scan quality report of '{self._scan_qa_unit.get_unit_name()}':\n{report.get_summary()}")
+        except Exception as e:
+            print(f'Error in computing the scan quality report: {e}')
+        
     def _perform_mapping(self, method:MappingMethods):
         """
         Performs discrete mapping based on the mapping coordinates stored in the list
@@ -1400,6 +1554,12 @@ class Wdg_HighLvlController_Raman(qw.QWidget):
         # Scramble the mapping coordinates if requested
         mapping_coordinates = self._scramble_mapping_coordinates(mapping_coordinates, method)
         
+        # Record the acquisition quality of the scan, reported on completion
+        self._scan_qa = ScanQA_Recorder(scan_type=method.value)
+        self._scan_qa_unit = mea_unit
+        self._worker_hilvlacq.set_scan_qa_recorder(self._scan_qa)
+        self._worker_autoMeaStorer.set_scan_qa_recorder(self._scan_qa)
+        
         # Perform the mapping measurement itself
         q_autosave = self._init_autoMeaStorer_worker(mea_unit)
         if method == MappingMethods.DISCRETE:
@@ -900,6 +900,34 @@ class Wdg_Calibration_Finetuning(qw.QWidget):
         assert isinstance(self._cal_ori, ImgMea_Cal), 'Calibration object not initialised'
         assert self._cal_ori.check_calibration_set() == True, 'Calibration parameters not set'
         
+    def set_base_calibration(self, cal:ImgMea_Cal) -> None:
+        """
+        Replaces the calibration the fine adjustments are relative to (e.g., with an automatically
+        refined one), resets the spinbox values and sets it to the measurement image
+
+        Args:
+            cal (ImgMea_Cal): New base calibration
+        """
+        assert self._cal_ori is not None, 'Fine adjuster not initialised'
+        assert isinstance(cal, ImgMea_Cal) and cal.check_calibration_set(), 'Calibration parameters not set'
+
+        self._cal_ori = deepcopy(cal)
+        self._cal_temp = deepcopy(cal)
+        for spin in [self._cal_sclx, self._cal_scly, self._cal_offsetx, self._cal_offsety, self._cal_rot_deg]:
+            spin.blockSignals(True)
+        try: self.reset_calibrationSpinbox_values()
+        finally:
+            for spin in [self._cal_sclx, self._cal_scly, self._cal_offsetx, self._cal_offsety, self._cal_rot_deg]:
+                spin.blockSignals(False)
+
+        img_unit = self._getter_measurement_image()
+        if not isinstance(img_unit, MeaImg_Unit): raise ValueError('Measurement image not initialised')
+        img_unit.set_calibration_ImageMeasurement_Calibration(self._cal_temp)
+
+    def check_fineadjuster_initialised(self) -> bool:
+        """Returns True if the fine adjustment is in progress (initialised and not finalised)"""
+        return self._cal_ori is not None
+
     def get_last_calibration(self) -> ImgMea_Cal|None:
         """
         Returns the last created calibration object
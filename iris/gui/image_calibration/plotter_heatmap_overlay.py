@@ -27,7 +27,11 @@ from iris.gui.dataHub_MeaImg import Wdg_DataHub_ImgCal
 from iris.data.measurement_image import MeaImg_Unit, MeaImg_Hub, MeaImg_Handler
 from iris.data.calibration_objective import ImgMea_Cal
 from iris.data.measurement_RamanMap import MeaRMap_Hub,MeaRMap_Unit,MeaRMap_Plotter,PlotterOptions,PlotterParams,PlotterExtraParamsBase
+from iris.data.heatmap_overlay import MeaRMap_OverlayPlotter, PlotterParams_Overlay
+from iris.data.overlay_registration import OverlayRegistration_Params, OverlayRegistration_Result, REG_CONFIDENCE_LOW,\
+    refine_overlay_calibration_mapping
 from iris.gui.submodules.heatmap_plotter_MeaRMap import XYLimits
+from iris.gui.submodules.mosaic_viewer import Dlg_MosaicViewer
 
 # Import processors
 from iris.gui.submodules.heatmap_plotter_MeaRMap import Wdg_MappingMeasurement_Plotter
@@ -46,82 +50,44 @@ class HeatmapOverlay_Design(Ui_heatmapPlotterOverlay,qw.QWidget):
         self.setupUi(self)
         self.setLayout(self.main_layout)
 
-class MappingPlotter_ImageOverlay(MeaRMap_Plotter):
+class MappingPlotter_ImageOverlay(MeaRMap_OverlayPlotter):
     """
     A modified version of the raman_plot class to allow image overlay on the heatmap
-    plot function
+    plot function, see MeaRMap_OverlayPlotter
     """
     def __init__(self) -> None:
         super().__init__()
         
-    def overlay_image(self, image: Image.Image, extent:tuple[float,float,float,float],
-                      callback=None) -> None:
-        """
-        Overlay an image on the heatmap plot
-        
-        Args:
-            ax (Axes): Axis object to plot the image
-            image (Image.Image): Image object to overlay
-            extent (tuple): Extent of the image in the plot (left,right,bottom,top) coordinates
-        """
-        assert isinstance(image,Image.Image), "Invalid image object."
-        assert isinstance(extent,tuple) and len(extent)==4, "Invalid extent object."
-        
-        ax = self._ax
-        
-        # Get current min and max values
-        x_min, x_max = ax.get_xlim()
-        y_min, y_max = ax.get_ylim()
-        
-        x_min_all = min(x_min, min(extent[0], extent[1]))
-        y_min_all = min(y_min, min(extent[2], extent[3]))
-        x_max_all = max(x_max, max(extent[0], extent[1]))
-        y_max_all = max(y_max, max(extent[2], extent[3]))
-        
-        ax.imshow(image, extent=extent, interpolation='lanczos')
-        
-        ax.set_xlim(x_min_all, x_max_all)
-        ax.set_ylim(y_min_all, y_max_all)
-        ax.set_aspect(AppPlotEnum.PLT_ASPECT.value)
-        
-        # Callback function
-        if callback is not None: callback()
-        
-class ImageProcessor_Worker(QObject):
+class OverlayAutoAlign_Worker(QObject):
     """
-    Worker class to process images in a separate thread
+    Worker refining the image calibration against a heatmap (see refine_overlay_calibration_mapping)
+    in a separate thread
     """
-    sig_finished = Signal()
-    def __init__(self, plotter:MappingPlotter_ImageOverlay):
-        super().__init__()
-        self._plotter = plotter
-        
-    @Slot(MeaImg_Unit,bool)
-    def overlay_stitched_image(self, imgUnit:MeaImg_Unit, low_res:bool) -> None:
+    sig_finished = Signal(object, object, str)  # result (None on error), calibration refined, error message
+
+    @Slot(MeaImg_Unit, MeaRMap_Unit, object, object, object, bool)
+    def align(self, img_unit:MeaImg_Unit, mapping_unit:MeaRMap_Unit, wavelength:float|None, channel:str|None,
+              spectral_channel:str|None, low_res:bool) -> None:
         """
-        Get the stitched image from the ImageUnit
-        
+        Refines the calibration of the image unit and emits the result with the calibration it refines
+
         Args:
-            imgUnit (MeaImg_Unit): Image unit to process
-            low_res (bool): Whether to get low resolution image
+            img_unit (MeaImg_Unit): Image unit, with its calibration set
+            mapping_unit (MeaRMap_Unit): Mapping unit of the heatmap
+            wavelength (float|None): Wavelength of the heatmap
+            channel (str|None): Derived heatmap channel, None for the intensity at the wavelength
+            spectral_channel (str|None): Spectral channel of the intensity, None for the primary one
+            low_res (bool): Align with the low resolution stitched image
         """
+        cal = img_unit.get_ImageMeasurement_Calibration()
         try:
-            img_stitched,img_stitched_limit_min,img_stitched_limit_max =\
-                imgUnit.get_image_all_stitched(low_res=low_res)
-                
-            img_stitched_extent = (
-                min(img_stitched_limit_min[0],img_stitched_limit_max[0]),
-                max(img_stitched_limit_max[0],img_stitched_limit_min[0]),
-                min(img_stitched_limit_min[1],img_stitched_limit_max[1]),
-                max(img_stitched_limit_max[1],img_stitched_limit_min[1])
-            )
-            
-            self._plotter.overlay_image(image=img_stitched,extent=img_stitched_extent)
-            self.sig_finished.emit()
+            result = refine_overlay_calibration_mapping(img_unit, mapping_unit, wavelength, channel, spectral_channel,
+                                                        OverlayRegistration_Params(low_res=low_res))
         except Exception as e:
-            print('Error in get_stitched_image:', e)
-            self.sig_finished.emit()
-        
+            self.sig_finished.emit(None, cal, str(e))
+            return
+        self.sig_finished.emit(result, cal, '')
+
 class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
     """
     A modified version of the plot_mapping_measurements class to allow image overlay
@@ -130,8 +96,7 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
     
     sig_update_img_combobox = Signal()
     sig_update_plot_overlay = Signal()
-    
-    sig_overlay_stitched_image = Signal(MeaImg_Unit,bool)
+    _sig_req_auto_align = Signal(MeaImg_Unit, MeaRMap_Unit, object, object, object, bool)
     
     def __init__(
         self,
@@ -175,9 +140,7 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         self._plotter = MappingPlotter_ImageOverlay()
         self._plotter._ax = self._ax   # self._ax / self._fig are set by super().__init__()
         self._plotter._fig = self._fig
-        self._pending_overlay: tuple[MeaImg_Unit, bool] | None = None
-        self._overlay_in_progress = False
-        self._init_worker()
+        self._worker_plotter.set_plotter(self._plotter)
 
     # >>> Calibration fine-tuning widgets <<<
         self._frm_calAdjust = Wdg_Calibration_Finetuning(
@@ -191,14 +154,43 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         self._frm_calAdjust.config_calibrate_button(text='Disabled',enabled=False,callback=lambda:None)
         self._frm_calAdjust.config_finetune_calibration_button(text='Finetune calibration',callback=self._finetune_calibration)
         
+        self._btn_autoAlign = qw.QPushButton('Auto-align calibration', self)
+        self._btn_autoAlign.setToolTip('Refines the calibration by maximising the mutual information between '
+                                       'the plotted heatmap and the image')
+        wdg_ovl.lyt_holder_finetuning.addWidget(self._btn_autoAlign)
+        self._btn_autoAlign.clicked.connect(self._auto_align_calibration)
+        
+        self._thread_align = QThread()
+        self._worker_align = OverlayAutoAlign_Worker()
+        self._worker_align.moveToThread(self._thread_align)
+        self._thread_align.start()
+        self.destroyed.connect(self._thread_align.quit)
+        self._thread_align.finished.connect(self._thread_align.deleteLater)
+        self._thread_align.finished.connect(self._worker_align.deleteLater)
+        self._sig_req_auto_align.connect(self._worker_align.align)
+        self._worker_align.sig_finished.connect(self._handle_auto_align_finished)
+        
+        self._btn_viewer = qw.QPushButton('Open in the zoomable viewer', self)
+        self._btn_viewer.setToolTip('Opens the selected image unit in the zoomable (tile pyramid) viewer')
+        wdg_ovl.lyt_holder_finetuning.addWidget(self._btn_viewer)
+        self._btn_viewer.clicked.connect(self._open_mosaic_viewer)
+        
     # >>> Control widgets <<<
         self._combo_ImageUnits = wdg_ovl.combo_imgUnit
         self._chk_lres = wdg_ovl.chk_lres
         self._chk_overlay = wdg_ovl.chk_overlay
+        self._spin_alpha = wdg_ovl.spin_alpha
+        self._combo_cmap = wdg_ovl.combo_cmap
+        
+        self._spin_alpha.setValue(self._alpha)
+        self._combo_cmap.addItems(sorted(matplotlib.colormaps, key=str.lower))
+        self._combo_cmap.setCurrentText(AppPlotEnum.PLT_COLOUR_MAP.value)
 
         self._combo_ImageUnits.currentTextChanged.connect(self.plot_heatmap)
         self._chk_lres.stateChanged.connect(self.plot_heatmap)
         self._chk_overlay.stateChanged.connect(self.plot_heatmap)
+        self._spin_alpha.valueChanged.connect(self.plot_heatmap)
+        self._combo_cmap.currentTextChanged.connect(self.plot_heatmap)
         self._combo_plot_mappingUnitName.currentTextChanged.connect(self.plot_heatmap)
         self._combo_plot_SpectralPosition.currentTextChanged.connect(self.plot_heatmap)
         self._entry_plot_clim_min.editingFinished.connect(self.plot_heatmap)
@@ -223,19 +215,6 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         """
         self.sig_update_img_combobox.emit()
         
-    def _init_worker(self):
-        """
-        Initialise the worker thread and object
-        """
-        self._thread_worker = QThread()
-        self._worker = ImageProcessor_Worker(plotter=self._plotter)
-        self._worker.moveToThread(self._thread_worker)
-        self._thread_worker.start()
-        
-        # Connect signals
-        self._worker.sig_finished.connect(self.handle_plot_overlay_finished)
-        self.sig_overlay_stitched_image.connect(self._worker.overlay_stitched_image)
-        
     @Slot()
     def _update_img_combobox(self):
         """
@@ -281,6 +260,68 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         self._frm_calAdjust.initialise_fineadjuster()
         self._frm_calAdjust.enable_finetuneCalibration_widgets(callback=apply_finetune_calibration)
         
+    @Slot()
+    def _auto_align_calibration(self) -> None:
+        """
+        Refines the image calibration aligning the stitched image with the plotted heatmap channel
+        in the background (see OverlayAutoAlign_Worker). Once accepted, the refined calibration is
+        set as the fine-tuning base calibration, see _handle_auto_align_finished.
+        """
+        img_unit = self._get_ImageUnit()
+        mapping_hub = self._mappingHub
+        if not isinstance(img_unit,MeaImg_Unit) or not isinstance(mapping_hub,MeaRMap_Hub): return
+        mappingUnit_name = self._combo_plot_mappingUnitName.currentText()
+        dict_nameToID = mapping_hub.get_dict_nameToID()
+        if not mappingUnit_name in dict_nameToID: return
+        mapping_unit = mapping_hub.get_MappingUnit(dict_nameToID[mappingUnit_name])
+        wavelength = self.get_current_wavelength()
+        if wavelength is None: return
+        
+        if not self._frm_calAdjust.check_fineadjuster_initialised(): self._finetune_calibration()
+        
+        self._btn_autoAlign.setEnabled(False)
+        self._btn_autoAlign.setText('Auto-aligning...')
+        self._sig_req_auto_align.emit(img_unit, mapping_unit, wavelength, self.get_current_channel(),
+                                      self.get_current_spectral_channel(), self._chk_lres.isChecked())
+        
+    @Slot(object, object, str)
+    def _handle_auto_align_finished(self, result:OverlayRegistration_Result|None, cal:ImgMea_Cal, error:str) -> None:
+        """
+        Asks the user to use the refined calibration and sets it as the fine-tuning base calibration
+        
+        Args:
+            result (OverlayRegistration_Result|None): Fitted correction, None on error
+            cal (ImgMea_Cal): Calibration refined by the correction
+            error (str): Error message, empty on success
+        """
+        self._btn_autoAlign.setText('Auto-align calibration')
+        self._btn_autoAlign.setEnabled(True)
+        if result is None:
+            qw.QMessageBox.warning(self, 'Auto-align calibration', f'Failed to align the calibration:\n{error}')
+            return
+        
+        icon = qw.QMessageBox.Warning if result.confidence < REG_CONFIDENCE_LOW else qw.QMessageBox.Question # pyright: ignore[reportAttributeAccessIssue] ; QMessageBox.Warning exists
+        msg = qw.QMessageBox(icon, 'Auto-align calibration', result.get_summary() + '\n\nUse the refined calibration?',
+            qw.QMessageBox.Yes | qw.QMessageBox.No, self) # pyright: ignore[reportAttributeAccessIssue] ; QMessageBox.Yes exists
+        if msg.exec() != qw.QMessageBox.Yes: return # pyright: ignore[reportAttributeAccessIssue] ; QMessageBox.Yes exists
+        
+        if not self._frm_calAdjust.check_fineadjuster_initialised(): self._finetune_calibration()
+        self._frm_calAdjust.set_base_calibration(result.get_corrected_calibration(cal))
+        self.sig_update_plot_overlay.emit()
+        
+    @Slot()
+    def _open_mosaic_viewer(self) -> None:
+        """
+        Opens the ImageUnit selected in the combobox in the zoomable (tile pyramid) viewer
+        """
+        try:
+            img_unit = self._get_ImageUnit()
+            if not isinstance(img_unit,MeaImg_Unit): raise ValueError('No ImageUnit found')
+            if not img_unit.check_readyForProcessing(): raise ValueError('No image or calibration found')
+            Dlg_MosaicViewer(self, img_unit).show()
+        except Exception as e:
+            qw.QMessageBox.warning(self,'Error in _open_mosaic_viewer',str(e))
+        
     @Slot()
     def handle_finetuning_finished(self) -> None:
         # Ask the user to apply the calibration changes
@@ -331,32 +372,10 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
     @Slot()
     def plot_heatmap(self) -> None:
         """
-        Plot the heatmap with the image overlay.
+        Plot the heatmap with the image overlay. The stitched image and the mapping coordinates
+        converted to the image's measurement coordinates are cached by the plotter, see
+        MeaRMap_OverlayPlotter.
         """
-        def correct_MappingMeasurementCoordinates(mapping_unit:MeaRMap_Unit,
-                measurement_img:MeaImg_Unit) -> MeaRMap_Unit:
-            """Correct the mapping measurement coordinates to match the image measurement
-            coordinates."""
-            label_x,label_y,_,_,_ = mapping_unit.get_labels()
-            dict_measurement = mapping_unit.get_dict_measurements(copy=False)
-
-            list_coorx:list = dict_measurement[label_x]
-            list_coory:list = dict_measurement[label_y]
-
-            list_coor = [(coorx,coory) for coorx,coory in zip(list_coorx,list_coory)]
-            list_coor_corr = [measurement_img.convert_stg2mea(coor) for coor in list_coor]
-
-            list_coorx_corr = [coor[0] for coor in list_coor_corr]
-            list_coory_corr = [coor[1] for coor in list_coor_corr]
-
-            # Update the values in the list, which are referenced by the mapping unit measurement dict
-            list_coorx.clear()
-            list_coorx.extend(list_coorx_corr)
-            list_coory.clear()
-            list_coory.extend(list_coory_corr)
-
-            return mapping_unit
-
         if self._isplotting: return
 
         mapping_hub = self._mappingHub
@@ -374,16 +393,10 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         mappingUnit_name = self._combo_plot_mappingUnitName.currentText()
         dict_nameToID = mapping_hub.get_dict_nameToID()
         if not mappingUnit_name in dict_nameToID: return
-        mappingUnit_id = dict_nameToID[mappingUnit_name]
+        mapping_unit = mapping_hub.get_MappingUnit(dict_nameToID[mappingUnit_name])
         wavelength = self.get_current_wavelength()
         if wavelength is None: return
 
-        mapping_unit_corr = mapping_hub.copy_mapping_unit(mappingUnit_id,mappingUnit_name+'_LaserCoorCorrected',appendToHub=False)
-        mapping_unit_corr = correct_MappingMeasurementCoordinates(
-            mapping_unit=mapping_unit_corr,
-            measurement_img=img_unit
-        )
-
         try: clim_min = float(self._entry_plot_clim_min.text())
         except: clim_min = None
         try: clim_max = float(self._entry_plot_clim_max.text())
@@ -391,11 +404,20 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
         clim = (clim_min,clim_max)
         if self._chk_auto_clim.isChecked(): clim = (None,None)
 
+        cmap = self._combo_cmap.currentText()
         self._isplotting = True
-        self._pending_overlay = (img_unit, flg_lowResImg) if self._chk_overlay.isChecked() else None
 
         options = self._get_plotter_option()
-        params = PlotterParams(mapping_unit=mapping_unit_corr, wavelength=wavelength, clim=clim)
+        params = PlotterParams_Overlay(
+            mapping_unit=mapping_unit,
+            wavelength=wavelength,
+            clim=clim,
+            img_unit=img_unit,
+            low_res=flg_lowResImg,
+            show_image=self._chk_overlay.isChecked(),
+            alpha=self._spin_alpha.value(),
+            cmap=cmap if cmap in matplotlib.colormaps else None,
+        )
         params_extra = self._get_plotter_extra_params()
         limits_xy = self._get_plot_xylim()
 
@@ -403,35 +425,14 @@ class Wdg_HeatmapOverlay(Wdg_MappingMeasurement_Plotter, qw.QWidget):
 
     @Slot()
     def on_plotter_worker_plotready(self) -> None:
-        """After the heatmap is drawn, start the image overlay in the worker thread."""
-        if self._pending_overlay is not None:
-            img_unit, low_res = self._pending_overlay
-            self._pending_overlay = None
-            self._overlay_in_progress = True
-            self.sig_overlay_stitched_image.emit(img_unit, low_res)
-        else:
-            self._canvas_widget.draw_idle()
-            self._isplotting = False
+        """Draw the composited plot."""
+        self._canvas_widget.draw_idle()
+        self._isplotting = False
 
     @Slot()
     def on_plotter_worker_finished(self) -> None:
-        """Reset _isplotting if the overlay worker was never started.
-
-        The base worker emits sig_finished_plotting without sig_plotready when it
-        takes its early-return error path (invalid mapping unit). In that case
-        on_plotter_worker_plotready is never called, so _isplotting would stay True
-        forever. Resetting here when no overlay is in progress covers both the
-        error path and the no-overlay success path (already False, so harmless).
-        """
-        if not self._overlay_in_progress:
-            self._pending_overlay = None
-            self._isplotting = False
-
-    @Slot()
-    def handle_plot_overlay_finished(self) -> None:
-        """Handle the plot overlay finished signal."""
-        self._overlay_in_progress = False
-        self._canvas_widget.draw_idle()
+        """Reset _isplotting, also when the worker takes its early-return error path (invalid
+        mapping unit) without emitting sig_plotready."""
         self._isplotting = False
 
 
@@ -15,7 +15,7 @@ import os
 import threading
 import queue
 
-from PIL import Image, ImageDraw, ImageFont, ImageQt
+from PIL import Image
 import numpy as np
 import cv2 as cv
 
@@ -29,11 +29,16 @@ if __name__ == '__main__':
     libdir = os.path.abspath(r'.\iris')
     sys.path.insert(0, os.path.dirname(libdir))
 
-from iris.utils.general import validator_float_greaterThanZero, messagebox_request_input, get_timestamp_us_int, get_all_widgets
+from iris.utils.general import validator_float_greaterThanZero, messagebox_request_input, get_timestamp_us_int, get_timestamp_us_str, get_all_widgets
+from iris.utils.focus_mapping import calculate_focus_score
+from iris.utils.tiling_pipeline import wait_stage_settled
 
 from iris.data.calibration_objective import ImgMea_Cal
 
+from iris.gui.submodules.video_overlay import VideoOverlay_Renderer, VideoFrame_Governor, convert_array_to_qimage
+
 from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam, Enum_CamCorrectionType
+from iris.multiprocessing.videoRecorder_StageCam import VideoRecorder_StageCam, StageCamRecording_Report
 
 from iris.gui import AppVideoEnum
 from iris.controllers import ControllerConfigEnum
@@ -43,6 +48,7 @@ from iris.resources.motion_video.brightfieldcontrol_ui import Ui_wdg_brightfield
 from iris.resources.motion_video.stagecontrol_ui import Ui_stagecontrol
 
 WAIT_MOVEMENT_TIMEOUT = 10.0  # Timeout for waiting for the movement to finish [s] (reset if the stage is still moving)
+RECORDING_MAX_LISTED_DROPPED = 20  # Maximum number of dropped frame indices listed in the recording report
 AUTOFOCUS_BLUR_KERNEL_SIZE = AppVideoEnum.AUTOFOCUS_BLUR_KERNEL_SIZE.value
 AUTOFOCUS_NO_IMPROVE_STEPS = AppVideoEnum.AUTOFOCUS_NO_IMPROVE_STEPS.value
 
@@ -293,57 +299,30 @@ class Motion_GoToCoor_Worker(QObject):
         if result is None: return None
         else: return np.array(result)
         
-    def _notify_finish(self, thread_xy:threading.Thread, thread_z:threading.Thread,
-                       event_finished:threading.Event):
+    def _notify_finish(self, thread_xy:threading.Thread, thread_z:threading.Thread|None,
+                       event_finished:threading.Event,
+                       target_mm:tuple[float,float,float]|None=None):
         """
-        Waits for the target to be reached and for the stage to be stationary for a minimum
-        settle time before signalling completion. Raises a TimeoutError if the total timeout
-        (reset while stage is still moving) is exceeded.
+        Waits for the stage to settle (see tiling_pipeline.wait_stage_settled): stationary and on
+        the target, or stationary for the settle time (STAGE_TILING_SETTLE_SEC), before signalling
+        completion. Signals a timeout if the stage does not settle within the total timeout (reset
+        while the stage is still moving).
 
         Args:
             thread_xy (threading.Thread): The thread moving the XY stage
-            thread_z (threading.Thread): The thread moving the Z stage
+            thread_z (threading.Thread|None): The thread moving the Z stage, None if Z is not moved
             event_finished (threading.Event): Event to signal when movement and settling are done
-        """
-        timeout = WAIT_MOVEMENT_TIMEOUT
-        settle_sec = ControllerConfigEnum.STAGE_TILING_SETTLE_SEC.value
-
-        timeout_start = time.time()
-        last_change_time = time.time()
-        coor = self._get_coor()
-        threads_done = False
-
-        while True:
-            if not threads_done:
-                if thread_xy.is_alive() or thread_z.is_alive():
-                    thread_xy.join(timeout=0.1)
-                    thread_z.join(timeout=0.1)
-                else:
-                    threads_done = True
-                    last_change_time = time.time()  # Reset settle timer once threads finish
-
-            if time.time() - timeout_start > timeout:
-                if event_finished is not None: event_finished.set()
-                self.sig_mvmt_finished.emit(self.msg_target_timeout)
-                break
-
-            coor_new = self._get_coor()
-            if coor_new is None:
-                time.sleep(0.01)
-                continue
-            if coor is None:
-                coor = coor_new
-            if not np.allclose(coor, coor_new, atol=0.001):
-                last_change_time = time.time()
-                timeout_start = time.time()  # Reset overall timeout while stage is still moving
-            coor = coor_new
-
-            if threads_done and (time.time() - last_change_time) >= settle_sec:
-                if event_finished is not None: event_finished.set()
-                self.sig_mvmt_finished.emit(self.msg_target_reached)
-                break
-
-            time.sleep(0.01)
+            target_mm (tuple[float,float,float]|None): Target coordinates in mm (x,y,z), None for an axis
+                without target. Defaults to None.
+        """
+        flg_settled = wait_stage_settled(
+            getter_coor=self._get_coor,
+            target_mm=target_mm,
+            getter_moving=lambda: thread_xy.is_alive() or (thread_z is not None and thread_z.is_alive()),
+            timeout_sec=WAIT_MOVEMENT_TIMEOUT,
+        )
+        if event_finished is not None: event_finished.set()
+        self.sig_mvmt_finished.emit(self.msg_target_reached if flg_settled else self.msg_target_timeout)
         
     @Slot(tuple, threading.Event)
     def work(
@@ -355,32 +334,35 @@ class Motion_GoToCoor_Worker(QObject):
 
         Args:
             coors_mm (tuple[float,float,float]): Target coordinates in mm (x,y,z). Use None to skip moving that axis.
+                The Z stage is left alone without a Z target (e.g., for a focus tracker driving it).
             event_finished (threading.Event): An event to signal when the movement is finished.
         """
         # print('Motion_GoToCoor_Worker.work() called with coordinates (mm):',coors_mm)
         # print('Thread ID:', threading.current_thread().ident)
-        # If None is provided, assign the current coordinates (i.e., do not move)
+        # If None is provided for X or Y, assign the current coordinates (i.e., do not move)
         coor_x_mm, coor_y_mm, coor_z_mm = coors_mm
-        if any([coor_x_mm is None,coor_y_mm is None,coor_z_mm is None]):
+        if coor_x_mm is None or coor_y_mm is None:
             res = self._get_coor()
             if res is None:
                 self.sig_mvmt_finished.emit(self.msg_target_failed)
                 return
-            coor_x_current,coor_y_current,coor_z_current = res
+            coor_x_current,coor_y_current,_ = res
             if coor_x_mm is None: coor_x_mm = coor_x_current
             if coor_y_mm is None: coor_y_mm = coor_y_current
-            if coor_z_mm is None: coor_z_mm = coor_z_current
         
-        self.sig_mvmt_started.emit('Moving to X: {:.3f} Y: {:.3f} Z: {:.3f} mm'.format(coor_x_mm,coor_y_mm,coor_z_mm))
+        msg_z = ' Z: {:.3f}'.format(coor_z_mm) if coor_z_mm is not None else ''
+        self.sig_mvmt_started.emit('Moving to X: {:.3f} Y: {:.3f}{} mm'.format(coor_x_mm,coor_y_mm,msg_z))
         
         # Operate both stages at once
         thread_xy_move = threading.Thread(target=self.ctrl_xy.move_direct,args=((coor_x_mm,coor_y_mm),))
-        thread_z_move = threading.Thread(target=self.ctrl_z.move_direct,args=(coor_z_mm,))
-        
         thread_xy_move.start()
-        thread_z_move.start()
+        thread_z_move = None
+        if coor_z_mm is not None:
+            thread_z_move = threading.Thread(target=self.ctrl_z.move_direct,args=(coor_z_mm,))
+            thread_z_move.start()
 
-        self._notify_finish(thread_xy_move,thread_z_move,event_finished)
+        self._notify_finish(thread_xy_move,thread_z_move,event_finished,
+                            target_mm=(coor_x_mm,coor_y_mm,coor_z_mm))
 
 # class _worker_set_vel_relative(QObject):
 #     """
@@ -547,13 +529,7 @@ class AutoFocus_Worker(QObject):
             self._collected_frames.append((timestamp_us, img.copy()))
 
     def _calculate_focus_score(self, image, blur):
-        if blur > 1:
-            image = cv.medianBlur(image, blur)
-        sx = cv.Sobel(image, cv.CV_64F, 1, 0, ksize=3)
-        sy = cv.Sobel(image, cv.CV_64F, 0, 1, ksize=3)
-        magnitude = sx**2 + sy**2
-        threshold = np.percentile(magnitude, 90)
-        return float(magnitude[magnitude >= threshold].mean())
+        return calculate_focus_score(image, blur)
 
     def _estimate_peak_z(self, z_arr: np.ndarray, scores_arr: np.ndarray) -> float | None:
         """Returns estimated peak Z in mm, or None if the Gaussian peak lies outside the scan range."""
@@ -627,7 +603,8 @@ class ImageCapture_Worker(QObject):
     """
     A worker to continuously update the video feed by capturing frames from the camera and applying corrections
     """
-    sig_qpixmap = Signal(QPixmap)  # Signal to emit the new frame as a QPixmap
+    sig_frame = Signal(object)  # Signal to emit the new frame to display as a (height,width,3) RGB numpy array (with overlays)
+    sig_frame_dropped = Signal()  # Signal to emit when the frame is not displayed, as the previous one is not displayed yet
     sig_img = Signal(Image.Image)  # Signal to emit the new frame as a PIL Image (with overlays)
     sig_raw_img = Signal(object, Image.Image)  # Signal to emit (timestamp_us, raw frame) before any overlays (for focus scoring)
     sig_no_frame = Signal()  # Signal to emit when no frame is captured
@@ -638,64 +615,34 @@ class ImageCapture_Worker(QObject):
         self._camera_controller = camera_controller
         self._stageHub = stageHub
         self._getter_imgcal = getter_imgcal
+        self._renderer = VideoOverlay_Renderer()
+        self._governor = VideoFrame_Governor()
         
-    def _overlay_scalebar(self,img:Image.Image) -> Image.Image:
+    def get_frame_governor(self) -> VideoFrame_Governor:
         """
-        Overlays a scalebar on the image based on the image calibration file
-
-        Args:
-            img (Image.Image): The image to be overlayed with the scalebar
+        Returns the governor of the displayed frames, to acknowledge their display and get the frame rate
 
         Returns:
-            Image.Image: The image with the scalebar overlayed
+            VideoFrame_Governor: The frame governor
         """
-        cal = self._getter_imgcal()
-        
-        if not isinstance(cal,ImgMea_Cal) or not cal.check_calibration_set():
-            return img
-        
-        if not isinstance(img,Image.Image): return img
+        return self._governor
         
-        scalex = 1/cal.scale_x_pixelPerMm
-        scalebar_length = int(ControllerConfigEnum.SCALEBAR_LENGTH_RATIO.value * img.size[0]) # in pixel
-        scalebar_height = int(ControllerConfigEnum.SCALEBAR_HEIGHT_RATIO.value * img.size[1]) # in pixel
-        
-        length_mm = scalebar_length * scalex
-        font = ControllerConfigEnum.SCALEBAR_FONT.value
-        font_size = int(scalebar_length/10 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
-        line_width = int(scalebar_length/50 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
-        
-        line_offset = scalebar_length/10
-        
-        box_length = scalebar_length + 2*line_offset
-        box_height = scalebar_height + 2*line_offset
-        
-        draw = ImageDraw.Draw(img)
-        # Draw a box around the scalebar, taking consideration of the font size height
-        draw.rectangle([(img.size[0]-box_length, img.size[1]-box_height),
-                        (img.size[0], img.size[1])], fill=(0,0,0))
-        draw.line([(img.size[0]-scalebar_length-line_offset, img.size[1]-line_offset),
-                   (img.size[0]-line_offset, img.size[1]-line_offset)],
-                  fill=(255,255,255), width=line_width)
-        
-        try: text_params = {'text':'{:.0f} µm'.format(abs(length_mm*1e3)), 'font':ImageFont.truetype(font,font_size)}
-        except Exception: raise ValueError('Scalebar font file not found. Please check the font path in the configuration.')
+    def _emit_frame(self, img:Image.Image, scalebar:bool, crosshair:bool) -> None:
+        """
+        Composites the overlays onto the frame and emits it, the display frame is dropped if the
+        previous one is not displayed yet
         
-        text_length = draw.textlength(**text_params)
+        Args:
+            img (Image.Image): The captured frame
+            scalebar (bool): Whether to overlay a scalebar on the image
+            crosshair (bool): Whether to overlay a crosshair on the image
+        """
+        frame, flg_overlay = self._renderer.render(img, self._getter_imgcal(), scalebar, crosshair)
+        if flg_overlay: img = Image.fromarray(frame)
+        self.sig_img.emit(img)
         
-        draw.text((img.size[0]-box_length/2-text_length/2, img.size[1]-line_offset*2-line_width-font_size/2),
-                  align='left', fill=(255,255,255), **text_params)
-        return img
-    
-    def _draw_crosshair(self, img:Image.Image) -> Image.Image:
-        width, height = img.size
-        draw = ImageDraw.Draw(img)
-        line_color = (255, 0, 0)
-        # Draw vertical line
-        draw.line([(width/2, 0), (width/2, height)], fill=line_color, width=3)
-        # Draw horizontal line
-        draw.line([(0, height/2), (width, height/2)], fill=line_color, width=3)
-        return img
+        if self._governor.request_display(): self.sig_frame.emit(frame)
+        else: self.sig_frame_dropped.emit()
     
     @Slot(Enum_CamCorrectionType, bool, bool)
     def grab_image_fresh(self, img_corr:Enum_CamCorrectionType, scalebar:bool, crosshair:bool):
@@ -722,13 +669,7 @@ class ImageCapture_Worker(QObject):
                 img = self._stageHub.apply_correction(img, img_corr)
 
             self.sig_raw_img.emit(get_timestamp_us_int(), img)
-
-            img = self._overlay_scalebar(img) if scalebar else img
-            if crosshair: img = self._draw_crosshair(img)
-
-            new_frame: QPixmap = ImageQt.toqpixmap(img)
-            self.sig_img.emit(img)
-            self.sig_qpixmap.emit(new_frame)
+            self._emit_frame(img, scalebar, crosshair)
 
         except Exception as e:
             print(f'Fresh capture failed: {e}')
@@ -758,16 +699,10 @@ class ImageCapture_Worker(QObject):
                 self.sig_no_frame.emit()
                 return
             
-            # Add a scalebar to it
             self.sig_raw_img.emit(get_timestamp_us_int(), img)
-
-            img = self._overlay_scalebar(img) if scalebar else img
-            if crosshair: img = self._draw_crosshair(img)
-
-            new_frame:QPixmap = ImageQt.toqpixmap(img)
-
-            self.sig_img.emit(img)
-            self.sig_qpixmap.emit(new_frame)
+            
+            # Add the overlays to it
+            self._emit_frame(img, scalebar, crosshair)
             
         except Exception as e:
             print(f'Video feed failed: {e}')
@@ -798,6 +733,7 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
     _sig_pause_video_ui = Signal()
     _sig_resume_video_ui = Signal()
     _sig_reinit_camera_done = Signal(bool, bool)  # (video_was_running, success)
+    _sig_recording_stopped = Signal(object, str)  # (report or None, error message)
     
     _sig_req_auto_focus = Signal(float,float,float,int,bool)
     
@@ -1074,6 +1010,15 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
         btn_save_flatfield.released.connect(lambda: self._save_flatfield_correction())
         btn_load_flatfield.released.connect(lambda: self._load_flatfield_correction())
         
+        # > Video recording with the stage coordinates
+        self._recorder:VideoRecorder_StageCam|None = None
+        self._btn_record = qw.QPushButton('Record video', wdg_video)
+        self._btn_record.setToolTip('Records the frames of the video feed with their timestamps and stage coordinates '
+                                    '(see VideoRecorder_StageCam)')
+        wdg_video.gridLayout.addWidget(self._btn_record, 6, 0, 1, 2)
+        self._btn_record.released.connect(lambda: self._toggle_recording())
+        self._sig_recording_stopped.connect(self._on_recording_stopped)
+        
         # Video corrections
         self._dict_vidcorrection = {}
         self._combo_vidcorrection = wdg_video.combo_image_correction
@@ -1294,6 +1239,91 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
             self._btn_reinit_conn.setStyleSheet('background-color: red')
             self.sig_statbar_message.emit('Camera re-initialisation failed — reconnect USB and try again', 'red')
 
+    def _toggle_recording(self) -> None:
+        """
+        Starts recording the camera frames with the stage coordinates into a selected directory,
+        or stops the running recording
+        """
+        if self._recorder is not None:
+            self._stop_recording()
+            return
+        dirpath = qw.QFileDialog.getExistingDirectory(self, 'Select the recording directory')
+        if not dirpath: return
+        try:
+            # The raw frames of the video feed are pushed, the recorder does not compete with
+            # the video feed (or an image tiling) for the camera
+            recorder = VideoRecorder_StageCam(self._stageHub, dirpath, f'stagecam_{get_timestamp_us_str()}')
+            recorder.start(acquire=False)
+        except Exception as e:
+            qw.QMessageBox.critical(self, 'Error', 'Failed to start the recording:\n' + str(e))
+            return
+        self._recorder = recorder
+        self._worker_img_capture.sig_raw_img.connect(self._record_frame, qc.Qt.ConnectionType.DirectConnection)
+        self._btn_record.setText('Stop recording')
+        self._btn_record.setStyleSheet('background-color: red')
+        self.sig_statbar_message.emit(f'Recording the video into {dirpath}', 'yellow')
+        
+    def _stop_recording(self) -> None:
+        """
+        Stops the recording in a background thread, the buffered frames being written
+        """
+        recorder = self._recorder
+        if recorder is None: return
+        self._worker_img_capture.sig_raw_img.disconnect(self._record_frame)
+        self._btn_record.setEnabled(False)
+        self._btn_record.setText('Writing the recording...')
+        
+        def _do_stop():
+            try: self._sig_recording_stopped.emit(recorder.stop(), '')
+            except Exception as e: self._sig_recording_stopped.emit(None, str(e))
+        
+        self._thread_recording_stop = threading.Thread(target=_do_stop, daemon=True)
+        self._thread_recording_stop.start()
+        
+    @Slot(object, Image.Image)
+    def _record_frame(self, timestamp_us:int, img:Image.Image) -> None:
+        """
+        Pushes a raw frame of the video feed to the running recording, called in the video thread
+        
+        Args:
+            timestamp_us (int): Timestamp of the frame [us]
+            img (Image.Image): Raw frame
+        """
+        recorder = self._recorder
+        if recorder is None or not recorder.is_recording(): return
+        if img.mode not in ('L','RGB'): img = img.convert('RGB')
+        recorder.push_frame(timestamp_us, img)
+        
+    @Slot(object, str)
+    def _on_recording_stopped(self, report:StageCamRecording_Report|None, error:str) -> None:
+        """
+        Resets the recording button and shows the recording report, with the dropped frames
+        
+        Args:
+            report (StageCamRecording_Report|None): Report of the recording, None on error
+            error (str): Error message, empty if the recording was written
+        """
+        table_path = self._recorder.get_table_path() if self._recorder is not None else ''
+        self._recorder = None
+        self._btn_record.setEnabled(True)
+        self._btn_record.setText('Record video')
+        self._btn_record.setStyleSheet('')
+        if report is None:
+            self.sig_statbar_message.emit('Video recording failed', 'red')
+            qw.QMessageBox.critical(self, 'Video recording', 'The recording failed:\n' + error)
+            return
+        
+        msg = f'{report.get_summary()}\nFrame table: {table_path}'
+        if report.num_dropped == 0:
+            self.sig_statbar_message.emit('Video recording saved', 'green')
+            qw.QMessageBox.information(self, 'Video recording', msg)
+            return
+        list_idx = report.list_dropped[:RECORDING_MAX_LISTED_DROPPED]
+        msg += f'\n\nDropped frames: {", ".join(map(str, list_idx))}'
+        if report.num_dropped > len(list_idx): msg += f', ... ({report.num_dropped - len(list_idx)} more, see the frame table)'
+        self.sig_statbar_message.emit(f'Video recording saved, {report.num_dropped} frames dropped', 'yellow')
+        qw.QMessageBox.warning(self, 'Video recording', msg)
+        
     def disable_overlays(self):
         """
         Disables the overlays on the video feed
@@ -1835,13 +1865,23 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
         self._sig_req_fresh_img.connect(self._worker_img_capture.grab_image_fresh)
         self._worker_img_capture.sig_error.connect(lambda msg: print(f'Video worker error: {msg}'))
         self._worker_img_capture.sig_img.connect(self._handle_img_capture)
-        self._worker_img_capture.sig_qpixmap.connect(self._handle_qpixmap_capture)
+        self._worker_img_capture.sig_frame.connect(self._handle_frame_capture)
+        self._worker_img_capture.sig_frame_dropped.connect(self._handle_frame_dropped)
         self._worker_img_capture.sig_no_frame.connect(self._handle_no_frame)
         
         # Defer thread start until after initialization is complete
         QTimer.singleShot(0, self._thread_video.start)
         self.destroyed.connect(self._thread_video.quit)
     
+    def get_video_fps(self) -> float:
+        """
+        Returns the measured frame rate of the displayed video feed
+
+        Returns:
+            float: Displayed frame rate [Hz], 0 if the video feed is not running
+        """
+        return self._worker_img_capture.get_frame_governor().get_fps()
+    
     def get_video_worker(self) -> ImageCapture_Worker:
         """
         Returns the video worker to access its methods and signals
@@ -1881,6 +1921,7 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
     def _init_video(self):
         if not self._camera_ctrl.get_initialisation_status(): self._camera_ctrl.__init__()
         self._currentFrame = None            # Empties the current frame
+        self._worker_img_capture.get_frame_governor().reset()
         
         # Loops the image updater to create outputs the video capture frame by frame
         self._flg_pause_video.clear()
@@ -1898,7 +1939,9 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
         if diff < 1/self._vid_refreshrate: sleep_msec = int((1/self._vid_refreshrate - diff)*1e3)
         else: sleep_msec = 0
         
-        QTimer.singleShot(sleep_msec, self.video_update)
+        # Request the next frame right away when late, so that its capture overlaps the display
+        if sleep_msec == 0: self.video_update()
+        else: QTimer.singleShot(sleep_msec, self.video_update)
     
     @Slot()
     def _handle_no_frame(self):
@@ -1909,24 +1952,33 @@ class Wdg_MotionController(Ui_stagecontrol, qw.QWidget):
         self._iscapturing.clear()
         self._trigger_next_video_update()
     
-    @Slot(QPixmap)
-    def _handle_qpixmap_capture(self, img_qpixmap:QPixmap):
+    @Slot(object)
+    def _handle_frame_capture(self, frame:np.ndarray):
         """
-        Handles the image capture from the camera and updates the video feed with the new image.
-        Should be used as a callback for the camera controller's image capture method.
+        Handles the frame capture from the camera and updates the video feed with the new frame.
+        The next frame is requested before the display, the worker drops it if this frame is not
+        displayed by then.
 
         Args:
-            img_qpixmap (QPixmap): The captured image in QPixmap format
+            frame (np.ndarray): The captured frame (height,width,3) RGB with the overlays
         """
+        self._iscapturing.clear()
+        self._trigger_next_video_update()
         try:
-            if self._currentFrame != img_qpixmap:
-                self._lbl_video.setPixmap(img_qpixmap)
-                self._currentFrame = img_qpixmap
-            
+            # The QImage shares the frame's memory, the QPixmap conversion is the only copy
+            self._currentFrame = QPixmap.fromImage(convert_array_to_qimage(frame))
+            self._lbl_video.setPixmap(self._currentFrame)
         except Exception as e: print(f'Failed to update video feed with captured image: {e}')
         finally:
-            self._iscapturing.clear()
-            self._trigger_next_video_update()
+            self._worker_img_capture.get_frame_governor().notify_displayed()
+            
+    @Slot()
+    def _handle_frame_dropped(self):
+        """
+        Handles a frame not displayed as the previous one was not displayed yet
+        """
+        self._iscapturing.clear()
+        self._trigger_next_video_update()
         
     @Slot(Image.Image)
     def _handle_img_capture(self, img:Image.Image):
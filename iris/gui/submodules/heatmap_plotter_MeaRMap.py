@@ -23,6 +23,7 @@ if __name__ == '__main__':
 
 from iris.utils.general import thread_assign, get_all_widgets_from_layout
 from iris.data.measurement_RamanMap import MeaRMap_Hub,MeaRMap_Unit, MeaRMap_Plotter, PlotterOptions, PlotterParams, PlotterExtraParamsBase
+from iris.data.analysis_bands import BandChannels_Calculator, Band_Window, Band_Ratio, parse_band_definitions, get_band_channel_names
 
 from iris.resources.heatmap_plotter_ui import Ui_HeatmapPlotter
 
@@ -75,7 +76,17 @@ class HeatmapPlotter_Worker(QObject):
     def __init__(self, plotter:MeaRMap_Plotter):
         super().__init__()
         self._plotter = plotter
-        
+
+    def set_plotter(self, plotter:MeaRMap_Plotter) -> None:
+        """
+        Sets the plotter used to plot the heatmaps, e.g., a plotter subclass sharing the figure and axes
+
+        Args:
+            plotter (MeaRMap_Plotter): Plotter to use
+        """
+        assert isinstance(plotter, MeaRMap_Plotter), 'plotter must be an instance of MeaRMap_Plotter'
+        self._plotter = plotter
+
     @Slot(PlotterOptions, PlotterParams, PlotterExtraParamsBase, XYLimits)
     def plot_heatmap(self, option:PlotterOptions, params:PlotterParams, extra_params:PlotterExtraParamsBase,
                      limits_xy:XYLimits) -> None:
@@ -95,7 +106,10 @@ class HeatmapPlotter_Worker(QObject):
         else:
             ramanshift_str = 'N/A'
         
-        title = f'{mappingUnit.get_unit_name()}\n{ramanshift_str}cm⁻¹ [{wavelength}nm]'
+        if params.channel is not None: title = f'{mappingUnit.get_unit_name()}\n{params.channel}'
+        elif params.spectral_channel is not None:
+            title = f'{mappingUnit.get_unit_name()} [{params.spectral_channel}]\n{ramanshift_str}cm⁻¹ [{wavelength}nm]'
+        else: title = f'{mappingUnit.get_unit_name()}\n{ramanshift_str}cm⁻¹ [{wavelength}nm]'
         params.title = title
         self._plotter.plot_heatmap(
             plotter=option,
@@ -118,6 +132,7 @@ class Wdg_MappingMeasurement_Plotter(qw.QWidget):
     
     sig_request_update_plot = Signal()  # Signal to update the plot in the main thread
     _sig_request_update_comboboxes = Signal()  # Signal to update the comboboxes in the main thread
+    _sig_band_channels_error = Signal(str)  # Signal emitted when the band channel computation fails, sends the error message
     
     _sig_udpate_plot = Signal(PlotterOptions, PlotterParams, PlotterExtraParamsBase, XYLimits)  # Signal to update the plot in the worker thread
     
@@ -293,6 +308,29 @@ class Wdg_MappingMeasurement_Plotter(qw.QWidget):
         self._chk_plot_in_RamanShift = wdg.chk_Ramanshift
         self._chk_plot_in_RamanShift.stateChanged.connect(self._update_comboboxes)
         
+        # > Set up the heatmap channel selection: the intensity at the spectral position or a derived
+        # channel stored in the mapping unit (e.g., PCA scores)
+        self._str_channel_spectralpos = 'Spectral position'
+        self._combo_plot_channel = qw.QComboBox(wdg)
+        self._combo_plot_channel.addItem(self._str_channel_spectralpos)
+        self._combo_plot_channel.setToolTip('Heatmap channel: intensity at the spectral position (of the primary or another spectral channel) or a derived channel of the mapping unit')
+        wdg.horizontalLayout.addWidget(self._combo_plot_channel)
+        self._str_channel_request = self._str_channel_spectralpos   # Last channel chosen by the user
+        self._dict_spectral_channel_items:dict[str,str] = {}        # Combobox item: spectral channel name
+        self._combo_plot_channel.currentTextChanged.connect(self._set_channel_request)
+        self._combo_plot_channel.currentIndexChanged.connect(lambda: self.sig_request_update_plot.emit())
+        
+        # > Set up the band channels (band area, centroid, peak position and ratios over Raman-shift windows)
+        self._band_calculator = BandChannels_Calculator()
+        self._band_definitions:tuple[list[Band_Window],list[Band_Ratio]]|None = None
+        self._str_band_definitions = ''
+        self._eve_band_computing = threading.Event()
+        self._btn_band_channels = qw.QPushButton('Band channels', wdg)
+        self._btn_band_channels.setToolTip('Define band windows in Raman shift, e.g., "D:1330-1370, G:1570-1610, D/G"')
+        self._btn_band_channels.clicked.connect(self._prompt_band_definitions)
+        self._sig_band_channels_error.connect(self._handle_band_channels_error)
+        wdg.horizontalLayout.addWidget(self._btn_band_channels)
+        
     def _init_plotter_options_widgets(self):
         """
         Initialize the plotter option widgets
@@ -520,6 +558,114 @@ class Wdg_MappingMeasurement_Plotter(qw.QWidget):
         self._combo_plot_SpectralPosition.blockSignals(False)
         self._isupdating_comboboxes = False
         
+    @Slot(str)
+    def _set_channel_request(self, channel:str) -> None:
+        """
+        Stores the channel chosen by the user, to be selected again whenever it is available
+        (e.g., after the derived channels are recomputed for new measurements)
+        """
+        self._str_channel_request = channel
+        
+    def _update_combobox_channel(self, mappingUnit:MeaRMap_Unit) -> None:
+        """
+        Refreshes the heatmap channel combobox according to the spectral channels (e.g., the other
+        tracks of a multi-track acquisition) and the derived channels of the mapping unit, selecting
+        the channel last chosen by the user if it is available
+        
+        Args:
+            mappingUnit (MeaRMap_Unit): The mapping unit to get the channels from
+        """
+        self._dict_spectral_channel_items = {f'{self._str_channel_spectralpos} [{channel}]': channel
+                                             for channel in mappingUnit.get_list_spectral_channels()}
+        list_channels = [self._str_channel_spectralpos] + list(self._dict_spectral_channel_items.keys())\
+            + mappingUnit.get_list_derived_channels()
+        if [self._combo_plot_channel.itemText(i) for i in range(self._combo_plot_channel.count())] == list_channels\
+            and self._combo_plot_channel.currentText() == self._str_channel_request:
+            return
+        
+        self._combo_plot_channel.blockSignals(True)
+        self._combo_plot_channel.clear()
+        self._combo_plot_channel.addItems(list_channels)
+        if self._str_channel_request in list_channels: self._combo_plot_channel.setCurrentText(self._str_channel_request)
+        else: self._combo_plot_channel.setCurrentIndex(0)
+        self._combo_plot_channel.blockSignals(False)
+        
+    @Slot()
+    def _prompt_band_definitions(self) -> None:
+        """
+        Asks the user for the band definitions and computes the band channels of the selected mapping unit
+        """
+        text, ok = qw.QInputDialog.getText(self, 'Band channels',
+            'Bands as [name:]lower-upper in cm⁻¹ and ratios as name/name, comma-separated\n'
+            '(e.g., D:1330-1370, G:1570-1610, D/G). Leave empty to remove the band channels:',
+            text=self._str_band_definitions)
+        if not ok: return
+        
+        try: definitions = parse_band_definitions(text) if text.strip() != '' else None
+        except ValueError as e:
+            qw.QMessageBox.warning(self, 'Band channels', str(e))
+            return
+        
+        # Remove the channels of the previous definitions
+        mappingUnit = self.get_selected_mappingUnit()
+        if self._band_definitions is not None and mappingUnit is not None:
+            for channel in get_band_channel_names(*self._band_definitions):
+                mappingUnit.remove_derived_channel(channel)
+        
+        self._str_band_definitions = text
+        self._band_definitions = definitions
+        if definitions is not None and definitions[0]:
+            self._str_channel_request = get_band_channel_names(*definitions)[0]
+        self.sig_request_update_plot.emit()
+        
+    def _request_band_channels(self, mappingUnit:MeaRMap_Unit) -> None:
+        """
+        Computes the band channels of the mapping unit in the background, if band definitions are set
+        and the channels are not up to date (only the measurements appended since the last computation
+        are computed, see BandChannels_Calculator)
+        """
+        if self._band_definitions is None or not self._band_definitions[0]: return
+        if self._eve_band_computing.is_set(): return
+        if self._band_calculator.check_uptodate(mappingUnit, *self._band_definitions): return
+        
+        self._eve_band_computing.set()
+        self._compute_band_channels(mappingUnit, *self._band_definitions)
+        
+    @thread_assign
+    def _compute_band_channels(self, mappingUnit:MeaRMap_Unit, bands:list[Band_Window], ratios:list[Band_Ratio]) -> None:
+        try: self._band_calculator.update_unit(mappingUnit, bands, ratios)
+        except Exception as e: self._sig_band_channels_error.emit(str(e))  # e.g., band outside the spectral range
+        finally: self._eve_band_computing.clear()
+        
+    @Slot(str)
+    def _handle_band_channels_error(self, message:str) -> None:
+        """
+        Reports a failed band channel computation and removes the band definitions, so that the
+        computation is not retried on every plot update
+        """
+        self._band_definitions = None
+        qw.QMessageBox.warning(self, 'Band channels', f'Failed to compute the band channels:\n{message}')
+        
+    def get_current_channel(self) -> str|None:
+        """
+        Retrieves the derived heatmap channel being plotted.
+        
+        Returns:
+            str|None: The derived channel name or None if the intensity at the spectral position is plotted.
+        """
+        if self._combo_plot_channel.currentIndex() <= 0: return None
+        if self._combo_plot_channel.currentText() in self._dict_spectral_channel_items: return None
+        return self._combo_plot_channel.currentText()
+        
+    def get_current_spectral_channel(self) -> str|None:
+        """
+        Retrieves the spectral channel the intensity at the spectral position is taken from.
+        
+        Returns:
+            str|None: The spectral channel name or None for the primary intensity (or a derived channel).
+        """
+        return self._dict_spectral_channel_items.get(self._combo_plot_channel.currentText())
+        
     def _get_plotter_option(self) -> PlotterOptions:
         """
         Get the current plotter option from the combobox
@@ -650,10 +796,14 @@ class Wdg_MappingMeasurement_Plotter(qw.QWidget):
         
         #PlotterOptions, PlotterParams, PlotterExtraParamsBase, XYLimits
         options = self._get_plotter_option()
+        self._request_band_channels(mappingUnit)
+        self._update_combobox_channel(mappingUnit)
         params = PlotterParams(
             mapping_unit=mappingUnit,
             wavelength=wavelength,
             clim=None,
+            channel=self.get_current_channel(),
+            spectral_channel=self.get_current_spectral_channel(),
         )
         # print(f'{self._id} Plotting heatmap for unit: {mappingUnit.get_unit_name()}, wavelength: {wavelength}nm')
         params_extra = self._get_plotter_extra_params()
@@ -712,10 +862,14 @@ class Wdg_MappingMeasurement_Plotter(qw.QWidget):
                 'data.csv',
                 'CSV files (*.csv)')[0]
             
-            spectralPosition_idx = self._combo_plot_SpectralPosition.currentIndex()
-            list_wavelength = self._current_mappingUnit.get_list_wavelengths()
-            wavelength = list_wavelength[spectralPosition_idx]
-            df = self._current_mappingUnit.get_heatmap_table(wavelength)
+            channel = self.get_current_channel()
+            if channel is not None:
+                df = self._current_mappingUnit.get_heatmap_table_channel(channel)
+            else:
+                spectralPosition_idx = self._combo_plot_SpectralPosition.currentIndex()
+                list_wavelength = self._current_mappingUnit.get_list_wavelengths()
+                wavelength = list_wavelength[spectralPosition_idx]
+                df = self._current_mappingUnit.get_heatmap_table(wavelength, self.get_current_spectral_channel())
             df.to_csv(filepath)
             qw.QMessageBox.information(self, 'Save data', 'Data saved successfully')
         except Exception as e: print('save_plot_data',e); return
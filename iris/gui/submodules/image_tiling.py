@@ -26,6 +26,7 @@ if __name__ == '__main__':
     sys.path.insert(0, os.path.dirname(libdir))
 
 from iris.utils.general import get_timestamp_us_str
+from iris.utils.tiling_pipeline import TilingPipeline
 
 from iris.gui.motion_video import Wdg_MotionController
 from iris.gui.dataHub_MeaImg import Wdg_DataHub_Image, Wdg_DataHub_ImgCal
@@ -34,8 +35,10 @@ from iris.gui.submodules.mappingCoordinatesTreeview import Wdg_Treeview_MappingC
 from iris.gui.submodules.meaCoor_generator.ssfrm_tilemthd1_rect_around import tiling_method_rectxy_scan_constz_around_a_point as TileMethod
 
 from iris.gui.image_calibration.Canvas_ROIdefinition import Canvas_Image_Annotations
+from iris.gui.submodules.mosaic_viewer import Dlg_MosaicViewer
 
 from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_blending import MosaicBlending_Params
 from iris.data.calibration_objective import ImgMea_Cal
 from iris.data.measurement_coordinates import MeaCoor_mm, List_MeaCoor_Hub
 
@@ -86,10 +89,12 @@ class ImageProcessor_Worker(QObject):
     
     sig_finished_msg = Signal(str)
     sig_finished_unit = Signal(MeaImg_Unit)
+    sig_finished_registration = Signal(MeaImg_Unit, str)
     
     msg_all_finished = 'Image capture complete'
     msg_error = 'Error in ImageTiling_Worker: '
     msg_stopped = 'Image capture stopped by user'
+    msg_registered = 'Tile placement refined'
     
     def __init__(self, motion_controller:Wdg_MotionController, flg_stop:threading.Event,
                  getter_liveview:Callable[[], bool] = lambda: True):
@@ -115,6 +120,25 @@ class ImageProcessor_Worker(QObject):
         except Exception as e:
             print('Error in get_stitched_image:', e)
     
+    @Slot(MeaImg_Unit)
+    def register_tile_placement(self, imgUnit:MeaImg_Unit) -> None:
+        """
+        Refines the tile placement of the ImageUnit by registering its overlapping tiles
+        (see MeaImg_Unit.register_tile_placement), the offsets are stored in the unit
+        
+        Args:
+            imgUnit (MeaImg_Unit): Image unit to register
+        """
+        try:
+            result = imgUnit.register_tile_placement()
+            num_used = len(result.list_pairs)
+            if num_used == 0: raise ValueError('No overlapping tiles could be registered')
+            msg = (f'{self.msg_registered}: {num_used} of {result.num_pairs_overlap} overlapping tile pairs used '
+                   f'({result.num_pairs_rejected} rejected), RMS residual {result.rms_residual_pixel:.2f} pixel')
+        except Exception as e:
+            msg = self.msg_error + f'Tile registration failed: {e}'
+        self.sig_finished_registration.emit(imgUnit, msg)
+    
     @staticmethod
     def _fmt_elapsed(seconds: float) -> str:
         m, s = divmod(int(seconds), 60)
@@ -188,52 +212,76 @@ class ImageProcessor_Worker(QObject):
         totalcoor = len(meaCoor_mm.mapping_coordinates)
         self.flg_stop.clear()
 
-        self._motion_ctrl.pause_video()
-        self._motion_ctrl.wait_for_capture_drain()  # drain any in-flight capture before the loop
-        self._motion_ctrl.enter_tiling_mode()       # switch camera to single-frame SW trigger mode
-        for i,coor in enumerate(meaCoor_mm.mapping_coordinates):
-            x, y, z = coor
-            if self.flg_stop.is_set():
-                break
-
+        def report_progress(num_done:int, total:int) -> None:
             elapsed = time.time() - start_time
             self.sig_statbar_update.emit(
-                f'Unit {unit_idx}/{total_units} | Tile {i+1}/{totalcoor} | Elapsed: {self._fmt_elapsed(elapsed)}')
-
-            flg_mvmt_done = threading.Event()
-            self.sig_gotocoor.emit(coor, flg_mvmt_done)
-            flg_mvmt_done.wait()
-
-            self._motion_ctrl.get_img_ready_event().clear()
-            self.sig_req_img_capture.emit()
-
-            if not self._motion_ctrl.get_img_ready_event().wait(timeout=5.0):
-                print(f'Timeout waiting for image capture at coordinate {coor}')
-                continue
-
-            img, _ = self._motion_ctrl.get_latest_image_with_timestamp()
-            if not isinstance(img,Image.Image):
-                print('Error in _take_image: No image received from the controller')
-                continue
+                f'Unit {unit_idx}/{total_units} | Tile {num_done+1}/{total} | Elapsed: {self._fmt_elapsed(elapsed)}')
 
+        def process_tile(coor:tuple[float,float,float], img:Image.Image, timestamp:str) -> None:
+            # Runs in the pipeline thread, while the stage moves to the next tile
+            x, y, z = coor
             img = img.crop((cropx_pixel,cropy_pixel,shape[0]-cropx_pixel,shape[1]-cropy_pixel))
-
             imgUnit.add_measurement(
-                    timestamp=get_timestamp_us_str(),
-                    x_coor=x-cropx_mm,
-                    y_coor=y-cropy_mm,
-                    z_coor=z,
+                    timestamp=timestamp,
+                    x_coor=float(x-cropx_mm),
+                    y_coor=float(y-cropy_mm),
+                    z_coor=float(z),
                     image=img
                 )
-
-            if self._getter_liveview():
+            # Only restitch the live view once the pipeline has caught up with the acquisition
+            if self._getter_liveview() and pipeline.get_num_pending() == 0:
                 img = imgUnit.get_image_all_stitched(low_res=True)[0]
                 self.sig_ret_image_processed.emit(img)
 
-        self._motion_ctrl.exit_tiling_mode()        # restore continuous streaming
-        self._motion_ctrl.resume_video()
+        pipeline = TilingPipeline(
+            move=self._move_to_coor,
+            capture=self._capture_fresh_image,
+            process=process_tile,
+            flg_stop=self.flg_stop,
+        )
+
+        self._motion_ctrl.pause_video()
+        self._motion_ctrl.wait_for_capture_drain()  # drain any in-flight capture before the loop
+        self._motion_ctrl.enter_tiling_mode()       # switch camera to single-frame SW trigger mode
+        try:
+            num_captured = pipeline.run(meaCoor_mm.mapping_coordinates, serpentine=True,
+                                        callback_progress=report_progress)
+            if num_captured < totalcoor and not self.flg_stop.is_set():
+                print(f'_take_image: {totalcoor-num_captured} of {totalcoor} tile(s) not captured')
+        except Exception as e:
+            print('Error in _take_image:', e)
+            imgUnit = None
+        finally:
+            self._motion_ctrl.exit_tiling_mode()        # restore continuous streaming
+            self._motion_ctrl.resume_video()
         return imgUnit
 
+    def _move_to_coor(self, coor:tuple[float,float,float]) -> None:
+        """
+        Moves the stage to the coordinates and waits for it to settle (see Motion_GoToCoor_Worker)
+
+        Args:
+            coor (tuple[float,float,float]): Target coordinates (x,y,z) [mm]
+        """
+        flg_mvmt_done = threading.Event()
+        self.sig_gotocoor.emit(coor, flg_mvmt_done)
+        flg_mvmt_done.wait()
+
+    def _capture_fresh_image(self) -> Image.Image|None:
+        """
+        Triggers the capture of a fresh image and waits for it
+
+        Returns:
+            Image.Image|None: Captured image, None on a timeout
+        """
+        self._motion_ctrl.get_img_ready_event().clear()
+        self.sig_req_img_capture.emit()
+        if not self._motion_ctrl.get_img_ready_event().wait(timeout=5.0):
+            print('Timeout waiting for image capture')
+            return None
+        img, _ = self._motion_ctrl.get_latest_image_with_timestamp()
+        return img
+
 class Wdg_HiLvlTiling(qw.QWidget):
     """
     A high level controller to take images, tile them into a single image, and save them 
@@ -244,6 +292,7 @@ class Wdg_HiLvlTiling(qw.QWidget):
     sig_update_combobox = Signal()
     
     sig_capture_list_img = Signal(list, list, ImageTiling_Params)
+    sig_req_register_tiles = Signal(MeaImg_Unit)
     
     
     def __init__(
@@ -298,6 +347,24 @@ class Wdg_HiLvlTiling(qw.QWidget):
             size_pixel=AppPlotEnum.IMGCAL_IMG_SIZE.value,
             )
         wdg.lyt_holder_img.addWidget(self._canvas_img)
+        self._btn_viewer = qw.QPushButton('Open in the zoomable viewer', wdg)
+        self._btn_viewer.clicked.connect(self._open_mosaic_viewer)
+        wdg.lyt_holder_img.addWidget(self._btn_viewer)
+        self._btn_register = qw.QPushButton('Refine the tile placement (register the overlaps)', wdg)
+        self._btn_register.setToolTip('Corrects the stage positioning errors by aligning the overlapping images.\n'
+                                      'The refined placement is used for the stitching and saved with the image.')
+        self._btn_register.clicked.connect(self._register_tile_placement)
+        wdg.lyt_holder_img.addWidget(self._btn_register)
+        self._chk_blend = qw.QCheckBox('Blend the seams and equalise the illumination', wdg)
+        self._chk_blend.setToolTip('Feathers the image overlaps and compensates the exposure differences between the images')
+        self._chk_blend_ff = qw.QCheckBox('Correct the vignetting with the camera flatfield reference', wdg)
+        self._chk_blend_ff.setToolTip('For images captured without the flatfield correction')
+        self._chk_blend_ff.setEnabled(False)
+        self._chk_blend.toggled.connect(self._chk_blend_ff.setEnabled)
+        self._chk_blend.toggled.connect(lambda _: self._plot_imgunit_combobox())
+        self._chk_blend_ff.toggled.connect(lambda _: self._plot_imgunit_combobox())
+        wdg.lyt_holder_img.addWidget(self._chk_blend)
+        wdg.lyt_holder_img.addWidget(self._chk_blend_ff)
         self._chk_lres = wdg.chk_lres
         self._chk_liveview = wdg.chk_liveView
         self._chk_lres.toggled.connect(lambda _: self._plot_imgunit_combobox())
@@ -353,6 +420,8 @@ class Wdg_HiLvlTiling(qw.QWidget):
         self._worker.sig_ret_image_processed.connect(self._canvas_img.set_image)
         self._worker.sig_statbar_update.connect(self._lbl_statusbar.setText)
         self.sig_req_plot_imgunit.connect(self._worker.get_stitched_image)
+        self.sig_req_register_tiles.connect(self._worker.register_tile_placement)
+        self._worker.sig_finished_registration.connect(self._handle_registration_finished)
 
         # Other signal/connection setups
         self._dataHub_img.get_ImageMeasurement_Hub().add_observer(self.sig_update_combobox.emit)
@@ -376,12 +445,77 @@ class Wdg_HiLvlTiling(qw.QWidget):
             if not(imgUnit.check_measurement_exist() and imgUnit.check_calibration_exist()):
                 raise ValueError('No image or calibration found')
             
+            self._apply_blending(imgUnit)
             self.sig_req_plot_imgunit.emit(imgUnit, self._chk_lres.isChecked())
         except Exception as e:
             qw.QMessageBox.warning(self,'Error in _plot_imgunit',str(e))
         finally:
             self._combo_imgunits.setEnabled(True)
         
+    def _apply_blending(self, imgUnit:MeaImg_Unit):
+        """
+        Sets the seam blending of the ImageUnit according to the checkboxes, with the camera flatfield
+        correction reference if requested and matching the images
+        
+        Args:
+            imgUnit (MeaImg_Unit): ImageUnit to set
+        """
+        if not self._chk_blend.isChecked(): imgUnit.set_stitch_blending(None); return
+        
+        flatfield = None
+        if self._chk_blend_ff.isChecked():
+            try:
+                flatfield = self._stageHub.get_flatfield_reference()
+                size = imgUnit.get_dict_measurement()['image'][0].size
+                if flatfield is not None and flatfield.shape[:2] != (size[1],size[0]): flatfield = None
+            except Exception as e: print('Error getting the flatfield reference:', e)
+        imgUnit.set_stitch_blending(MosaicBlending_Params(flatfield=flatfield))
+        
+    def _open_mosaic_viewer(self):
+        """
+        Opens the ImageUnit selected in the combobox in the zoomable (tile pyramid) viewer
+        """
+        try:
+            imgUnit = self._get_selected_ImageUnit()
+            if not isinstance(imgUnit,MeaImg_Unit): raise ValueError('No ImageUnit found')
+            if not imgUnit.check_readyForProcessing(): raise ValueError('No image or calibration found')
+            Dlg_MosaicViewer(self, imgUnit).show()
+        except Exception as e:
+            qw.QMessageBox.warning(self,'Error in _open_mosaic_viewer',str(e))
+        
+    def _register_tile_placement(self):
+        """
+        Refines the tile placement of the ImageUnit selected in the combobox, in the worker thread
+        """
+        try:
+            imgUnit = self._get_selected_ImageUnit()
+            if not isinstance(imgUnit,MeaImg_Unit): raise ValueError('No ImageUnit found')
+            if not imgUnit.check_readyForProcessing(): raise ValueError('No image or calibration found')
+            if imgUnit.get_numMeasurements() < 2: raise ValueError('At least 2 images are required')
+        except Exception as e:
+            qw.QMessageBox.warning(self,'Error in _register_tile_placement',str(e))
+            return
+        self._btn_register.setEnabled(False)
+        self._lbl_statusbar.setText('Registering the tile overlaps...')
+        self.sig_req_register_tiles.emit(imgUnit)
+        
+    @Slot(MeaImg_Unit, str)
+    def _handle_registration_finished(self, imgUnit:MeaImg_Unit, msg:str):
+        """
+        Reports the refinement of the tile placement and replots the refined ImageUnit
+        
+        Args:
+            imgUnit (MeaImg_Unit): The registered ImageUnit
+            msg (str): Message to display
+        """
+        self._btn_register.setEnabled(True)
+        self._lbl_statusbar.setText(msg)
+        if msg.startswith(self._worker.msg_error):
+            qw.QMessageBox.warning(self,'Tile registration',msg)
+            return
+        qw.QMessageBox.information(self,'Tile registration',msg)
+        if self._combo_imgunits.currentText() == imgUnit.get_IdName()[1]: self._plot_imgunit_combobox()
+        
     def _update_combobox(self):
         """
         Update the combobox with the ImageUnits stored in the ImageHub
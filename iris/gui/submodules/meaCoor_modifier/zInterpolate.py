@@ -18,6 +18,7 @@ if __name__ == '__main__':
     sys.path.insert(0, os.path.dirname(libdir))
 
 from iris.data.measurement_coordinates import MeaCoor_mm, List_MeaCoor_Hub
+from iris.data.focus_surface import fit_focus_surface
 
 from iris.utils.general import messagebox_request_input
 
@@ -27,6 +28,16 @@ class Option_InterpolationMethod(Enum):
     LINEAR = 'linear'
     NEAREST = 'nearest'
     CUBIC = 'cubic'
+    PLANE = 'tilted plane'
+    POLYNOMIAL = 'polynomial (RANSAC)'
+    TPS = 'thin-plate spline'
+
+# Interpolation methods using a fitted focus surface (defined outside the convex hull of the references)
+dict_focus_surface_methods = {
+    Option_InterpolationMethod.PLANE: 'plane',
+    Option_InterpolationMethod.POLYNOMIAL: 'polynomial',
+    Option_InterpolationMethod.TPS: 'tps',
+}
 
 class Interpolator_Worker(QObject):
     sig_finished = Signal(str)
@@ -38,11 +49,14 @@ class Interpolator_Worker(QObject):
     
     def __init__(self):
         super().__init__()
+        self._fit_report = ''   # Residuals and cross-validated error of the last focus surface fit
         
     def _interpolate_z_values(self,list_coor:list,list_ref:list,method:Option_InterpolationMethod,
                               skip_nan:bool=True) -> list[tuple[float, float, float]]:
         """
         Interpolates the z-values of the given coordinates based on the reference coordinates.
+        The focus surface methods (see dict_focus_surface_methods) also extrapolate outside the
+        reference range and are robust to outlier references (polynomial).
         
         Args:
             list_coor (list): List of coordinates to interpolate, each coordinate is a list of [X, Y].
@@ -57,14 +71,23 @@ class Interpolator_Worker(QObject):
         values = np.array(list_ref)[:, 2]   # Z values from list_ref
         xi = np.array(list_coor)[:, :2]     # X, Y coordinates for which to interpolate
         
-        interpolated_z = griddata(points, values, xi, method=method.value)
+        self._fit_report = ''
+        if method in dict_focus_surface_methods:
+            surface = fit_focus_surface(np.column_stack([points, values]), dict_focus_surface_methods[method])
+            interpolated_z = surface.evaluate(xi)
+            num_outliers = int(np.sum(~surface.get_inlier_mask()))
+            self._fit_report = (f'Focus surface RMS residual: {surface.get_rms_residual()*1e3:.2f} µm, '
+                                f'cross-validated error: {surface.cross_validate()*1e3:.2f} µm, '
+                                f'rejected references: {num_outliers}')
+        else:
+            interpolated_z = griddata(points, values, xi, method=method.value)
         
         list_coor_interpolated = []
         for i in range(len(list_coor)):
             if np.isnan(interpolated_z[i]) and skip_nan:
                 print(f"Warning: Interpolated z-value for {list_coor[i]} is NaN, skipping.")
                 continue
-            list_coor_interpolated.append((list_coor[i][0], list_coor[i][1], interpolated_z[i]))
+            list_coor_interpolated.append((list_coor[i][0], list_coor[i][1], float(interpolated_z[i])))
             
         return list_coor_interpolated
     
@@ -83,13 +106,16 @@ class Interpolator_Worker(QObject):
         list_coor_tgt = meaCoorTarget.mapping_coordinates.copy()
         list_coor_ref = meaCoorRef.mapping_coordinates.copy()
         
-        # try:
-        list_coor_interp = self._interpolate_z_values(
-            list_coor=list_coor_tgt,
-            list_ref=list_coor_ref,
-            method=method,
-            skip_nan=True
-        )
+        try:
+            list_coor_interp = self._interpolate_z_values(
+                list_coor=list_coor_tgt,
+                list_ref=list_coor_ref,
+                method=method,
+                skip_nan=True
+            )
+        except ValueError as e:
+            self.sig_finished.emit(self.msg_error + str(e))
+            return
         
         modified_coor = MeaCoor_mm(meaCoorTarget.mappingUnit_name + "_zInterpolated", list_coor_interp)
         
@@ -101,7 +127,7 @@ class Interpolator_Worker(QObject):
                                    "Only the valid coordinates have been modified.")
             self.sig_saveModification.emit(modified_coor)
         else:
-            self.sig_finished.emit(self.msg_success)
+            self.sig_finished.emit(self.msg_success + ('\n' + self._fit_report if self._fit_report else ''))
             self.sig_saveModification.emit(modified_coor)
 
 class ZInterpolate(Ui_zInterpolate, qw.QWidget):
@@ -112,7 +138,9 @@ class ZInterpolate(Ui_zInterpolate, qw.QWidget):
         "Instructions:\n"
         "1. Select the mapping coordinates unit you want to modify from the 'Select the mapping coordinates to modify' dropdown.\n"
         "2. Select the reference mapping coordinates unit from the 'Select the mapping coordinates reference' dropdown.\n"
-        "3. Choose the interpolation method (linear, nearest, or cubic) from the 'Interpolation method' dropdown.\n"
+        "3. Choose the interpolation method (linear, nearest, cubic, or a fitted focus surface: tilted plane, "
+        "polynomial with outlier rejection, or thin-plate spline) from the 'Interpolation method' dropdown. "
+        "The fitted surfaces also extrapolate outside the reference range.\n"
         "4. Click the 'Modify Z-coordinates' button to perform the interpolation and modify the z-coordinates.\n"
         "5. You will be prompted to enter a new name for the modified mapping coordinates unit. Enter a unique name and click OK.\n"
         "6. The modified mapping coordinates unit will be added to the hub with the new name.\n\n"
@@ -0,0 +1,292 @@
+"""
+A zoomable viewer of large image mosaics, showing the tiles of a MosaicPyramid.
+
+Only the tiles visible at the current zoom level are requested, from a background worker, and
+only those (plus the coarsest level as a backdrop) are kept in the scene. The disk cache of a pyramid
+created by the viewer is deleted when it is replaced or the viewer is released (closed).
+"""
+import sys
+import os
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import PySide6.QtWidgets as qw
+from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsPixmapItem
+from PySide6.QtGui import QPixmap, QPainter, QWheelEvent
+from PySide6.QtCore import Signal, Slot, QObject, QThread, QTimer, QSize, Qt
+from PIL import Image, ImageQt
+
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_pyramid import MosaicPyramid
+
+VIEWER_ZOOM_STEP = 1.25         # Zoom factor per mouse wheel step
+VIEWER_MAX_ZOOM = 8.0           # Maximum zoom [screen pixel per full resolution pixel]
+VIEWER_UPDATE_DELAY_MS = 30     # Delay of the tile update after a view change (debounce)
+
+
+class PyramidTile_Worker(QObject):
+    """
+    Worker loading the pyramid tiles in a separate thread
+    """
+    sig_tile_ready = Signal(int, int, int, Image.Image)   # level, col, row, tile
+
+    def __init__(self):
+        super().__init__()
+        self._latest_request:int = 0
+
+    def set_latest_request(self, request_id:int) -> None:
+        """
+        Sets the latest request ID, the tiles of the older requests not loaded yet are dropped
+
+        Args:
+            request_id (int): Latest request ID
+        """
+        self._latest_request = request_id
+
+    @Slot(object, list, int)
+    def load_tiles(self, pyramid:MosaicPyramid, list_tiles:list, request_id:int) -> None:
+        """
+        Loads the tiles and emits them one by one
+
+        Args:
+            pyramid (MosaicPyramid): Pyramid to load the tiles from
+            list_tiles (list[tuple[int,int,int]]): Tiles (level,col,row) to load
+            request_id (int): ID of the request
+        """
+        for level, col, row in list_tiles:
+            if request_id != self._latest_request: return
+            try: tile = pyramid.get_tile(level, col, row)
+            except Exception as e:
+                print('Error in PyramidTile_Worker.load_tiles:', e)
+                continue
+            self.sig_tile_ready.emit(level, col, row, tile)
+
+    @Slot(object)
+    def release_pyramid(self, pyramid:MosaicPyramid) -> None:
+        """
+        Clears the memory and disk caches of a pyramid no longer displayed. Run in the worker
+        thread, after the pending tile requests, so no tile is being written meanwhile
+
+        Args:
+            pyramid (MosaicPyramid): Pyramid to release
+        """
+        try: pyramid.clear_cache(disk=True)
+        except Exception as e: print('Error in PyramidTile_Worker.release_pyramid:', e)
+
+
+class Wdg_MosaicViewer(QGraphicsView):
+    """
+    Zoomable (mouse wheel) and pannable (drag) view of an image mosaic
+    """
+    sig_req_tiles = Signal(object, list, int)
+    sig_req_release = Signal(object)
+
+    def __init__(self, parent:qw.QWidget|None=None):
+        super().__init__(parent)
+        self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        self._scene = QGraphicsScene(self)
+        self.setScene(self._scene)
+        self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+        self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+        self.setSizePolicy(qw.QSizePolicy.Policy.Expanding, qw.QSizePolicy.Policy.Expanding)
+        self.setMinimumSize(QSize(200, 200))
+
+        self._pyramid:MosaicPyramid|None = None
+        self._flg_owned = False     # Whether the pyramid was created by the viewer (its disk cache is deleted)
+        self._flg_released = False
+        self._dict_items:dict[tuple[int,int,int],QGraphicsPixmapItem] = {}
+        self._set_wanted:set[tuple[int,int,int]] = set()
+        self._request_id = 0
+
+        self._timer_update = QTimer(self)
+        self._timer_update.setSingleShot(True)
+        self._timer_update.setInterval(VIEWER_UPDATE_DELAY_MS)
+        self._timer_update.timeout.connect(self._update_tiles)
+
+    # >>> Worker setup <<<
+        self._thread = QThread()
+        self._worker = PyramidTile_Worker()
+        self._worker.moveToThread(self._thread)
+        self._thread.start()
+        self.destroyed.connect(self._thread.quit)
+        self._thread.finished.connect(self._thread.deleteLater)
+        self._thread.finished.connect(self._worker.deleteLater)
+
+        self.sig_req_tiles.connect(self._worker.load_tiles)
+        self.sig_req_release.connect(self._worker.release_pyramid)
+        self._worker.sig_tile_ready.connect(self._add_tile)
+
+    def set_pyramid(self, pyramid:MosaicPyramid, owned:bool=False) -> None:
+        """
+        Sets the pyramid to display, fitted in the view
+
+        Args:
+            pyramid (MosaicPyramid): Pyramid to display
+            owned (bool): Deletes the disk cache of the pyramid when it is replaced or the viewer
+                is released. Default is False
+        """
+        assert isinstance(pyramid, MosaicPyramid), 'Pyramid must be a MosaicPyramid object'
+        assert not self._flg_released, 'Viewer has been released'
+        if pyramid is not self._pyramid: self._drop_pyramid()
+        self._pyramid = pyramid
+        self._flg_owned = owned
+        for item in self._dict_items.values(): self._scene.removeItem(item)
+        self._dict_items.clear()
+        self._set_wanted.clear()
+
+        wid, hei = pyramid.get_image_size()
+        self._scene.setSceneRect(0, 0, wid, hei)
+        self.fitInView(self._scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        self._timer_update.start()
+
+    def set_imageunit(self, unit:MeaImg_Unit) -> None:
+        """
+        Displays an image unit, with a new pyramid
+
+        Args:
+            unit (MeaImg_Unit): Image unit to display
+        """
+        self.set_pyramid(MosaicPyramid(unit), owned=True)
+
+    def _drop_pyramid(self) -> None:
+        """
+        Cancels the pending tile requests and, if owned, queues the release of the current pyramid
+        in the worker thread
+        """
+        self._request_id += 1
+        self._worker.set_latest_request(self._request_id)
+        if self._pyramid is not None and self._flg_owned: self.sig_req_release.emit(self._pyramid)
+        self._pyramid = None
+        self._flg_owned = False
+
+    def release(self) -> None:
+        """
+        Stops the worker and deletes the disk cache of the pyramid if owned. The viewer cannot
+        display anything afterwards. Calling it again has no effect
+        """
+        if self._flg_released: return
+        self._flg_released = True
+        self._timer_update.stop()
+        self._request_id += 1
+        self._worker.set_latest_request(self._request_id)
+        self._thread.quit()
+        self._thread.wait()
+        # Worker stopped (and deleted): the cache is deleted here
+        if self._pyramid is not None and self._flg_owned:
+            try: self._pyramid.clear_cache(disk=True)
+            except Exception as e: print('Error in Wdg_MosaicViewer.release:', e)
+        self._pyramid = None
+        self._flg_owned = False
+
+    def get_num_items(self) -> int:
+        """Returns the number of tiles in the scene"""
+        return len(self._dict_items)
+
+    def wheelEvent(self, event:QWheelEvent) -> None:
+        if self._pyramid is None: return
+        factor = VIEWER_ZOOM_STEP if event.angleDelta().y() > 0 else 1/VIEWER_ZOOM_STEP
+        # Not zoomed out beyond the whole image nor in beyond the maximum zoom
+        rect = self._scene.sceneRect()
+        scale_min = min(self.viewport().width()/rect.width(), self.viewport().height()/rect.height())
+        scale = min(max(self.transform().m11()*factor, scale_min), VIEWER_MAX_ZOOM)
+        factor = scale/self.transform().m11()
+        self.scale(factor, factor)
+        self._timer_update.start()
+
+    def scrollContentsBy(self, dx:int, dy:int) -> None:
+        super().scrollContentsBy(dx, dy)
+        self._timer_update.start()
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        self._timer_update.start()
+
+    @Slot()
+    def _update_tiles(self) -> None:
+        """
+        Requests the tiles visible at the current zoom level and removes the others, except for
+        the coarsest level kept as a backdrop
+        """
+        if self._pyramid is None: return
+        pyramid = self._pyramid
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        level = pyramid.select_level(self.transform().m11())
+        top = pyramid.get_num_levels() - 1
+
+        set_wanted = set(pyramid.get_visible_tiles(level, (rect.left(), rect.top(), rect.right(), rect.bottom())))
+        set_wanted.update(pyramid.get_visible_tiles(top, (0, 0, *pyramid.get_image_size())))
+        for key in [key for key in self._dict_items if key not in set_wanted]:
+            self._scene.removeItem(self._dict_items.pop(key))
+        self._set_wanted = set_wanted
+
+        # Backdrop first, then the visible tiles
+        list_missing = sorted([key for key in set_wanted if key not in self._dict_items], key=lambda key: -key[0])
+        if not list_missing: return
+        self._request_id += 1
+        self._worker.set_latest_request(self._request_id)
+        self.sig_req_tiles.emit(pyramid, list_missing, self._request_id)
+
+    @Slot(int, int, int, Image.Image)
+    def _add_tile(self, level:int, col:int, row:int, tile:Image.Image) -> None:
+        """
+        Adds a loaded tile to the scene, if still visible
+
+        Args:
+            level (int): Pyramid level
+            col (int): Tile column
+            row (int): Tile row
+            tile (Image.Image): Tile
+        """
+        key = (level, col, row)
+        if self._pyramid is None or key not in self._set_wanted or key in self._dict_items: return
+
+        span = self._pyramid.get_tile_size()*2**level
+        item = QGraphicsPixmapItem(QPixmap.fromImage(ImageQt.ImageQt(tile)))
+        item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+        item.setPos(col*span, row*span)
+        item.setScale(2**level)
+        item.setZValue(-level)  # Finer levels on top
+        self._scene.addItem(item)
+        self._dict_items[key] = item
+
+
+class Dlg_MosaicViewer(qw.QDialog):
+    """
+    Dialog window with a mosaic viewer of an image unit
+    """
+    def __init__(self, parent:qw.QWidget|None, unit:MeaImg_Unit):
+        super().__init__(parent)
+        self.setWindowTitle(f'Mosaic viewer - {unit.get_IdName()[1]}')
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.resize(800, 600)
+
+        lyt = qw.QVBoxLayout(self)
+        self._viewer = Wdg_MosaicViewer(self)
+        lyt.addWidget(self._viewer)
+        lyt.addWidget(qw.QLabel('Scroll to zoom, drag to pan', self))
+        self.setLayout(lyt)
+
+        self._viewer.set_imageunit(unit)
+        self.finished.connect(self._viewer.release)
+
+    def closeEvent(self, event) -> None:
+        self._viewer.release()
+        super().closeEvent(event)
+
+
+def test():
+    app = qw.QApplication()
+    unit = MeaImg_Unit(reconstruct=True)
+    from iris.data.calibration_objective import ImgMea_Cal
+    cal = ImgMea_Cal('test cal')
+    cal.generate_dummy_params()
+    unit.set_calibration_ImageMeasurement_Calibration(cal)
+    unit.test_generate_dummy()
+    dlg = Dlg_MosaicViewer(None, unit)
+    dlg.show()
+    sys.exit(app.exec())
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,267 @@
+"""
+Low-overhead rendering of the live video feed overlays (scalebar, crosshair).
+
+- The overlays are static for a given frame size and image calibration: they are drawn once into
+    cached transparent layers (one per overlay component, cropped to its bounding box) and
+    composited onto every frame with a QPainter, instead of being drawn onto every frame
+- The frames are wrapped into QImages without copying (convert_array_to_qimage), the painter
+    draws directly into the frame array
+- The display drops frames while the GUI thread has not displayed the previous one yet
+    (VideoFrame_Governor), so that a slow GUI thread never accumulates stale frames, and measures
+    the displayed frame rate
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from PySide6.QtGui import QImage, QPainter
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.controllers import ControllerConfigEnum
+
+CROSSHAIR_COLOUR = (255, 0, 0)  # Colour of the crosshair (R,G,B)
+CROSSHAIR_WIDTH = 3             # Line width of the crosshair [pixel]
+VIDEO_FPS_WINDOW_SEC = 2.0      # Time window of the displayed frame rate measurement [s]
+
+
+def convert_array_to_qimage(arr:np.ndarray) -> QImage:
+    """
+    Wraps an image array into a QImage without copying. The array must outlive the QImage, and
+    painting on the QImage modifies the array.
+
+    Args:
+        arr (np.ndarray): Image array (height,width,3) RGB, (height,width,4) RGBA or (height,width)
+            grayscale of uint8, with contiguous rows
+
+    Returns:
+        QImage: Image sharing the array's memory
+    """
+    assert isinstance(arr, np.ndarray) and arr.dtype == np.uint8, 'The image array must be a uint8 numpy array'
+    if arr.ndim == 2: fmt, channels = QImage.Format.Format_Grayscale8, 1
+    elif arr.ndim == 3 and arr.shape[2] == 3: fmt, channels = QImage.Format.Format_RGB888, 3
+    elif arr.ndim == 3 and arr.shape[2] == 4: fmt, channels = QImage.Format.Format_RGBA8888, 4
+    else: raise ValueError(f'Unsupported image array shape: {arr.shape}')
+    assert arr.strides[-1] == 1 and (arr.ndim == 2 or arr.strides[1] == channels),\
+        'The image array rows must be contiguous'
+    height, width = arr.shape[:2]
+    return QImage(arr.data, width, height, arr.strides[0], fmt)
+
+def draw_scalebar(img:Image.Image, scale_x_pixelPerMm:float, font:str|None=None) -> Image.Image:
+    """
+    Draws a scalebar at the bottom right of the image, in place
+
+    Args:
+        img (Image.Image): The image to draw the scalebar on
+        scale_x_pixelPerMm (float): Image scale in the x direction [pixel/mm]
+        font (str|None): Font file of the scalebar text. Default (None) is ControllerConfigEnum.SCALEBAR_FONT
+
+    Returns:
+        Image.Image: The image with the scalebar
+    """
+    scalex = 1/scale_x_pixelPerMm
+    scalebar_length = int(ControllerConfigEnum.SCALEBAR_LENGTH_RATIO.value * img.size[0]) # in pixel
+    scalebar_height = int(ControllerConfigEnum.SCALEBAR_HEIGHT_RATIO.value * img.size[1]) # in pixel
+
+    length_mm = scalebar_length * scalex
+    font = font if font is not None else ControllerConfigEnum.SCALEBAR_FONT.value
+    font_size = int(scalebar_length/10 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
+    line_width = int(scalebar_length/50 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
+
+    line_offset = scalebar_length/10
+
+    box_length = scalebar_length + 2*line_offset
+    box_height = scalebar_height + 2*line_offset
+
+    draw = ImageDraw.Draw(img)
+    # Draw a box around the scalebar, taking consideration of the font size height
+    draw.rectangle([(img.size[0]-box_length, img.size[1]-box_height),
+                    (img.size[0], img.size[1])], fill=(0,0,0))
+    draw.line([(img.size[0]-scalebar_length-line_offset, img.size[1]-line_offset),
+               (img.size[0]-line_offset, img.size[1]-line_offset)],
+              fill=(255,255,255), width=line_width)
+
+    try: text_params = {'text':'{:.0f} µm'.format(abs(length_mm*1e3)), 'font':ImageFont.truetype(font,font_size)}
+    except Exception: raise ValueError('Scalebar font file not found. Please check the font path in the configuration.')
+
+    text_length = draw.textlength(**text_params)
+
+    draw.text((img.size[0]-box_length/2-text_length/2, img.size[1]-line_offset*2-line_width-font_size/2),
+              align='left', fill=(255,255,255), **text_params)
+    return img
+
+def draw_crosshair_vertical(img:Image.Image) -> Image.Image:
+    """Draws the vertical line of the crosshair at the centre of the image, in place"""
+    width, height = img.size
+    ImageDraw.Draw(img).line([(width/2, 0), (width/2, height)], fill=CROSSHAIR_COLOUR, width=CROSSHAIR_WIDTH)
+    return img
+
+def draw_crosshair_horizontal(img:Image.Image) -> Image.Image:
+    """Draws the horizontal line of the crosshair at the centre of the image, in place"""
+    width, height = img.size
+    ImageDraw.Draw(img).line([(0, height/2), (width, height/2)], fill=CROSSHAIR_COLOUR, width=CROSSHAIR_WIDTH)
+    return img
+
+
+class VideoOverlay_Renderer():
+    """
+    Composites the scalebar and crosshair overlays onto the video frames from cached layers
+    """
+    def __init__(self, font:str|None=None):
+        """
+        Args:
+            font (str|None): Font file of the scalebar text. Default (None) is ControllerConfigEnum.SCALEBAR_FONT
+        """
+        self._font = font
+        self._layers_key:tuple|None = None
+        self._list_layers:list[tuple[int,int,QImage]] = []
+        self._num_layer_renders = 0
+
+    def get_num_layer_renders(self) -> int:
+        """Returns the number of times the overlay layers were drawn"""
+        return self._num_layer_renders
+
+    def _render_layers(self, size:tuple[int,int], list_draw:list[Callable[[Image.Image],Image.Image]])\
+        -> list[tuple[int,int,QImage]]:
+        """
+        Draws the overlay components into transparent layers cropped to their content
+
+        Args:
+            size (tuple[int,int]): Frame size (width,height) [pixel]
+            list_draw (list[Callable[[Image.Image],Image.Image]]): Functions drawing the components, in order
+
+        Returns:
+            list[tuple[int,int,QImage]]: Position (x,y) [pixel] and premultiplied ARGB image of the layers
+        """
+        list_layers = []
+        for draw in list_draw:
+            canvas = draw(Image.new('RGBA', size, (0,0,0,0)))
+            bbox = canvas.getchannel('A').getbbox()
+            if bbox is None: continue
+            arr = np.asarray(canvas.crop(bbox))
+            # Deep copy owned by the QImage, the array is released
+            layer = convert_array_to_qimage(arr).convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+            list_layers.append((bbox[0], bbox[1], layer))
+        self._num_layer_renders += 1
+        return list_layers
+
+    def _get_layers(self, size:tuple[int,int], cal:ImgMea_Cal|None, scalebar:bool, crosshair:bool)\
+        -> list[tuple[int,int,QImage]]:
+        """
+        Returns the overlay layers for the frame size and calibration, drawn only if they changed
+        """
+        scale = cal.scale_x_pixelPerMm if scalebar and isinstance(cal,ImgMea_Cal) and cal.check_calibration_set() else None
+        key = (size, scale, crosshair, self._font, ControllerConfigEnum.SCALEBAR_FONT.value)
+        if key != self._layers_key:
+            list_draw = []
+            if scale is not None: list_draw.append(lambda img: draw_scalebar(img, scale, self._font))
+            if crosshair: list_draw.extend([draw_crosshair_vertical, draw_crosshair_horizontal])
+            self._list_layers = self._render_layers(size, list_draw)
+            self._layers_key = key
+        return self._list_layers
+
+    def render(self, img:Image.Image, cal:ImgMea_Cal|None, scalebar:bool, crosshair:bool) -> tuple[np.ndarray,bool]:
+        """
+        Renders a frame with the overlays
+
+        Args:
+            img (Image.Image): Video frame
+            cal (ImgMea_Cal|None): Image calibration of the scalebar, no scalebar if None or not set
+            scalebar (bool): Whether to overlay the scalebar
+            crosshair (bool): Whether to overlay the crosshair
+
+        Returns:
+            tuple[np.ndarray,bool]: Frame (height,width,3) RGB with the overlays, True if overlays were
+                drawn (else the frame is a read-only view of the image)
+        """
+        assert isinstance(img, Image.Image), 'The video frame must be a PIL Image'
+        if img.mode != 'RGB': img = img.convert('RGB')
+        list_layers = self._get_layers(img.size, cal, scalebar, crosshair)
+        if len(list_layers) == 0: return np.asarray(img), False
+
+        frame = np.array(img)
+        qimage = convert_array_to_qimage(frame)
+        painter = QPainter(qimage)
+        try:
+            for x, y, layer in list_layers: painter.drawImage(x, y, layer)
+        finally:
+            painter.end()
+        return frame, True
+
+
+class VideoFrame_Governor():
+    """
+    Drops the frames to display while the previous frame is not displayed yet, and measures the
+    displayed frame rate. Thread-safe: the frames are offered from the worker thread and
+    acknowledged from the GUI thread.
+    """
+    def __init__(self, window_sec:float=VIDEO_FPS_WINDOW_SEC):
+        """
+        Args:
+            window_sec (float): Time window of the frame rate measurement [s]. Default is VIDEO_FPS_WINDOW_SEC
+        """
+        assert window_sec > 0, 'The frame rate time window must be positive'
+        self._window_sec = window_sec
+        self._lock = threading.Lock()
+        self._flg_pending = False
+        self._num_dropped = 0
+        self._times_displayed:deque[float] = deque()
+
+    def request_display(self) -> bool:
+        """
+        Requests the display of a new frame
+
+        Returns:
+            bool: True if the frame is to be displayed (the display must then be acknowledged with
+                notify_displayed), False if it is dropped
+        """
+        with self._lock:
+            if self._flg_pending:
+                self._num_dropped += 1
+                return False
+            self._flg_pending = True
+            return True
+
+    def notify_displayed(self) -> None:
+        """
+        Acknowledges the display of the requested frame (also if the display failed)
+        """
+        now = time.perf_counter()
+        with self._lock:
+            self._flg_pending = False
+            self._times_displayed.append(now)
+            while self._times_displayed and now - self._times_displayed[0] > self._window_sec:
+                self._times_displayed.popleft()
+
+    def get_fps(self) -> float:
+        """
+        Returns the displayed frame rate over the time window
+
+        Returns:
+            float: Frame rate [Hz], 0 if fewer than 2 frames were displayed in the window
+        """
+        now = time.perf_counter()
+        with self._lock:
+            times = [t for t in self._times_displayed if now - t <= self._window_sec]
+        if len(times) < 2 or times[-1] <= times[0]: return 0.0
+        return (len(times) - 1)/(times[-1] - times[0])
+
+    def get_num_dropped(self) -> int:
+        """Returns the number of frames dropped"""
+        with self._lock: return self._num_dropped
+
+    def reset(self) -> None:
+        """Resets the pending display, the dropped frame count and the frame rate measurement"""
+        with self._lock:
+            self._flg_pending = False
+            self._num_dropped = 0
+            self._times_displayed.clear()
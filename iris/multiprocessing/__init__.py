@@ -1,5 +1,7 @@
 import os
 from enum import Enum
+from dataclasses import dataclass
+from typing import ClassVar
 
 # Camera controller imports
 if __name__ == '__main__':
@@ -8,39 +10,50 @@ if __name__ == '__main__':
     sys.path.append(os.path.dirname(SCRIPT_DIR))
 
 
-from iris.utils.general import read_update_config_file_section
+from iris.utils.config_schema import Class_ConfigSection, config_field, config_registry
 
-dict_mpHub_default = {
+@dataclass(frozen=True)
+class MPMeaHub_Config(Class_ConfigSection):
+    """
+    Typed parameters of the stage and Raman measurement hubs. The request interval and the time
+    offset of the stage hub can be reloaded while the hubs are running.
+    """
+    SECTION: ClassVar[str] = 'STAGE AND RAMAN MEASUREMENT HUB PARAMETERS'
     # > Maximum storage <
-    'stagehub_maxstorage': 500,   # Maximum number of measurements stored in the stage measurement hub. Default: 500
-    'ramanhub_maxstorage': 500,   # Maximum number of measurements stored in the Raman measurement hub. Default: 500
+    stagehub_maxstorage: int = config_field(500, 'Maximum number of measurements stored in the stage measurement hub',
+                                            min_value=2, max_value=1_000_000)
+    ramanhub_maxstorage: int = config_field(500, 'Maximum number of measurements stored in the Raman measurement hub',
+                                            min_value=1, max_value=1_000_000)
     # > Sampling interval and time offset between the stage and the stage measurement hub <
-    'stagehub_maxinterval': 100,      # Maximum interval for between stage coordinate reportings in [ms]. Default: 100
-    'stagehub_request_interval': 20,  # Interval for the stage measurement hub to request the stage position in [ms]. Default: 20
-    'stagehub_time_offset_ms': 75,    # Time offset for the stage measurement hub in [ms] between the get_coordinate() request
-}
+    stagehub_maxinterval: int = config_field(100, 'Maximum interval for between stage coordinate reportings',
+                                             unit='ms', min_value=1, max_value=10_000)
+    stagehub_request_interval: int = config_field(20, 'Interval for the stage measurement hub to request the stage position',
+                                                  unit='ms', min_value=1, max_value=10_000, reloadable=True)
+    stagehub_time_offset_ms: float = config_field(75.0, 'Time offset for the stage measurement hub between the get_coordinate() request '
+                                                  'and the retrieved coordinate', unit='ms', min_value=-10_000, max_value=10_000, reloadable=True)
+    # > Burst acquisition of the Raman measurement hub <
+    ramanhub_batch_maxframes: int = config_field(16, 'Maximum number of spectra per burst (measure_spectrum_batch). Set to 1 to disable',
+                                                 min_value=1, max_value=10_000)
+    ramanhub_batch_maxlatency_ms: int = config_field(100, 'Maximum duration of a burst, limits the delay before the spectra are available',
+                                                     unit='ms', min_value=1, max_value=60_000)
+    # > Video recording of the stage camera <
+    stagecam_rec_buffer_frames: int = config_field(64, 'Maximum number of recorded frames waiting to be written, the oldest are dropped when full',
+                                                   min_value=1, max_value=10_000)
+    stagecam_rec_chunk_frames: int = config_field(32, 'Number of frames per recording file (chunk)', min_value=1, max_value=10_000)
+    stagecam_rec_format: str = config_field('npz', 'Recording file format: lossless frame chunks (npz) or lossless OpenCV video (ffv1)',
+                                            choices=('npz','ffv1'))
 
-dict_mpHub_comments = {
-    # > Maximum storage <
-    'stagehub_maxstorage': 'Maximum number of measurements stored in the stage measurement hub. Default: 500',
-    'ramanhub_maxstorage': 'Maximum number of measurements stored in the Raman measurement hub. Default: 500',
-    # > Sampling interval and time offset between the stage and the stage measurement hub <
-    'stagehub_maxinterval': 'Maximum interval for between stage coordinate reportings in [ms]. Default: 100',
-    'stagehub_request_interval': 'Interval for the stage measurement hub to request the stage position in [ms]. Default: 20',
-    'stagehub_time_offset_ms': 'Time offset for the stage measurement hub in [ms] between the get_coordinate() request'
-                               'and the retrieved coordinate, default: 75',
-}
-
-dict_mpHub_read = read_update_config_file_section(
-    dict_controllers_default=dict_mpHub_default,
-    dict_controllers_comments=dict_mpHub_comments,
-    section='STAGE AND RAMAN MEASUREMENT HUB PARAMETERS',
-)
+mpHub_config:MPMeaHub_Config = config_registry.register(MPMeaHub_Config)
 
 # >>> Enum setup <<<
-class MPMeaHubEnum(Enum):   # Short for Multiprocessing Measurement Hub Enum
-    STAGEHUB_MAXSTORAGE = dict_mpHub_read['stagehub_maxstorage']
-    RAMANHUB_MAXSTORAGE = dict_mpHub_read['ramanhub_maxstorage']
-    STAGEHUB_MAXINTERVAL = dict_mpHub_read['stagehub_maxinterval']
-    STAGEHUB_REQUEST_INTERVAL = dict_mpHub_read['stagehub_request_interval']
-    STAGEHUB_TIME_OFFSET_MS = dict_mpHub_read['stagehub_time_offset_ms']
\ No newline at end of file
+class MPMeaHubEnum(Enum):   # Short for Multiprocessing Measurement Hub Enum. Values at startup, see config_registry for the reloaded ones
+    STAGEHUB_MAXSTORAGE = mpHub_config.stagehub_maxstorage
+    RAMANHUB_MAXSTORAGE = mpHub_config.ramanhub_maxstorage
+    STAGEHUB_MAXINTERVAL = mpHub_config.stagehub_maxinterval
+    STAGEHUB_REQUEST_INTERVAL = mpHub_config.stagehub_request_interval
+    STAGEHUB_TIME_OFFSET_MS = mpHub_config.stagehub_time_offset_ms
+    RAMANHUB_BATCH_MAXFRAMES = mpHub_config.ramanhub_batch_maxframes
+    RAMANHUB_BATCH_MAXLATENCY_MS = mpHub_config.ramanhub_batch_maxlatency_ms
+    STAGECAM_REC_BUFFER_FRAMES = mpHub_config.stagecam_rec_buffer_frames
+    STAGECAM_REC_CHUNK_FRAMES = mpHub_config.stagecam_rec_chunk_frames
+    STAGECAM_REC_FORMAT = mpHub_config.stagecam_rec_format
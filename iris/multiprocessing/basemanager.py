@@ -5,6 +5,7 @@ class MyManager(SyncManager):
 
 class StageNamespace(Namespace):
     stage_offset_ms = 0.0
+    stage_request_interval_ms = 20
 
 def get_my_manager() -> SyncManager:
     manager = MyManager()
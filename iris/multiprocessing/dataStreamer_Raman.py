@@ -41,6 +41,7 @@ import multiprocessing.connection as mpc
 import threading
 import time
 
+import numpy as np
 import pandas as pd
 
 if __name__ == '__main__':
@@ -51,10 +52,12 @@ if __name__ == '__main__':
 
 
 from iris.utils.general import convert_timestamp_us_int_to_str, get_timestamp_us_int
+from iris.utils.tracing import trace_span
 from iris.calibration.calibration_generator import SpectrometerCalibrator, Wdg_SpectrometerCalibrationGenerator
 from iris.multiprocessing.basemanager import MyManager,get_my_manager, SyncManager
 
 from iris.controllers import Controller_Spectrometer
+from iris import DataAnalysisConfigEnum
 
 from iris.multiprocessing import MPMeaHubEnum
 
@@ -133,6 +136,12 @@ class DataStreamer_Raman(mp.Process):
         
         self._pause_interval_measurement = 10   # The pause interval the continuous measurement [ms] (if the pause flag is raised)
         
+        # Burst acquisition (controller.measure_spectrum_batch), falls back to measure_spectrum if not supported
+        self._batch_maxframes = int(MPMeaHubEnum.RAMANHUB_BATCH_MAXFRAMES.value)
+        self._batch_maxlatency_us = int(MPMeaHubEnum.RAMANHUB_BATCH_MAXLATENCY_MS.value*1e3)
+        self._lbl_wavelength = DataAnalysisConfigEnum.WAVELENGTH_LABEL.value
+        self._lbl_intensity = DataAnalysisConfigEnum.INTENSITY_LABEL.value
+        
         # Locks
         self._lock_meaCal_pipe = mp.Lock() # A lock for the pipe to calibrate a measurement
         
@@ -168,7 +177,8 @@ class DataStreamer_Raman(mp.Process):
                 try:
                     self._flg_ListReady.clear()
                     package = self._list_measurements_updater.pop(0)
-                    self._set_measurement_childProc(*package)
+                    if isinstance(package[0], list): self._set_measurement_batch_childProc(*package)
+                    else: self._set_measurement_childProc(*package)
                 except IndexError:
                 # except queue.Empty:
                     time.sleep(self._pause_interval_updater/1000)
@@ -325,7 +335,8 @@ class DataStreamer_Raman(mp.Process):
             (defaults to %y%m%d_%H%M%S_%f)
         """
         # Calibrate the measurements
-        cal_spectrum = self._calibrator.calibrate_measurement(raw_spectrum)
+        with trace_span('raman.calibrate', cat='calibration'):
+            cal_spectrum = self._calibrator.calibrate_measurement(raw_spectrum)
         
         # # ><>< Debugging part starts here ><><
         # print('Calibrated spectrum:')
@@ -335,6 +346,30 @@ class DataStreamer_Raman(mp.Process):
         # print(raw_spectrum.head(5))
         # # ><>< Debugging part ends here ><><
         
+        self._append_measurement(timestamp, cal_spectrum, integration_time_ms)
+        
+    def _set_measurement_batch_childProc(self,list_timestamp:list[int],df_batch:pd.DataFrame,integration_time_ms:float):
+        """
+        Sets a burst of measurements, see _store_measurement_batch. The burst is calibrated at once
+        (the calibration is applied per row) and then split into the measurements.
+        
+        Args:
+            list_timestamp (list[int]): The timestamps of the measurements in the format of get_timestamp_us()
+            df_batch (pd.DataFrame): The raw spectra, one after the other
+            integration_time_ms (float): The integration time in [ms]
+        """
+        with trace_span('raman.calibrate', cat='calibration', frames=len(list_timestamp)):
+            cal_batch = self._calibrator.calibrate_measurement(df_batch)
+        
+        num_pixels = len(cal_batch)//len(list_timestamp)
+        for i, timestamp in enumerate(list_timestamp):
+            cal_spectrum = cal_batch.iloc[i*num_pixels:(i+1)*num_pixels].reset_index(drop=True)
+            self._append_measurement(timestamp, cal_spectrum, integration_time_ms)
+        
+    def _append_measurement(self,timestamp:int,cal_spectrum:pd.DataFrame,integration_time_ms:float):
+        """
+        Stores a calibrated measurement, removing the oldest one if the maximum number of measurements is reached
+        """
         self._list_timestamps.append(timestamp)
         self._list_measurements.append(cal_spectrum)
         self._list_integrationtime.append(integration_time_ms)
@@ -387,11 +422,12 @@ class DataStreamer_Raman(mp.Process):
         assert self._flg_pause_measurement.is_set(), "The continuous measurement is running. Use get_measurement() instead."
         
         # Performs a measurement
-        result = self._controller.measure_spectrum()
+        with trace_span('raman.measure_single', cat='acquisition'):
+            result = self._controller.measure_spectrum()
         raw_spectrum, ts_us_int, int_time_us = result
         
         # Calibrate the measurements
-        with self._lock_meaCal_pipe:
+        with self._lock_meaCal_pipe, trace_span('raman.calibrate_single', cat='calibration'):
             self._pipe_cal_mea_front.send(raw_spectrum)
             cal_spectrum = self._pipe_cal_mea_front.recv()
         
@@ -415,6 +451,8 @@ class DataStreamer_Raman(mp.Process):
         try:
             self._flg_process_measurement.set()
             list_timestamps_debug = []
+            flg_batch = self._batch_maxframes > 1
+            num_frames = 1  # Burst size, adapted to the integration time after the first burst
             while self._flg_process_measurement.is_set():
                 try:
                     # Pauses the continuous measurement
@@ -422,9 +460,23 @@ class DataStreamer_Raman(mp.Process):
                         time.sleep(self._pause_interval_measurement/1000)
                         continue
                     
+                    # Performs a burst of measurements if supported by the controller
+                    if flg_batch:
+                        try:
+                            with trace_span('raman.measure_batch', cat='acquisition', frames=num_frames):
+                                wavelength, intensities, timestamps, int_time_us = self._controller.measure_spectrum_batch(num_frames)
+                        except (NotImplementedError, AttributeError):
+                            print('_auto_collect_measurement: Burst acquisition not supported by the controller, using single measurements')
+                            flg_batch = False
+                            continue
+                        self._store_measurement_batch(wavelength, intensities, timestamps, int_time_us)
+                        num_frames = max(1, min(self._batch_maxframes, int(self._batch_maxlatency_us // max(int_time_us, 1))))
+                        continue
+                    
                     # Performs a measurement
                     # ts_start = get_timestamp_us_int()
-                    result = self._controller.measure_spectrum()
+                    with trace_span('raman.measure', cat='acquisition'):
+                        result = self._controller.measure_spectrum()
                     raw_spectrum, ts_mea, int_time_us = result
                     int_time_ms = int_time_us/1000
                     # ts_end = get_timestamp_us_int()
@@ -449,6 +501,24 @@ class DataStreamer_Raman(mp.Process):
         finally:
             self._flg_process_measurement.set()
             
+    def _store_measurement_batch(self, wavelength:np.ndarray, intensities:np.ndarray, timestamps:np.ndarray, int_time_us:int):
+        """
+        Queues a burst of measurements for the updater as a single package: the list of timestamps and
+        one dataframe holding the raw spectra one after the other, see _set_measurement_batch_childProc
+        
+        Args:
+            wavelength (np.ndarray): (W,) wavelength array, shared by all the spectra
+            intensities (np.ndarray): (n, W) intensity array
+            timestamps (np.ndarray): (n,) timestamps [us]
+            int_time_us (int): integration time [us]
+        """
+        if len(timestamps) == 0: return
+        df_batch = pd.DataFrame({
+            self._lbl_wavelength: np.tile(wavelength, len(timestamps)),
+            self._lbl_intensity: np.asarray(intensities).reshape(-1),
+        })
+        self._list_measurements_updater.append(([int(ts) for ts in timestamps.tolist()], df_batch, int_time_us/1000))
+            
     def join(self, timeout:float|None=None):
         """
         Joins the process
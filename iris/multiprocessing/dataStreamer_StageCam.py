@@ -62,7 +62,10 @@ from iris.multiprocessing.basemanager import get_my_manager, StageNamespace
 from iris.controllers import ControllerConfigEnum
 from iris.controllers import Controller_XY, Controller_Z, CameraController
     
-from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing import MPMeaHubEnum, MPMeaHub_Config
+from iris.utils.config_schema import config_registry
+from iris.utils.tracing import trace_span
+from iris.data.scan_qa import ScanQA_Flag
 
 IMAGECAL_KERNELSIZE = 61
 
@@ -97,9 +100,10 @@ class DataStreamer_StageCam(mp.Process):
         # > Operation parameters <
         self._flg_selfrunning = mp.Event()
         
-        # > Constants <
-        self._pause_interval_sec = MPMeaHubEnum.STAGEHUB_REQUEST_INTERVAL.value / 1000.0  # Convert to seconds
-        self._stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+        # > Live parameters, shared with the running hub through the namespace <
+        self._config_applied:MPMeaHub_Config = config_registry.get(MPMeaHub_Config)  # Last config pushed to the namespace
+        self._namespace.stage_request_interval_ms = self._config_applied.stagehub_request_interval
+        config_registry.subscribe(MPMeaHub_Config, self.apply_config)
         
         # > Locks <
         self._lock_pipe = mp.Lock()  # Lock for the pipe
@@ -110,6 +114,7 @@ class DataStreamer_StageCam(mp.Process):
         """
         CLOSEST = 1
         INTERPOLATE = 2
+        INTERPOLATE_FLAGGED = 3 # Interpolation, also returning the ScanQA_Flag
         
     class _child_CoorProc():
         """
@@ -136,6 +141,7 @@ class DataStreamer_StageCam(mp.Process):
             
             # > Constants <
             self._max_measurement = MPMeaHubEnum.STAGEHUB_MAXSTORAGE.value # Maximum number of coordinates stored
+            self._max_interval_us = MPMeaHubEnum.STAGEHUB_MAXINTERVAL.value*1000 # Maximum interval between coordinates [us]
             
             # > Thread <
             self._thread:threading.Thread = threading.Thread()
@@ -194,29 +200,36 @@ class DataStreamer_StageCam(mp.Process):
             self._flg_data_added.clear()
             self._flg_data_added.wait(timeout_sec)
             
-        def get_interpolated_coordinate(self,timestamp:int) -> tuple[float,float,float]|None:
+        def get_interpolated_coordinate(self,timestamp:int,return_flag:bool=False)\
+            -> tuple[float,float,float]|None|tuple[tuple[float,float,float]|None,ScanQA_Flag]:
             """
             Get the interpolated coordinate based on the timestamp
             
             Args:
                 timestamp (int): Timestamp in [us]
+                return_flag (bool, optional): Also returns the ScanQA_Flag of the interpolation. Defaults to False.
                 
             Returns:
-                tuple[int,tuple[float,float,float]]: timestamp, coordinate
+                tuple[float,float,float]|None: coordinate, or (coordinate, ScanQA_Flag) if return_flag
             """
             idx = 0
+            flag = ScanQA_Flag.NONE
             try:
                 while True:
                     with self._lock: idx = bisect.bisect_left(self._list_timestamp,timestamp)
                     if idx >= len(self._list_timestamp)-1:
+                        flag |= ScanQA_Flag.WAITED
                         self.wait_coordinate()
-                    elif idx == 0: return self._list_timestamp[idx]  # If the requested timestamp is before the first recorded timestamp, return the first recorded coordinate
+                    elif idx == 0:  # If the requested timestamp is before the first recorded timestamp, return the first recorded coordinate
+                        coor = self._list_coordinates[idx]
+                        return (coor,flag|ScanQA_Flag.CLAMPED) if return_flag else coor
                     else: break
                     
                 with self._lock:
                     idx = bisect.bisect_left(self._list_timestamp,timestamp)
                     ts1,coor1 = self._list_timestamp[idx-1],self._list_coordinates[idx-1]
                     ts2,coor2 = self._list_timestamp[idx],self._list_coordinates[idx]
+                if ts2 - ts1 > self._max_interval_us: flag |= ScanQA_Flag.GAP
                     
                 # Interpolate the coordinates
                 coor1 = np.array(coor1)
@@ -229,7 +242,7 @@ class DataStreamer_StageCam(mp.Process):
                 print(f'Available indices: {len(self._list_timestamp)} and {len(self._list_coordinates)}')
                 coor = None
             
-            return coor
+            return (coor,flag) if return_flag else coor
         
         def _assign_and_send_coordinates(self):
             """
@@ -249,6 +262,8 @@ class DataStreamer_StageCam(mp.Process):
                         coor = self.get_closest_coordinate(timestamp)
                     elif req_type == DataStreamer_StageCam.Enum_CoorType.INTERPOLATE:
                         coor = self.get_interpolated_coordinate(timestamp)
+                    elif req_type == DataStreamer_StageCam.Enum_CoorType.INTERPOLATE_FLAGGED:
+                        coor = self.get_interpolated_coordinate(timestamp,return_flag=True)
                     else:
                         raise ValueError('Invalid request type')
                 except Exception as e:
@@ -274,6 +289,7 @@ class DataStreamer_StageCam(mp.Process):
         Enumeration for the type of command
         """
         FLATFIELD_REF = 'flatfield_ref'
+        GET_FLATFIELD_REF = 'get_flatfield_ref'
         SAVE_FLATFIELD_REF = 'save_flatfield_ref'
         LOAD_FLATFIELD_REF = 'load_flatfield_ref'
         SET_FLATFIELD_GAIN = 'set_flatfield_gain'
@@ -487,6 +503,9 @@ class DataStreamer_StageCam(mp.Process):
             elif request[0] == DataStreamer_StageCam.Enum_CommandType.GET_FLATFIELD_GAIN:
                 return_pkg = self._ff_gain
             
+            elif request[0] == DataStreamer_StageCam.Enum_CommandType.GET_FLATFIELD_REF:
+                return_pkg = self._ff_arr_correction
+            
             elif request[0] == DataStreamer_StageCam.Enum_CommandType.FLATFIELD_REF:
                 if not isinstance(request[1],np.ndarray): raise ValueError('Invalid request type, reference image is not a numpy array')
                 self._calculate_reference_flatfield(request[1])
@@ -551,6 +570,19 @@ class DataStreamer_StageCam(mp.Process):
             self._cam_pipe_main.send((self.Enum_CommandType.FLATFIELD_REF,ref_img))
             self._cam_pipe_main.recv()
             
+    def get_flatfield_reference(self) -> np.ndarray|None:
+        """
+        Get the reference normalisation array of the flatfield correction (e.g., to equalise the
+        illumination of the stitched images, see MosaicBlending_Params)
+        
+        Returns:
+            np.ndarray|None: Reference normalisation array, None if not set
+        """
+        with self._lock_pipe:
+            self._cam_pipe_main.send((self.Enum_CommandType.GET_FLATFIELD_REF,0))
+            ref = self._cam_pipe_main.recv()
+        return ref
+        
     def get_flatfield_gain(self) -> float:
         """
         Get the flatfield gain
@@ -631,6 +663,21 @@ class DataStreamer_StageCam(mp.Process):
         """
         self._namespace.stage_offset_ms = offset_ms
     
+    def apply_config(self, config:MPMeaHub_Config) -> None:
+        """
+        Apply the reloadable parameters of a reloaded config to the (running) hub. Only the parameters
+        changed by the reload are pushed, so that the values set in the meantime (e.g., the offset set
+        from the menu or calibrated) are kept.
+        
+        Args:
+            config (MPMeaHub_Config): Reloaded measurement hub parameters
+        """
+        previous, self._config_applied = self._config_applied, config
+        if config.stagehub_request_interval != previous.stagehub_request_interval:
+            self._namespace.stage_request_interval_ms = config.stagehub_request_interval
+        if config.stagehub_time_offset_ms != previous.stagehub_time_offset_ms:
+            self._namespace.stage_offset_ms = config.stagehub_time_offset_ms
+    
     def run(self):
         print('>>>>>> Stage hub is running <<<<<<')
         self._collect_coordinateAndImage()
@@ -644,14 +691,15 @@ class DataStreamer_StageCam(mp.Process):
         child_proc_cam.run()
         while self._flg_selfrunning.is_set():
             try:
-                timestamp = int(get_timestamp_us_int() + self._namespace.stage_offset_ms * 1e3)
-                coorx, coory = self.xy_controller.get_coordinates()
-                coorz = self.z_controller.get_coordinates()
-                coor = (coorx, coory, coorz)
+                with trace_span('stage.poll', cat='acquisition'):
+                    timestamp = int(get_timestamp_us_int() + self._namespace.stage_offset_ms * 1e3)
+                    coorx, coory = self.xy_controller.get_coordinates()
+                    coorz = self.z_controller.get_coordinates()
+                    coor = (coorx, coory, coorz)
                 
                 child_proc_coor.append_coordinate(timestamp,coor)
                 
-                time.sleep(self._pause_interval_sec)
+                time.sleep(self._namespace.stage_request_interval_ms / 1000.0)
             except Exception as e:
                 print('Error in stage hub:',e)
                 time.sleep(0.5)
@@ -672,11 +720,29 @@ class DataStreamer_StageCam(mp.Process):
         Returns:
             tuple|None: Coordinates in [x,y,z] or None if no coordinates are found
         """
-        with self._lock_pipe:
+        with self._lock_pipe, trace_span('stage.interpolate', cat='interpolation'):
             self._coor_pipe_main.send((self.Enum_CoorType.INTERPOLATE,timestamp))
             coor = self._coor_pipe_main.recv()
         return coor
     
+    def get_coordinates_interpolate_flagged(self,timestamp:int) -> tuple[tuple[float,float,float]|None,ScanQA_Flag]:
+        """
+        Get the coordinates by interpolating the coordinates between the timestamps (linear), with the
+        quality flag of the interpolation (see iris.data.scan_qa)
+        
+        Args:
+            timestamp (int): Timestamp in us
+        
+        Returns:
+            tuple: Coordinates in [x,y,z] or None if no coordinates are found, and the ScanQA_Flag
+        """
+        with self._lock_pipe, trace_span('stage.interpolate', cat='interpolation'):
+            self._coor_pipe_main.send((self.Enum_CoorType.INTERPOLATE_FLAGGED,timestamp))
+            result = self._coor_pipe_main.recv()
+        if result is None: return None, ScanQA_Flag.NONE
+        coor, flag = result
+        return coor, ScanQA_Flag(flag)
+    
     def get_coordinates_closest(self,timestamp:int) -> tuple[float,float,float]|None:
         """
         Get the closest coordinates to the timestamp
@@ -687,7 +753,7 @@ class DataStreamer_StageCam(mp.Process):
         Returns:
             tuple: Coordinates in [x,y,z] or None if no coordinates are found
         """
-        with self._lock_pipe:
+        with self._lock_pipe, trace_span('stage.closest', cat='interpolation'):
             self._coor_pipe_main.send((self.Enum_CoorType.CLOSEST,timestamp))
             coor = self._coor_pipe_main.recv()
         return coor
@@ -720,6 +786,7 @@ def initialise_proxy_stage(manager:mpm.SyncManager) -> tuple[Controller_XY,Contr
     
     stg_namespace:StageNamespace = manager.Namespace()
     stg_namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    stg_namespace.stage_request_interval_ms = MPMeaHubEnum.STAGEHUB_REQUEST_INTERVAL.value
     
     return xyproxy,zproxy,camproxy,stg_namespace
 
@@ -0,0 +1,417 @@
+"""
+A recorder of the stage camera video with the stage coordinates, for later review or correlation
+with the Raman measurements.
+
+Idea:
+- The frames are acquired from the stage hub (DataStreamer_StageCam.get_image) by an acquisition
+    thread, or pushed from another frame source (e.g., the raw frames of the video feed), and
+    timestamped in [us] integer format (see iris.utils.general), as the stage coordinates
+- The stage coordinates of every frame are interpolated from the stage hub by a locator thread as
+    soon as the frame arrives, while the hub still holds the coordinates around its timestamp
+- The frames go into a bounded ring buffer. A writer thread takes them out in chunks and writes each
+    chunk into a file (lossless frame chunks or OpenCV FFV1 video) with the located coordinates
+- When the writer falls behind (e.g., a slow disk), the oldest frames in the buffer are dropped
+    instead of growing the memory. The dropped frames are reported explicitly: they are listed in
+    the sidecar table (with their timestamp and coordinates, but no file) and in the report
+
+Files of a recording <name> in the recording directory:
+- <name>_chunk<00000>.npz (frames array (num_frames,height,width[,channels]) uint8) or
+    <name>_chunk<00000>.mkv (FFV1 video)
+- <name>_frames.csv: sidecar table with one row per frame (stored or dropped), see REC_COLUMNS.
+    The rows are appended after every chunk, so that an interrupted recording keeps its table.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import csv
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+
+import numpy as np
+import pandas as pd
+import cv2
+from PIL import Image
+
+from iris.utils.general import get_timestamp_us_int
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam, Enum_CamCorrectionType
+
+REC_COLUMNS = ('frame', 'timestamp_us', 'x_mm', 'y_mm', 'z_mm', 'dropped', 'chunk', 'chunk_index') # Sidecar table columns
+REC_VIDEO_FPS = 30.0            # Nominal frame rate written in the FFV1 video files (the timestamps are in the sidecar table) [Hz]
+REC_JOIN_TIMEOUT_SEC = 30.0     # Timeout to finish writing the buffered frames when stopping [s]
+
+class Enum_RecFormat(Enum):
+    """
+    Enumeration for the file format of the recording
+    """
+    NPZ = 'npz'     # Lossless frame chunks (numpy)
+    FFV1 = 'ffv1'   # Lossless OpenCV video (FFV1 codec in a Matroska container)
+
+@dataclass
+class StageCamRecording_Report:
+    """
+    Report of a stage camera recording
+    """
+    num_frames:int=0        # Number of frames received (stored and dropped)
+    num_stored:int=0        # Number of frames written to disk
+    num_dropped:int=0       # Number of frames dropped because the buffer was full
+    list_dropped:list[int]=field(default_factory=list)  # Frame indices of the dropped frames
+    peak_buffered:int=0     # Maximum number of frames waiting in the buffer
+    num_chunks:int=0        # Number of files written
+    duration_sec:float=0.0  # Time between the first and the last frame [s]
+
+    def get_summary(self) -> str:
+        """
+        Returns a one-line summary of the recording
+        """
+        fps = (self.num_frames-1)/self.duration_sec if self.num_frames > 1 and self.duration_sec > 0 else 0.0
+        return (f'{self.num_frames} frames in {self.duration_sec:.1f} s ({fps:.1f} fps): {self.num_stored} stored in '
+                f'{self.num_chunks} chunks, {self.num_dropped} dropped (peak buffer {self.peak_buffered} frames)')
+
+@dataclass
+class _Rec_Frame:
+    """
+    A frame of the recording, waiting in the buffer
+    """
+    index:int
+    timestamp_us:int
+    arr:np.ndarray|None     # None for a dropped frame
+    coor:tuple[float,float,float]|None = None   # Interpolated stage coordinates, None if not available
+    located:bool = False    # Whether the coordinates have been interpolated
+
+class VideoRecorder_StageCam():
+    def __init__(self, stageHub:DataStreamer_StageCam, dirpath:str, name:str,
+                 rec_format:Enum_RecFormat|str=MPMeaHubEnum.STAGECAM_REC_FORMAT.value,
+                 buffer_frames:int=MPMeaHubEnum.STAGECAM_REC_BUFFER_FRAMES.value,
+                 chunk_frames:int=MPMeaHubEnum.STAGECAM_REC_CHUNK_FRAMES.value):
+        """
+        Records the stage camera frames with their timestamps and interpolated stage coordinates.
+
+        Args:
+            stageHub (DataStreamer_StageCam): Stage hub, source of the frames and the coordinates
+            dirpath (str): Directory of the recording files
+            name (str): Name of the recording, prefix of the files
+            rec_format (Enum_RecFormat|str): File format. Default is MPMeaHubEnum.STAGECAM_REC_FORMAT
+            buffer_frames (int): Maximum number of frames waiting to be written. Default is MPMeaHubEnum.STAGECAM_REC_BUFFER_FRAMES
+            chunk_frames (int): Number of frames per file. Default is MPMeaHubEnum.STAGECAM_REC_CHUNK_FRAMES
+        """
+        assert isinstance(stageHub, DataStreamer_StageCam), 'The stage hub must be a DataStreamer_StageCam'
+        assert os.path.isdir(dirpath), 'The recording directory does not exist'
+        assert isinstance(name, str) and name != '', 'The recording name must be a non-empty string'
+        assert isinstance(buffer_frames, int) and buffer_frames >= 1, 'The buffer size must be a positive integer'
+        assert isinstance(chunk_frames, int) and chunk_frames >= 1, 'The chunk size must be a positive integer'
+        self._stageHub = stageHub
+        self._dirpath = dirpath
+        self._name = name
+        self._format = Enum_RecFormat(rec_format)
+        self._buffer_frames = buffer_frames
+        self._chunk_frames = chunk_frames
+
+        # > Ring buffer, shared between the frame sources and the writer thread <
+        self._buffer:deque[_Rec_Frame] = deque()
+        self._list_dropped:list[_Rec_Frame] = []   # Dropped frames not yet in the table
+        self._queue_locate:deque[_Rec_Frame] = deque()  # Frames waiting for their coordinates
+        self._cond = threading.Condition()
+        self._report = StageCamRecording_Report()
+        self._ts_first:int|None = None
+
+        # > Operation parameters <
+        self._flg_recording = threading.Event()
+        self._flg_acquiring = threading.Event()
+        self._thread_writer:threading.Thread = threading.Thread()
+        self._thread_acquisition:threading.Thread = threading.Thread()
+        self._thread_locator:threading.Thread = threading.Thread()
+        self._writer_error:Exception|None = None
+
+    def get_table_path(self) -> str:
+        """
+        Returns the path of the sidecar table of the recording
+        """
+        return os.path.join(self._dirpath, f'{self._name}_frames.csv')
+
+    def get_report(self) -> StageCamRecording_Report:
+        """
+        Returns a snapshot of the recording report
+        """
+        with self._cond:
+            report = StageCamRecording_Report(**{**self._report.__dict__, 'list_dropped': list(self._report.list_dropped)})
+        return report
+
+    def is_recording(self) -> bool:
+        return self._flg_recording.is_set()
+
+    def start(self, acquire:bool=True, correction:Enum_CamCorrectionType=Enum_CamCorrectionType.RAW,
+              interval_sec:float=0.0) -> None:
+        """
+        Starts the recording
+
+        Args:
+            acquire (bool): Acquire the frames from the stage hub. If False, the frames are pushed
+                with push_frame(). Default is True
+            correction (Enum_CamCorrectionType): Correction of the acquired frames. Default is RAW
+            interval_sec (float): Minimum interval between the acquired frames [s]. Default is 0 (as fast as possible)
+        """
+        assert not self._flg_recording.is_set(), 'The recording has already started'
+        assert isinstance(correction, Enum_CamCorrectionType), 'Invalid correction type'
+        assert interval_sec >= 0, 'The acquisition interval must be non-negative'
+        with open(self.get_table_path(), 'w', newline='') as f:
+            csv.writer(f).writerow(REC_COLUMNS)
+
+        self._flg_recording.set()
+        self._thread_locator = threading.Thread(target=self._locate_frames, daemon=True)
+        self._thread_locator.start()
+        self._thread_writer = threading.Thread(target=self._write_frames, daemon=True)
+        self._thread_writer.start()
+        if acquire:
+            self._flg_acquiring.set()
+            self._thread_acquisition = threading.Thread(target=self._acquire_frames, args=(correction,interval_sec),
+                                                        daemon=True)
+            self._thread_acquisition.start()
+
+    def stop(self) -> StageCamRecording_Report:
+        """
+        Stops the acquisition, writes the buffered frames and returns the report
+
+        Returns:
+            StageCamRecording_Report: Report of the recording
+
+        Raises:
+            Exception: The error of the writer thread, if any
+        """
+        self._flg_acquiring.clear()
+        if self._thread_acquisition.is_alive(): self._thread_acquisition.join()
+        with self._cond:
+            self._flg_recording.clear()
+            self._cond.notify_all()
+        if self._thread_writer.is_alive(): self._thread_writer.join(REC_JOIN_TIMEOUT_SEC)
+        if self._thread_locator.is_alive(): self._thread_locator.join(REC_JOIN_TIMEOUT_SEC)
+        if self._writer_error is not None: raise self._writer_error
+
+        report = self.get_report()
+        if report.num_dropped > 0:
+            print(f'Stage camera recording {self._name}: {report.num_dropped} frames dropped, frame indices {report.list_dropped}')
+        return report
+
+    def push_frame(self, timestamp_us:int, img:Image.Image|np.ndarray) -> bool:
+        """
+        Adds a frame to the recording. Never blocks: if the buffer is full, the oldest buffered
+        frame is dropped.
+
+        Args:
+            timestamp_us (int): Timestamp of the frame [us]
+            img (Image.Image|np.ndarray): Frame, uint8 grayscale or RGB
+
+        Returns:
+            bool: True if no frame was dropped to make room for this one
+        """
+        assert self._flg_recording.is_set(), 'The recording has not started'
+        arr = np.asarray(img)
+        assert arr.dtype == np.uint8 and (arr.ndim == 2 or (arr.ndim == 3 and arr.shape[2] == 3)),\
+            'The frame must be a uint8 grayscale or RGB image'
+        with self._cond:
+            if self._ts_first is None: self._ts_first = timestamp_us
+            self._report.duration_sec = (timestamp_us - self._ts_first)/1e6
+            frame = _Rec_Frame(self._report.num_frames, int(timestamp_us), arr)
+            self._report.num_frames += 1
+            self._queue_locate.append(frame)
+
+            flg_kept = len(self._buffer) < self._buffer_frames
+            if not flg_kept:
+                dropped = self._buffer.popleft()
+                dropped.arr = None
+                self._list_dropped.append(dropped)
+                self._report.num_dropped += 1
+                self._report.list_dropped.append(dropped.index)
+            self._buffer.append(frame)
+            self._report.peak_buffered = max(self._report.peak_buffered, len(self._buffer))
+            self._cond.notify_all()
+        return flg_kept
+
+    def _acquire_frames(self, correction:Enum_CamCorrectionType, interval_sec:float) -> None:
+        """
+        Acquires the frames from the stage hub until the acquisition stops. The frame timestamp is
+        the middle of the request, as the exposure time is not known.
+        """
+        while self._flg_acquiring.is_set():
+            ts_start = get_timestamp_us_int()
+            try:
+                img = self._stageHub.get_image(correction)
+                ts_end = get_timestamp_us_int()
+                if not isinstance(img, Image.Image): raise ValueError('No image received from the stage hub')
+                self.push_frame((ts_start + ts_end)//2, img)
+            except Exception as e:
+                print('Error in the stage camera recording acquisition:', e)
+                time.sleep(0.5)
+            time.sleep(max(0.0, interval_sec - (get_timestamp_us_int() - ts_start)/1e6))
+
+    def _locate_frames(self) -> None:
+        """
+        Interpolates the stage coordinates of the frames in their arrival order, until the
+        recording stops and every frame is located
+        """
+        while True:
+            with self._cond:
+                while self._flg_recording.is_set() and len(self._queue_locate) == 0:
+                    self._cond.wait(0.5)
+                if len(self._queue_locate) == 0: break
+                frame = self._queue_locate.popleft()
+            try: coor = self._stageHub.get_coordinates_interpolate(frame.timestamp_us)
+            except Exception as e:
+                print('Error in the stage camera recording locator:', e)
+                coor = None
+            with self._cond:
+                frame.coor = coor
+                frame.located = True
+                self._cond.notify_all()
+
+    def _write_frames(self) -> None:
+        """
+        Writes the buffered frames in chunks until the recording stops and the buffer is empty
+        """
+        try:
+            list_chunk:list[_Rec_Frame] = []
+            while True:
+                with self._cond:
+                    while self._flg_recording.is_set() and len(self._buffer) == 0:
+                        self._cond.wait(0.5)
+                    flg_last = not self._flg_recording.is_set()
+                    frame = self._buffer.popleft() if len(self._buffer) > 0 else None
+                    flg_last = flg_last and frame is None
+                    list_dropped, self._list_dropped = self._list_dropped, []
+
+                # A frame of a different shape starts a new chunk
+                if frame is not None and len(list_chunk) > 0 and frame.arr.shape != list_chunk[0].arr.shape:  # pyright: ignore[reportOptionalMemberAccess] ; buffered frames have arrays
+                    self._write_chunk(list_chunk, list_dropped)
+                    list_chunk, list_dropped = [], []
+                if frame is not None: list_chunk.append(frame)
+                if len(list_chunk) >= self._chunk_frames or (flg_last and (len(list_chunk) > 0 or len(list_dropped) > 0)):
+                    self._write_chunk(list_chunk, list_dropped)
+                    list_chunk = []
+                elif len(list_dropped) > 0:
+                    self._append_table_rows(self._get_table_rows(list_dropped, None))
+                if flg_last: break
+        except Exception as e:
+            print('Error in the stage camera recording writer:', e)
+            self._writer_error = e
+            self._flg_acquiring.clear()
+            with self._cond:
+                self._flg_recording.clear()
+                self._buffer.clear()
+                self._cond.notify_all()
+
+    def _get_chunk_path(self, idx_chunk:int) -> str:
+        ext = 'npz' if self._format == Enum_RecFormat.NPZ else 'mkv'
+        return os.path.join(self._dirpath, f'{self._name}_chunk{idx_chunk:05d}.{ext}')
+
+    def _get_table_rows(self, list_frames:list[_Rec_Frame], idx_chunk:int|None) -> list[tuple]:
+        """
+        Returns the sidecar table rows of the frames, with the stage coordinates interpolated by
+        the locator thread (waiting for it if needed)
+
+        Args:
+            list_frames (list[_Rec_Frame]): Frames
+            idx_chunk (int|None): Chunk index of the stored frames, None for dropped frames
+        """
+        with self._cond:
+            while not all(frame.located for frame in list_frames) and self._thread_locator.is_alive():
+                self._cond.wait(0.5)
+        list_rows = []
+        for i, frame in enumerate(list_frames):
+            x, y, z = frame.coor if frame.coor is not None else (np.nan, np.nan, np.nan)
+            list_rows.append((frame.index, frame.timestamp_us, x, y, z, idx_chunk is None,
+                              idx_chunk if idx_chunk is not None else -1, i if idx_chunk is not None else -1))
+        return list_rows
+
+    def _append_table_rows(self, list_rows:list[tuple]) -> None:
+        list_rows = sorted(list_rows)   # In frame order, the dropped frames among the stored ones
+        with open(self.get_table_path(), 'a', newline='') as f:
+            csv.writer(f).writerows(list_rows)
+
+    def _write_chunk(self, list_frames:list[_Rec_Frame], list_dropped:list[_Rec_Frame]) -> None:
+        """
+        Writes the frames into a chunk file and their rows (and those of the dropped frames) into
+        the sidecar table
+
+        Args:
+            list_frames (list[_Rec_Frame]): Frames of the chunk, of the same shape
+            list_dropped (list[_Rec_Frame]): Dropped frames to add to the table
+        """
+        list_rows = self._get_table_rows(list_dropped, None)
+        if len(list_frames) > 0:
+            idx_chunk = self._report.num_chunks
+            self._write_chunk_file(self._get_chunk_path(idx_chunk), [frame.arr for frame in list_frames])  # pyright: ignore[reportArgumentType] ; buffered frames have arrays
+            list_rows.extend(self._get_table_rows(list_frames, idx_chunk))
+            with self._cond:
+                self._report.num_chunks += 1
+                self._report.num_stored += len(list_frames)
+        self._append_table_rows(list_rows)
+
+    def _write_chunk_file(self, path:str, list_arr:list[np.ndarray]) -> None:
+        """
+        Writes the frames of a chunk into a file
+
+        Args:
+            path (str): File path
+            list_arr (list[np.ndarray]): Frames of the same shape
+        """
+        if self._format == Enum_RecFormat.NPZ:
+            np.savez(path, frames=np.stack(list_arr))
+            return
+        height, width = list_arr[0].shape[:2]
+        flg_colour = list_arr[0].ndim == 3
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'FFV1'), REC_VIDEO_FPS, (width, height), isColor=flg_colour)
+        if not writer.isOpened(): raise IOError(f'The FFV1 video file could not be opened: {path}')
+        try:
+            for arr in list_arr: writer.write(cv2.cvtColor(arr, cv2.COLOR_RGB2BGR) if flg_colour else arr)
+        finally:
+            writer.release()
+
+def load_recording_table(dirpath:str, name:str) -> pd.DataFrame:
+    """
+    Loads the sidecar table of a stage camera recording
+
+    Args:
+        dirpath (str): Directory of the recording files
+        name (str): Name of the recording
+
+    Returns:
+        pd.DataFrame: Table with the columns REC_COLUMNS, one row per frame in frame order
+    """
+    df = pd.read_csv(os.path.join(dirpath, f'{name}_frames.csv'))
+    return df.sort_values('frame', ignore_index=True)
+
+def load_recording_chunk(dirpath:str, name:str, idx_chunk:int) -> np.ndarray:
+    """
+    Loads the frames of a chunk of a stage camera recording
+
+    Args:
+        dirpath (str): Directory of the recording files
+        name (str): Name of the recording
+        idx_chunk (int): Chunk index (see the 'chunk' column of the table)
+
+    Returns:
+        np.ndarray: Frames (num_frames,height,width[,3]) uint8, RGB. The grayscale frames of the
+            FFV1 files are loaded as RGB
+    """
+    path = os.path.join(dirpath, f'{name}_chunk{idx_chunk:05d}')
+    if os.path.exists(path + '.npz'):
+        with np.load(path + '.npz') as npz: return npz['frames']
+
+    cap = cv2.VideoCapture(path + '.mkv')
+    if not cap.isOpened(): raise FileNotFoundError(f'Recording chunk not found: {path}')
+    list_arr = []
+    try:
+        while True:
+            ret, arr = cap.read()
+            if not ret: break
+            list_arr.append(cv2.cvtColor(arr, cv2.COLOR_BGR2RGB))
+    finally:
+        cap.release()
+    return np.stack(list_arr)
@@ -15,8 +15,9 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox, QGridLayout,
-    QSizePolicy, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox, QDoubleSpinBox,
+    QGridLayout, QHBoxLayout, QLabel, QSizePolicy,
+    QVBoxLayout, QWidget)
 
 class Ui_heatmapPlotterOverlay(object):
     def setupUi(self, heatmapPlotterOverlay):
@@ -53,6 +54,34 @@ class Ui_heatmapPlotterOverlay(object):
 
         self.verticalLayout_6.addWidget(self.chk_overlay)
 
+        self.lyt_heatmap_style = QHBoxLayout()
+        self.lyt_heatmap_style.setObjectName(u"lyt_heatmap_style")
+        self.lbl_alpha = QLabel(heatmapPlotterOverlay)
+        self.lbl_alpha.setObjectName(u"lbl_alpha")
+
+        self.lyt_heatmap_style.addWidget(self.lbl_alpha)
+
+        self.spin_alpha = QDoubleSpinBox(heatmapPlotterOverlay)
+        self.spin_alpha.setObjectName(u"spin_alpha")
+        self.spin_alpha.setMaximum(1.000000000000000)
+        self.spin_alpha.setSingleStep(0.100000000000000)
+        self.spin_alpha.setValue(0.500000000000000)
+
+        self.lyt_heatmap_style.addWidget(self.spin_alpha)
+
+        self.lbl_cmap = QLabel(heatmapPlotterOverlay)
+        self.lbl_cmap.setObjectName(u"lbl_cmap")
+
+        self.lyt_heatmap_style.addWidget(self.lbl_cmap)
+
+        self.combo_cmap = QComboBox(heatmapPlotterOverlay)
+        self.combo_cmap.setObjectName(u"combo_cmap")
+
+        self.lyt_heatmap_style.addWidget(self.combo_cmap)
+
+
+        self.verticalLayout_6.addLayout(self.lyt_heatmap_style)
+
 
         self.gridLayout.addLayout(self.verticalLayout_6, 1, 0, 1, 1)
 
@@ -77,5 +106,7 @@ class Ui_heatmapPlotterOverlay(object):
         heatmapPlotterOverlay.setWindowTitle(QCoreApplication.translate("heatmapPlotterOverlay", u"Form", None))
         self.chk_lres.setText(QCoreApplication.translate("heatmapPlotterOverlay", u"Show low-resolution image (faster processing)", None))
         self.chk_overlay.setText(QCoreApplication.translate("heatmapPlotterOverlay", u"Enable image overlay", None))
+        self.lbl_alpha.setText(QCoreApplication.translate("heatmapPlotterOverlay", u"Heatmap opacity:", None))
+        self.lbl_cmap.setText(QCoreApplication.translate("heatmapPlotterOverlay", u"Colour map:", None))
     # retranslateUi
 
@@ -0,0 +1,346 @@
+"""
+Typed and validated runtime configuration on top of the config.ini sections.
+
+A section is described by a dataclass schema whose fields are declared with config_field(), giving
+the default value (which also sets the type), the config file comment, the unit, the allowed
+range and whether the setting can be changed without restarting the app. The sections are read
+through read_update_config_file_section() (which keeps the config file in sync) and validated,
+with a ConfigValidationError naming the section, key, value and allowed range.
+
+The loaded sections are kept in the config_registry, which:
+- dumps the effective values (e.g., at startup) with dump_effective_config()
+- reloads the config file with reload_config(): the changes of the reloadable settings are applied
+    and pushed to the subscribers (e.g., a running DataStreamer_StageCam), the other changes are
+    reported as requiring a restart and ignored.
+
+Usage:
+    @dataclass(frozen=True)
+    class MyHub_Config(Class_ConfigSection):
+        SECTION: ClassVar[str] = 'MY HUB PARAMETERS'
+        interval_ms: int = config_field(20, 'Request interval', unit='ms', min_value=1, reloadable=True)
+
+    config = config_registry.register(MyHub_Config)
+    config_registry.subscribe(MyHub_Config, callback)   # callback(new_config)
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import dataclasses
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, ClassVar
+
+from iris.utils.general import read_update_config_file_section
+
+
+class ConfigValidationError(ValueError):
+    """
+    Raised when config values are invalid. Lists every invalid entry of the section.
+    """
+    def __init__(self, section:str, list_errors:list[str]):
+        self.section = section
+        self.list_errors = list_errors
+        super().__init__(f'Invalid configuration in [{section}]:\n  ' + '\n  '.join(list_errors))
+
+
+@dataclass(frozen=True)
+class Config_FieldSpec():
+    """
+    Description of a config entry, stored in the dataclass field metadata
+    """
+    comment:str
+    unit:str = ''
+    min_value:float|None = None
+    max_value:float|None = None
+    choices:tuple|None = None
+    reloadable:bool = False
+
+    def describe_range(self) -> str:
+        """Returns the allowed values as text, e.g., '[1, 1000] ms'"""
+        if self.choices is not None: text = 'one of ' + ', '.join(repr(choice) for choice in self.choices)
+        elif self.min_value is not None and self.max_value is not None: text = f'[{self.min_value}, {self.max_value}]'
+        elif self.min_value is not None: text = f'>= {self.min_value}'
+        elif self.max_value is not None: text = f'<= {self.max_value}'
+        else: text = 'any value'
+        return f'{text} {self.unit}'.strip()
+
+
+def config_field(default:bool|int|float|str, comment:str, unit:str='', min_value:float|None=None,
+                 max_value:float|None=None, choices:tuple|None=None, reloadable:bool=False) -> Any:
+    """
+    Declares a config entry in a Class_ConfigSection schema.
+
+    Args:
+        default (bool|int|float|str): default value, its type is the type of the entry
+        comment (str): comment written next to the entry in the config file
+        unit (str, optional): unit of the value. Defaults to ''.
+        min_value (float|None, optional): minimum allowed value (inclusive). Defaults to None.
+        max_value (float|None, optional): maximum allowed value (inclusive). Defaults to None.
+        choices (tuple|None, optional): allowed values. Defaults to None.
+        reloadable (bool, optional): True if the entry can change without restarting the app. Defaults to False.
+
+    Returns:
+        dataclasses.Field: the field of the schema
+    """
+    assert isinstance(default, (bool, int, float, str)), 'config_field: The default must be a bool, int, float or str.'
+    spec = Config_FieldSpec(comment=comment, unit=unit, min_value=min_value, max_value=max_value,
+                            choices=tuple(choices) if choices is not None else None, reloadable=reloadable)
+    return dataclasses.field(default=default, metadata={'config': spec})
+
+
+@dataclass(frozen=True)
+class Class_ConfigSection():
+    """
+    Base class of the config section schemas. The subclasses are frozen dataclasses with a SECTION
+    name and their entries declared with config_field().
+    """
+    SECTION: ClassVar[str] = ''
+
+    @classmethod
+    def get_specs(cls) -> dict[str,Config_FieldSpec]:
+        """Returns the spec of every entry of the section"""
+        return {field.name: field.metadata['config'] for field in dataclasses.fields(cls) if 'config' in field.metadata}
+
+    @classmethod
+    def get_defaults(cls) -> dict[str,Any]:
+        """Returns the default value of every entry of the section"""
+        return {field.name: field.default for field in dataclasses.fields(cls) if 'config' in field.metadata}
+
+    @classmethod
+    def from_dict(cls, dict_values:dict[str,Any]):
+        """
+        Converts and validates the values of a section.
+
+        Args:
+            dict_values (dict[str,Any]): values per entry, missing entries take their default
+
+        Raises:
+            ConfigValidationError: if any value has the wrong type or is outside its allowed range
+
+        Returns:
+            Class_ConfigSection: the validated section
+        """
+        dict_defaults = cls.get_defaults()
+        dict_specs = cls.get_specs()
+        list_errors = []
+        dict_converted = {}
+        for key, default in dict_defaults.items():
+            value = dict_values.get(key, default)
+            spec = dict_specs[key]
+            try: value = _convert_value(value, type(default))
+            except (TypeError, ValueError):
+                list_errors.append(f'{key} = {value!r}: expected a {type(default).__name__}, allowed {spec.describe_range()}')
+                continue
+            if not _is_within_spec(value, spec):
+                list_errors.append(f'{key} = {value!r}: out of range, allowed {spec.describe_range()}')
+                continue
+            dict_converted[key] = value
+        unknown = sorted(set(dict_values) - set(dict_defaults))
+        list_errors.extend(f'{key}: unknown entry' for key in unknown)
+        if list_errors: raise ConfigValidationError(cls.SECTION, list_errors)
+        return cls(**dict_converted)
+
+    def to_dict(self) -> dict[str,Any]:
+        return {key: getattr(self, key) for key in self.get_specs()}
+
+
+def _convert_value(value:Any, value_type:type) -> bool|int|float|str:
+    """Converts a value to the type of the entry, raises a ValueError if it cannot be converted exactly"""
+    if value_type == bool:
+        if isinstance(value, bool): return value
+        if isinstance(value, str) and value.strip().lower() in ('true', 'false'): return value.strip().lower() == 'true'
+        raise ValueError(f'{value!r} is not a boolean value')
+    if value_type == int:
+        if isinstance(value, bool): raise ValueError(f'{value!r} is not an integer')
+        if isinstance(value, str):
+            try: return int(value)
+            except ValueError: value = float(value)     # e.g., '1000.0'
+        if isinstance(value, float):
+            if not value.is_integer(): raise ValueError(f'{value!r} is not an integer')
+            return int(value)
+        return int(value)
+    if value_type == float:
+        if isinstance(value, bool): raise ValueError(f'{value!r} is not a number')
+        return float(value)
+    return str(value)
+
+
+def _is_within_spec(value:Any, spec:Config_FieldSpec) -> bool:
+    if spec.choices is not None: return value in spec.choices
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value != value: return False     # NaN
+        if spec.min_value is not None and value < spec.min_value: return False
+        if spec.max_value is not None and value > spec.max_value: return False
+    return True
+
+
+def load_config_section(schema:type[Class_ConfigSection], config_file:str='config.ini') -> Class_ConfigSection:
+    """
+    Reads a section from the config file (adding the missing entries and updating the comments)
+    and validates it.
+
+    Args:
+        schema (type[Class_ConfigSection]): the section schema
+        config_file (str, optional): path to the config file. Defaults to 'config.ini'.
+
+    Raises:
+        ConfigValidationError: if any value of the section is invalid
+
+    Returns:
+        Class_ConfigSection: the validated section
+    """
+    assert issubclass(schema, Class_ConfigSection) and schema.SECTION, 'load_config_section: Invalid section schema.'
+    dict_defaults = schema.get_defaults()
+    dict_comments = {key: f'{spec.comment}. Allowed: {spec.describe_range()}. Default: {dict_defaults[key]}'
+                     for key, spec in schema.get_specs().items()}
+    try:
+        dict_read = read_update_config_file_section(
+            dict_controllers_default=dict_defaults,
+            dict_controllers_comments=dict_comments,
+            section=schema.SECTION,
+            config_file=config_file,
+        )
+    except ValueError:
+        # Re-read the (now complete) section as strings to report every invalid entry by name
+        dict_read = read_update_config_file_section(
+            dict_controllers_default={key: str(value) for key, value in dict_defaults.items()},
+            dict_controllers_comments=dict_comments,
+            section=schema.SECTION,
+            config_file=config_file,
+        )
+    return schema.from_dict(dict_read)
+
+
+class Config_Registry():
+    """
+    Keeps the loaded config sections, reloads them and notifies the subscribers of the changes of
+    the reloadable entries
+    """
+    def __init__(self):
+        self._dict_configs:dict[type[Class_ConfigSection],Class_ConfigSection] = {}
+        self._dict_files:dict[type[Class_ConfigSection],str] = {}
+        self._dict_subscribers:dict[type[Class_ConfigSection],list[Callable[[],Callable|None]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, schema:type[Class_ConfigSection], config_file:str='config.ini') -> Class_ConfigSection:
+        """
+        Loads a section and keeps it for the reloads. A section registered twice is not reloaded.
+
+        Args:
+            schema (type[Class_ConfigSection]): the section schema
+            config_file (str, optional): path to the config file. Defaults to 'config.ini'.
+
+        Returns:
+            Class_ConfigSection: the validated section
+        """
+        with self._lock:
+            if schema in self._dict_configs: return self._dict_configs[schema]
+        config = load_config_section(schema, config_file)
+        with self._lock:
+            self._dict_configs[schema] = config
+            self._dict_files[schema] = config_file
+            self._dict_subscribers.setdefault(schema, [])
+        return config
+
+    def get(self, schema:type[Class_ConfigSection]) -> Class_ConfigSection:
+        """Returns the current values of a registered section"""
+        with self._lock:
+            assert schema in self._dict_configs, f'Config_Registry: The section {schema.__name__} is not registered.'
+            return self._dict_configs[schema]
+
+    def get_registered(self) -> list[Class_ConfigSection]:
+        with self._lock: return list(self._dict_configs.values())
+
+    def subscribe(self, schema:type[Class_ConfigSection], callback:Callable[[Class_ConfigSection],None]) -> None:
+        """
+        Subscribes to the reloads of a section. Bound methods are held weakly, so that the
+        subscription does not keep their object alive.
+
+        Args:
+            schema (type[Class_ConfigSection]): the section schema
+            callback (Callable[[Class_ConfigSection],None]): called with the new section values
+                whenever a reloadable entry changes
+        """
+        ref = weakref.WeakMethod(callback) if hasattr(callback, '__self__') else (lambda: callback)
+        with self._lock: self._dict_subscribers.setdefault(schema, []).append(ref)
+
+    def reload(self, config_file:str|None=None) -> dict[type[Class_ConfigSection],list[str]]:
+        """
+        Reloads every registered section. All the sections are validated before any is applied.
+        Only the changes of the reloadable entries are applied, the others are reported and require
+        a restart.
+
+        Args:
+            config_file (str|None, optional): config file to read instead of the registered ones. Defaults to None.
+
+        Raises:
+            ConfigValidationError: if any section is invalid, nothing is applied in that case
+
+        Returns:
+            dict[type[Class_ConfigSection],list[str]]: the applied entries per section (changed sections only)
+        """
+        with self._lock: list_schemas = list(self._dict_configs)
+        dict_new = {schema: load_config_section(schema, config_file or self._dict_files[schema]) for schema in list_schemas}
+
+        dict_applied = {}
+        list_notify = []
+        with self._lock:
+            for schema, new in dict_new.items():
+                current = self._dict_configs[schema]
+                dict_specs = schema.get_specs()
+                dict_changes = {key: value for key, value in new.to_dict().items() if getattr(current, key) != value}
+                list_restart = [key for key in dict_changes if not dict_specs[key].reloadable]
+                for key in list_restart:
+                    print(f"[Config] '{key}' in [{schema.SECTION}] changed to {dict_changes[key]!r}, restart the app to apply it")
+                dict_reload = {key: value for key, value in dict_changes.items() if dict_specs[key].reloadable}
+                if not dict_reload: continue
+                updated = dataclasses.replace(current, **dict_reload)
+                self._dict_configs[schema] = updated
+                dict_applied[schema] = list(dict_reload)
+                self._dict_subscribers[schema] = [ref for ref in self._dict_subscribers[schema] if ref() is not None]
+                list_notify.extend((ref, updated) for ref in self._dict_subscribers[schema])
+
+        for ref, updated in list_notify:
+            callback = ref()
+            if callback is None: continue
+            try: callback(updated)
+            except Exception as e: print(f'[Config] Error in the reload callback {callback}: {e}')
+        return dict_applied
+
+    def format_effective(self) -> str:
+        """
+        Returns the effective values of the registered sections as text. Values that differ from
+        the default are marked with '*', the reloadable entries with '(live)'.
+        """
+        list_lines = []
+        for config in self.get_registered():
+            list_lines.append(f'[{config.SECTION}]')
+            dict_defaults = config.get_defaults()
+            for key, spec in config.get_specs().items():
+                value = getattr(config, key)
+                marker = '*' if value != dict_defaults[key] else ' '
+                unit = f' {spec.unit}' if spec.unit else ''
+                live = ' (live)' if spec.reloadable else ''
+                list_lines.append(f' {marker} {key} = {value!r}{unit}{live}')
+        return '\n'.join(list_lines)
+
+
+config_registry = Config_Registry()
+
+
+def dump_effective_config() -> None:
+    """Prints the effective values of the registered config sections"""
+    print('>>>>> IRIS: EFFECTIVE CONFIGURATION (* = non-default) <<<<<')
+    print(config_registry.format_effective())
+
+
+def reload_config(config_file:str|None=None) -> dict[type[Class_ConfigSection],list[str]]:
+    """
+    Reloads the registered config sections, see Config_Registry.reload()
+    """
+    return config_registry.reload(config_file)
@@ -0,0 +1,334 @@
+"""
+Unattended focus-map acquisition: autofocus at a set of XY sites sampled over a mapping region and
+fit of a focus surface that can be applied to any mapping coordinates.
+
+The job runs without the GUI, directly on the stage and camera controllers:
+1. The sites are sampled on a regular grid over the bounding box of the region and snapped to the
+    nearest coordinate of the region (so that they lie on the sample).
+2. The visit order is optimised (nearest-neighbour tour improved by 2-opt) to minimise the XY travel.
+3. At each site, a discrete Z sweep centred on the Z predicted from the sites already focused is
+    scored with the same sharpness metric as the autofocus of the motion controller, and a
+    Gaussian is fitted on the scores.
+4. The fits with a poor goodness of fit, a low contrast or a peak outside the sweep are rejected.
+5. A focus surface (see iris.data.focus_surface) is fitted on the accepted sites.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import cv2 as cv
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.spatial import cKDTree
+
+from iris.controllers.class_xy_stage_controller import Class_XYController
+from iris.controllers.class_z_stage_controller import Class_ZController
+from iris.controllers.class_camera_controller import Class_CameraController
+from iris.data.measurement_coordinates import MeaCoor_mm
+from iris.data.focus_surface import Class_FocusSurface, FocusSurfaceMethod, fit_focus_surface
+
+
+def calculate_focus_score(image_gray:np.ndarray, blur:int=1) -> float:
+    """
+    Calculates the sharpness of an image: mean of the top 10% squared Sobel gradient magnitudes
+
+    Args:
+        image_gray (np.ndarray): grayscale image
+        blur (int): median blur kernel size (odd) applied before the gradient. Defaults to 1 (none).
+
+    Returns:
+        float: the focus score
+    """
+    if blur > 1:
+        image_gray = cv.medianBlur(image_gray, blur)
+    sx = cv.Sobel(image_gray, cv.CV_64F, 1, 0, ksize=3)
+    sy = cv.Sobel(image_gray, cv.CV_64F, 0, 1, ksize=3)
+    magnitude = sx**2 + sy**2
+    threshold = np.percentile(magnitude, 90)
+    return float(magnitude[magnitude >= threshold].mean())
+
+@dataclass
+class Focus_Peak:
+    z_mm: float             # Estimated best focus
+    r_squared: float        # Goodness of the Gaussian fit of the scores
+    contrast: float         # Peak amplitude relative to the peak score (0: flat, 1: no background)
+    in_range: bool          # Whether the peak lies within the sweep, away from its ends
+
+def fit_focus_peak(z_arr:np.ndarray, scores:np.ndarray) -> Focus_Peak|None:
+    """
+    Fits a Gaussian with a constant background on the focus scores of a Z sweep
+
+    Args:
+        z_arr (np.ndarray): Z positions of the frames [mm]
+        scores (np.ndarray): focus scores of the frames
+
+    Returns:
+        Focus_Peak|None: the peak, None if there are too few points or the fit fails
+    """
+    order = np.argsort(z_arr)
+    z_arr, scores = np.asarray(z_arr, dtype=float)[order], np.asarray(scores, dtype=float)[order]
+    if len(z_arr) < 5 or np.ptp(z_arr) <= 0: return None
+
+    def gaussian(z, amplitude, mu, sigma, offset):
+        return amplitude * np.exp(-(z - mu)**2 / (2 * sigma**2)) + offset
+
+    z_range = float(np.ptp(z_arr))
+    idx_max = int(np.argmax(scores))
+    p0 = [np.ptp(scores), z_arr[idx_max], z_range / 4, scores.min()]
+    bounds = ([0, -np.inf, z_range / (4 * len(z_arr)), -np.inf], [np.inf, np.inf, z_range, np.inf])
+    try: popt, _ = curve_fit(gaussian, z_arr, scores, p0=p0, bounds=bounds, maxfev=5000)
+    except (RuntimeError, ValueError): return None
+
+    amplitude, mu, _, offset = popt
+    residual = scores - gaussian(z_arr, *popt)
+    total = np.sum((scores - scores.mean())**2)
+    r_squared = 1 - np.sum(residual**2) / total if total > 0 else 0.0
+    peak = amplitude + offset
+    contrast = amplitude / peak if peak > 0 else 0.0
+    step = z_range / (len(z_arr) - 1)
+    in_range = bool(z_arr[0] + step <= mu <= z_arr[-1] - step)
+    return Focus_Peak(float(mu), float(r_squared), float(contrast), in_range)
+
+def generate_focus_sites(meaCoor:MeaCoor_mm, num_x:int, num_y:int) -> np.ndarray:
+    """
+    Samples the focus sites on a regular grid over the bounding box of the mapping coordinates,
+    each grid point being snapped to the nearest mapping coordinate (duplicates removed)
+
+    Args:
+        meaCoor (MeaCoor_mm): the mapping region
+        num_x (int): number of grid points along X
+        num_y (int): number of grid points along Y
+
+    Returns:
+        np.ndarray: (N, 2) XY coordinates of the sites [mm]
+    """
+    assert num_x >= 1 and num_y >= 1, 'generate_focus_sites: The number of sites must be positive.'
+    coor = np.asarray(meaCoor.mapping_coordinates, dtype=float)[:, :2]
+    assert len(coor) > 0, 'generate_focus_sites: The mapping coordinates are empty.'
+    (xmin, ymin), (xmax, ymax) = coor.min(axis=0), coor.max(axis=0)
+    grid_x, grid_y = np.meshgrid(np.linspace(xmin, xmax, num_x), np.linspace(ymin, ymax, num_y))
+    _, idx = cKDTree(coor).query(np.column_stack([grid_x.ravel(), grid_y.ravel()]))
+    _, idx_first = np.unique(idx, return_index=True)
+    return coor[idx[np.sort(idx_first)]]
+
+def optimise_visit_order(sites_xy:np.ndarray, start_xy:tuple[float,float]|None=None,
+                         max_passes:int=20) -> np.ndarray:
+    """
+    Optimises the visit order of the sites (open path from the start position): nearest-neighbour
+    tour improved with 2-opt moves
+
+    Args:
+        sites_xy (np.ndarray): (N, 2) XY coordinates of the sites
+        start_xy (tuple[float,float]|None): the current XY position. Defaults to None (start at the first site).
+        max_passes (int): maximum number of 2-opt passes. Defaults to 20.
+
+    Returns:
+        np.ndarray: (N,) indices of the sites in the visit order
+    """
+    sites_xy = np.asarray(sites_xy, dtype=float)
+    num_sites = len(sites_xy)
+    if num_sites <= 2: return np.arange(num_sites)
+    start = np.asarray(start_xy, dtype=float) if start_xy is not None else sites_xy[0]
+
+    # Nearest-neighbour tour
+    remaining = np.ones(num_sites, dtype=bool)
+    order = []
+    current = start
+    for _ in range(num_sites):
+        dist = np.where(remaining, np.linalg.norm(sites_xy - current, axis=1), np.inf)
+        idx = int(np.argmin(dist))
+        order.append(idx)
+        remaining[idx] = False
+        current = sites_xy[idx]
+    order = np.array(order)
+
+    # 2-opt on the open path with a fixed start: reversing the path between the sites i and j
+    # replaces the edges (i-1, i) and (j, j+1) with (i-1, j) and (i, j+1), no edge after the last site
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, num_sites):
+            path = np.vstack([start, sites_xy[order]])
+            a, b, c = path[i-1], path[i], path[i+1:]
+            gain = np.linalg.norm(a - b) - np.linalg.norm(c - a, axis=1)
+            gain[:-1] += np.linalg.norm(c[:-1] - path[i+2:], axis=1) - np.linalg.norm(b - path[i+2:], axis=1)
+            k = int(np.argmax(gain))
+            if gain[k] > 1e-12:
+                order[i-1:i+k+1] = order[i-1:i+k+1][::-1]
+                improved = True
+        if not improved: break
+    return order
+
+def get_path_length(sites_xy:np.ndarray, order:np.ndarray, start_xy:tuple[float,float]|None=None) -> float:
+    """Returns the travel length [mm] of visiting the sites in the given order"""
+    path = np.asarray(sites_xy, dtype=float)[order]
+    if start_xy is not None: path = np.vstack([start_xy, path])
+    return float(np.linalg.norm(np.diff(path, axis=0), axis=1).sum())
+
+@dataclass
+class FocusMap_Params:
+    num_sites_x: int = 4                # Number of sites along X
+    num_sites_y: int = 4                # Number of sites along Y
+    z_range_mm: float = 0.1             # Full width of the Z sweep at each site [mm]
+    z_step_mm: float = 0.005            # Z step of the sweep [mm]
+    blur_kernel: int = 3                # Median blur kernel size of the focus score
+    settle_time_sec: float = 0.0        # Wait after each move before the capture [s]
+    min_r_squared: float = 0.8          # Minimum goodness of the Gaussian fit of an accepted site
+    min_contrast: float = 0.2           # Minimum peak contrast of an accepted site
+    surface_method: FocusSurfaceMethod = 'tps'  # Method of the fitted focus surface
+
+    def __post_init__(self):
+        assert self.num_sites_x >= 1 and self.num_sites_y >= 1, 'FocusMap_Params: The number of sites must be positive.'
+        assert self.z_range_mm > 0 and 0 < self.z_step_mm < self.z_range_mm, 'FocusMap_Params: Invalid Z sweep.'
+        assert self.blur_kernel >= 1 and self.blur_kernel % 2 == 1, 'FocusMap_Params: The blur kernel must be a positive odd integer.'
+
+@dataclass
+class Focus_Site:
+    x_mm: float
+    y_mm: float
+    z_mm: float|None                    # Best focus, None if the fit failed
+    r_squared: float = 0.0
+    contrast: float = 0.0
+    accepted: bool = False
+    reason: str = ''                    # Reason for the rejection
+
+@dataclass
+class FocusMap_Result:
+    sites: list[Focus_Site] = field(default_factory=list)  # In the visit order
+    surface: Class_FocusSurface|None = None                 # None if too few sites were accepted
+    path_length_mm: float = 0.0
+    duration_sec: float = 0.0
+
+    def get_references(self) -> np.ndarray:
+        """Returns the (N, 3) XYZ coordinates of the accepted sites"""
+        return np.array([(site.x_mm, site.y_mm, site.z_mm) for site in self.sites if site.accepted], dtype=float).reshape(-1, 3)
+
+    def to_reference_MeaCoor(self, name:str) -> MeaCoor_mm:
+        """Returns the accepted sites as mapping coordinates, e.g., as the reference of the Z interpolation"""
+        return MeaCoor_mm(name, [tuple(float(val) for val in coor) for coor in self.get_references()])
+
+    def apply(self, meaCoor:MeaCoor_mm, name:str|None=None) -> MeaCoor_mm:
+        """
+        Assigns the Z-coordinates of the mapping coordinates from the focus surface
+
+        Args:
+            meaCoor (MeaCoor_mm): the mapping coordinates
+            name (str|None): name of the new mapping coordinates. Defaults to the name with a '_focusMap' suffix.
+
+        Returns:
+            MeaCoor_mm: the new mapping coordinates
+        """
+        if self.surface is None: raise ValueError('apply: No focus surface, too few sites were accepted.')
+        coor = np.asarray(meaCoor.mapping_coordinates, dtype=float)
+        z = self.surface.evaluate(coor[:, :2])
+        list_coor = [(float(x), float(y), float(zz)) for (x, y), zz in zip(coor[:, :2], z)]
+        return MeaCoor_mm(name if name is not None else meaCoor.mappingUnit_name + '_focusMap', list_coor)
+
+class FocusMap_Job():
+    """
+    Headless focus-mapping job running on the stage and camera controllers
+    """
+    def __init__(self, ctrl_xy:Class_XYController, ctrl_z:Class_ZController, camera:Class_CameraController,
+                 params:FocusMap_Params|None=None, flg_stop:threading.Event|None=None,
+                 callback_progress:Callable[[int,int,Focus_Site],None]|None=None):
+        """
+        Args:
+            ctrl_xy (Class_XYController): XY stage controller
+            ctrl_z (Class_ZController): Z stage controller
+            camera (Class_CameraController): camera controller
+            params (FocusMap_Params|None): parameters of the job. Defaults to FocusMap_Params().
+            flg_stop (threading.Event|None): set to abort the job. Defaults to None.
+            callback_progress (Callable|None): called with (site index, number of sites, site)
+                after each site. Defaults to None.
+        """
+        self._ctrl_xy = ctrl_xy
+        self._ctrl_z = ctrl_z
+        self._camera = camera
+        self._params = params if params is not None else FocusMap_Params()
+        self._flg_stop = flg_stop if flg_stop is not None else threading.Event()
+        self._callback_progress = callback_progress
+
+    def _capture_gray(self) -> np.ndarray:
+        img = np.array(self._camera.img_capture())
+        if img.ndim == 3: img = cv.cvtColor(img, cv.COLOR_RGB2GRAY)
+        return img
+
+    def _predict_z(self, accepted:list[Focus_Site], x:float, y:float, z_default:float) -> float:
+        """Predicts the focus at a site from the sites already accepted: plane fit, nearest site or default"""
+        if len(accepted) >= 3:
+            try: return float(fit_focus_surface([(s.x_mm, s.y_mm, s.z_mm) for s in accepted], 'plane').evaluate([[x, y]])[0])
+            except ValueError: pass     # Collinear sites
+        if accepted:
+            nearest = min(accepted, key=lambda s: (s.x_mm - x)**2 + (s.y_mm - y)**2)
+            return nearest.z_mm
+        return z_default
+
+    def _autofocus_site(self, x:float, y:float, z_centre:float) -> Focus_Site:
+        """Sweeps Z around z_centre at the current XY position and fits the focus peak"""
+        params = self._params
+        num_steps = int(round(params.z_range_mm / params.z_step_mm)) + 1
+        list_z, list_score = [], []
+        for z_target in z_centre + np.linspace(-params.z_range_mm/2, params.z_range_mm/2, num_steps):
+            if self._flg_stop.is_set(): break
+            self._ctrl_z.move_direct(float(z_target))
+            if params.settle_time_sec > 0: time.sleep(params.settle_time_sec)
+            list_z.append(float(self._ctrl_z.get_coordinates()))    # The stage may not reach the target exactly
+            list_score.append(calculate_focus_score(self._capture_gray(), params.blur_kernel))
+
+        peak = fit_focus_peak(np.array(list_z), np.array(list_score))
+        if peak is None: return Focus_Site(x, y, None, reason='fit failed')
+        site = Focus_Site(x, y, peak.z_mm, peak.r_squared, peak.contrast)
+        if not peak.in_range: site.reason = 'peak outside the sweep'
+        elif peak.r_squared < params.min_r_squared: site.reason = f'poor fit (R² {peak.r_squared:.2f})'
+        elif peak.contrast < params.min_contrast: site.reason = f'low contrast ({peak.contrast:.2f})'
+        else: site.accepted = True
+        return site
+
+    def run(self, meaCoor:MeaCoor_mm, z_start_mm:float|None=None) -> FocusMap_Result:
+        """
+        Runs the focus mapping over the region of the mapping coordinates
+
+        Args:
+            meaCoor (MeaCoor_mm): the mapping region
+            z_start_mm (float|None): centre of the sweep of the first site. Defaults to the current Z.
+
+        Returns:
+            FocusMap_Result: the sites and the fitted focus surface. The surface is None if the job
+                was stopped or too few sites were accepted.
+        """
+        time1 = time.perf_counter()
+        params = self._params
+        self._flg_stop.clear()
+        z_default = float(self._ctrl_z.get_coordinates()) if z_start_mm is None else z_start_mm
+        start_xy = tuple(self._ctrl_xy.get_coordinates())
+
+        sites_xy = generate_focus_sites(meaCoor, params.num_sites_x, params.num_sites_y)
+        order = optimise_visit_order(sites_xy, start_xy)
+        result = FocusMap_Result(path_length_mm=get_path_length(sites_xy, order, start_xy))
+
+        accepted:list[Focus_Site] = []
+        for i, idx in enumerate(order):
+            if self._flg_stop.is_set(): break
+            x, y = (float(val) for val in sites_xy[idx])
+            self._ctrl_xy.move_direct((x, y))
+            site = self._autofocus_site(x, y, self._predict_z(accepted, x, y, z_default))
+            result.sites.append(site)
+            if site.accepted: accepted.append(site)
+            if self._callback_progress is not None: self._callback_progress(i, len(order), site)
+
+        if not self._flg_stop.is_set() and accepted:
+            try: result.surface = fit_focus_surface(result.get_references(), params.surface_method)
+            except ValueError as e: print(f'FocusMap_Job: The focus surface could not be fitted: {e}')
+        result.duration_sec = time.perf_counter() - time1
+        return result
+
+    def stop(self) -> None:
+        """Aborts the job after the current frame"""
+        self._flg_stop.set()
@@ -0,0 +1,243 @@
+"""
+Pipelined image tiling acquisition: moves the stage through the tile coordinates and captures an
+image at each, while the images already captured are processed (cropped, thumbnailed, stored)
+in a background thread, overlapping the next stage move.
+
+- The tiles are visited in a serpentine (boustrophedon) order: rows of tiles scanned in alternate
+    directions, instead of returning to the start of every row
+- The image is captured as soon as the stage has settled, detected from the stage coordinates
+    (stationary within a tolerance over the last samples and on the target), instead of waiting a
+    fixed settle time after every move. A stage stationary off its target (e.g., rounding of the
+    target to the motor steps) is settled after the fixed settle time. The coordinates are polled no
+    faster than the stage hub samples them, such that every sample is a new one.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Sequence
+
+import numpy as np
+from PIL import Image
+
+from iris.controllers import ControllerConfigEnum
+from iris.multiprocessing import MPMeaHub_Config
+from iris.utils.config_schema import config_registry
+from iris.utils.general import get_timestamp_us_str
+
+SETTLE_NUM_SAMPLES = 3          # Number of consecutive stationary stage samples of a settled stage
+SETTLE_TIMEOUT_SEC = 10.0       # Timeout of the settling, reset while the stage is moving [s]
+PIPELINE_MAX_PENDING = 8        # Maximum number of captured images waiting to be processed
+
+
+def order_serpentine(list_coor:Sequence[Sequence[float]], tol_mm:float=1e-3) -> list[int]:
+    """
+    Orders tile coordinates in a serpentine: the tiles are grouped into rows (along the axis with
+    the fewest distinct values, i.e., the longest rows), scanned in alternate directions
+
+    Args:
+        list_coor (Sequence[Sequence[float]]): Tile coordinates (x,y[,z]) [mm]
+        tol_mm (float): Tolerance to group the coordinates into rows [mm]. Default is 1e-3
+
+    Returns:
+        list[int]: Indices of the tiles in the serpentine order
+    """
+    if len(list_coor) == 0: return []
+    arr = np.asarray(list_coor, dtype=float)[:,:2]
+    rounded = np.round(arr/tol_mm)
+    # Rows along x (constant y) unless there are fewer distinct x values
+    axis_row = 1 if len(np.unique(rounded[:,1])) <= len(np.unique(rounded[:,0])) else 0
+    axis_scan = 1 - axis_row
+
+    list_order = []
+    for i, row_value in enumerate(np.unique(rounded[:,axis_row])):
+        idx_row = np.nonzero(rounded[:,axis_row] == row_value)[0]
+        idx_row = idx_row[np.argsort(arr[idx_row,axis_scan], kind='stable')]
+        if i % 2 == 1: idx_row = idx_row[::-1]
+        list_order.extend(int(idx) for idx in idx_row)
+    return list_order
+
+
+def calculate_travel_mm(list_coor:Sequence[Sequence[float]], order:Sequence[int]|None=None) -> float:
+    """
+    Calculates the total XY travel distance through tile coordinates
+
+    Args:
+        list_coor (Sequence[Sequence[float]]): Tile coordinates (x,y[,z]) [mm]
+        order (Sequence[int]|None): Order of the tiles, None for the given order. Default is None
+
+    Returns:
+        float: Travel distance [mm]
+    """
+    if len(list_coor) < 2: return 0.0
+    arr = np.asarray(list_coor, dtype=float)[:,:2]
+    if order is not None: arr = arr[list(order)]
+    return float(np.linalg.norm(np.diff(arr, axis=0), axis=1).sum())
+
+
+def wait_stage_settled(getter_coor:Callable[[],Sequence[float]|None],
+                       target_mm:Sequence[float|None]|None=None,
+                       getter_moving:Callable[[],bool]|None=None,
+                       tol_mm:float|None=None, target_tol_mm:float|None=None,
+                       settle_sec:float|None=None, num_samples:int=SETTLE_NUM_SAMPLES,
+                       timeout_sec:float=SETTLE_TIMEOUT_SEC, poll_sec:float|None=None) -> bool:
+    """
+    Waits for the stage to settle: the last stage coordinate samples are within a tolerance of each
+    other (stationary) and of the target, or the stage has been stationary for the settle time
+
+    Args:
+        getter_coor (Callable[[],Sequence[float]|None]): Returns the current stage coordinates [mm],
+            e.g., from DataStreamer_StageCam.get_coordinates_closest, or None if not available
+        target_mm (Sequence[float|None]|None): Target coordinates [mm], None for the axes (or all)
+            to ignore. Default is None
+        getter_moving (Callable[[],bool]|None): Returns True while the move command is running,
+            e.g., a stage thread alive. Default is None
+        tol_mm (float|None): Max coordinate change between the samples of a stationary stage [mm].
+            Default (None) is ControllerConfigEnum.STAGE_TILING_SETTLE_TOL_MM
+        target_tol_mm (float|None): Max distance to the target of a settled stage [mm].
+            Default (None) is ControllerConfigEnum.STAGE_TILING_TARGET_TOL_MM
+        settle_sec (float|None): Time after which a stationary stage off the target is settled [s].
+            Default (None) is ControllerConfigEnum.STAGE_TILING_SETTLE_SEC
+        num_samples (int): Number of stationary samples. Default is SETTLE_NUM_SAMPLES
+        timeout_sec (float): Timeout, reset while the stage is moving [s]. Default is SETTLE_TIMEOUT_SEC
+        poll_sec (float|None): Polling interval [s], not shorter than the sampling interval of the
+            coordinates, otherwise a repeated sample is taken for a stationary one.
+            Default (None) is the stage hub request interval (stagehub_request_interval)
+
+    Returns:
+        bool: True if the stage settled, False on timeout
+    """
+    tol_mm = tol_mm if tol_mm is not None else ControllerConfigEnum.STAGE_TILING_SETTLE_TOL_MM.value
+    target_tol_mm = target_tol_mm if target_tol_mm is not None else ControllerConfigEnum.STAGE_TILING_TARGET_TOL_MM.value
+    settle_sec = settle_sec if settle_sec is not None else ControllerConfigEnum.STAGE_TILING_SETTLE_SEC.value
+    if poll_sec is None: poll_sec = config_registry.get(MPMeaHub_Config).stagehub_request_interval/1e3
+    assert num_samples >= 2, 'At least 2 samples are required to detect a stationary stage'
+
+    if target_mm is not None:
+        mask_target = np.array([value is not None for value in target_mm])
+        arr_target = np.array([value if value is not None else np.nan for value in target_mm], dtype=float)
+
+    history:deque[np.ndarray] = deque(maxlen=num_samples)
+    time_moved = time.perf_counter()
+    while True:
+        flg_moving = getter_moving() if getter_moving is not None else False
+        coor = getter_coor()
+        now = time.perf_counter()
+        if coor is not None:
+            coor = np.asarray(coor, dtype=float)
+            if len(history) > 0 and np.abs(coor - history[-1]).max() > tol_mm:
+                history.clear()
+                time_moved = now
+            history.append(coor)
+        if flg_moving: time_moved = now
+
+        if not flg_moving and len(history) == num_samples:
+            flg_on_target = target_mm is None or\
+                bool(np.all(np.abs(coor[mask_target] - arr_target[mask_target]) <= target_tol_mm))
+            if flg_on_target or now - time_moved >= settle_sec: return True
+
+        if now - time_moved > timeout_sec: return False
+        time.sleep(poll_sec)
+
+
+class TilingPipeline():
+    """
+    Acquires images at a list of coordinates, processing every image in a background thread while
+    the stage moves to the next coordinate
+    """
+    def __init__(self, move:Callable[[tuple[float,float,float]],bool|None],
+                 capture:Callable[[],Image.Image|None],
+                 process:Callable[[tuple[float,float,float],Image.Image,str],None],
+                 flg_stop:threading.Event|None=None, max_pending:int=PIPELINE_MAX_PENDING):
+        """
+        Args:
+            move (Callable[[tuple[float,float,float]],bool|None]): Moves the stage to the coordinates
+                (x,y,z) [mm] and returns once the stage has settled (see wait_stage_settled). Returns
+                False if the move failed (the tile is skipped)
+            capture (Callable[[],Image.Image|None]): Captures an image, None if the capture failed
+                (the tile is skipped)
+            process (Callable[[tuple[float,float,float],Image.Image,str],None]): Processes a captured
+                image (coordinates, image, capture timestamp), called in the processing thread in
+                the capture order
+            flg_stop (threading.Event|None): Event to stop the acquisition. Default is None
+            max_pending (int): Maximum number of captured images waiting to be processed, the
+                acquisition waits for the processing beyond. Default is PIPELINE_MAX_PENDING
+        """
+        assert max_pending > 0, 'The maximum number of pending images must be positive'
+        self._move = move
+        self._capture = capture
+        self._process = process
+        self._flg_stop = flg_stop if flg_stop is not None else threading.Event()
+        self._queue:queue.Queue = queue.Queue(maxsize=max_pending)
+        self._list_errors:list[Exception] = []
+
+    def get_num_pending(self) -> int:
+        """Returns the number of captured images waiting to be processed"""
+        return self._queue.qsize()
+
+    def _run_processing(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None: return
+                # Keep draining the queue after an error, so that the acquisition never blocks
+                if not self._list_errors: self._process(*item)
+            except Exception as e:
+                print('Error in TilingPipeline processing:', e)
+                self._list_errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def run(self, list_coor:Sequence[tuple[float,float,float]], serpentine:bool=True,
+            callback_progress:Callable[[int,int],None]|None=None) -> int:
+        """
+        Acquires and processes the images at the coordinates, returns once all the captured images
+        are processed
+
+        Args:
+            list_coor (Sequence[tuple[float,float,float]]): Coordinates (x,y,z) of the tiles [mm]
+            serpentine (bool): Visit the tiles in a serpentine order (see order_serpentine), else in
+                the given order. Default is True
+            callback_progress (Callable[[int,int],None]|None): Called before every tile with the
+                number of tiles done and the total. Default is None
+
+        Returns:
+            int: Number of images captured and processed
+
+        Raises:
+            Exception: The first error raised by the processing
+        """
+        order = order_serpentine(list_coor) if serpentine else list(range(len(list_coor)))
+        self._list_errors.clear()
+        thread = threading.Thread(target=self._run_processing, daemon=True)
+        thread.start()
+
+        num_captured = 0
+        try:
+            for i, idx in enumerate(order):
+                if self._flg_stop.is_set() or self._list_errors: break
+                if callback_progress is not None: callback_progress(i, len(order))
+                coor = tuple(list_coor[idx])
+                if self._move(coor) is False:
+                    print(f'Error in TilingPipeline: Failed to move to the coordinate {coor}')
+                    continue
+                img = self._capture()
+                timestamp = get_timestamp_us_str()
+                if not isinstance(img, Image.Image):
+                    print(f'Error in TilingPipeline: No image captured at the coordinate {coor}')
+                    continue
+                self._queue.put((coor, img, timestamp))
+                num_captured += 1
+        finally:
+            self._queue.put(None)
+            thread.join()
+
+        if self._list_errors: raise self._list_errors[0]
+        return num_captured
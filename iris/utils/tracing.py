@@ -0,0 +1,416 @@
+"""
+Lightweight cross-process tracing, exported as Chrome/Perfetto trace JSON (chrome://tracing or
+https://ui.perfetto.dev).
+
+Each process writes its events into its own ring buffer in shared memory, without locks: a slot is
+claimed from an atomic counter and published by writing its sequence number last (seqlock), so that
+a reader in another process never sees a half-written event. The events use the monotonic
+perf_counter clock of each process, aligned to the wall clock with a (perf_counter, time_ns) pair
+taken when the ring buffer is created.
+
+The tracing is disabled by default and switched on and off at runtime for all the processes of the
+app through a small control block in shared memory. The processes started after this module is
+imported share the control block through the IRIS_TRACE_ROOT environment variable. Each process
+lists its PID in a slot of the control block, claimed by creating a per-slot marker in shared memory
+(the creation fails if the slot is taken, an atomic claim across the processes). While disabled, a
+span costs a function call and a flag check.
+
+Usage:
+    enable_tracing()
+    with trace_span('raman.measure', cat='acquisition', frames=16):
+        ...
+    @traced('stage.interpolate', cat='interpolation')
+    def get_coordinates(...): ...
+    export_chrome_trace('trace.json')
+    close_tracing()     # In the main process, when done
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import functools
+import itertools
+import json
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable
+
+import numpy as np
+
+ENV_TRACE_ROOT = 'IRIS_TRACE_ROOT'
+os.environ.setdefault(ENV_TRACE_ROOT, str(os.getpid()))
+
+TRACE_DEFAULT_CAPACITY = 32768    # Events per process (~6 MB)
+TRACE_MAX_PROCESSES = 64
+TRACE_ATTACH_RETRY_SEC = 1.0    # Minimum interval to look for the control block while tracing is off
+
+_DTYPE_EVENT = np.dtype([
+    ('seq', np.int64),      # Slot sequence number + 1, 0 while being written
+    ('ts_ns', np.int64),    # perf_counter_ns at the start of the event
+    ('dur_ns', np.int64),   # Duration, spans only
+    ('tid', np.int64),      # Native thread ID
+    ('ph', 'S1'),           # Chrome trace phase: X (span), i (instant), C (counter), M (metadata)
+    ('name', 'S48'),
+    ('cat', 'S16'),
+    ('args', 'S80'),        # JSON encoded arguments
+])
+
+# Control block: [enabled, capacity, epoch_wall_ns, <reserved>, pid_0, ..., pid_N]
+_CTL_ENABLED, _CTL_CAPACITY, _CTL_EPOCH = 0, 1, 2
+_CTL_PIDS = 4
+# Ring buffer header: [pid, perf0_ns, wall0_ns, capacity]
+_RING_HEADER = 4
+
+
+def _get_ctl_name() -> str:
+    return f'iris_tr_{os.environ[ENV_TRACE_ROOT]}_ctl'
+
+
+def _get_ring_name(pid:int) -> str:
+    return f'iris_tr_{os.environ[ENV_TRACE_ROOT]}_{pid}'
+
+
+def _get_slot_name(idx:int) -> str:
+    return f'iris_tr_{os.environ[ENV_TRACE_ROOT]}_slot{idx}'
+
+
+def _unlink_shm(name:str) -> None:
+    try:
+        shm = SharedMemory(name=name, track=False)
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError: pass
+
+
+def _get_clock_pair() -> tuple[int,int]:
+    """Returns a (perf_counter_ns, time_ns) pair taken as close together as possible"""
+    list_pairs = []
+    for _ in range(5):
+        perf_start = time.perf_counter_ns()
+        wall = time.time_ns()
+        perf_end = time.perf_counter_ns()
+        list_pairs.append((perf_end - perf_start, (perf_start + perf_end)//2, wall))
+    _, perf, wall = min(list_pairs)
+    return perf, wall
+
+
+def _encode_args(args:dict) -> bytes:
+    if not args: return b''
+    text = json.dumps(args, default=str).encode()
+    return text if len(text) <= _DTYPE_EVENT['args'].itemsize else b'{"truncated":true}'
+
+
+class _Trace_Ring():
+    """
+    Ring buffer of the events of one process, in shared memory
+    """
+    def __init__(self, name:str, create:bool, capacity:int=0):
+        if create:
+            size = 8*_RING_HEADER + capacity*_DTYPE_EVENT.itemsize
+            self._shm = SharedMemory(name=name, create=True, size=size, track=False)
+        else:
+            self._shm = SharedMemory(name=name, track=False)
+        self.header = np.ndarray((_RING_HEADER,), dtype=np.int64, buffer=self._shm.buf)
+        if create:
+            perf0, wall0 = _get_clock_pair()
+            self.header[:] = (os.getpid(), perf0, wall0, capacity)
+        self.capacity = int(self.header[3])
+        self.events = np.ndarray((self.capacity,), dtype=_DTYPE_EVENT, buffer=self._shm.buf, offset=8*_RING_HEADER)
+        self._counter = itertools.count()
+
+    def write(self, ph:bytes, name:str, cat:str, ts_ns:int, dur_ns:int, args:bytes) -> None:
+        slot = next(self._counter)     # Atomic under the GIL, no lock needed between the threads
+        idx = slot % self.capacity
+        self.events['seq'][idx] = 0
+        self.events[idx] = (0, ts_ns, dur_ns, threading.get_native_id(), ph, name.encode()[:48], cat.encode()[:16], args)
+        self.events['seq'][idx] = slot + 1
+
+    def read(self) -> np.ndarray:
+        """Returns a consistent copy of the published events, oldest first"""
+        events = self.events.copy()
+        seq_after = self.events['seq'].copy()
+        events = events[(events['seq'] > 0) & (events['seq'] == seq_after)]
+        return events[np.argsort(events['seq'])]
+
+    def close(self, unlink:bool=False) -> None:
+        del self.header, self.events
+        self._shm.close()
+        if unlink: self._shm.unlink()
+
+
+class _Trace_State():
+    """
+    Tracing state of the current process
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self.ctl:np.ndarray|None = None
+        self.shm_ctl:SharedMemory|None = None
+        self.ring:_Trace_Ring|None = None
+        self.shm_slot:SharedMemory|None = None     # Marker of the PID slot claimed in the control block
+        self.next_attach = 0.0
+        self.local = threading.local()   # Per thread: the thread name is recorded
+        self.lock = threading.Lock()     # Only for the (rare) set-up of the ring buffer
+
+    def attach_ctl(self, create:bool=False, capacity:int=TRACE_DEFAULT_CAPACITY) -> bool:
+        if self.ctl is not None: return True
+        size = 8*(_CTL_PIDS + TRACE_MAX_PROCESSES)
+        try: shm = SharedMemory(name=_get_ctl_name(), track=False)
+        except FileNotFoundError:
+            if not create: return False
+            try:
+                shm = SharedMemory(name=_get_ctl_name(), create=True, size=size, track=False)
+                np.ndarray((size//8,), dtype=np.int64, buffer=shm.buf)[:] = 0
+                np.ndarray((size//8,), dtype=np.int64, buffer=shm.buf)[_CTL_CAPACITY] = capacity
+            except FileExistsError: shm = SharedMemory(name=_get_ctl_name(), track=False)
+        self.shm_ctl = shm
+        self.ctl = np.ndarray((size//8,), dtype=np.int64, buffer=shm.buf)
+        return True
+
+    def get_ring(self) -> _Trace_Ring:
+        if self.ring is not None: return self.ring
+        with self.lock:
+            if self.ring is not None: return self.ring
+            ring = _Trace_Ring(_get_ring_name(self.pid), create=True, capacity=int(self.ctl[_CTL_CAPACITY]))
+            # Registers the process in the control block
+            pids = self.ctl[_CTL_PIDS:]
+            for idx in range(len(pids)):
+                if pids[idx] != 0: continue
+                try: self.shm_slot = SharedMemory(name=_get_slot_name(idx), create=True, size=8, track=False)
+                except FileExistsError: continue    # Claimed by another process in the meantime
+                pids[idx] = self.pid
+                break
+            else: print('tracing: Too many traced processes, the events of this process are not exported')
+            ring.write(b'M', 'process_name', '', 0, 0, _encode_args({'name': mp.current_process().name}))
+            self.ring = ring
+        return ring
+
+
+_state = _Trace_State()
+
+
+def _get_state() -> _Trace_State:
+    """Returns the tracing state of the current process (a new one after a fork)"""
+    global _state
+    if _state.pid != os.getpid(): _state = _Trace_State()
+    return _state
+
+
+def is_tracing_enabled() -> bool:
+    state = _get_state()
+    if state.ctl is None:
+        now = time.monotonic()
+        if now < state.next_attach: return False
+        state.next_attach = now + TRACE_ATTACH_RETRY_SEC
+        if not state.attach_ctl(): return False
+    return bool(state.ctl[_CTL_ENABLED])
+
+
+def enable_tracing(capacity:int=TRACE_DEFAULT_CAPACITY) -> None:
+    """
+    Enables the tracing in all the processes of the app.
+
+    Args:
+        capacity (int, optional): number of events kept per process, used by the processes that
+            start tracing afterwards. Defaults to TRACE_DEFAULT_CAPACITY.
+    """
+    assert capacity > 0, 'enable_tracing: The capacity must be positive.'
+    state = _get_state()
+    state.attach_ctl(create=True, capacity=capacity)
+    state.ctl[_CTL_ENABLED] = 1
+
+
+def disable_tracing() -> None:
+    """Disables the tracing in all the processes, the recorded events are kept for the export"""
+    state = _get_state()
+    if state.attach_ctl(): state.ctl[_CTL_ENABLED] = 0
+
+
+def clear_trace() -> None:
+    """Discards the events recorded so far (from the export)"""
+    state = _get_state()
+    if state.attach_ctl(): state.ctl[_CTL_EPOCH] = time.time_ns()
+
+
+def _record(ph:bytes, name:str, cat:str, ts_ns:int, dur_ns:int, args:dict) -> None:
+    state = _get_state()
+    ring = state.get_ring()
+    if not getattr(state.local, 'named', False):
+        state.local.named = True
+        ring.write(b'M', 'thread_name', '', 0, 0, _encode_args({'name': threading.current_thread().name}))
+    ring.write(ph, name, cat, ts_ns, dur_ns, _encode_args(args))
+
+
+class _Span():
+    """Context manager recording a complete event (Chrome phase 'X')"""
+    __slots__ = ('_name', '_cat', '_args', '_start')
+
+    def __init__(self, name:str, cat:str, args:dict):
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None: self._args['error'] = exc_type.__name__
+        try: _record(b'X', self._name, self._cat, self._start, end - self._start, self._args)
+        except Exception as e: print(f'tracing: Failed to record {self._name}: {e}')
+        return False
+
+    def set_arg(self, key:str, value:Any) -> None:
+        """Adds an argument to the span, e.g., a result known at its end"""
+        self._args[key] = value
+
+
+class _NullSpan():
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc_value, traceback): return False
+    def set_arg(self, key:str, value:Any) -> None: pass
+
+_NULL_SPAN = _NullSpan()
+
+
+def trace_span(name:str, cat:str='iris', **args) -> _Span|_NullSpan:
+    """
+    Returns a context manager recording its duration as a span, if the tracing is enabled.
+
+    Args:
+        name (str): span name (up to 48 characters)
+        cat (str, optional): category (up to 16 characters), e.g., 'acquisition'. Defaults to 'iris'.
+        **args: arguments shown with the span (JSON serialisable, up to 80 characters encoded)
+    """
+    if not is_tracing_enabled(): return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def traced(name:str|None=None, cat:str='iris') -> Callable:
+    """
+    Decorator recording every call of the function as a span.
+
+    Args:
+        name (str|None, optional): span name. Defaults to the qualified name of the function.
+        cat (str, optional): category. Defaults to 'iris'.
+    """
+    def decorator(func:Callable) -> Callable:
+        span_name = name or func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_tracing_enabled(): return func(*args, **kwargs)
+            with _Span(span_name, cat, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_instant(name:str, cat:str='iris', **args) -> None:
+    """Records an instant event (Chrome phase 'i'), if the tracing is enabled"""
+    if not is_tracing_enabled(): return
+    try: _record(b'i', name, cat, time.perf_counter_ns(), 0, args)
+    except Exception as e: print(f'tracing: Failed to record {name}: {e}')
+
+
+def trace_counter(name:str, cat:str='iris', **values:float) -> None:
+    """Records counter values (Chrome phase 'C'), e.g., a queue length, if the tracing is enabled"""
+    if not is_tracing_enabled(): return
+    try: _record(b'C', name, cat, time.perf_counter_ns(), 0, values)
+    except Exception as e: print(f'tracing: Failed to record {name}: {e}')
+
+
+def collect_trace_events() -> list[dict]:
+    """
+    Collects the events of all the traced processes, aligned to a common clock.
+
+    Returns:
+        list[dict]: Chrome trace events, the metadata first and then in time order, with the
+            timestamps in [us] from the first event
+    """
+    state = _get_state()
+    if not state.attach_ctl(): return []
+    epoch_ns = int(state.ctl[_CTL_EPOCH])
+    list_meta, list_events = [], []
+    for pid in [int(pid) for pid in state.ctl[_CTL_PIDS:] if pid != 0]:
+        if pid == state.pid and state.ring is not None: ring, flg_own = state.ring, True
+        else:
+            try: ring, flg_own = _Trace_Ring(_get_ring_name(pid), create=False), False
+            except FileNotFoundError: continue     # The process has ended (Windows) or has been cleaned up
+        try:
+            _, perf0, wall0, _ = (int(val) for val in ring.header)
+            events = ring.read()
+        finally:
+            if not flg_own: ring.close()
+
+        for event in events:
+            ph = event['ph'].decode()
+            args = json.loads(event['args']) if event['args'] else {}
+            tid = int(event['tid'])
+            if ph == 'M':
+                list_meta.append({'name': event['name'].decode(errors='replace'), 'ph': 'M', 'pid': pid, 'tid': tid, 'args': args})
+                continue
+            wall_ns = wall0 + int(event['ts_ns']) - perf0
+            if wall_ns < epoch_ns: continue
+            dict_event = {'name': event['name'].decode(errors='replace'), 'cat': event['cat'].decode(errors='replace'), 'ph': ph,
+                          'ts': wall_ns, 'pid': pid, 'tid': tid, 'args': args}
+            if ph == 'X': dict_event['dur'] = int(event['dur_ns'])/1e3
+            if ph == 'i': dict_event['s'] = 't'
+            list_events.append(dict_event)
+
+    # Spans starting together: the enclosing (longer) one first
+    list_events.sort(key=lambda event: (event['ts'], -event.get('dur', 0)))
+    ts0 = list_events[0]['ts'] if list_events else 0
+    for event in list_events: event['ts'] = (event['ts'] - ts0)/1e3
+    return list_meta + list_events
+
+
+def export_chrome_trace(filepath:str) -> int:
+    """
+    Exports the recorded events as a Chrome/Perfetto trace JSON file.
+
+    Args:
+        filepath (str): path of the .json file
+
+    Returns:
+        int: number of exported events (excluding the metadata)
+    """
+    list_events = collect_trace_events()
+    with open(filepath, 'w') as f:
+        json.dump({'traceEvents': list_events, 'displayTimeUnit': 'ms'}, f)
+    return sum(event['ph'] != 'M' for event in list_events)
+
+
+def close_tracing() -> None:
+    """
+    Disables the tracing and frees the shared memory of all the processes. To be called by the
+    main process when the app closes (or after the export).
+    """
+    state = _get_state()
+    if not state.attach_ctl(): return
+    state.ctl[_CTL_ENABLED] = 0
+    for idx, pid in enumerate(int(pid) for pid in state.ctl[_CTL_PIDS:]):
+        if pid == 0 or pid == state.pid: continue
+        _unlink_shm(_get_ring_name(pid))
+        _unlink_shm(_get_slot_name(idx))
+    if state.ring is not None:
+        state.ring.close(unlink=True)
+        state.ring = None
+    if state.shm_slot is not None:
+        state.shm_slot.close()
+        state.shm_slot.unlink()
+        state.shm_slot = None
+    del state.ctl
+    state.ctl = None
+    state.shm_ctl.close()
+    state.shm_ctl.unlink()
+    state.shm_ctl = None
+    state.local = threading.local()
+    state.next_attach = 0.0
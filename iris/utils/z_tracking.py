@@ -0,0 +1,129 @@
+"""
+Feed-forward Z tracking of a focus surface while the XY stage moves, e.g., along the lines of a
+continuous mapping scan.
+
+The XY position is polled at the update rate and the XY velocity is estimated by a least-squares
+line over the last positions. The Z command is the focus surface evaluated at the XY position
+predicted one Z-stage latency ahead, so that the Z stage reaches it when the XY stage gets there.
+To protect the Z stage, the commands are limited to the maximum update rate and only issued when
+the target differs from the last command by more than a deadband.
+
+The focus surface is given by the caller: for the continuous scans, the surface set on the acquisition
+worker (Hilvl_MeasurementAcq_Worker.set_focus_surface, e.g., from a focus map) or, without one, a
+surface fitted on the Z-coordinates of the scan line ends.
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    SCRIPT_DIR = os.path.abspath(r'.\iris')
+    sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import numpy as np
+
+from iris.controllers.class_z_stage_controller import Class_ZController
+from iris.data.focus_surface import Class_FocusSurface
+
+
+class FeedForward_ZController():
+    """
+    Issues Z corrections ahead of the XY trajectory from a focus surface
+    """
+    def __init__(self, surface:Class_FocusSurface, getter_xy:Callable[[],tuple[float,float]|None],
+                 ctrl_z:Class_ZController, latency_sec:float=0.05, max_update_hz:float=10.0,
+                 deadband_mm:float=0.0005, num_velocity_samples:int=3):
+        """
+        Args:
+            surface (Class_FocusSurface): the fitted focus surface
+            getter_xy (Callable[[],tuple[float,float]|None]): returns the current XY position [mm],
+                or None if it is not available
+            ctrl_z (Class_ZController): the Z stage controller
+            latency_sec (float): time between a Z command and the Z stage reaching it [s]. Defaults to 0.05.
+            max_update_hz (float): maximum rate of the Z commands [Hz]. Defaults to 10.0.
+            deadband_mm (float): minimum change of the Z target to issue a command [mm]. Defaults to 0.0005.
+            num_velocity_samples (int): number of the last positions for the velocity estimate. Defaults to 3.
+        """
+        assert latency_sec >= 0, 'FeedForward_ZController: The latency must be non-negative.'
+        assert max_update_hz > 0, 'FeedForward_ZController: The maximum update rate must be positive.'
+        assert deadband_mm >= 0, 'FeedForward_ZController: The deadband must be non-negative.'
+        assert num_velocity_samples >= 2, 'FeedForward_ZController: At least 2 samples are required for the velocity.'
+        self._surface = surface
+        self._getter_xy = getter_xy
+        self._ctrl_z = ctrl_z
+        self._latency_sec = latency_sec
+        self._period_sec = 1.0 / max_update_hz
+        self._deadband_mm = deadband_mm
+
+        self._history:deque[tuple[float,float,float]] = deque(maxlen=num_velocity_samples)   # (t, x, y)
+        self._last_command_z:float|None = None
+        self._list_commands:list[tuple[float,float]] = []   # (perf_counter time [s], Z command [mm])
+        self._flg_stop = threading.Event()
+        self._thread:threading.Thread|None = None
+
+    def get_target_z(self, x:float, y:float) -> float:
+        """Returns the focus surface at the XY position [mm]"""
+        return float(self._surface.evaluate([[x, y]])[0])
+
+    def _predict_xy(self) -> tuple[float,float]:
+        """Predicts the XY position one latency ahead from the position history"""
+        t, x, y = (np.array(col) for col in zip(*self._history))
+        if len(t) < 2 or np.ptp(t) <= 0: return float(x[-1]), float(y[-1])
+        dt = t - t.mean()
+        vx = np.dot(dt, x - x.mean()) / np.dot(dt, dt)
+        vy = np.dot(dt, y - y.mean()) / np.dot(dt, dt)
+        return float(x[-1] + vx * self._latency_sec), float(y[-1] + vy * self._latency_sec)
+
+    def update(self) -> bool:
+        """
+        Polls the XY position and issues a Z command if needed. Called at the update rate by the
+        tracking thread.
+
+        Returns:
+            bool: True if a Z command was issued
+        """
+        xy = self._getter_xy()
+        if xy is None: return False
+        now = time.perf_counter()
+        self._history.append((now, float(xy[0]), float(xy[1])))
+
+        z_target = self.get_target_z(*self._predict_xy())
+        if self._last_command_z is not None and abs(z_target - self._last_command_z) < self._deadband_mm: return False
+        if self._list_commands and now - self._list_commands[-1][0] < self._period_sec: return False
+        self._list_commands.append((now, z_target))
+        self._last_command_z = z_target
+        self._ctrl_z.move_direct(z_target)
+        return True
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while not self._flg_stop.is_set():
+            try: self.update()
+            except Exception as e: print(f'FeedForward_ZController: Z update error: {e}')
+            next_tick += self._period_sec
+            self._flg_stop.wait(max(next_tick - time.perf_counter(), 0))
+
+    def start(self) -> None:
+        """Starts the tracking in a background thread, from an empty position history"""
+        self.stop()
+        self._history.clear()
+        self._flg_stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the tracking and waits for the last command to finish"""
+        self._flg_stop.set()
+        if self._thread is not None: self._thread.join()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_commands(self) -> list[tuple[float,float]]:
+        """Returns the issued commands as (perf_counter time [s], Z [mm])"""
+        return list(self._list_commands)
@@ -11,10 +11,11 @@ if __name__ == "__main__":
     
 import multiprocessing as mp
 import multiprocessing.pool as mpp
+import threading
 
 from PySide6.QtGui import QCloseEvent
 import PySide6.QtWidgets as qw
-from PySide6.QtCore import QTimer
+from PySide6.QtCore import QTimer, Signal
 
 from iris.controllers import Controller_Spectrometer, Controller_XY, Controller_Z
 
@@ -35,12 +36,15 @@ from iris.gui.shortcut_handler import ShortcutHandler
 from iris.data.measurement_coordinates import List_MeaCoor_Hub
 
 from iris.calibration.calibration_generator import MainWindow_SpectrometerCalibrationGenerator
+from iris.calibration.stage_latency import StageLatency_Calibrator, StageLatency_Params, StageLatency_Store, camera_edge_signal
 
 from iris.multiprocessing.basemanager import MyManager
 from iris.multiprocessing.dataStreamer_Raman import DataStreamer_Raman,initialise_manager_raman,initialise_proxy_raman
 from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam,initialise_manager_stage,initialise_proxy_stage
 
 from iris.utils.general import messagebox_request_input
+from iris.utils.config_schema import ConfigValidationError, dump_effective_config, reload_config
+from iris.utils.tracing import enable_tracing, disable_tracing, clear_trace, export_chrome_trace, close_tracing, is_tracing_enabled
 
 from main_analyser import main_analyser
 
@@ -62,6 +66,8 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
     Args:
         tk (None): tkinter library
     """
+    sig_stage_latency_done = Signal(str)    # Emitted with the result message of the stage latency calibration
+    
     def __init__(self,
                  processor:mpp.Pool,
                  raman_controller:'Controller_Spectrometer',
@@ -206,6 +212,10 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
     # >> Set up the controllers menubar <<
         menu_controllers.addAction('Set camera exposure time [ms]',self._motion.set_camera_exposure_ms)
         menu_controllers.addAction('Set the stage timestamp offset [ms]',self.set_RamanStage_offset)
+        menu_controllers.addAction('Calibrate the stage timestamp offset',self.calibrate_stage_latency)
+        self.sig_stage_latency_done.connect(lambda msg: qw.QMessageBox.information(self, 'Stage timestamp offset calibration', msg))
+        menu_controllers.addAction('Reload the configuration file',self.reload_configuration)
+        menu_controllers.addAction('Start/stop the performance tracing',self.toggle_tracing)
         
     # >> Set up the keybindings <<
         self.shortcutHandler = ShortcutHandler(self)
@@ -241,6 +251,41 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
         
         self.shortcutHandler.set_keybinding_press(ShortcutsEnum.JOG_MODE_SWITCH.value,self._motion._chkbox_jog_enabled.toggle)
         
+    def reload_configuration(self):
+        """
+        Reload the config file and apply the settings that can change without a restart
+        """
+        try: dict_applied = reload_config()
+        except ConfigValidationError as e:
+            qw.QMessageBox.warning(self, 'Invalid configuration', f'The configuration has not been reloaded:\n{e}')
+            return
+        if not dict_applied:
+            qw.QMessageBox.information(self, 'Configuration reloaded', 'No live setting has changed. '
+                                       'Changes of the other settings require a restart of the app.')
+            return
+        list_lines = [f'[{schema.SECTION}] ' + ', '.join(keys) for schema, keys in dict_applied.items()]
+        qw.QMessageBox.information(self, 'Configuration reloaded', 'Applied:\n' + '\n'.join(list_lines))
+        dump_effective_config()
+        
+    def toggle_tracing(self):
+        """
+        Start the performance tracing in all the processes, or stop it and export the timeline
+        (Chrome/Perfetto trace JSON)
+        """
+        if not is_tracing_enabled():
+            enable_tracing()
+            clear_trace()   # Only the events of this session are exported
+            qw.QMessageBox.information(self, 'Tracing started', 'Select the menu item again to stop the tracing and export the timeline.')
+            return
+        
+        disable_tracing()
+        filepath, _ = qw.QFileDialog.getSaveFileName(self, 'Export the performance trace', 'iris_trace.json', 'Trace JSON (*.json)')
+        if not filepath: return
+        try: num_events = export_chrome_trace(filepath)
+        except Exception as e: qw.QMessageBox.warning(self, 'Error', f'Failed to export the trace:\n{e}'); return
+        qw.QMessageBox.information(self, 'Trace exported', f'{num_events} events exported to {filepath}.\n'
+                                   'Open it in https://ui.perfetto.dev or chrome://tracing')
+        
     def set_RamanStage_offset(self):
         """
         Set the time offset between the stage and the Raman spectrometer reported timestamps
@@ -268,6 +313,42 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
         except: qw.QMessageBox.warning(self, 'Error', 'The input must be a number')
         else: self._stageHub.set_measurement_offset_ms(offset_ms); qw.QMessageBox.information(self, 'Success', f'The offset has been set to {offset_ms} ms')
         
+    def calibrate_stage_latency(self):
+        """
+        Calibrate the stage timestamp offset by scanning the stage back and forth along X across a sharp
+        feature at the centre of the camera view, and store it for the current stage controller
+        """
+        def validator_float(input_str:str) -> bool:
+            try: return float(input_str) > 0
+            except: return False
+        
+        length_mm = messagebox_request_input(
+            parent=self,
+            title='Stage timestamp offset calibration',
+            message='Centre a sharp edge (perpendicular to the X-axis) in the camera view and enter the scan length in [mm]:',
+            default='0.2',
+            validator=validator_float,
+            loop_until_valid=True
+        )
+        if not isinstance(length_mm, str): return
+        
+        length_mm = float(length_mm)
+        x, y = self._xy_controller.get_coordinates()
+        params = StageLatency_Params(start_xy=(x - length_mm/2, y), end_xy=(x + length_mm/2, y))
+        calibrator = StageLatency_Calibrator(self._xy_controller, self._stageHub, camera_edge_signal(self._stageHub.get_camera_controller()))
+        
+        def run():
+            try:
+                result = calibrator.run(params)
+                StageLatency_Store().set_result(self._xy_controller.get_identifier(), result)
+                self._stageHub.set_measurement_offset_ms(result.offset_ms)
+                msg = (f'The offset has been set to {result.offset_ms:.1f} ms (previously {result.offset_before_ms:.1f} ms, '
+                       f'std {result.std_ms:.1f} ms over {len(result.list_corrections_ms)} scan pairs at {result.speed_mm_s:.3f} mm/s)')
+            except Exception as e: msg = f'The calibration failed: {e}'
+            finally: self._xy_controller.move_direct((x, y))
+            self.sig_stage_latency_done.emit(msg)
+        threading.Thread(target=run, daemon=True).start()
+        
     def initialisations(self):
         """
         Turns on all the auto-updaters once all the widgets are initialised
@@ -285,6 +366,10 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
         dirpath_speccal = LibraryConfigEnum.SPECTROMETER_CALIBRATION_DIR_DEFAULT.value
         if not os.path.isdir(dirpath_speccal): os.makedirs(dirpath_speccal,exist_ok=True)
         
+        # > Apply the calibrated stage timestamp offset of the stage controller, if any <
+        offset_ms = StageLatency_Store().apply(self._xy_controller.get_identifier(), self._stageHub)
+        if offset_ms is not None: print(f'Calibrated stage timestamp offset applied: {offset_ms:.1f} ms')
+        
         # > Initialise the high level controllers <
         self._hilvl_coorGen.initialise()
         self._hilvl_raman.initialise()
@@ -389,6 +474,9 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
         print('Terminating the processes')
         self._processor.terminate()
         
+        try: close_tracing()
+        except Exception as e: print('Error in closing the tracing:\n{}'.format(e))
+        
         try:
             print('Shutting down the multiprocessing manager')
             self._base_manager.shutdown()
@@ -400,6 +488,7 @@ class MainWindow_Controller(Ui_main_controller,qw.QMainWindow):
         os._exit(0)
 
 if __name__ == '__main__':
+    dump_effective_config()
     print('>>>>> IRIS: INITIATING THE CONTROLLERS AND THE APP <<<<<')
     app = qw.QApplication([])
     
@@ -0,0 +1,40 @@
+"""
+Tests for the backend of the spectrometer calibration (SpectrometerCalibrator)
+"""
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from iris import DataAnalysisConfigEnum
+from iris.calibration.calibration_generator import CalibrationParams, SpectrometerCalibrator
+
+
+@pytest.fixture
+def calibrator():
+    (pipe_update, pipe_update_front), (pipe_mea, pipe_mea_front) = mp.Pipe(), mp.Pipe()
+    calibrator = SpectrometerCalibrator(pipe_update, pipe_mea)
+    yield calibrator
+    calibrator.terminate()
+    pipe_update_front.close(); pipe_mea_front.close()
+
+
+def test_calibrate_extra_tracks(calibrator):
+    params = CalibrationParams()
+    params['wavelen_poly_coeffs'] = (0.5, 500)
+    params['intensity_poly_coeffs'] = (0.01, 1)
+    calibrator._cal_params = params
+
+    lbl_wavelength = DataAnalysisConfigEnum.WAVELENGTH_LABEL.value
+    lbl_intensity = DataAnalysisConfigEnum.INTENSITY_LABEL.value
+    pixels = np.arange(1, 11, dtype=float)
+    measurement = pd.DataFrame({lbl_wavelength: pixels, lbl_intensity: np.full(10, 100.0), 'reference': np.full(10, 50.0)})
+    cal_spectrum = calibrator.calibrate_measurement(measurement)
+
+    ratio = 0.01*pixels + 1
+    assert cal_spectrum.columns.tolist() == measurement.columns.tolist()
+    assert np.allclose(cal_spectrum[lbl_wavelength], 0.5*pixels + 500)
+    assert np.allclose(cal_spectrum[lbl_intensity], 100*ratio)
+    assert np.allclose(cal_spectrum['reference'], 50*ratio)
+    assert np.allclose(measurement['reference'], 50.0)    # Not modified
@@ -0,0 +1,95 @@
+"""
+Offline tests of the stage timestamp offset calibration (iris.calibration.stage_latency) with a
+dummy stage reporting its coordinates with a known latency and a sensor crossing a sharp edge
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from iris.calibration.stage_latency import (StageLatency_Calibrator, StageLatency_Params, StageLatency_Store,
+                                            estimate_edge_shift_mm)
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.general import get_timestamp_us_int
+
+EDGE_X_MM = 0.2
+MAX_SPEED_MM_S = 20.0
+
+
+class XY_Latency(XYController_Dummy):
+    """Moves at a constant speed and reports the position of latency_ms ago"""
+    def __init__(self, latency_ms:float):
+        super().__init__()
+        self._latency_us = latency_ms*1e3
+        self._lock = threading.Lock()
+        self._list_motions = [(0, np.zeros(2), np.zeros(2), 1.0)]    # (start [us], xy0, xy1, duration [us])
+
+    def get_identifier(self) -> str:
+        return 'Latency XY stage'
+
+    def get_position(self, timestamp_us:float) -> tuple[float,float]:
+        with self._lock:
+            t0, xy0, xy1, duration = next(motion for motion in reversed(self._list_motions) if motion[0] <= timestamp_us)
+        frac = min(max((timestamp_us - t0)/duration, 0.0), 1.0)
+        return tuple(xy0 + frac*(xy1 - xy0))
+
+    def get_coordinates(self):
+        return self.get_position(get_timestamp_us_int() - self._latency_us)
+
+    def move_direct(self, coor_abs:tuple[float,float]):
+        now = get_timestamp_us_int()
+        xy0, xy1 = np.array(self.get_position(now)), np.array(coor_abs, dtype=float)
+        duration = max(np.linalg.norm(xy1 - xy0)/(MAX_SPEED_MM_S*self._vel/100)*1e6, 1.0)
+        with self._lock: self._list_motions.append((now, xy0, xy1, duration))
+        time.sleep(duration/1e6)
+
+
+def _edge_sensor(ctrl_xy:XY_Latency, delay_ms:float):
+    """Sensor of a sharp edge, sampled every ~2 ms, with timestamps lagging by delay_ms"""
+    rng = np.random.default_rng(0)
+    def get_signal():
+        time.sleep(0.002)
+        ts = get_timestamp_us_int()
+        x = ctrl_xy.get_position(ts - delay_ms*1e3)[0]
+        return float(np.tanh((x - EDGE_X_MM)/0.005) + rng.normal(0, 0.02)), ts
+    return get_signal
+
+
+def test_edge_shift():
+    pos = np.linspace(0, 1, 400)
+    profile = lambda x: np.tanh((x - 0.5)/0.01)
+    assert estimate_edge_shift_mm(pos, profile(pos - 0.013), pos[::-1], profile(pos[::-1] + 0.007)) == pytest.approx(0.02, abs=5e-4)
+
+
+@pytest.mark.parametrize('latency_ms, delay_ms', [(30.0, 0.0), (10.0, 60.0)])
+def test_recover_latency(latency_ms, delay_ms, tmp_path):
+    ctrl_xy = XY_Latency(latency_ms)
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = 0.0
+    hub = DataStreamer_StageCam(ctrl_xy, ZController_Dummy(), None, namespace)
+    thread = threading.Thread(target=hub._collect_coordinateAndImage)
+    thread.start()
+    try:
+        time.sleep(0.1)
+        calibrator = StageLatency_Calibrator(ctrl_xy, hub, _edge_sensor(ctrl_xy, delay_ms))
+        result = calibrator.run(StageLatency_Params(start_xy=(0.0, 0.0), end_xy=(0.4, 0.0), speed_rel=10, num_pairs=2))
+    finally:
+        hub._flg_selfrunning.clear()
+        thread.join()
+
+    # The stage coordinate of a sensor timestamp is reported latency_ms before it is stamped and
+    # sensed delay_ms before the sensor timestamp
+    assert result.offset_ms == pytest.approx(delay_ms - latency_ms, abs=3.0)
+    assert result.speed_mm_s == pytest.approx(2.0, rel=0.05)
+    assert result.std_ms < 2.0
+    assert ctrl_xy.get_vel_acc_relative()[1] == 100    # Speed restored
+
+    store = StageLatency_Store(str(tmp_path/'latency.json'))
+    assert store.apply(ctrl_xy.get_identifier(), hub) is None
+    store.set_result(ctrl_xy.get_identifier(), result)
+    assert store.apply(ctrl_xy.get_identifier(), hub) == result.offset_ms
+    assert hub.get_measurement_offset_ms() == result.offset_ms
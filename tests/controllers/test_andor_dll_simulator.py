@@ -0,0 +1,174 @@
+"""
+Tests for the offline Andor SDK simulator (iris.controllers.andor_dll_simulator), exercising the
+DLL bindings, their wrappers and the controllers of raman_spectrometer_controller_Andor_dll(_image)
+"""
+import importlib
+import os
+import time
+
+import numpy as np
+import pytest
+
+from iris.controllers import andor_dll_simulator as simulator
+from iris.controllers.andor_dll_simulator import AndorCamera_Simulator, AndorDLL_Simulator
+from iris.data.frame_extraction import Frame_Extractor, parse_track_definitions
+
+
+@pytest.fixture
+def andor(monkeypatch):
+    """The controller module, imported with the simulated libraries. The environment is restored after the test."""
+    monkeypatch.setenv('ANDOR_DLL_SIMULATOR', '1')
+    monkeypatch.setenv('ANDOR_DLL_INITIALIZED', '')
+    monkeypatch.delenv('ANDOR_DLL_INITIALIZED')     # Set by the module on its first import, removed on teardown
+    module = importlib.import_module('iris.controllers.raman_spectrometer_controller_Andor_dll')
+    assert isinstance(module.andorDLL, AndorDLL_Simulator), 'The controller module was imported without the simulator'
+    return module
+
+
+@pytest.fixture
+def camera(andor) -> AndorCamera_Simulator:
+    device = AndorCamera_Simulator(x_pixel=512, y_pixel=64, cooling_rate_degC_per_sec=200.0, stabilisation_time_sec=0.05)
+    andor.andorDLL.device = device
+    return device
+
+
+def test_error_codes_match_sdk(andor):
+    list_codes = [value for name, value in vars(simulator).items() if name.startswith('DRV_')]
+    assert all(andor.ErrorCodes(code) for code in list_codes)
+
+
+def test_not_initialised(andor, camera):
+    with pytest.raises(RuntimeError, match='not initialised'):
+        andor.getMostRecentImage(512, 1, 512)
+    with pytest.raises(RuntimeError, match='DRV_NOT_INITIALIZED'):
+        andor.setReadMode('0. Full Vertical Binning')
+    with pytest.raises(AttributeError):
+        andor.andorDLL.GetSomethingUnknown
+
+
+def test_read_modes(andor, camera):
+    andor.initialize('')
+    assert andor.getDetector() == (512, 64)
+    andor.setAcquisitionMode('1. Single')
+    andor.setExposureTime(0.002)
+
+    dict_images = {}
+    for mode, num_pixels in [('0. Full Vertical Binning', 512), ('3. Single-Track', 512), ('4. Image', 128*16)]:
+        andor.setReadMode(mode)
+        if mode == '3. Single-Track': andor.setSingleTrack(32, 8)
+        if mode == '4. Image': andor.setImage(hbin=4, vbin=4, hstart=1, hend=512, vstart=1, vend=64)
+        andor.startAcquisition()
+        assert andor.waitForAcquisition()
+        dict_images[mode] = andor.getAcquiredData(num_pixels)
+
+    # The FVB collects the whole slit image, the track only its centre rows
+    fvb, track = dict_images['0. Full Vertical Binning'], dict_images['3. Single-Track']
+    assert fvb.sum() > track.sum() > 0
+    assert np.corrcoef(fvb, track)[0, 1] > 0.95     # Same spectrum
+    image = dict_images['4. Image'].reshape(16, 128)
+    assert np.argmax(image.sum(axis=1)) in (7, 8)     # Slit centred on the sensor
+
+    # Invalid settings are reported by the wrappers
+    with pytest.raises(ValueError, match='Vertical binning'):
+        andor.setImage(hbin=1, vbin=5, hstart=1, hend=512, vstart=1, vend=64)
+    with pytest.raises(ValueError, match='Track height'):
+        andor.setSingleTrack(2, 10)
+    with pytest.raises(ValueError, match='Array size'):
+        andor.getAcquiredData(100)
+
+
+def test_kinetic_series(andor, camera):
+    andor.initialize('')
+    andor.setReadMode('0. Full Vertical Binning')
+    andor.setAcquisitionMode('3. Kinetics')
+    andor.setNumberKinetics(5)
+    andor.setExposureTime(0.005)
+    andor.setKineticCycleTime(0.02)
+    exposure, _, kinetic = andor.getAcquisitionTimings_sec()
+    assert exposure == pytest.approx(0.005) and kinetic == pytest.approx(0.02)
+
+    time1 = time.perf_counter()
+    andor.startAcquisition()
+    with pytest.raises(RuntimeError, match='in progress'):
+        andor.getAcquiredData(5*512)
+    with pytest.raises(RuntimeError, match='DRV_ACQUIRING'):
+        andor.setExposureTime(0.01)
+    num_waits = 0
+    while andor.waitForAcquisitionTimeOut(500): num_waits += 1
+    assert time.perf_counter() - time1 >= 5 * 0.02
+    assert 1 <= num_waits <= 5
+    assert andor.getTotalNumberImagesAcquired() == 5
+    assert andor.getAcquiredData(5*512).reshape(5, 512).shape == (5, 512)
+
+    # The series is finished: the acquisition is idle
+    with pytest.raises(RuntimeError, match='DRV_IDLE'):
+        andor.abortAcquisition()
+
+
+def test_cooling_ramp(andor, camera):
+    andor.initialize('')
+    with pytest.raises(RuntimeError, match='DRV_TEMPERATURE_OFF'):
+        andor.checkCoolingStatus()
+    with pytest.raises(RuntimeError, match='DRV_P1INVALID'):
+        andor.setTemperature(-150)
+    andor.coolerON()
+    andor.setTemperature(-60)
+    with pytest.raises(RuntimeError, match='DRV_TEMPERATURE_NOT_REACHED'):
+        andor.checkCoolingStatus()
+    time.sleep(0.2)
+    assert -60 < andor.getTemperature() < 0
+    time.sleep(0.3)
+    assert andor.getTemperature() == -60
+    time.sleep(0.1)
+    andor.checkCoolingStatus()
+    andor.coolerOFF()
+    time.sleep(0.05)
+    assert andor.getTemperature() > -60
+
+
+def test_controller_offline(andor, camera, tmp_path):
+    controller = andor.SpectrometerController_Andor()
+    assert controller.get_identifier() == f'Andor_{camera.serial_number}'
+    assert controller.set_integration_time_us(1000) == 1000
+
+    spectrum, _, int_time_us = controller.measure_spectrum()
+    assert len(spectrum) == 512 and int_time_us == 1000
+
+    wavelength, intensities, timestamps, _ = controller.measure_spectrum_batch(10)
+    assert intensities.shape == (10, len(wavelength))
+    assert np.all(np.diff(timestamps) > 0)
+
+    # Errors from the library propagate through the controller
+    camera.inject_error('GetImages', simulator.DRV_ERROR_ACK)
+    with pytest.raises(RuntimeError, match='communicate'):
+        controller.measure_spectrum_batch(2)
+    camera.inject_error('WaitForAcquisitionTimeOut', simulator.DRV_NO_NEW_DATA)
+    with pytest.raises(TimeoutError):
+        controller.measure_spectrum()
+
+    path = os.path.join(tmp_path, 'last.sif')
+    with pytest.raises(ChildProcessError):
+        controller._test_save_last_measurement_as_sif(path)
+    controller.terminate()
+    controller._test_save_last_measurement_as_sif(path)
+    assert os.path.getsize(path) > 512 * 4
+
+
+def test_image_controller_tracks(andor, camera):
+    module = importlib.import_module('iris.controllers.raman_spectrometer_controller_Andor_dll_image')
+    assert isinstance(module.andorDLL, AndorDLL_Simulator), 'The controller module was imported without the simulator'
+    module.andorDLL.device = camera
+    controller = module.SpectrometerController_Andor()
+    try:
+        wavelength, intensities, _, _ = controller.measure_spectrum_batch(3)
+        assert intensities.shape == (3, len(wavelength)) == (3, 512)
+
+        # With the tracks, the bursts give way to the single measurements, which keep the extra tracks
+        tracks = parse_track_definitions('sample:24-40/0-8, reference:40-48')
+        controller.set_frame_extractor(Frame_Extractor(tracks, (64, 512)))
+        spectrum, _, _ = controller.measure_spectrum()
+        assert spectrum.columns[2:].tolist() == ['reference'] and len(spectrum) == 512
+        with pytest.raises(NotImplementedError):
+            controller.measure_spectrum_batch(3)
+    finally:
+        controller.terminate()
@@ -0,0 +1,110 @@
+"""
+Tests for the band integration and ratio channels in iris.data.analysis_bands
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.analysis_bands import (Band_Window, Band_Ratio, BandChannels_Calculator, compute_band_channels,
+                                      parse_band_definitions, get_band_channel_names)
+
+
+def _gaussian(x, amplitude, centre, sigma):
+    return amplitude * np.exp(-0.5*((x-centre)/sigma)**2)
+
+
+def _generate_spectra(axis:np.ndarray, num_mea:int=50, seed:int=0):
+    """Two Gaussian bands on a sloped background, with known areas and centres"""
+    rng = np.random.default_rng(seed)
+    amp = rng.uniform(1, 10, (num_mea, 2))
+    centre = np.stack([rng.uniform(995, 1005, num_mea), rng.uniform(1595, 1605, num_mea)], axis=1)
+    sigma = np.array([8.0, 12.0])
+    spectra = 5 + 0.01 * axis[None, :] * rng.uniform(0.5, 2, (num_mea, 1))
+    for j in range(2):
+        spectra = spectra + _gaussian(axis[None, :], amp[:, j:j+1], centre[:, j:j+1], sigma[j])
+    area = amp * sigma * np.sqrt(2*np.pi)
+    return spectra, area, centre
+
+
+def test_gaussian_bands():
+    axis = np.linspace(200, 2000, 3601)
+    spectra, area, centre = _generate_spectra(axis)
+    bands = [Band_Window(950, 1050, 'A'), Band_Window(1520, 1680, 'B')]
+    ratios = [Band_Ratio('A', 'B')]
+
+    dict_channels = compute_band_channels(spectra, bands, ratios, axis_ramanshift=axis, batch_size=16)
+    assert list(dict_channels.keys()) == get_band_channel_names(bands, ratios)
+    for j, label in enumerate(['A', 'B']):
+        np.testing.assert_allclose(dict_channels[f'{label} area'], area[:, j], rtol=1e-3)
+        np.testing.assert_allclose(dict_channels[f'{label} centroid'], centre[:, j], atol=0.05)
+        np.testing.assert_allclose(dict_channels[f'{label} peak position'], centre[:, j], atol=0.05)
+    np.testing.assert_allclose(dict_channels['A/B ratio'], area[:, 0] / area[:, 1], rtol=2e-3)
+
+    # A reversed axis gives the same result
+    dict_reversed = compute_band_channels(spectra[:, ::-1], bands, ratios, axis_ramanshift=axis[::-1])
+    for name in dict_channels:
+        np.testing.assert_allclose(dict_reversed[name], dict_channels[name], rtol=1e-10)
+
+
+def test_parse_band_definitions():
+    bands, ratios = parse_band_definitions('D:1330-1370, G: 1570-1610 ,-50-50, D/G')
+    assert bands == [Band_Window(1330, 1370, 'D'), Band_Window(1570, 1610, 'G'), Band_Window(-50, 50)]
+    assert ratios == [Band_Ratio('D', 'G')]
+    assert bands[2].get_label() == '-50-50cm⁻¹'
+    with pytest.raises(ValueError):
+        parse_band_definitions('D:1330-1370, D/G')
+    with pytest.raises(ValueError):
+        parse_band_definitions('1370-1330')
+
+
+def test_cache_invalidation_on_append():
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    axis = np.linspace(800, 1800, 500)
+    wavelength = [unit.convert(Raman_shift=float(shift)) for shift in axis]
+    spectra, area, _ = _generate_spectra(axis, num_mea=10)
+    for i, spectrum in enumerate(spectra):
+        df = pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: spectrum})
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(i), 0.0, 0.0), df, [df])
+
+    bands = [Band_Window(950, 1050, 'A'), Band_Window(1520, 1680, 'B')]
+    calculator = BandChannels_Calculator(batch_size=4)
+    list_names = calculator.update_unit(unit, bands, [Band_Ratio('A', 'B')])
+    assert calculator.num_computations == 1
+    assert unit.get_list_derived_channels() == list_names
+    np.testing.assert_allclose(unit.get_derived_channel('A area'), area[:, 0], rtol=1e-2)
+
+    # Cached: no recomputation for the same definitions
+    calculator.update_unit(unit, bands, [Band_Ratio('A', 'B')])
+    assert calculator.num_computations == 1
+
+    # New definitions are recomputed
+    calculator.update_unit(unit, bands[:1])
+    assert calculator.num_computations == 2
+
+    # Appending points extends the band channels with NaN and clears the other derived channels,
+    # only the appended points are then computed
+    unit.set_derived_channel('PC1', np.zeros(10))
+    for i in range(3):
+        df = pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: spectra[i]})
+        unit.append_dfmeasurement_data(str(1_800_000_000_000_000 + i), (99.0 + i, 0.0, 0.0), df, [df])
+    assert 'PC1' not in unit.get_list_derived_channels()
+    assert np.isnan(unit.get_derived_channel('A area')[10:]).all()
+    assert not calculator.check_uptodate(unit, bands[:1])
+    calculator.update_unit(unit, bands[:1])
+    assert calculator.num_computations == 2 and calculator.num_row_updates == 1
+    assert calculator.check_uptodate(unit, bands[:1])
+    incremental = {name: unit.get_derived_channel(name) for name in get_band_channel_names(bands[:1])}
+    np.testing.assert_array_equal(incremental['A area'][10:], incremental['A area'][:3])
+    calculator.update_unit(unit, bands[:1], force=True)
+    for name, values in incremental.items():
+        np.testing.assert_array_equal(unit.get_derived_channel(name), values)
+
+    # Other changes of the measurement data clear the channels, they are recomputed over the whole unit
+    unit.clear_measurements([str(1_800_000_000_000_000)])
+    assert unit.get_list_derived_channels() == []
+    calculator.update_unit(unit, bands[:1])
+    assert calculator.num_computations == 4 and len(unit.get_derived_channel('A area')) == unit.get_numMeasurements()
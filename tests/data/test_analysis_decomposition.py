@@ -0,0 +1,92 @@
+"""
+Tests for the out-of-core PCA and NMF in iris.data.analysis_decomposition
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Plotter, PlotterParams
+from iris.data.analysis_decomposition import compute_pca, compute_nmf, add_scores_to_unit
+
+
+def _generate_mixtures(num_mea:int=300, num_wvl:int=80, n_pure:int=3, noise:float=0.01, seed:int=0):
+    rng = np.random.default_rng(seed)
+    axis = np.linspace(0, 1, num_wvl)
+    pure = np.array([np.exp(-0.5*((axis-c)/0.05)**2) for c in np.linspace(0.2, 0.8, n_pure)])
+    abundances = rng.uniform(0, 1, (num_mea, n_pure))
+    spectra = abundances @ pure + rng.normal(0, noise, (num_mea, num_wvl))
+    return spectra, abundances, pure
+
+
+def _generate_unit(spectra:np.ndarray) -> MeaRMap_Unit:
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    wavelength = np.linspace(800, 900, spectra.shape[1])
+    for i, spectrum in enumerate(spectra):
+        df = pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: spectrum})
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(i % 20), float(i // 20), 0.0), df, [df])
+    return unit
+
+
+def test_pca_matches_svd():
+    spectra, _, _ = _generate_mixtures()
+    result = compute_pca(spectra, n_components=4, batch_size=37)
+
+    centred = spectra - spectra.mean(axis=0)
+    _, sing, vt = np.linalg.svd(centred, full_matrices=False)
+    np.testing.assert_allclose(result.mean, spectra.mean(axis=0), atol=1e-12)
+    np.testing.assert_allclose(result.explained_variance, sing[:4]**2 / (len(spectra) - 1), rtol=1e-8)
+    for i in range(4):
+        sign = np.sign(vt[i] @ result.components[i])
+        np.testing.assert_allclose(result.components[i], sign * vt[i], atol=1e-8)
+    np.testing.assert_allclose(result.scores, centred @ result.components.T, atol=1e-8)
+
+    # The batch size must not change the result
+    result_1batch = compute_pca(spectra, n_components=4, batch_size=len(spectra))
+    np.testing.assert_allclose(result.components, result_1batch.components, atol=1e-8)
+
+
+def test_pca_from_unit_and_heatmap_channels():
+    spectra, _, _ = _generate_mixtures(num_mea=60)
+    unit = _generate_unit(spectra)
+    result = compute_pca(unit, n_components=2, batch_size=16)
+    np.testing.assert_allclose(result.scores, compute_pca(spectra, 2).scores, atol=1e-8)
+
+    assert add_scores_to_unit(unit, result) == ['PC1', 'PC2']
+    assert unit.get_list_derived_channels() == ['PC1', 'PC2']
+    _, _, intensity = MeaRMap_Plotter()._retrieve_heatmap_data(unit, None, 'PC2')
+    np.testing.assert_array_equal(intensity, result.scores[:, 1])
+
+    # The channels are cleared when the measurement data changes
+    df = unit.get_dict_measurements()[unit.get_keys_dict_measurement()[-1]][0]
+    unit.append_dfmeasurement_data(str(1_800_000_000_000_000), (0.0, 99.0, 0.0), df, [df])
+    assert unit.get_list_derived_channels() == []
+    params = PlotterParams(mapping_unit=unit, channel='PC1')
+    with pytest.raises(ValueError):
+        MeaRMap_Plotter()._retrieve_heatmap_data(unit, None, params.channel)
+
+
+def test_nmf_recovers_mixtures():
+    spectra, abundances, pure = _generate_mixtures(noise=0.0)
+    result = compute_nmf(spectra, n_components=3, batch_size=50, max_iter=1000, tol=1e-7)
+
+    reconstruction = result.scores @ result.components
+    assert np.linalg.norm(spectra - reconstruction) / np.linalg.norm(spectra) < 0.02
+    assert np.all(result.scores >= 0) and np.all(result.components >= 0)
+
+    # Each pure component is matched by one of the NMF components
+    pure_n = pure / np.linalg.norm(pure, axis=1, keepdims=True)
+    comp_n = result.components / np.linalg.norm(result.components, axis=1, keepdims=True)
+    assert np.all((pure_n @ comp_n.T).max(axis=1) > 0.98)
+
+
+def test_benchmark_pca_throughput():
+    spectra, _, _ = _generate_mixtures(num_mea=20_000, num_wvl=1024, n_pure=5)
+    time1 = time.perf_counter()
+    compute_pca(spectra, n_components=5, batch_size=4096)
+    duration = time.perf_counter() - time1
+    print(f'PCA: {len(spectra)/duration:.0f} spectra/s (1024 points per spectrum)')
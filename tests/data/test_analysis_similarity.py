@@ -0,0 +1,91 @@
+"""
+Tests for the reference-spectrum similarity maps in iris.data.analysis_similarity
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.analysis_similarity import Reference_Spectrum, compute_similarity, add_similarity_to_unit
+
+
+def _generate_references(num_refs:int=3) -> list[Reference_Spectrum]:
+    # Finer and wider axis than the map, to exercise the resampling
+    axis = np.linspace(100, 2100, 4001)
+    return [Reference_Spectrum(f'ref{i}', axis, np.exp(-0.5*((axis-c)/40)**2) + 0.2*np.exp(-0.5*((axis-c-300)/60)**2))
+            for i, c in enumerate(np.linspace(400, 1400, num_refs))]
+
+
+def _generate_mixtures(references:list[Reference_Spectrum], num_mea:int=200, seed:int=0):
+    rng = np.random.default_rng(seed)
+    axis = np.linspace(200, 2000, 500)
+    refs = np.array([np.interp(axis, ref.ramanshift, ref.intensity) for ref in references])
+    abundances = rng.uniform(0, 1, (num_mea, len(references)))
+    abundances[rng.uniform(size=abundances.shape) < 0.3] = 0    # Some references absent
+    return axis, abundances @ refs, abundances, refs
+
+
+def test_metrics_on_pure_spectra():
+    references = _generate_references()
+    axis, _, _, refs = _generate_mixtures(references)
+    spectra = np.repeat(refs, 2, axis=0) * np.array([[1.0], [3.0]] * len(refs))   # Scaled pure spectra
+
+    for metric in ('cosine', 'pearson'):
+        result = compute_similarity(spectra, references, metric, axis_ramanshift=axis, batch_size=4)
+        np.testing.assert_array_equal(result.best_index, np.repeat(np.arange(len(refs)), 2))
+        np.testing.assert_allclose(result.best_score, 1.0, atol=1e-9)
+
+    result = compute_similarity(spectra, references, 'angle', axis_ramanshift=axis)
+    np.testing.assert_array_equal(result.best_index, np.repeat(np.arange(len(refs)), 2))
+    np.testing.assert_allclose(result.best_score, 0.0, atol=1e-6)
+
+    # Cosine against an explicit computation
+    result = compute_similarity(spectra, references, 'cosine', axis_ramanshift=axis)
+    expected = (spectra @ refs.T) / np.outer(np.linalg.norm(spectra, axis=1), np.linalg.norm(refs, axis=1))
+    np.testing.assert_allclose(result.scores, expected, atol=1e-12)
+
+
+def test_nnls_recovers_abundances():
+    references = _generate_references(num_refs=4)
+    axis, spectra, abundances, _ = _generate_mixtures(references)
+    result = compute_similarity(spectra, references, 'nnls', axis_ramanshift=axis, batch_size=64)
+    np.testing.assert_allclose(result.scores, abundances, atol=1e-4)
+    assert np.all(result.scores >= 0)
+    assert result.residual.max() < 1e-3
+    np.testing.assert_array_equal(result.best_index, np.argmax(abundances, axis=1))
+
+
+def test_unit_channels():
+    references = _generate_references()
+    axis, spectra, abundances, _ = _generate_mixtures(references, num_mea=30)
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    wavelength = [unit.convert(Raman_shift=float(shift)) for shift in axis]
+    for i, spectrum in enumerate(spectra):
+        df = pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: spectrum})
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(i % 6), float(i // 6), 0.0), df, [df])
+
+    result = compute_similarity(unit, references, 'nnls', batch_size=7)
+    np.testing.assert_allclose(result.scores, abundances, atol=1e-3)
+
+    list_channels = add_similarity_to_unit(unit, result)
+    assert list_channels == ['NNLS abundance best match', 'NNLS abundance best score',
+                             'NNLS abundance: ref0', 'NNLS abundance: ref1', 'NNLS abundance: ref2', 'NNLS abundance residual']
+    assert unit.get_list_derived_channels() == list_channels
+    np.testing.assert_array_equal(unit.get_derived_channel('NNLS abundance best match'), result.best_index)
+
+
+def test_benchmark_throughput():
+    references = _generate_references(num_refs=10)
+    rng = np.random.default_rng(1)
+    axis = np.linspace(200, 2000, 1024)
+    refs = np.array([np.interp(axis, ref.ramanshift, ref.intensity) for ref in references])
+    spectra = rng.uniform(0, 1, (20_000, len(refs))) @ refs + rng.normal(0, 0.01, (20_000, len(axis)))
+    for metric in ('cosine', 'pearson', 'angle', 'nnls'):
+        time1 = time.perf_counter()
+        compute_similarity(spectra, references, metric, axis_ramanshift=axis)
+        duration = time.perf_counter() - time1
+        print(f'{metric}: {len(spectra)/duration:.0f} spectra/s')
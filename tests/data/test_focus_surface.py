@@ -0,0 +1,114 @@
+"""
+Tests for the focus-surface models (iris.data.focus_surface) and their use in the Z-interpolation
+of mapping coordinates
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pytest
+
+from iris.data.focus_surface import (FocusSurface_Plane, FocusSurface_Polynomial, FocusSurface_TPS,
+                                     fit_focus_surface)
+
+
+def _grid_references(func, num:int=5, extent:float=2.0) -> np.ndarray:
+    x, y = np.meshgrid(np.linspace(0, extent, num), np.linspace(0, extent, num))
+    x, y = x.ravel(), y.ravel()
+    return np.column_stack([x, y, func(x, y)])
+
+
+def _tilted(x, y):
+    return 0.010*x - 0.004*y + 1.5
+
+
+def _quadratic(x, y):
+    return 1.5 + 0.01*x - 0.004*y + 0.002*x**2 - 0.001*x*y + 0.003*y**2
+
+
+def test_analytic_surfaces():
+    targets = np.random.default_rng(0).uniform(0, 2, (1000, 2))
+
+    plane = FocusSurface_Plane().fit(_grid_references(_tilted))
+    np.testing.assert_allclose(plane.get_coefficients(), (0.010, -0.004, 1.5), atol=1e-12)
+    np.testing.assert_allclose(plane.evaluate(targets), _tilted(*targets.T), atol=1e-12)
+
+    poly = FocusSurface_Polynomial(order=2).fit(_grid_references(_quadratic))
+    np.testing.assert_allclose(poly.evaluate(targets), _quadratic(*targets.T), atol=1e-10)
+    assert poly.get_inlier_mask().all()
+    assert poly.cross_validate() < 1e-10
+
+    # The thin-plate spline reproduces a plane exactly (affine trend), interpolates otherwise
+    tps = FocusSurface_TPS().fit(_grid_references(_tilted))
+    np.testing.assert_allclose(tps.evaluate(targets), _tilted(*targets.T), atol=1e-9)
+    tps = FocusSurface_TPS().fit(_grid_references(_quadratic, num=9))
+    np.testing.assert_allclose(tps.get_residuals(), 0, atol=1e-9)
+    np.testing.assert_allclose(tps.evaluate(targets), _quadratic(*targets.T), atol=2e-4)
+    assert tps.cross_validate() < 1e-3
+
+    # X and Y arrays of any shape
+    x, y = np.meshgrid(np.linspace(0, 2, 1000), np.linspace(0, 2, 1000))
+    z = poly.evaluate(x, y)
+    assert z.shape == (1000, 1000)
+    np.testing.assert_allclose(z, _quadratic(x, y), atol=1e-10)
+
+
+def test_extrapolation():
+    refs = _grid_references(_tilted, num=3)
+    outside = np.array([[-1.0, -1.0], [3.0, 0.5], [5.0, 5.0]])
+    for method in ['plane', 'polynomial', 'tps']:
+        z = fit_focus_surface(refs, method).evaluate(outside)
+        assert np.all(np.isfinite(z))
+        np.testing.assert_allclose(z, _tilted(*outside.T), atol=1e-8)
+
+
+def test_outlier_rejection():
+    refs = _grid_references(_quadratic, num=6)
+    rng = np.random.default_rng(1)
+    refs[:, 2] += rng.uniform(-1e-4, 1e-4, len(refs))   # Bounded focus noise
+    idx_outliers = [3, 17, 28]
+    refs[idx_outliers, 2] += [0.05, -0.08, 0.03]    # Failed autofocus
+
+    robust = FocusSurface_Polynomial(order=2).fit(refs)
+    mask = robust.get_inlier_mask()
+    assert not mask[idx_outliers].any() and mask.sum() == len(refs) - len(idx_outliers)
+    np.testing.assert_allclose(robust.get_residuals()[idx_outliers], [0.05, -0.08, 0.03], atol=1e-3)
+    assert robust.get_rms_residual() < 2e-4
+    assert robust.cross_validate() < 3e-4
+
+    targets = rng.uniform(0, 2, (1000, 2))
+    error_robust = np.abs(robust.evaluate(targets) - _quadratic(*targets.T)).max()
+    error_plain = np.abs(FocusSurface_Polynomial(order=2, ransac=False).fit(refs).evaluate(targets) - _quadratic(*targets.T)).max()
+    assert error_robust < 3e-4 < error_plain
+
+    # A fixed threshold gives the same inliers
+    fixed = FocusSurface_Polynomial(order=2, threshold=1e-3).fit(refs)
+    np.testing.assert_array_equal(fixed.get_inlier_mask(), mask)
+
+
+def test_invalid_references():
+    with pytest.raises(ValueError):
+        fit_focus_surface([[0, 0, 1], [1, 1, 1]], 'plane')
+    with pytest.raises(ValueError):
+        fit_focus_surface([[0, 0, 1], [1, 1, 1], [2, 2, 1], [3, 3, 1]], 'tps')     # Collinear
+    with pytest.raises(ValueError):
+        fit_focus_surface(_grid_references(_tilted), 'cubic')
+    surface = fit_focus_surface(np.vstack([_grid_references(_tilted, num=3), [[np.nan, 0, 0]]]), 'plane')
+    assert len(surface.get_residuals()) == 9
+
+
+def test_interpolator_worker():
+    from iris.gui.submodules.meaCoor_modifier.zInterpolate import Interpolator_Worker, Option_InterpolationMethod
+
+    worker = Interpolator_Worker()
+    refs = _grid_references(_tilted, num=3).tolist()
+    targets = [(-0.5, -0.5, 0.0), (1.0, 1.0, 0.0), (2.5, 1.0, 0.0)]
+
+    linear = worker._interpolate_z_values(targets, refs, Option_InterpolationMethod.LINEAR)
+    assert len(linear) == 1     # Outside the convex hull of the references
+
+    result = worker._interpolate_z_values(targets, refs, Option_InterpolationMethod.TPS)
+    assert len(result) == 3
+    np.testing.assert_allclose([coor[2] for coor in result], _tilted(*np.array(targets)[:, :2].T), atol=1e-8)
+    assert 'cross-validated' in worker._fit_report
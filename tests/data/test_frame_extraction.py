@@ -0,0 +1,119 @@
+"""
+Tests for the multi-track frame extraction (iris.data.frame_extraction) and the spectral channels
+of MeaRMap_Unit
+"""
+import time
+
+import numpy as np
+import pytest
+
+from iris.data.frame_extraction import Track_Definition, Frame_Extractor, parse_track_definitions, detect_hot_pixels
+from iris.data.measurement_Raman import MeaRaman
+from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Plotter
+
+
+def _synthetic_frames(num_frames:int, rows:int=64, cols:int=256, seed:int=0):
+    """Frames with two tracks of known spectra on a constant background of 100 counts per pixel"""
+    rng = np.random.default_rng(seed)
+    axis = np.arange(cols)
+    spectrum_a = 50 * np.exp(-0.5*((axis-80)/5)**2)
+    spectrum_b = 30 * np.exp(-0.5*((axis-180)/8)**2)
+    gains = rng.uniform(0.5, 2.0, (num_frames, 2))
+    frames = np.full((num_frames, rows, cols), 100.0)
+    frames[:, 10:20] += gains[:, 0, None, None] * spectrum_a
+    frames[:, 40:50] += gains[:, 1, None, None] * spectrum_b
+    expected = np.stack([10 * gains[:, 0, None] * spectrum_a, 10 * gains[:, 1, None] * spectrum_b], axis=1)
+    return frames, expected
+
+
+def test_known_tracks():
+    frames, expected = _synthetic_frames(8)
+    tracks = [Track_Definition('sample', 10, 20, background=((25, 30),)),
+              Track_Definition('reference', 40, 50, background=((55, 60),))]
+    extractor = Frame_Extractor(tracks, frames.shape[1:])
+
+    spectra = extractor.extract(frames)
+    assert spectra.shape == (8, 2, 256) and spectra.dtype == np.float64
+    np.testing.assert_allclose(spectra, expected, atol=1e-2)
+    np.testing.assert_allclose(extractor.extract(frames[3]), expected[3], atol=1e-2)
+
+    # Without a background band the offset remains
+    raw = Frame_Extractor([Track_Definition('sample', 10, 20)], frames.shape[1:]).extract(frames[0])
+    np.testing.assert_allclose(raw[0], expected[0, 0] + 1000, atol=1e-2)
+
+    # Column binning
+    binned = Frame_Extractor(tracks, frames.shape[1:], column_bin=4)
+    assert binned.get_num_columns() == 64
+    np.testing.assert_allclose(binned.extract(frames[0]), expected[0].reshape(2, 64, 4).sum(axis=2), atol=1e-1)
+
+
+def test_hot_pixels():
+    frames, expected = _synthetic_frames(4)
+    rng = np.random.default_rng(1)
+    darks = rng.normal(100, 2, (5, *frames.shape[1:]))
+    darks[:, 12, 30] += 5000
+    darks[:, 45, 200] += 5000
+    mask = detect_hot_pixels(darks)
+    assert mask.sum() == 2 and mask[12, 30] and mask[45, 200]
+
+    frames[:, 12, 30] += 5000
+    frames[:, 45, 200] += 5000
+    tracks = [Track_Definition('sample', 10, 20, background=((25, 30),)),
+              Track_Definition('reference', 40, 50, background=((55, 60),))]
+    spectra = Frame_Extractor(tracks, frames.shape[1:], hot_pixel_mask=mask).extract(frames)
+    np.testing.assert_allclose(spectra, expected, atol=1e-2)    # Rescaled to the full track height
+
+
+def test_parse_track_definitions():
+    tracks = parse_track_definitions('sample:100-140/60-80, reference: 200-240/250-260/20-30 ,dark:0-10')
+    assert tracks[0] == Track_Definition('sample', 100, 140, background=((60, 80),))
+    assert tracks[1].background == ((250, 260), (20, 30))
+    assert tracks[2].get_height() == 10
+    for text in ['sample:140-100', 'sample:10-20, sample:30-40', ':10-20', 'sample:10']:
+        with pytest.raises(ValueError):
+            parse_track_definitions(text)
+    with pytest.raises(AssertionError):
+        Frame_Extractor(tracks, (128, 256))     # Outside the frame
+
+
+def test_spectral_channels_in_map():
+    frames, expected = _synthetic_frames(6, cols=32)
+    tracks = [Track_Definition('sample', 10, 20, background=((25, 30),)),
+              Track_Definition('reference', 40, 50, background=((55, 60),))]
+    extractor = Frame_Extractor(tracks, frames.shape[1:])
+
+    unit = MeaRMap_Unit(unit_name='multitrack')
+    unit.test_generate_dummy()
+    unit.clear_measurements()
+    assert unit.get_list_spectral_channels() == []
+    wavelength = np.linspace(790, 850, 32)
+    for i, frame in enumerate(frames):
+        df = extractor.to_dataframe(wavelength, extractor.extract(frame))
+        df_ave = MeaRaman.average([df, df])
+        assert list(df_ave.columns) == list(df.columns)
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(i % 3), float(i // 3), 0.0), df_ave, [df])
+    assert unit.get_list_spectral_channels() == ['reference']
+
+    wvl = float(wavelength[10])
+    table = unit.get_heatmap_table(wvl, 'reference')
+    np.testing.assert_allclose(table.iloc[:, -1].values, expected[:, 1, 10], atol=1e-2)
+    np.testing.assert_allclose(unit.get_heatmap_table(wvl).iloc[:, -1].values, expected[:, 0, 10], atol=1e-2)
+    with pytest.raises(KeyError):
+        unit.get_heatmap_table(wvl, 'unknown')
+    with pytest.raises(ValueError):
+        MeaRMap_Plotter()._retrieve_heatmap_data(unit, wvl, spectral_channel='unknown')
+
+
+def test_benchmark_kinetic_rate():
+    """2048x512 frames with 4 tracks must be extracted faster than a kinetic series (>50 frames/s)"""
+    rng = np.random.default_rng(0)
+    frames = rng.integers(300, 2000, (64, 512, 2048), dtype=np.uint16)
+    tracks = [Track_Definition(f'track{i}', 128*i, 128*i+64, background=((128*i+64, 128*i+128),)) for i in range(4)]
+    extractor = Frame_Extractor(tracks, (512, 2048), hot_pixel_mask=rng.uniform(size=(512, 2048)) < 1e-3)
+    extractor.extract(frames[:16])
+
+    time1 = time.perf_counter()
+    for i in range(0, len(frames), 16): extractor.extract(frames[i:i+16])
+    rate = len(frames) / (time.perf_counter() - time1)
+    print(f'Extraction: {rate:.0f} frames/s')
+    assert rate > 50
@@ -0,0 +1,163 @@
+"""
+Tests of the heatmap overlay compositing (iris.data.heatmap_overlay): the layer updates against a
+full redraw, the cache invalidation on calibration changes and the time of a wavelength sweep
+"""
+import time
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.heatmap_overlay import MeaRMap_OverlayPlotter, PlotterParams_Overlay
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.measurement_Raman import MeaRaman
+from iris.data.measurement_RamanMap import MeaRMap_Plotter, MeaRMap_Unit, PlotterOptions, PlotterParams,\
+    PlotterExtParams_Scattering, PlotterExtParams_Interpolation
+
+
+def _make_mapping_unit(num_x:int=12, num_y:int=10, num_wavelength:int=40) -> MeaRMap_Unit:
+    unit = MeaRMap_Unit(unit_name='overlay')
+    unit.test_generate_dummy()  # Sets the metadata
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    wavelength = np.linspace(800, 900, num_wavelength)
+    rng = np.random.default_rng(0)
+    for i in range(num_x*num_y):
+        x, y = 0.1 + 0.07*(i // num_y) + rng.uniform(-0.01, 0.01), 0.1 + 0.07*(i % num_y) + rng.uniform(-0.01, 0.01)
+        df = pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: rng.uniform(0, 100, num_wavelength)})
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (x, y, 0.0), MeaRaman.average([df]), [df])
+    return unit
+
+
+def _make_image_unit() -> MeaImg_Unit:
+    rng = np.random.default_rng(1)
+    cal = ImgMea_Cal('overlay')
+    cal.set_calibration_params(100.0, 100.0, 0.05, -0.03, 0.0, flip_y=1)
+    unit = MeaImg_Unit('mosaic', cal)
+    for i in range(4):
+        image = Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8))
+        unit.add_measurement(f'{i:05d}', 0.2 + 0.6*(i // 2), 0.2 + 0.6*(i % 2), 0.0, image)
+    return unit
+
+
+def _render(plotter:MeaRMap_Plotter) -> np.ndarray:
+    fig, _ = plotter.get_figure_axes()
+    canvas = fig.canvas if isinstance(fig.canvas, FigureCanvasAgg) else FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def _params(mapping_unit, img_unit, wavelength, **kwargs) -> PlotterParams_Overlay:
+    params = PlotterParams_Overlay(mapping_unit=mapping_unit, wavelength=wavelength, clim=(None,None),
+                                   img_unit=img_unit, **kwargs)
+    params.title = f'{wavelength:.2f}'
+    return params
+
+
+def _plot_legacy(plotter:MeaRMap_Plotter, option, mapping_unit:MeaRMap_Unit, img_unit:MeaImg_Unit,
+                 wavelength:float, params_extra) -> None:
+    """The previous overlay: copy of the unit with the corrected coordinates, heatmap, then the stitched image"""
+    unit_corr = MeaRMap_Unit()   # As MeaRMap_Hub.copy_mapping_unit
+    unit_corr.set_dict_metadata(deepcopy(mapping_unit.get_dict_unit_metadata()))
+    unit_corr.set_dict_measurements(deepcopy(mapping_unit.get_dict_measurements()))
+    unit_corr.set_unitName_and_unitID(mapping_unit.get_unit_name() + '_LaserCoorCorrected')
+    label_x, label_y, _, _, _ = unit_corr.get_labels()
+    dict_mea = unit_corr.get_dict_measurements(copy=False)
+    list_corr = [img_unit.convert_stg2mea(coor) for coor in zip(dict_mea[label_x], dict_mea[label_y])]
+    dict_mea[label_x][:] = [coor[0] for coor in list_corr]
+    dict_mea[label_y][:] = [coor[1] for coor in list_corr]
+
+    params = PlotterParams(mapping_unit=unit_corr, wavelength=wavelength, clim=(None,None))
+    params.title = f'{wavelength:.2f}'
+    plotter.plot_heatmap(option, params, params_extra)
+    img, limit_min, limit_max = img_unit.get_image_all_stitched(low_res=True)
+    extent = (min(limit_min[0],limit_max[0]), max(limit_min[0],limit_max[0]),
+              min(limit_min[1],limit_max[1]), max(limit_min[1],limit_max[1]))
+    MeaRMap_OverlayPlotter.overlay_image(plotter, img, extent)   # pyright: ignore[reportArgumentType] ; same axes attributes
+
+
+@pytest.mark.parametrize('option, params_extra', [
+    (PlotterOptions.interpolation, PlotterExtParams_Interpolation()),
+    (PlotterOptions.scattering, PlotterExtParams_Scattering()),
+])
+def test_layer_update_matches_redraw(option, params_extra):
+    mapping_unit, img_unit = _make_mapping_unit(), _make_image_unit()
+    list_wavelength = mapping_unit.get_list_wavelengths()
+
+    # First plot: the same as the previous overlay
+    plotter = MeaRMap_OverlayPlotter()
+    plotter.plot_heatmap(option, _params(mapping_unit, img_unit, list_wavelength[3]), params_extra)
+    plotter_legacy = MeaRMap_Plotter()
+    _plot_legacy(plotter_legacy, option, mapping_unit, img_unit, list_wavelength[3], params_extra)
+    assert np.array_equal(_render(plotter), _render(plotter_legacy))
+
+    # Layer updates: wavelength, colour limits, colour map and opacity
+    for wavelength, kwargs in [(list_wavelength[10], {}), (list_wavelength[20], {'cmap':'magma'}),
+                               (list_wavelength[25], {'cmap':'magma', 'alpha':0.4}),
+                               (list_wavelength[30], {'alpha':0.7, 'clim':(20.0, None)})]:
+        clim = kwargs.pop('clim', (None,None))
+        params = _params(mapping_unit, img_unit, wavelength, **kwargs)
+        params.clim = clim
+        plotter.plot_heatmap(option, params, params_extra)
+
+        plotter_full = MeaRMap_OverlayPlotter()
+        plotter_full.plot_heatmap(option, params, params_extra)
+        assert np.array_equal(_render(plotter), _render(plotter_full))
+
+    counts = plotter.get_cache_counts()
+    assert counts == {'stitch':1, 'coordinates':1, 'redraw':1, 'update':4}
+
+
+def test_cache_invalidation():
+    mapping_unit, img_unit = _make_mapping_unit(), _make_image_unit()
+    list_wavelength = mapping_unit.get_list_wavelengths()
+    option, params_extra = PlotterOptions.scattering, PlotterExtParams_Scattering()
+    plotter = MeaRMap_OverlayPlotter()
+    plotter.plot_heatmap(option, _params(mapping_unit, img_unit, list_wavelength[0]), params_extra)
+    plotter.plot_heatmap(option, _params(mapping_unit, img_unit, list_wavelength[1], low_res=True), params_extra)
+    assert plotter.get_cache_counts() == {'stitch':1, 'coordinates':1, 'redraw':1, 'update':1}
+
+    # A calibration change (e.g., fine-tuning) converts the coordinates and stitches the image again
+    cal = img_unit.get_ImageMeasurement_Calibration()
+    cal.set_calibration_params(100.0, 100.0, 0.08, -0.03, 0.0)
+    plotter.plot_heatmap(option, _params(mapping_unit, img_unit, list_wavelength[1]), params_extra)
+    assert plotter.get_cache_counts() == {'stitch':2, 'coordinates':2, 'redraw':2, 'update':1}
+    offsets = plotter.get_figure_axes()[1].collections[0].get_offsets()
+    assert np.isclose(offsets[0][0], mapping_unit.get_dict_measurements()[mapping_unit.get_labels()[0]][0] + 0.08)
+
+    # Hiding the image redraws without stitching, plain parameters plot the stage coordinates
+    plotter.plot_heatmap(option, _params(mapping_unit, img_unit, list_wavelength[1], show_image=False), params_extra)
+    assert len(plotter.get_figure_axes()[1].images) == 0
+    plotter.plot_heatmap(option, PlotterParams(mapping_unit=mapping_unit, wavelength=list_wavelength[1]), params_extra)
+    offsets = plotter.get_figure_axes()[1].collections[0].get_offsets()
+    assert np.isclose(offsets[0][0], mapping_unit.get_dict_measurements()[mapping_unit.get_labels()[0]][0])
+    assert plotter.get_cache_counts() == {'stitch':2, 'coordinates':2, 'redraw':3, 'update':1}
+
+
+def test_benchmark_wavelength_sweep():
+    mapping_unit, img_unit = _make_mapping_unit(30, 30), _make_image_unit()
+    list_wavelength = mapping_unit.get_list_wavelengths()[:20]
+    option, params_extra = PlotterOptions.interpolation, PlotterExtParams_Interpolation()
+
+    plotter_legacy = MeaRMap_Plotter()
+    start = time.perf_counter()
+    for wavelength in list_wavelength:
+        _plot_legacy(plotter_legacy, option, mapping_unit, img_unit, wavelength, params_extra)
+        _render(plotter_legacy)
+    time_legacy = time.perf_counter() - start
+
+    plotter = MeaRMap_OverlayPlotter()
+    start = time.perf_counter()
+    for wavelength in list_wavelength:
+        plotter.plot_heatmap(option, _params(mapping_unit, img_unit, wavelength, alpha=0.5), params_extra)
+        _render(plotter)
+    time_cached = time.perf_counter() - start
+    print(f'\nOverlay sweep of {len(list_wavelength)} wavelengths, {mapping_unit.get_numMeasurements()} points:'
+          f' full redraw {time_legacy:.2f} s, layer updates {time_cached:.2f} s')
+
+    assert plotter.get_cache_counts()['update'] == len(list_wavelength) - 1
+    assert time_cached < time_legacy
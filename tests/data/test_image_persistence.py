@@ -0,0 +1,140 @@
+"""
+Tests of the image unit persistence (iris.data.measurement_image.MeaImg_Handler): round trip of
+every image codec, incremental re-saves, rolled back saves and the throughput of the parallel encoding
+"""
+import os
+import sqlite3 as sql
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit, MeaImg_Hub, MeaImg_Handler
+
+
+def _make_unit(name:str, num_images:int, size:int=32, seed:int=0) -> MeaImg_Unit:
+    rng = np.random.default_rng(seed)
+    cal = ImgMea_Cal('persistence')
+    cal.set_calibration_params(100.0, 100.0, 0.0, 0.0, 0.0, flip_y=1)
+    unit = MeaImg_Unit(name, cal)
+    for i in range(num_images):
+        image = Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+        unit.add_measurement(f'{seed}_{i:05d}', i*0.25, -i*0.5, 0.1, image)
+    return unit
+
+
+def _assert_units_equal(unit:MeaImg_Unit, unit_loaded:MeaImg_Unit) -> None:
+    assert unit_loaded.get_IdName() == unit.get_IdName()
+    assert unit_loaded.get_calibration_asdict()[1] == unit.get_calibration_asdict()[1]
+    dict_mea, dict_loaded = unit.get_dict_measurement(), unit_loaded.get_dict_measurement()
+    assert dict_loaded['timestamp'] == dict_mea['timestamp']
+    assert np.allclose(dict_loaded['coor_x'], dict_mea['coor_x'])
+    assert np.allclose(dict_loaded['coor_y'], dict_mea['coor_y'])
+    for key in [k for k, t in unit.get_dict_measurement_types().items() if t == Image.Image]:
+        for img, img_loaded in zip(dict_mea[key], dict_loaded[key]):
+            assert np.array_equal(np.asarray(img_loaded.convert('RGB')), np.asarray(img))
+
+
+@pytest.mark.parametrize('codec', ['png', 'webp', 'npy'])
+def test_round_trip(codec, tmp_path):
+    hub = MeaImg_Hub()
+    hub.append_ImageMeasurementUnit(_make_unit('mosaic', 5, seed=1))
+    hub.append_ImageMeasurementUnit(_make_unit('single', 1, seed=2))
+    handler = MeaImg_Handler(codec=codec, num_workers=4)
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'units').join()
+    assert all(name.endswith('.' + codec) for name in os.listdir(tmp_path/'images'))
+    assert 'single.' + codec in os.listdir(tmp_path/'images')
+
+    hub_loaded = MeaImg_Hub()
+    handler.load_ImageMeasurementHub_database(str(tmp_path/'units.db'), hub_loaded)
+    assert sorted(hub_loaded.get_list_ImageUnit_ids()) == sorted(hub.get_list_ImageUnit_ids())
+    for unit_id in hub.get_list_ImageUnit_ids():
+        _assert_units_equal(hub.get_ImageMeasurementUnit(unit_id=unit_id),
+                            hub_loaded.get_ImageMeasurementUnit(unit_id=unit_id))
+
+
+def test_incremental_save(tmp_path):
+    unit = _make_unit('mosaic', 6, seed=3)
+    hub = MeaImg_Hub()
+    hub.append_ImageMeasurementUnit(unit)
+    handler = MeaImg_Handler(codec='png', png_compression=1)
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'units').join()
+    assert len(os.listdir(tmp_path/'images')) == 6
+
+    # Only the added image is written, the unit metadata are replaced, not duplicated
+    unit.add_measurement('3_99999', 9.0, 9.0, 0.0, Image.new('RGB', (32, 32), (10, 20, 30)))
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'units').join()
+    assert len(os.listdir(tmp_path/'images')) == 7
+
+    conn = sql.connect(str(tmp_path/'units.db'))
+    table_meta = handler._table_prefix + handler._new_save_parameters['meta_table']
+    assert conn.execute(f'SELECT COUNT(*) FROM {table_meta}').fetchone()[0] == 1
+    assert conn.execute(f'SELECT COUNT(*) FROM {handler._table_prefix + unit.get_IdName()[0]}').fetchone()[0] == 7
+    conn.close()
+
+    hub_loaded = MeaImg_Hub()
+    handler.load_ImageMeasurementHub_database(str(tmp_path/'units.db'), hub_loaded)
+    _assert_units_equal(unit, hub_loaded.get_ImageMeasurementUnit(unit_id=unit.get_IdName()[0]))
+
+
+def test_benchmark_2000_tiles(tmp_path):
+    hub = MeaImg_Hub()
+    hub.append_ImageMeasurementUnit(_make_unit('bench', 2000, size=64, seed=4))
+
+    dict_times = {}
+    for codec, num_workers in [('png', 1), ('png', 0), ('webp', 0), ('npy', 0)]:
+        dirpath = tmp_path/f'{codec}_{num_workers}'
+        os.makedirs(dirpath)
+        handler = MeaImg_Handler(codec=codec, num_workers=num_workers)
+        start = time.perf_counter()
+        handler.save_ImageMeasurementHub_database(hub, str(dirpath), 'bench').join()
+        dict_times[(codec, num_workers)] = time.perf_counter() - start
+        assert len(os.listdir(dirpath/'images')) == 2000
+    print('\nSave time of 2000 tiles of 64 px [s]:',
+          ', '.join(f'{codec} ({workers or "all"} workers) {t:.2f}' for (codec, workers), t in dict_times.items()))
+
+    # Loose bound: the parallel save is not slower than the sequential one
+    assert dict_times[('png', 0)] < dict_times[('png', 1)]*1.5
+
+
+def test_save_into_old_schema(tmp_path):
+    # A database saved before the tile_offsets_pixel metadata key existed still accepts new units
+    handler = MeaImg_Handler(codec='png')
+    hub = MeaImg_Hub()
+    unit_old = _make_unit('old', 2, seed=5)
+    hub.append_ImageMeasurementUnit(unit_old)
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'units').join()
+    table_meta = handler._table_prefix + handler._new_save_parameters['meta_table']
+    conn = sql.connect(str(tmp_path/'units.db'))
+    conn.execute(f'ALTER TABLE {table_meta} DROP COLUMN tile_offsets_pixel')
+    conn.commit()
+    conn.close()
+
+    unit_new = _make_unit('new', 2, seed=6)
+    hub.append_ImageMeasurementUnit(unit_new)
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'units').join()
+
+    hub_loaded = MeaImg_Hub()
+    handler.load_ImageMeasurementHub_database(str(tmp_path/'units.db'), hub_loaded)
+    for unit in (unit_old, unit_new):
+        _assert_units_equal(unit, hub_loaded.get_ImageMeasurementUnit(unit_id=unit.get_IdName()[0]))
+
+
+def test_rollback_deletes_images(tmp_path):
+    handler = MeaImg_Handler(codec='png')
+    unit = _make_unit('mosaic', 3, seed=7)
+    # A measurement table the rows do not fit in: the insert fails after the images are written
+    conn = sql.connect(str(tmp_path/'units.db'))
+    conn.execute(f'CREATE TABLE {handler._table_prefix}{unit.get_IdName()[0]} (timestamp TEXT)')
+    conn.commit()
+    os.makedirs(tmp_path/'images')
+    with open(tmp_path/'images'/'other.png', 'wb') as f: f.write(b'')
+
+    with pytest.raises(sql.OperationalError):
+        handler.save_ImageMeasurementUnit_database(unit, conn, str(tmp_path/'units.db'))
+    assert os.listdir(tmp_path/'images') == ['other.png']
+    table_meta = handler._table_prefix + handler._new_save_parameters['meta_table']
+    assert conn.execute(f'SELECT COUNT(*) FROM {table_meta}').fetchone()[0] == 0
+    conn.close()
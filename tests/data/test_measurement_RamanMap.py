@@ -1,8 +1,9 @@
 """
-Tests for MeaRMap_Unit.get_arr_measurements()
+Tests for MeaRMap_Unit.get_arr_measurements() and the unpickling of older units
 """
+import dill
 import numpy as np
-from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Hub, MeaRMap_Handler
 
 
 def test_shapes():
@@ -86,3 +87,31 @@ def test_single_measurement():
     assert coords[0, 1] == 1.0  # x
     assert coords[0, 2] == 2.0  # y
     assert coords[0, 3] == 3.0  # z
+
+
+def test_unpickle_older_unit():
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()
+    # A unit pickled before the derived channels and the scan QA report were introduced
+    for attr in ('_dict_derived_channels', '_set_derived_rowwise', '_scan_qa'): delattr(unit, attr)
+    loaded:MeaRMap_Unit = dill.loads(dill.dumps(unit))
+
+    assert loaded.get_scan_qa() is None
+    assert loaded.get_list_derived_channels() == []
+    n = loaded.get_numMeasurements()
+    loaded.set_derived_channel('band', np.arange(n, dtype=float), notify=False, rowwise=True)
+    assert loaded.set_derived_channel_rows({'band': np.zeros(2)}, 0, notify=False)
+    loaded.remove_derived_channel()
+    assert loaded.get_list_derived_channels() == []
+
+
+def test_pickled_hub_round_trip(tmp_path):
+    hub = MeaRMap_Hub()
+    hub.test_generate_dummy()
+    handler = MeaRMap_Handler()
+    handler.save_MappingHub_pickle(hub, str(tmp_path), 'hub').join()
+
+    loaded = handler.load_MappingMeasurement_pickle(MeaRMap_Hub(), str(tmp_path/'hub.pkl'))
+    assert loaded.get_list_MappingUnit_names() == hub.get_list_MappingUnit_names()
+    unit = loaded.get_MappingUnit(loaded.get_list_MappingUnit_ids()[0])
+    assert unit.get_list_derived_channels() == []
@@ -0,0 +1,89 @@
+"""
+Tests for MeaRMap_Handler.save_MappingUnit_chunked() and load_MappingUnit_chunked()
+"""
+import os
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Handler
+
+
+def _generate_unit() -> MeaRMap_Unit:
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()
+    return unit
+
+
+def test_roundtrip_bit_exact(tmp_path):
+    unit = _generate_unit()
+    handler = MeaRMap_Handler()
+    dirpath = os.path.join(tmp_path, 'unit.npyc')
+
+    handler.save_MappingUnit_chunked(unit, dirpath, flg_saveraw=True, chunk_size=3)
+    loaded = handler.load_MappingUnit_chunked(dirpath)
+
+    coords, spectra, _, wavelengths = unit.get_arr_measurements()
+    coords_l, spectra_l, _, wavelengths_l = loaded.get_arr_measurements()
+    np.testing.assert_array_equal(coords, coords_l)
+    np.testing.assert_array_equal(spectra, spectra_l)
+    np.testing.assert_array_equal(wavelengths, wavelengths_l)
+
+    assert loaded.get_dict_unit_metadata() == unit.get_dict_unit_metadata()
+    assert loaded.get_list_RamanMeasurement_ids() == unit.get_list_RamanMeasurement_ids()
+
+    _, _, _, _, lbl_listmea, _ = unit.get_keys_dict_measurement()
+    _, _, _, _, lbl_intensity = unit.get_labels()
+    for list_ori, list_loaded in zip(unit.get_dict_measurements()[lbl_listmea], loaded.get_dict_measurements()[lbl_listmea]):
+        assert len(list_ori) == len(list_loaded)
+        for df_ori, df_loaded in zip(list_ori, list_loaded):
+            np.testing.assert_array_equal(df_ori[lbl_intensity].to_numpy(), df_loaded[lbl_intensity].to_numpy())
+
+
+def test_overwrite_and_partial_export(tmp_path):
+    unit = _generate_unit()
+    handler = MeaRMap_Handler()
+    dirpath = os.path.join(tmp_path, 'unit.npyc')
+
+    handler.save_MappingUnit_chunked(unit, dirpath, chunk_size=4)
+    handler.save_MappingUnit_chunked(unit, dirpath, chunk_size=100)
+    assert sorted(os.listdir(dirpath)) == ['coords_00000.npy', 'intensity_00000.npy', 'metadata.json', 'wavelengths.npy']
+
+    # Without the metadata file, the export is treated as incomplete
+    os.remove(os.path.join(dirpath, 'metadata.json'))
+    with pytest.raises(AssertionError):
+        handler.load_MappingUnit_chunked(dirpath)
+
+
+def test_peak_memory_200k_points(tmp_path):
+    num_mea = 200_000
+    num_wavelength = 64
+    unit = _generate_unit()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    mea_id_key, lbl_x, lbl_y, lbl_z, lbl_listmea, lbl_avemea = unit.get_keys_dict_measurement()
+
+    # A single spectrum is shared by every point so that the map itself is cheap to build
+    df = pd.DataFrame({
+        lbl_wavelength: np.linspace(800, 900, num_wavelength),
+        lbl_intensity: np.random.uniform(0, 100, num_wavelength),
+    })
+    unit.set_dict_measurements({
+        mea_id_key: list(range(num_mea)),
+        lbl_x: [float(i % 500) for i in range(num_mea)],
+        lbl_y: [float(i // 500) for i in range(num_mea)],
+        lbl_z: [0.0] * num_mea,
+        lbl_listmea: [None] * num_mea,
+        lbl_avemea: [df] * num_mea,
+    })
+
+    chunk_size = 4096
+    handler = MeaRMap_Handler()
+    tracemalloc.start()
+    handler.save_MappingUnit_chunked(unit, os.path.join(tmp_path, 'big.npyc'), chunk_size=chunk_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    map_size = num_mea * num_wavelength * 8
+    assert peak < map_size / 4, f'Peak export memory {peak} B is not bounded by the chunk size (map size {map_size} B)'
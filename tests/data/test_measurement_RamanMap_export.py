@@ -0,0 +1,133 @@
+"""
+Tests for the streaming MeaRMap_Handler.save_MappingUnit_ext()
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from iris.data.measurement_RamanMap import MeaRMap_Unit, MeaRMap_Handler
+from iris.data.measurement_Raman import MeaRaman
+
+
+def _generate_unit(num_mea:int=12, num_wavelength:int=50) -> MeaRMap_Unit:
+    """Generates a unit with a varying number of raw spectra per measurement"""
+    unit = MeaRMap_Unit(unit_name='test')
+    unit.test_generate_dummy()  # Sets the metadata
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    wavelength = np.linspace(800, 900, num_wavelength)
+    rng = np.random.default_rng(0)
+    for i in range(num_mea):
+        list_df = [pd.DataFrame({lbl_wavelength: wavelength, lbl_intensity: rng.uniform(0, 100, num_wavelength)})
+                   for _ in range(1 + i % 3)]
+        df_avg = MeaRaman.average(list_df)
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(i), float(2*i), 0.5), df_avg, list_df)
+    return unit
+
+
+def _legacy_long_dataframe(unit:MeaRMap_Unit, flg_saveraw:bool) -> pd.DataFrame:
+    """Reference implementation of the previous (per-measurement concatenation) export"""
+    dict_mea = unit.get_dict_measurements()
+    mea_id_key, lbl_x, lbl_y, lbl_z, lbl_listmea, lbl_avemea = unit.get_keys_dict_measurement()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    list_df = []
+    for i in range(unit.get_numMeasurements()):
+        size = dict_mea[lbl_avemea][i].shape[0]
+        df = pd.DataFrame()
+        df[mea_id_key] = [dict_mea[mea_id_key][i]] * size
+        for key in (lbl_x, lbl_y, lbl_z):
+            df[key] = [dict_mea[key][i]] * size
+        if flg_saveraw:
+            list_raw = dict_mea[lbl_listmea][i]
+            df[lbl_wavelength] = list_raw[0][lbl_wavelength]
+            for j, raw in enumerate(list_raw):
+                df[lbl_intensity + f'_{j+1}'] = raw[lbl_intensity]
+        else:
+            df[lbl_wavelength] = dict_mea[lbl_avemea][i][lbl_wavelength]
+            df[lbl_intensity] = dict_mea[lbl_avemea][i][lbl_intensity]
+        list_df.append(df)
+    return pd.concat(list_df, axis=0, ignore_index=True)
+
+
+def _read_export(filepath:str, extension:str) -> pd.DataFrame:
+    if extension in ('csv', 'txt'):
+        with open(filepath) as f:
+            num_meta_lines = f.read().split('\n\n')[0].count('\n') + 2
+        return pd.read_csv(filepath, sep='\t', skiprows=num_meta_lines, float_precision='round_trip')
+    elif extension == 'parquet':
+        return pd.read_parquet(filepath)
+    return pd.read_feather(filepath)
+
+
+@pytest.mark.parametrize('extension', ['csv', 'txt', 'parquet', 'feather'])
+@pytest.mark.parametrize('flg_saveraw', [True, False])
+def test_long_layout_matches_legacy(tmp_path, extension, flg_saveraw):
+    unit = _generate_unit()
+    filepath = os.path.join(tmp_path, f'unit.{extension}')
+    MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, flg_saveraw, extension, batch_size=5).join()
+
+    df_expected = _legacy_long_dataframe(unit, flg_saveraw)
+    df_saved = _read_export(filepath, extension)
+    assert list(df_saved.columns) == list(df_expected.columns)
+    mea_id_key = df_expected.columns[0]
+    if extension in ('parquet', 'feather'):
+        # The measurement IDs keep their str type
+        assert df_saved[mea_id_key].tolist() == df_expected[mea_id_key].tolist()
+    else:
+        assert df_saved[mea_id_key].astype(str).tolist() == df_expected[mea_id_key].tolist()
+    np.testing.assert_array_equal(df_saved.iloc[:, 1:].to_numpy(dtype=np.float64), df_expected.iloc[:, 1:].to_numpy(dtype=np.float64))
+
+    if extension in ('parquet', 'feather'):
+        assert os.path.isfile(os.path.join(tmp_path, 'unit_metadata.txt'))
+
+
+def test_wide_layout(tmp_path):
+    unit = _generate_unit()
+    filepath = os.path.join(tmp_path, 'unit.parquet')
+    MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, False, 'parquet', layout='wide', batch_size=5).join()
+
+    df_saved = pd.read_parquet(filepath)
+    coords, spectra, _, wavelengths = unit.get_arr_measurements()
+    assert len(df_saved) == unit.get_numMeasurements()
+    assert list(df_saved.columns[4:]) == [str(wvl) for wvl in wavelengths]
+    np.testing.assert_array_equal(df_saved.iloc[:, :4].to_numpy(dtype=np.float64), coords)
+    np.testing.assert_array_equal(df_saved.iloc[:, 4:].to_numpy(dtype=np.float64), spectra)
+
+    # With the raw data, there is one row per raw spectrum
+    MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, True, 'parquet', layout='wide').join()
+    df_saved = pd.read_parquet(filepath)
+    _, _, _, _, lbl_listmea, _ = unit.get_keys_dict_measurement()
+    assert len(df_saved) == sum(len(list_df) for list_df in unit.get_dict_measurements()[lbl_listmea])
+    assert df_saved['Accumulation'].tolist()[:6] == [1, 1, 2, 1, 2, 3]
+
+
+def test_progress_and_cancellation(tmp_path):
+    unit = _generate_unit()
+    list_progress = []
+    filepath = os.path.join(tmp_path, 'unit.feather')
+    MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, True, 'feather', batch_size=5,
+                                           callback_progress=lambda n, total: list_progress.append((n, total))).join()
+    assert list_progress == [(5, 12), (10, 12), (12, 12)]
+
+    event_cancel = threading.Event()
+    filepath = os.path.join(tmp_path, 'unit_cancelled.csv')
+    def cancel_after_first_batch(n, total):
+        event_cancel.set()
+    MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, True, 'csv', batch_size=5,
+                                           callback_progress=cancel_after_first_batch, event_cancel=event_cancel).join()
+    assert not os.path.exists(filepath)
+
+
+def test_throughput(tmp_path):
+    unit = _generate_unit(num_mea=2000, num_wavelength=1000)
+    for extension in ('csv', 'parquet', 'feather'):
+        filepath = os.path.join(tmp_path, f'unit.{extension}')
+        time1 = time.perf_counter()
+        MeaRMap_Handler().save_MappingUnit_ext(unit, filepath, False, extension, callback_progress=lambda n, total: None).join()
+        duration = time.perf_counter() - time1
+        print(f'{extension}: {unit.get_numMeasurements()/duration:.0f} measurements/s, {os.path.getsize(filepath)/1e6:.1f} MB')
+        assert os.path.isfile(filepath)
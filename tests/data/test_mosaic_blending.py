@@ -0,0 +1,107 @@
+"""
+Tests of the seam blending and illumination equalisation of image mosaics (iris.data.mosaic_blending)
+over synthetic tiles with vignetting and exposure differences
+"""
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_blending import MosaicBlending_Params, solve_tile_gains
+
+SCALE_PX_PER_MM = 100.0
+TILE_PX = 120
+STEP_PX = 90
+
+
+def _vignetting(size:int) -> np.ndarray:
+    coor = (np.arange(size) - (size - 1)/2)/(size/2)
+    return 1 - 0.35*(coor[None,:]**2 + coor[:,None]**2)/2
+
+
+def _vignetted_mosaic(num:int, tile_px:int=TILE_PX, step_px:int=STEP_PX, seed:int=0)\
+    -> tuple[MeaImg_Unit, np.ndarray, np.ndarray]:
+    """Returns a unit of num x num vignetted tiles with random exposures, the scene and the exposures"""
+    rng = np.random.default_rng(seed)
+    size = step_px*(num - 1) + tile_px
+    texture = cv2.GaussianBlur(rng.random((size, size)).astype(np.float32), (0, 0), 3)
+    scene = 150 + 400*(texture - texture.mean())[..., None]*np.array([1.0, 0.8, 0.6], dtype=np.float32)
+    vignetting = _vignetting(tile_px)[..., None]
+
+    cal = ImgMea_Cal('blending')
+    cal.set_calibration_params(SCALE_PX_PER_MM, SCALE_PX_PER_MM, 0.0, 0.0, 0.0, flip_y=1)
+    unit = MeaImg_Unit('blending', cal)
+    exposures = rng.uniform(0.8, 1.2, num*num)
+    for index, (row, col) in enumerate([(row, col) for row in range(num) for col in range(num)]):
+        patch = scene[row*step_px:row*step_px + tile_px, col*step_px:col*step_px + tile_px]
+        tile = np.clip(patch*vignetting*exposures[index], 0, 255).astype(np.uint8)
+        unit.add_measurement('0', col*step_px/SCALE_PX_PER_MM, row*step_px/SCALE_PX_PER_MM, 0.0, Image.fromarray(tile))
+    return unit, scene, exposures
+
+
+def _seam_contrast(unit:MeaImg_Unit, img:Image.Image) -> float:
+    """Mean absolute step across the tile edges of the pasted placement"""
+    arr = np.asarray(img, dtype=float).mean(axis=2)
+    list_xy, size = unit.get_stitch_placement()[:2]
+    seams_x = sorted({x for x, _ in list_xy if x > 0} | {x + size[0] for x, _ in list_xy if x + size[0] < arr.shape[1]})
+    seams_y = sorted({y for _, y in list_xy if y > 0} | {y + size[1] for _, y in list_xy if y + size[1] < arr.shape[0]})
+    steps = [np.abs(arr[:, x] - arr[:, x - 1]).mean() for x in seams_x]
+    steps += [np.abs(arr[y] - arr[y - 1]).mean() for y in seams_y]
+    return float(np.mean(steps))
+
+
+def test_seam_contrast_reduction():
+    unit, scene, _ = _vignetted_mosaic(4)
+    img_pasted = unit.get_image_all_stitched()[0]
+
+    unit.set_stitch_blending(MosaicBlending_Params())
+    img_blended = unit.get_image_all_stitched()[0]
+    assert img_blended.size == img_pasted.size
+    assert unit.get_image_all_stitched(blend=False)[0].tobytes() == img_pasted.tobytes()
+    contrast_pasted, contrast_blended = _seam_contrast(unit, img_pasted), _seam_contrast(unit, img_blended)
+    print(f'Seam contrast: pasted {contrast_pasted:.2f}, blended {contrast_blended:.2f}')
+    assert contrast_blended < 0.3*contrast_pasted
+
+    # With the flatfield (reference normalisation array of the camera flatfield correction), the
+    # mosaic matches the scene up to the overall exposure
+    flatfield = np.stack([_vignetting(TILE_PX)/_vignetting(TILE_PX).min()]*3, axis=2)
+    unit.set_stitch_blending(MosaicBlending_Params(flatfield=flatfield))
+    arr = np.asarray(unit.get_image_all_stitched()[0], dtype=float)
+    ratio = arr[5:-5, 5:-5]/scene[5:-5, 5:-5]
+    assert np.std(ratio)/np.mean(ratio) < 0.03
+    assert _seam_contrast(unit, Image.fromarray(arr.astype(np.uint8))) < contrast_blended
+
+    # Low resolution images use the same settings
+    assert unit.get_image_all_stitched(low_res=True)[0].size[0] < img_blended.size[0]
+
+
+def test_gain_recovery():
+    unit, _, exposures = _vignetted_mosaic(4, seed=1)
+    list_xy = unit.get_stitch_placement()[0]
+    list_tiles = [np.asarray(unit.get_stitch_image(i), dtype=np.float32) for i in range(unit.get_numMeasurements())]
+    gains = solve_tile_gains(list_tiles, list_xy, MosaicBlending_Params())
+
+    # The compensated exposures are equal, close to the mean exposure
+    compensated = gains*exposures[:, None]
+    assert np.std(compensated)/np.mean(compensated) < 0.02
+    assert abs(np.mean(gains) - 1) < 0.1
+
+
+def test_benchmark_blending():
+    unit, _, _ = _vignetted_mosaic(10, tile_px=200, step_px=160, seed=2)
+    start = time.perf_counter()
+    img_pasted = unit.get_image_all_stitched()[0]
+    duration_paste = time.perf_counter() - start
+
+    unit.set_stitch_blending(MosaicBlending_Params())
+    start = time.perf_counter()
+    img_blended = unit.get_image_all_stitched()[0]
+    duration_blend = time.perf_counter() - start
+    print(f'10x10 mosaic ({img_pasted.size[0]}x{img_pasted.size[1]} px): pasting {duration_paste:.3f} s, '
+          f'blending {duration_blend:.3f} s')
+
+    assert _seam_contrast(unit, img_blended) < 0.3*_seam_contrast(unit, img_pasted)
+    assert duration_blend < 10
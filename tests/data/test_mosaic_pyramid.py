@@ -0,0 +1,106 @@
+"""
+Tests of the mosaic tile pyramid (iris.data.mosaic_pyramid): tiles against the (downsampled) full
+stitch, with and without the seam blending, disk caching and the memory bound while panning a viewport
+"""
+import numpy as np
+import pytest
+from PIL import Image
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_blending import MosaicBlending_Params
+from iris.data.mosaic_pyramid import MosaicPyramid
+
+TILE_PX = 64
+
+
+@pytest.fixture(scope='module')
+def unit() -> MeaImg_Unit:
+    """Mosaic of 6 x 5 textured images of 200 px, overlapping by 50 px, on a rotated stage"""
+    rng = np.random.default_rng(0)
+    cal = ImgMea_Cal('pyramid')
+    cal.set_calibration_params(100.0, 100.0, 0.0, 0.0, 0.02, flip_y=1)
+    unit = MeaImg_Unit('pyramid', cal)
+    for row in range(5):
+        for col in range(6):
+            base = rng.integers(0, 256, 3)
+            noise = rng.integers(-40, 40, (200, 200, 3))
+            image = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+            unit.add_measurement('0', col*1.5, row*1.5, 0.0, image)
+    return unit
+
+
+def _assemble(pyramid:MosaicPyramid, level:int) -> np.ndarray:
+    wid, hei = pyramid.get_level_size(level)
+    img = Image.new('RGB', (wid, hei))
+    for _, col, row in pyramid.get_visible_tiles(level, (0, 0, *pyramid.get_image_size())):
+        img.paste(pyramid.get_tile(level, col, row), (col*TILE_PX, row*TILE_PX))
+    return np.asarray(img, dtype=float)
+
+
+def test_tiles_match_stitch(unit, tmp_path):
+    pyramid = MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX)
+    stitched = unit.get_image_all_stitched()[0]
+    assert pyramid.get_image_size() == stitched.size
+    assert pyramid.get_level_size(pyramid.get_num_levels() - 1)[0] <= TILE_PX < pyramid.get_level_size(pyramid.get_num_levels() - 2)[0]
+
+    # Full resolution: exactly the stitch
+    assert np.array_equal(_assemble(pyramid, 0), np.asarray(stitched, dtype=float))
+
+    # Downsampled levels: the box-downsampled stitch, up to the image seams
+    for level in range(1, pyramid.get_num_levels()):
+        reduced = np.asarray(stitched.reduce(2**level), dtype=float)
+        assembled = _assemble(pyramid, level)
+        assert assembled.shape == reduced.shape
+        assert np.median(np.abs(assembled - reduced)) < 1
+        assert np.mean(np.abs(assembled - reduced)) < 4
+
+    # Cached on disk: a new pyramid of the same unit serves the same tiles without rendering
+    pyramid_cached = MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX)
+    pyramid_cached._render_tile = None
+    assert np.array_equal(np.asarray(pyramid_cached.get_tile(1, 2, 1)), np.asarray(pyramid.get_tile(1, 2, 1)))
+
+
+def test_blended_tiles_match_stitch(unit, tmp_path):
+    pyramid_pasted = MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX)
+    yy, xx = np.mgrid[0:150, 0:200]
+    flatfield = 1.0 - 0.3*((xx - 100)**2 + (yy - 75)**2)/(100**2 + 75**2)
+    try:
+        unit.set_stitch_blending(MosaicBlending_Params(feather_px=30, flatfield=flatfield))
+        pyramid = MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX)
+        stitched = unit.get_image_all_stitched()[0]
+        # The blending is part of the disk cache key
+        assert pyramid.get_cache_dir() != pyramid_pasted.get_cache_dir()
+        unit.set_stitch_blending(MosaicBlending_Params(feather_px=20, flatfield=flatfield))
+        assert MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX).get_cache_dir() != pyramid.get_cache_dir()
+    finally:
+        unit.set_stitch_blending(None)
+    assert not np.array_equal(np.asarray(stitched), np.asarray(unit.get_image_all_stitched()[0]))
+
+    # Full resolution: exactly the blended stitch
+    assert np.array_equal(_assemble(pyramid, 0), np.asarray(stitched, dtype=float))
+
+    # Downsampled levels: the box-downsampled blended stitch, up to the image seams
+    for level in range(1, pyramid.get_num_levels()):
+        reduced = np.asarray(stitched.reduce(2**level), dtype=float)
+        assembled = _assemble(pyramid, level)
+        assert assembled.shape == reduced.shape
+        assert np.median(np.abs(assembled - reduced)) < 1
+        assert np.mean(np.abs(assembled - reduced)) < 4
+
+
+def test_viewport_memory_bound(unit, tmp_path):
+    pyramid = MosaicPyramid(unit, cache_dir=str(tmp_path), tile_px=TILE_PX, max_tiles_memory=20)
+    assert pyramid.select_level(2.0) == 0 and pyramid.select_level(0.3) == 1
+    assert pyramid.select_level(1e-3) == pyramid.get_num_levels() - 1
+
+    # Pan a 200 x 120 screen pixel viewport over the image at every zoom level
+    view_wid, view_hei = 200, 120
+    for scale in [1.0, 0.5, 0.25, 0.1]:
+        level = pyramid.select_level(scale)
+        for x in range(0, pyramid.get_image_size()[0], 37):
+            rect = (x, x/2, x + view_wid/scale, x/2 + view_hei/scale)
+            list_tiles = pyramid.get_visible_tiles(level, rect)
+            assert len(list_tiles) <= (view_wid/scale/(TILE_PX*2**level) + 2)*(view_hei/scale/(TILE_PX*2**level) + 2)
+            for key in list_tiles: pyramid.get_tile(*key)
+            assert pyramid.get_num_tiles_memory() <= 20
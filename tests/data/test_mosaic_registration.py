@@ -0,0 +1,143 @@
+"""
+Tests of the registration-refined tile placement (iris.data.mosaic_registration) over synthetic
+mosaics: tiles cut at sub-pixel positions from a textured scene, with the stage coordinates
+reporting the nominal grid only
+"""
+import time
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit, MeaImg_Hub, MeaImg_Handler
+from iris.data.mosaic_registration import phase_correlate, solve_global_placement
+
+SCALE_PX_PER_MM = 100.0
+TILE_PX = 160
+STEP_PX = 100
+JITTER_PX = 4.0
+
+
+def _scene(size:int, seed:int=0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.random((size, size)).astype(np.float32), (0, 0), 2)*255
+
+
+def _jittered_mosaic(num:int, seed:int=0) -> tuple[MeaImg_Unit, np.ndarray]:
+    """Returns a unit of num x num tiles placed on the grid by the stage and their true placements"""
+    rng = np.random.default_rng(seed)
+    scene = _scene(STEP_PX*num + TILE_PX + 4*int(JITTER_PX), seed)
+    cal = ImgMea_Cal('registration')
+    cal.set_calibration_params(SCALE_PX_PER_MM, SCALE_PX_PER_MM, 0.0, 0.0, 0.0, flip_y=1)
+    unit = MeaImg_Unit('mosaic', cal)
+    list_true = []
+    for row in range(num):
+        for col in range(num):
+            xy_true = np.array([col, row])*STEP_PX + 2*JITTER_PX + rng.uniform(-JITTER_PX, JITTER_PX, 2)
+            mat = np.float32([[1, 0, -xy_true[0]], [0, 1, -xy_true[1]]])
+            tile = cv2.warpAffine(scene, mat, (TILE_PX, TILE_PX), flags=cv2.INTER_CUBIC)
+            image = Image.fromarray(np.clip(tile, 0, 255).astype(np.uint8)).convert('RGB')
+            unit.add_measurement('0', col*STEP_PX/SCALE_PX_PER_MM, row*STEP_PX/SCALE_PX_PER_MM, 0.0, image)
+            list_true.append(xy_true)
+    return unit, np.array(list_true)
+
+
+def _placement_error(unit:MeaImg_Unit, xy_true:np.ndarray) -> np.ndarray:
+    """Refined minus true placement of every tile, up to the mosaic translation"""
+    num = int(np.sqrt(len(xy_true)))
+    xy_nominal = np.array([(col*STEP_PX, row*STEP_PX) for row in range(num) for col in range(num)], dtype=float)
+    error = xy_nominal + np.array(unit.get_tile_offsets()) - xy_true
+    return error - error.mean(axis=0)
+
+
+def test_phase_correlate():
+    scene = _scene(200)
+    for dx, dy in [(2.3, -1.6), (-0.4, 0.7)]:
+        shifted = cv2.warpAffine(scene, np.float32([[1, 0, -dx], [0, 1, -dy]]), (200, 200), flags=cv2.INTER_CUBIC)
+        shift_x, shift_y, response = phase_correlate(scene[40:160, 60:140], shifted[40:160, 60:140])
+        assert (shift_x, shift_y) == pytest.approx((dx, dy), abs=0.1)
+        assert response > 0.3
+
+
+def test_register_jittered_mosaic(tmp_path):
+    unit, xy_true = _jittered_mosaic(4)
+    img_nominal, min_mm, _ = unit.get_image_all_stitched()
+    result = unit.register_tile_placement()
+
+    # Sub-pixel recovery of the injected jitter, the stage coordinates unchanged
+    assert result.num_pairs_overlap == 2*4*3 + 2*3*3
+    assert result.num_pairs_rejected == 0
+    assert np.abs(_placement_error(unit, xy_true)).max() < 0.3
+    assert unit.get_dict_measurement()['coor_x'][:4] == [0.0, 1.0, 2.0, 3.0]
+    img_refined, min_mm_refined, _ = unit.get_image_all_stitched()
+    assert img_refined.tobytes() != img_nominal.tobytes()
+    assert unit.get_image_all_stitched(refined=False)[0].tobytes() == img_nominal.tobytes()
+    assert np.allclose(min_mm_refined, min_mm, atol=2*JITTER_PX/SCALE_PX_PER_MM)
+    assert unit.get_image_all_stitched(low_res=True)[0].size[0] < img_refined.size[0]
+
+    # Saved and loaded with the unit
+    hub = MeaImg_Hub()
+    hub.append_ImageMeasurementUnit(unit)
+    handler = MeaImg_Handler()
+    handler.save_ImageMeasurementHub_database(hub, str(tmp_path), 'mosaic').join()
+    hub_loaded = MeaImg_Hub()
+    handler.load_ImageMeasurementHub_database(str(tmp_path/'mosaic.db'), hub_loaded)
+    unit_loaded = hub_loaded.get_ImageMeasurementUnit(unit_id=unit.get_IdName()[0])
+    assert unit_loaded.get_tile_offsets() == pytest.approx(unit.get_tile_offsets())
+
+    # Invalidated by new measurements
+    unit.add_measurement('0', 0.0, 0.0, 0.0, Image.new('RGB', (TILE_PX, TILE_PX)))
+    assert not unit.check_tile_offsets_exist()
+
+
+def test_reject_unrelated_tile():
+    unit, xy_true = _jittered_mosaic(4, seed=1)
+    dict_mea = unit.get_dict_measurement()
+    dict_mea['image'][5] = Image.fromarray(_scene(TILE_PX, seed=7).astype(np.uint8)).convert('RGB')
+    result = unit.register_tile_placement()
+
+    assert all(5 not in pair for pair in result.list_pairs)
+    assert result.num_pairs_rejected == 8     # Tile 5 overlaps 4 neighbours and 4 diagonals
+    error = _placement_error(unit, xy_true)
+    error = np.delete(error, 5, axis=0)
+    assert np.abs(error - error.mean(axis=0)).max() < 0.3
+
+
+def test_global_placement_matches_dense():
+    # Two 6 x 5 grids and an isolated tile
+    rng = np.random.default_rng(3)
+    list_pairs = []
+    for offset in (0, 30):
+        for i in range(30):
+            if i % 6 < 5: list_pairs.append((offset + i, offset + i + 1))
+            if i < 24: list_pairs.append((offset + i, offset + i + 6))
+    pairs = np.array(list_pairs)
+    deltas = rng.normal(0, 2, (len(pairs), 3))
+    weights = rng.uniform(0.2, 1, len(pairs))
+    offsets = solve_global_placement(61, pairs, deltas, weights)
+
+    mat_A = np.zeros((len(pairs) + 3, 61))
+    sqrt_w = np.sqrt(weights)
+    mat_A[np.arange(len(pairs)), pairs[:,1]] = sqrt_w
+    mat_A[np.arange(len(pairs)), pairs[:,0]] = -sqrt_w
+    mat_A[len(pairs), :30], mat_A[len(pairs) + 1, 30:60], mat_A[len(pairs) + 2, 60] = 1, 1, 1
+    vec_b = np.zeros((len(pairs) + 3, 3))
+    vec_b[:len(pairs)] = deltas*sqrt_w[:,None]
+    assert np.allclose(offsets, np.linalg.lstsq(mat_A, vec_b, rcond=None)[0], atol=1e-8)
+    assert np.allclose(offsets[:30].mean(axis=0), 0) and np.allclose(offsets[60], 0)
+
+
+def test_benchmark_20x20():
+    unit, xy_true = _jittered_mosaic(20, seed=2)
+    start = time.perf_counter()
+    result = unit.register_tile_placement()
+    duration = time.perf_counter() - start
+    print(f'20x20 mosaic registration: {duration:.2f} s, {result.num_pairs_overlap} pairs, '
+          f'RMS residual {result.rms_residual_pixel:.3f} px')
+
+    error = _placement_error(unit, xy_true)
+    assert result.num_pairs_rejected == 0
+    assert np.sqrt(np.mean(error**2)) < 0.15
+    assert duration < 30
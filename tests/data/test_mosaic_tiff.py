@@ -0,0 +1,78 @@
+"""
+Tests of the streaming pyramidal TIFF export of image mosaics (iris.data.mosaic_tiff): the pixels
+against the in-memory stitch, the pixel size metadata and the peak memory on a large mosaic
+"""
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.mosaic_tiff import write_mosaic_tiff
+
+
+def _mosaic(num_cols:int, num_rows:int, size_px:int, rotation_rad:float, seed:int=0) -> MeaImg_Unit:
+    """Mosaic of textured images overlapping by a quarter, at 100 px/mm"""
+    rng = np.random.default_rng(seed)
+    cal = ImgMea_Cal('tiff')
+    cal.set_calibration_params(100.0, 100.0, 0.0, 0.0, rotation_rad, flip_y=1)
+    unit = MeaImg_Unit('tiff', cal)
+    step_mm = size_px*0.75/100
+    for row in range(num_rows):
+        for col in range(num_cols):
+            base = rng.integers(0, 256, 3)
+            noise = rng.integers(-40, 40, (size_px, size_px, 3))
+            image = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+            unit.add_measurement('0', col*step_mm, row*step_mm, 0.0, image)
+    return unit
+
+
+@pytest.mark.parametrize('rotation_rad', [0.0, 0.02])
+def test_tiff_matches_stitch(tmp_path, rotation_rad):
+    unit = _mosaic(5, 4, 120, rotation_rad)
+    stitched, coor_min_mm, _ = unit.get_image_all_stitched()
+    filepath = write_mosaic_tiff(unit, str(tmp_path/'mosaic.tif'), tile_px=64)
+
+    with tifffile.TiffFile(filepath) as tif:
+        levels = tif.series[0].levels
+        assert len(levels) == 4
+        # Full resolution: exactly the stitch
+        assert np.array_equal(levels[0].asarray(), np.asarray(stitched))
+        # Downsampled levels: the box-downsampled stitch, up to the image seams
+        for level in range(1, len(levels)):
+            reduced = np.asarray(stitched.reduce(2**level), dtype=float)
+            arr = levels[level].asarray().astype(float)
+            assert arr.shape == reduced.shape
+            assert np.median(np.abs(arr - reduced)) < 1
+            assert np.mean(np.abs(arr - reduced)) < 4
+
+        # Pixel size: 10 um at the full resolution
+        page = tif.pages[0]
+        assert page.tags['ResolutionUnit'].value == tifffile.RESUNIT.CENTIMETER
+        num, den = page.tags['XResolution'].value
+        assert num/den == pytest.approx(1000)
+        metadata = json.loads(page.tags['ImageDescription'].value)
+        assert metadata['pixel_size_x_um'] == pytest.approx(10)
+        assert metadata['coor_min_mm'] == pytest.approx(list(coor_min_mm))
+
+
+def test_tiff_peak_memory(tmp_path):
+    # 3 x 48 images of 400 px: a stitched image of about 1000 x 14500 px (43 MB), while a strip
+    # overlaps at most 3 rows of 3 images
+    unit = _mosaic(3, 48, 400, 0.0)
+    size = unit.get_stitch_placement()[2]
+    size_stitched = size[0]*size[1]*3
+
+    tracemalloc.start()
+    write_mosaic_tiff(unit, str(tmp_path/'large.tif'))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'Stitched image {size_stitched/1e6:.1f} MB, peak memory of the export {peak/1e6:.1f} MB')
+
+    assert peak < size_stitched/3
+    with tifffile.TiffFile(str(tmp_path/'large.tif')) as tif:
+        assert tif.series[0].levels[0].shape == (size[1], size[0], 3)
@@ -0,0 +1,139 @@
+"""
+Tests of the overlay calibration refinement (iris.data.overlay_registration): recovery of known
+translation, scale and rotation perturbations of synthetic correlated image/heatmap pairs, and the
+confidence of ambiguous alignments
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+from scipy.ndimage import gaussian_filter, map_coordinates
+
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.data.measurement_RamanMap import MeaRMap_Unit
+from iris.data.overlay_registration import OverlayRegistration_Params, REG_CONFIDENCE_LOW, compute_nmi,\
+    refine_overlay_calibration, refine_overlay_calibration_mapping, register_overlay
+
+_RNG = np.random.default_rng(0)
+_BLOBS = (_RNG.uniform(0, 2, (25, 2)), _RNG.uniform(0.08, 0.2, 25), _RNG.uniform(0.3, 1, 25))
+_ANCHOR = (0.2, 0.3)    # Scale and rotation centre of the synthetic image [mm]
+
+
+def _pattern(x:np.ndarray, y:np.ndarray) -> np.ndarray:
+    out = np.zeros_like(x)
+    for (cx, cy), width, amp in zip(*_BLOBS): out += amp*np.exp(-((x-cx)**2 + (y-cy)**2)/(2*width**2))
+    return out
+
+
+def _make_render(scale_true:float, rot_true:float, pixel_mm:float=0.01, extent=(0.0, 2.0, 0.0, 2.0)):
+    """Renders the pattern as displayed with a calibration corrected by (scale, rotation), the true
+    correction being (scale_true, rot_true)"""
+    xs = extent[0] + (np.arange(int((extent[1]-extent[0])/pixel_mm)) + 0.5)*pixel_mm
+    ys = extent[3] - (np.arange(int((extent[3]-extent[2])/pixel_mm)) + 0.5)*pixel_mm
+    mesh_x, mesh_y = np.meshgrid(xs - _ANCHOR[0], ys - _ANCHOR[1])
+    def render(scale:float, rot:float):
+        ratio, angle = scale/scale_true, rot_true - rot
+        qx = ratio*(np.cos(angle)*mesh_x - np.sin(angle)*mesh_y) + _ANCHOR[0]
+        qy = ratio*(np.sin(angle)*mesh_x + np.cos(angle)*mesh_y) + _ANCHOR[1]
+        return (170*_pattern(qx, qy)).astype(np.float32), extent
+    return render
+
+
+def _make_grid(x0:float, x1:float, y0:float, y1:float, step:float) -> tuple[np.ndarray,np.ndarray]:
+    grid_x, grid_y = np.meshgrid(np.arange(x0, x1, step), np.arange(y0, y1, step))
+    return grid_x.ravel(), grid_y.ravel()
+
+
+def test_compute_nmi():
+    rng = np.random.default_rng(1)
+    arr = rng.normal(0, 1, 5000)
+    assert compute_nmi(arr, arr) == pytest.approx(2.0)
+    assert compute_nmi(arr, 5 - 3*arr) == pytest.approx(2.0)     # Inverted contrast
+    assert 1.3 < compute_nmi(arr, np.exp(arr)) < 2.0
+    assert compute_nmi(arr, rng.normal(0, 1, 5000)) < 1.1
+
+
+@pytest.mark.parametrize('scale, rot_deg, dx, dy', [(1.03, 1.0, 0.07, -0.05), (0.97, -1.5, -0.12, 0.04)])
+def test_register_overlay_synthetic(scale, rot_deg, dx, dy):
+    # Heatmap: nonlinear, inverted function of the image content with noise, offset by (-dx,-dy)
+    x, y = _make_grid(0.4, 1.6, 0.4, 1.5, 0.04)
+    values = 100 - 60*_pattern(x, y)**2 + np.random.default_rng(2).normal(0, 2, x.size)
+    result = register_overlay(_make_render(scale, np.deg2rad(rot_deg)), x - dx, y - dy, values)
+
+    assert result.offset_x_mm == pytest.approx(dx, abs=0.03) and result.offset_y_mm == pytest.approx(dy, abs=0.03)
+    assert result.scale == pytest.approx(scale, abs=0.015)
+    assert np.rad2deg(result.rotation_rad) == pytest.approx(rot_deg, abs=0.5)
+    assert result.nmi > result.nmi_initial and result.confidence > REG_CONFIDENCE_LOW
+
+
+def _make_cal(scale:float, laser_x:float, laser_y:float, rot_rad:float) -> ImgMea_Cal:
+    cal = ImgMea_Cal('overlay')
+    cal.set_calibration_params(scale, scale, laser_x, laser_y, rot_rad, flip_y=1)
+    return cal
+
+
+def _make_mapping_unit(x:np.ndarray, y:np.ndarray, values:np.ndarray) -> MeaRMap_Unit:
+    """Mapping unit of flat spectra of the heatmap values"""
+    unit = MeaRMap_Unit(unit_name='overlay')
+    unit.test_generate_dummy()
+    unit.clear_measurements()
+    _, _, _, lbl_wavelength, lbl_intensity = unit.get_labels()
+    for i, (coor_x, coor_y, value) in enumerate(zip(x, y, values)):
+        df = pd.DataFrame({lbl_wavelength: [800.0, 900.0], lbl_intensity: [value, value]})
+        unit.append_dfmeasurement_data(str(1_700_000_000_000_000 + i), (float(coor_x), float(coor_y), 0.0), df, [df])
+    return unit
+
+
+@pytest.mark.parametrize('offset_x, offset_y, scale, rot_deg, from_mapping',
+                         [(0.04, 0.03, 1.0, 0.0, False), (-0.06, 0.02, 1.03, 0.8, True)])
+def test_refine_overlay_calibration(offset_x, offset_y, scale, rot_deg, from_mapping):
+    # Mosaic of smooth random tiles, the heatmap is sampled from it with the true calibration
+    rng = np.random.default_rng(3)
+    cal_true = _make_cal(200.0, 0.05, -0.03, 0.0)
+    unit = MeaImg_Unit('mosaic', cal_true)
+    for i in range(4):
+        arr = gaussian_filter(rng.normal(0, 1, (160, 200)), 12)
+        arr = ((arr - arr.min())/np.ptp(arr)*255).astype(np.uint8)
+        unit.add_measurement(f'{i:05d}', 0.2 + 0.9*(i//2), 0.2 + 0.7*(i%2), 0.0, Image.fromarray(np.stack([arr]*3, axis=2)))
+    img, limit_min, limit_max = unit.get_image_all_stitched(low_res=False)
+    left, right = sorted((limit_min[0], limit_max[0]))
+    bottom, top = sorted((limit_min[1], limit_max[1]))
+    arr = np.asarray(img.convert('L'), dtype=float)
+
+    x, y = _make_grid(0.45, 1.7, 0.4, 1.3, 0.03)
+    x_mea, y_mea = np.array([unit.convert_stg2mea(coor) for coor in zip(x, y)]).T
+    col = (x_mea - left)/(right - left)*arr.shape[1] - 0.5
+    row = (top - y_mea)/(top - bottom)*arr.shape[0] - 0.5
+    values = 1000*np.exp(-map_coordinates(arr, [row, col], order=1)/80) + rng.normal(0, 5, x.size)
+
+    # Perturbed calibration
+    cal = _make_cal(200.0/scale, 0.05 - offset_x, -0.03 - offset_y, -np.deg2rad(rot_deg))
+    unit.set_calibration_ImageMeasurement_Calibration(cal)
+    params = OverlayRegistration_Params(low_res=False)
+    if from_mapping:    # Heatmap points from the mapping unit's heatmap table
+        result = refine_overlay_calibration_mapping(unit, _make_mapping_unit(x, y, values), 850.0, params=params)
+    else: result = refine_overlay_calibration(unit, x, y, values, params)
+    assert unit.get_ImageMeasurement_Calibration() is cal  # Not modified
+
+    cal_fit = result.get_corrected_calibration(cal)
+    assert cal_fit.laser_coor_x_mm == pytest.approx(0.05, abs=0.01)
+    assert cal_fit.laser_coor_y_mm == pytest.approx(-0.03, abs=0.01)
+    assert cal_fit.scale_x_pixelPerMm == pytest.approx(200.0, rel=0.01)
+    assert np.rad2deg(cal_fit.rotation_rad) == pytest.approx(0.0, abs=0.3)
+    assert result.nmi > result.nmi_initial and result.confidence > REG_CONFIDENCE_LOW
+    assert 'Confidence' in result.get_summary()
+
+
+def test_register_overlay_ambiguous():
+    # Periodic stripes: every period aligns equally well
+    period = 0.2
+    def render(scale:float, rot:float):
+        xs = (np.arange(200) + 0.5)*0.01
+        return np.tile((127*(1 + np.sin(2*np.pi*xs/period))).astype(np.float32), (200, 1)), (0.0, 2.0, 0.0, 2.0)
+    x, y = _make_grid(0.5, 1.5, 0.5, 1.5, 0.02)
+    values = np.sin(2*np.pi*(x + 0.03)/period)
+    params = OverlayRegistration_Params(num_scale_steps=1, num_rotation_steps=1, max_scale_ratio=0, max_rotation_deg=0)
+    result = register_overlay(render, x, y, values, params)
+    assert result.confidence < REG_CONFIDENCE_LOW
+    assert 'low, please review' in result.get_summary()
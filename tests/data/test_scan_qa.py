@@ -0,0 +1,114 @@
+"""
+Tests of the post-scan acquisition quality report (iris.data.scan_qa) over dummy scans with
+injected delays: slow moves and acquisitions, a paused spectrum stream, a stage reporting gap and
+a slow scan line
+"""
+import sqlite3 as sql
+import threading
+import time
+
+import pytest
+
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.data.measurement_Raman import MeaRaman
+from iris.data.measurement_RamanMap import MeaRMap_Hub, MeaRMap_Unit, MeaRMap_Handler
+from iris.data.scan_qa import ScanQA_Recorder, ScanQA_Flag, load_scan_qa_database
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.general import get_timestamp_us_int
+
+
+@pytest.fixture
+def stage():
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    ctrl_xy = XYController_Dummy()
+    hub = DataStreamer_StageCam(ctrl_xy, ZController_Dummy(), None, namespace)
+    thread = threading.Thread(target=hub._collect_coordinateAndImage)
+    thread.start()
+    yield hub, ctrl_xy, namespace
+    hub._flg_selfrunning.clear()
+    thread.join()
+
+
+def _store(recorder:ScanQA_Recorder, hub:DataStreamer_StageCam, unit:MeaRMap_Unit, ts:int) -> ScanQA_Flag:
+    """Stores a dummy spectrum at a timestamp, as the measurement storer does"""
+    start = recorder.get_time()
+    coor, flag = hub.get_coordinates_interpolate_flagged(ts)
+    mea = MeaRaman(reconstruct=True)
+    mea.test_generate_dummy()
+    unit.append_ramanmeasurement_data(timestamp=ts, coor=coor, measurement=mea)
+    recorder.record_storage(ts, start, flag, int_time_ms=10)
+    return flag
+
+
+def test_discrete_scan(stage, tmp_path):
+    hub, ctrl_xy, _ = stage
+    ts_before_history = get_timestamp_us_int() - 10_000_000
+    time.sleep(0.2)
+    recorder = ScanQA_Recorder('discrete')
+    unit = MeaRMap_Unit(unit_name='discrete')
+    for i in range(12):
+        with recorder.time_move(i):
+            ctrl_xy.move_direct((0.01*i, 0.0))
+            time.sleep(0.12 if i == 5 else 0.01)   # Slow move
+        with recorder.time_acquisition(i) as list_ts:
+            time.sleep(0.15 if i == 8 else 0.01)   # Slow acquisition
+            list_ts.append(get_timestamp_us_int())
+        _store(recorder, hub, unit, ts_before_history if i == 0 else list_ts[0])
+    recorder.finish()
+
+    report = recorder.compute_report()
+    assert report.num_points == report.num_spectra == 12
+    assert report.move_outliers == [5] and report.acquisition_outliers == [8]
+    assert report.num_clamped == 1
+    assert 0.1 < report.duty_cycle < 0.7
+    assert report.dead_time_sec == pytest.approx(report.duration_sec - report.acquisition_sec)
+    assert any('Slow stage moves at points [5]' in issue for issue in report.get_list_issues())
+
+    # Saved and loaded with the unit
+    unit.set_scan_qa(report)
+    mapping_hub = MeaRMap_Hub()
+    mapping_hub.append_mapping_unit(unit)
+    handler = MeaRMap_Handler()
+    handler.save_MappingHub_database(mapping_hub, str(tmp_path), 'scan').join()
+    with sql.connect(str(tmp_path/'scan.db')) as conn:
+        loaded, png = load_scan_qa_database(conn, unit.get_unit_id(), handler._table_prefix)
+    assert png[:8] == b'\x89PNG\r\n\x1a\n'
+    assert loaded.to_dict() == report.to_dict()
+    hub_loaded = handler.load_MappingMeasurementHub_database(MeaRMap_Hub(), str(tmp_path/'scan.db'))
+    assert hub_loaded.get_MappingUnit(unit.get_unit_id()).get_scan_qa().move_outliers == [5]
+
+
+def test_continuous_scan(stage):
+    hub, ctrl_xy, namespace = stage
+    time.sleep(0.2)
+    recorder = ScanQA_Recorder('continuous')
+    unit = MeaRMap_Unit(unit_name='continuous')
+    # > Spectrum stream, stored afterwards as from the measurement queue <
+    list_ts = []
+    for line in range(4):
+        start, xy_start = recorder.get_time(), (0.0, 0.01*line)
+        for i in range(15):
+            if line == 1 and i == 7: time.sleep(0.1)     # Paused stream: ~10 spectra dropped
+            if line == 2 and i == 0: namespace.stage_request_interval_ms = 300    # Stage reporting gap
+            time.sleep(0.01)
+            ctrl_xy.move_direct((0.1*i/14, 0.01*line))
+            list_ts.append(get_timestamp_us_int())
+        namespace.stage_request_interval_ms = MPMeaHubEnum.STAGEHUB_REQUEST_INTERVAL.value
+        if line == 3: time.sleep(0.3)   # Slow line
+        recorder.record_line(line, start, xy_start, (0.1, 0.01*line))
+    list_flags = [_store(recorder, hub, unit, ts) for ts in list_ts]
+    recorder.finish()
+
+    report = recorder.compute_report()
+    assert report.num_spectra == 60 and report.num_points == 4
+    assert len(report.timestamp_gaps) == 1 and 15 < report.timestamp_gaps[0] < 30
+    assert 5 <= report.estimated_dropped_spectra <= 12
+    assert report.interval_jitter_ms < 0.5*report.interval_median_ms
+    assert report.num_stage_gaps > 5
+    assert not any(flag & ScanQA_Flag.GAP for flag in list_flags[:30])   # Only from the stage reporting gap
+    assert report.slow_lines == [1, 3]   # The paused line is slow too
+    assert report.line_speed_mean_mm_s > 0
@@ -0,0 +1,54 @@
+"""
+Tests of the zoomable mosaic viewer (iris.gui.submodules.mosaic_viewer): the tiles are loaded in the
+background and the disk cache of the viewer's pyramid is deleted when the viewer closes
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import time
+
+import numpy as np
+import PySide6.QtWidgets as qw
+from PIL import Image
+
+import iris.data.mosaic_pyramid as mosaic_pyramid
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.gui.submodules.mosaic_viewer import Dlg_MosaicViewer
+
+
+def _make_unit() -> MeaImg_Unit:
+    rng = np.random.default_rng(0)
+    cal = ImgMea_Cal('viewer')
+    cal.set_calibration_params(100.0, 100.0, 0.0, 0.0, 0.0, flip_y=1)
+    unit = MeaImg_Unit('viewer', cal)
+    for i in range(4):
+        image = Image.fromarray(rng.integers(0, 256, (300, 300, 3)).astype(np.uint8))
+        unit.add_measurement('0', 2.5*(i%2), 2.5*(i//2), 0.0, image)
+    return unit
+
+
+def _wait_for(condition, timeout:float=10.0) -> bool:
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        qw.QApplication.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_cache_deleted_on_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(mosaic_pyramid, 'PYRAMID_CACHE_DIR_DEFAULT', str(tmp_path))
+    app = qw.QApplication.instance() or qw.QApplication([])
+
+    dlg = Dlg_MosaicViewer(None, _make_unit())
+    dlg.show()
+    viewer = dlg._viewer
+    cache_dir = viewer._pyramid.get_cache_dir()
+    assert os.path.dirname(cache_dir) == str(tmp_path)
+    assert _wait_for(lambda: viewer.get_num_items() > 0)
+    assert os.path.isdir(cache_dir)
+
+    dlg.close()
+    assert not os.path.exists(cache_dir)
+    viewer.release()    # Idempotent
@@ -0,0 +1,54 @@
+"""
+Tests of the stage moves of the motion controller (Motion_GoToCoor_Worker, iris.gui.motion_video)
+with the dummy stages
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import threading
+
+import numpy as np
+
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.gui.motion_video import Motion_GoToCoor_Worker
+
+
+class _ZController_Recorder(ZController_Dummy):
+    """Dummy Z stage recording the moves"""
+    def __init__(self):
+        super().__init__()
+        self.list_targets = []
+
+    def move_direct(self, coor_abs):
+        self.list_targets.append(coor_abs)
+        return super().move_direct(coor_abs)
+
+
+class _StageHub():
+    """Stands in for the stage hub, sampling the dummy stages on request"""
+    def __init__(self, ctrl_xy:XYController_Dummy, ctrl_z:ZController_Dummy):
+        self._ctrl_xy, self._ctrl_z = ctrl_xy, ctrl_z
+
+    def get_coordinates_closest(self, timestamp:int) -> tuple[float,float,float]:
+        return (*self._ctrl_xy.get_coordinates(), self._ctrl_z.get_coordinates())
+
+
+def test_goto_without_z_target():
+    ctrl_xy, ctrl_z = XYController_Dummy(), _ZController_Recorder()
+    worker = Motion_GoToCoor_Worker(_StageHub(ctrl_xy, ctrl_z), ctrl_xy, ctrl_z)
+    list_msg = []
+    worker.sig_mvmt_started.connect(list_msg.append)
+    worker.sig_mvmt_finished.connect(list_msg.append)
+
+    # Without a Z target (e.g., Z driven by a focus tracker), the Z stage is left alone
+    event_finished = threading.Event()
+    worker.work((0.4, 0.3, None), event_finished)
+    assert event_finished.is_set() and list_msg[-1] == worker.msg_target_reached
+    assert ctrl_z.list_targets == [] and 'Z' not in list_msg[0]
+    assert np.allclose(ctrl_xy.get_coordinates(), (0.4, 0.3), atol=0.002)
+
+    worker.work((None, None, 0.02), threading.Event())
+    assert ctrl_z.list_targets == [0.02] and list_msg[-1] == worker.msg_target_reached
+    assert np.allclose(ctrl_xy.get_coordinates(), (0.4, 0.3), atol=0.002)
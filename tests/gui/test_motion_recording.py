@@ -0,0 +1,76 @@
+"""
+Tests of the stage camera recording control of the motion controller (Wdg_MotionController,
+iris.gui.motion_video) with the dummy stages and camera
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import threading
+import time
+
+import PySide6.QtWidgets as qw
+from PySide6.QtCore import QThread
+
+from iris.controllers.camera_controller_dummy import CameraController_Dummy
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.gui.motion_video import Wdg_MotionController
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.multiprocessing.videoRecorder_StageCam import load_recording_table
+
+
+def _process_events_until(condition, timeout:float=10.0) -> bool:
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        qw.QApplication.processEvents()
+        time.sleep(0.01)
+    return condition()
+
+
+def test_record_and_stop(tmp_path, monkeypatch):
+    app = qw.QApplication.instance() or qw.QApplication([])
+    list_messages = []
+    monkeypatch.setattr(qw.QFileDialog, 'getExistingDirectory', lambda *args, **kwargs: str(tmp_path))
+    monkeypatch.setattr(qw.QMessageBox, 'information', lambda parent, title, msg: list_messages.append(msg))
+    monkeypatch.setattr(qw.QMessageBox, 'warning', lambda parent, title, msg: list_messages.append(msg))
+
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    ctrl_xy, ctrl_z = XYController_Dummy(), ZController_Dummy()
+    hub = DataStreamer_StageCam(ctrl_xy, ctrl_z, CameraController_Dummy(), namespace)
+    thread_hub = threading.Thread(target=hub._collect_coordinateAndImage)
+    thread_hub.start()
+    wdg = None
+    try:
+        wdg = Wdg_MotionController(None, ctrl_xy, ctrl_z, hub, lambda: None)
+        wdg._toggle_recording()
+        assert wdg._recorder is not None and wdg._recorder.is_recording()
+        assert wdg._btn_record.text() == 'Stop recording'
+        _process_events_until(lambda: wdg._recorder.get_report().num_frames >= 5)
+
+        # The frames come from the video feed, the recorder does not acquire from the camera
+        wdg.pause_video()
+        _process_events_until(lambda: False, timeout=0.5)
+        num_frames = wdg._recorder.get_report().num_frames
+        _process_events_until(lambda: False, timeout=0.5)
+        assert wdg._recorder.get_report().num_frames == num_frames
+
+        wdg._toggle_recording()
+        assert _process_events_until(lambda: len(list_messages) > 0)
+        assert wdg._recorder is None and wdg._btn_record.text() == 'Record video' and wdg._btn_record.isEnabled()
+    finally:
+        if wdg is not None:     # The widget workers poll the hub
+            wdg.pause_video()
+            for thread in wdg.findChildren(QThread):
+                thread.quit()
+                thread.wait()
+        hub._flg_selfrunning.clear()
+        thread_hub.join()
+
+    # The report of the recording is shown, with its frame table
+    name = [filename for filename in os.listdir(tmp_path) if filename.endswith('_frames.csv')][0][:-len('_frames.csv')]
+    df = load_recording_table(str(tmp_path), name)
+    assert len(df) >= 5 and f'{len(df)} frames' in list_messages[0] and name in list_messages[0]
@@ -0,0 +1,164 @@
+"""
+Tests of the live video overlay rendering (iris.gui.submodules.video_overlay) with the dummy camera:
+overlay geometry against the previous per-frame drawing, zero-copy frame wrapping, frame dropping
+and the per-frame cost
+"""
+import os
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import time
+
+import matplotlib
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont, ImageQt
+from PySide6.QtGui import QColor, QGuiApplication, QPainter, QPixmap
+
+from iris.controllers import ControllerConfigEnum
+from iris.controllers.camera_controller_dummy import CameraController_Dummy
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.gui.motion_video import ImageCapture_Worker
+from iris.gui.submodules.video_overlay import VideoFrame_Governor, VideoOverlay_Renderer, convert_array_to_qimage
+from iris.multiprocessing.dataStreamer_StageCam import Enum_CamCorrectionType
+
+FONT = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', 'DejaVuSans-Bold.ttf')
+
+
+def _draw_legacy(img:Image.Image, cal:ImgMea_Cal, scalebar:bool, crosshair:bool) -> Image.Image:
+    """The previous per-frame drawing of ImageCapture_Worker (_overlay_scalebar, _draw_crosshair)"""
+    if scalebar and cal.check_calibration_set():
+        scalex = 1/cal.scale_x_pixelPerMm
+        scalebar_length = int(ControllerConfigEnum.SCALEBAR_LENGTH_RATIO.value * img.size[0])
+        scalebar_height = int(ControllerConfigEnum.SCALEBAR_HEIGHT_RATIO.value * img.size[1])
+        length_mm = scalebar_length * scalex
+        font_size = int(scalebar_length/10 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
+        line_width = int(scalebar_length/50 * ControllerConfigEnum.SCALEBAR_FONT_RATIO.value)
+        line_offset = scalebar_length/10
+        box_length = scalebar_length + 2*line_offset
+        box_height = scalebar_height + 2*line_offset
+
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([(img.size[0]-box_length, img.size[1]-box_height), (img.size[0], img.size[1])], fill=(0,0,0))
+        draw.line([(img.size[0]-scalebar_length-line_offset, img.size[1]-line_offset),
+                   (img.size[0]-line_offset, img.size[1]-line_offset)], fill=(255,255,255), width=line_width)
+        text_params = {'text':'{:.0f} µm'.format(abs(length_mm*1e3)), 'font':ImageFont.truetype(FONT,font_size)}
+        text_length = draw.textlength(**text_params)
+        draw.text((img.size[0]-box_length/2-text_length/2, img.size[1]-line_offset*2-line_width-font_size/2),
+                  align='left', fill=(255,255,255), **text_params)
+    if crosshair:
+        width, height = img.size
+        draw = ImageDraw.Draw(img)
+        draw.line([(width/2, 0), (width/2, height)], fill=(255, 0, 0), width=3)
+        draw.line([(0, height/2), (width, height/2)], fill=(255, 0, 0), width=3)
+    return img
+
+
+def _make_camera(size:tuple[int,int]=(640,480)) -> CameraController_Dummy:
+    cam = CameraController_Dummy()
+    cam._frame = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    cam.set_exposure_time_us(0)
+    return cam
+
+
+def _make_cal(scale:float=850.0) -> ImgMea_Cal:
+    cal = ImgMea_Cal('video')
+    cal.set_calibration_params(scale, scale, 0.0, 0.0, 0.0, flip_y=1)
+    return cal
+
+
+@pytest.mark.parametrize('size', [(640,480), (1280,1024)])
+@pytest.mark.parametrize('scalebar, crosshair', [(True, True), (True, False), (False, True)])
+def test_overlay_geometry(size, scalebar, crosshair):
+    cam, cal = _make_camera(size), _make_cal()
+    renderer = VideoOverlay_Renderer(font=FONT)
+    for _ in range(3):
+        img = cam.img_capture()
+        frame, flg_overlay = renderer.render(img, cal, scalebar, crosshair)
+        assert flg_overlay
+        assert np.array_equal(frame, np.asarray(_draw_legacy(img.copy(), cal, scalebar, crosshair)))
+    # The layers are drawn once, and again only when the calibration changes
+    assert renderer.get_num_layer_renders() == 1
+    cal_new = _make_cal(400.0)
+    frame, _ = renderer.render(img, cal_new, scalebar, crosshair)
+    assert np.array_equal(frame, np.asarray(_draw_legacy(img.copy(), cal_new, scalebar, crosshair)))
+    assert renderer.get_num_layer_renders() == (2 if scalebar else 1)
+
+    # No overlays: the frame is the image itself
+    frame, flg_overlay = renderer.render(img, ImgMea_Cal('unset'), True, False)
+    assert not flg_overlay and np.array_equal(frame, np.asarray(img))
+
+
+def test_convert_array_to_qimage():
+    arr = np.zeros((6, 10, 3), dtype=np.uint8)
+    qimage = convert_array_to_qimage(arr)
+    assert (qimage.width(), qimage.height()) == (10, 6)
+    painter = QPainter(qimage)
+    painter.fillRect(2, 1, 3, 2, QColor(10, 20, 30))
+    painter.end()
+    # Painted in place, without a copy
+    assert np.array_equal(arr[1:3, 2:5], np.full((2, 3, 3), (10, 20, 30)))
+    assert arr.sum() == 6*60
+
+
+def test_frame_governor():
+    governor = VideoFrame_Governor(window_sec=5.0)
+    assert governor.request_display()
+    assert not governor.request_display() and governor.get_num_dropped() == 1
+    governor.notify_displayed()
+    for _ in range(5):
+        time.sleep(0.02)
+        assert governor.request_display()
+        governor.notify_displayed()
+    assert 20 < governor.get_fps() < 55
+    governor.reset()
+    assert governor.get_fps() == 0 and governor.get_num_dropped() == 0
+
+
+def test_worker_drops_undisplayed_frames():
+    cal = _make_cal()
+    worker = ImageCapture_Worker(camera_controller=_make_camera(), stageHub=None, getter_imgcal=lambda: cal) # pyright: ignore[reportArgumentType] ; Not used for the raw frames
+    worker._renderer = VideoOverlay_Renderer(font=FONT)
+    list_frames, list_imgs, list_raw, list_dropped = [], [], [], []
+    worker.sig_frame.connect(list_frames.append)
+    worker.sig_img.connect(list_imgs.append)
+    worker.sig_raw_img.connect(lambda ts, img: list_raw.append(img))
+    worker.sig_frame_dropped.connect(lambda: list_dropped.append(True))
+
+    # The second frame is dropped as the first one is not displayed yet, the images are all emitted
+    worker.grab_image(Enum_CamCorrectionType.RAW, True, True)
+    worker.grab_image(Enum_CamCorrectionType.RAW, True, True)
+    assert len(list_frames) == 1 and len(list_dropped) == 1 and len(list_imgs) == 2
+    worker.get_frame_governor().notify_displayed()
+    worker.grab_image(Enum_CamCorrectionType.RAW, True, True)
+    assert len(list_frames) == 2
+
+    # The displayed frame and the emitted image carry the overlays, the raw frame does not
+    expected = np.asarray(_draw_legacy(list_raw[-1].copy(), cal, True, True))
+    assert np.array_equal(list_frames[-1], expected)
+    assert np.array_equal(np.asarray(list_imgs[-1]), expected)
+    assert not np.array_equal(np.asarray(list_raw[-1]), expected)
+
+
+def test_benchmark_per_frame_cost():
+    app = QGuiApplication.instance() or QGuiApplication([])
+    cam, cal = _make_camera((1280,1024)), _make_cal()
+    renderer = VideoOverlay_Renderer(font=FONT)
+    num_frames = 30
+
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        img = _draw_legacy(cam.img_capture().copy(), cal, True, True)
+        pixmap_legacy = ImageQt.toqpixmap(img)
+    time_legacy = (time.perf_counter() - start)/num_frames
+
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        frame, _ = renderer.render(cam.img_capture(), cal, True, True)
+        pixmap = QPixmap.fromImage(convert_array_to_qimage(frame))
+    time_cached = (time.perf_counter() - start)/num_frames
+    print(f'\nPer-frame overlay and conversion cost of 1280x1024 frames: per-frame drawing {time_legacy*1e3:.2f} ms,'
+          f' cached layers {time_cached*1e3:.2f} ms')
+
+    assert pixmap.toImage() == pixmap_legacy.toImage().convertToFormat(pixmap.toImage().format())
+    assert time_cached < time_legacy
@@ -0,0 +1,103 @@
+"""
+Tests for the burst acquisition (measure_spectrum_batch) of the spectrometer controllers and its
+use in DataStreamer_Raman._auto_collect_measurement
+"""
+import multiprocessing as mp
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from iris.calibration.calibration_generator import SpectrometerCalibrator
+from iris.controllers.raman_spectrometer_controller_dummy import SpectrometerController_Dummy
+from iris.multiprocessing.dataStreamer_Raman import DataStreamer_Raman
+
+
+def _new_streamer(controller) -> DataStreamer_Raman:
+    dict_measurements = {'timestamp_us_int': [], 'raw_spectrum': [], 'integration_time_ms': [], 'flg_retrieved': []}
+    return DataStreamer_Raman(controller, dict_measurements)
+
+
+def _run_collector(streamer:DataStreamer_Raman, duration_sec:float) -> list:
+    thread = threading.Thread(target=streamer._auto_collect_measurement)
+    thread.start()
+    streamer.resume_auto_measurement()
+    time.sleep(duration_sec)
+    streamer.pause_auto_measurement()
+    streamer._flg_process_measurement.clear()
+    thread.join()
+    return streamer._list_measurements_updater
+
+
+def test_dummy_batch_timestamps():
+    controller = SpectrometerController_Dummy()
+    controller.set_integration_time_us(2000)
+    list_ts = []
+    for wavelength, intensities, timestamps, int_time_us in controller.iter_spectrum_batches(8, event_stop=None):
+        assert intensities.shape == (8, len(wavelength))
+        assert timestamps.dtype == np.int64 and int_time_us == 2000
+        list_ts.extend(timestamps.tolist())
+        if len(list_ts) >= 32: break
+    assert np.all(np.diff(list_ts) > 0)
+    np.testing.assert_array_equal(np.diff(list_ts[:8]), 2000)
+
+
+def test_streamer_consumes_batches():
+    controller = SpectrometerController_Dummy()
+    controller.set_integration_time_us(1000)
+    streamer = _new_streamer(controller)
+    streamer._batch_maxframes = 16
+    streamer._batch_maxlatency_us = 20_000
+
+    # One package per burst: the timestamps and a single dataframe of the spectra
+    list_packages = _run_collector(streamer, 0.5)
+    assert all(isinstance(package[0], list) for package in list_packages)
+    list_ts = [ts for package in list_packages for ts in package[0]]
+    assert len(list_ts) > 50 and len(list_packages) < len(list_ts)
+    assert np.all(np.diff(list_ts) > 0)
+    list_ts_batch, df_batch, int_time_ms = list_packages[-1]
+    assert all(isinstance(ts, int) for ts in list_ts_batch) and int_time_ms == 1.0
+    assert isinstance(df_batch, pd.DataFrame) and list(df_batch.columns) == [streamer._lbl_wavelength, streamer._lbl_intensity]
+    num_pixels = len(df_batch)//len(list_ts_batch)
+    assert len(df_batch) == num_pixels*len(list_ts_batch)
+
+    # The updater calibrates the bursts at once and splits them into the measurements
+    (pipe_update, _pipe_update_front), (pipe_mea, _pipe_mea_front) = mp.Pipe(), mp.Pipe()
+    streamer._calibrator = SpectrometerCalibrator(pipe_update, pipe_mea)
+    try: streamer._set_measurement_batch_childProc(list_ts_batch, df_batch, int_time_ms)
+    finally: streamer._calibrator.terminate()
+    assert streamer._list_timestamps == list_ts_batch
+    for i, spectrum in enumerate(streamer._list_measurements):
+        raw_spectrum = df_batch.iloc[i*num_pixels:(i+1)*num_pixels].reset_index(drop=True)
+        pd.testing.assert_frame_equal(spectrum, streamer._calibrator.calibrate_measurement(raw_spectrum))
+
+
+def test_streamer_scalar_fallback():
+    class Controller_ScalarOnly(SpectrometerController_Dummy):
+        def measure_spectrum_batch(self, num_frames):
+            raise NotImplementedError
+
+    controller = Controller_ScalarOnly()
+    controller.set_integration_time_us(1000)
+    streamer = _new_streamer(controller)
+    list_packages = _run_collector(streamer, 0.3)
+    assert len(list_packages) > 10
+    assert np.all(np.diff([package[0] for package in list_packages]) > 0)
+
+
+def test_batch_throughput_gain():
+    controller = SpectrometerController_Dummy()
+    controller.set_integration_time_us(0)  # Overhead-dominated regime
+    num_frames = 200
+
+    time1 = time.perf_counter()
+    for _ in range(num_frames): controller.measure_spectrum()
+    rate_scalar = num_frames / (time.perf_counter() - time1)
+
+    time1 = time.perf_counter()
+    controller.measure_spectrum_batch(num_frames)
+    rate_batch = num_frames / (time.perf_counter() - time1)
+
+    print(f'Scalar: {rate_scalar:.0f} spectra/s, burst: {rate_batch:.0f} spectra/s')
+    assert rate_batch > 2 * rate_scalar
@@ -0,0 +1,156 @@
+"""
+Tests of the stage camera recording (iris.multiprocessing.videoRecorder_StageCam) with the dummy
+camera and stages: frame/timestamp/coordinate alignment, lossless storage and bounded memory
+with a slow disk writer
+"""
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from iris.controllers.camera_controller_dummy import CameraController_Dummy
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.multiprocessing.videoRecorder_StageCam import VideoRecorder_StageCam, Enum_RecFormat,\
+    load_recording_table, load_recording_chunk
+from iris.utils.general import get_timestamp_us_int
+
+
+class _CountingCamera(CameraController_Dummy):
+    """Dummy camera writing the frame count into the frames and logging the capture timestamps"""
+    def __init__(self, size:tuple[int,int]=(160,120)):
+        super().__init__()
+        self._frame = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        self._exposure_time_us = 2000
+        self.list_ts = []
+
+    def frame_capture(self):
+        frame = super().frame_capture().copy()
+        count = len(self.list_ts)
+        frame[0,0] = (count % 256, count // 256 % 256, 0)
+        self.list_ts.append(get_timestamp_us_int())
+        return frame
+
+
+class _SlowRecorder(VideoRecorder_StageCam):
+    """Recorder with a slow disk"""
+    def _write_chunk_file(self, path, list_arr):
+        time.sleep(0.05)
+        super()._write_chunk_file(path, list_arr)
+
+
+@pytest.fixture
+def stage():
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    ctrl_xy, cam = XYController_Dummy(), _CountingCamera()
+    hub = DataStreamer_StageCam(ctrl_xy, ZController_Dummy(), cam, namespace)
+    thread = threading.Thread(target=hub._collect_coordinateAndImage)
+    thread.start()
+    time.sleep(0.1)
+    yield hub, ctrl_xy, cam
+    hub._flg_selfrunning.clear()
+    thread.join()
+
+
+@pytest.mark.parametrize('rec_format', [Enum_RecFormat.NPZ, Enum_RecFormat.FFV1])
+def test_frame_timestamp_alignment(stage, tmp_path, rec_format):
+    hub, ctrl_xy, cam = stage
+    recorder = VideoRecorder_StageCam(hub, str(tmp_path), 'rec', rec_format=rec_format, buffer_frames=64, chunk_frames=7)
+    recorder.start(interval_sec=0.01)
+    for i in range(4):
+        ctrl_xy.move_direct((0.1*i, 0.05*i))
+        time.sleep(0.15)
+    report = recorder.stop()
+
+    # Every captured frame is stored, in order, with the timestamp of its capture
+    df = load_recording_table(str(tmp_path), 'rec')
+    assert report.num_dropped == 0 and not df['dropped'].any()
+    assert report.num_frames == report.num_stored == len(df) > 20
+    assert report.num_chunks == int(np.ceil(len(df)/7))
+    assert np.array_equal(df['frame'], np.arange(len(df))) and np.all(np.diff(df['timestamp_us']) > 0)
+    list_ts_cam = cam.list_ts[:len(df)]
+    for k, ts in enumerate(df['timestamp_us']):
+        if k > 0: assert list_ts_cam[k-1] < ts
+        if k+1 < len(list_ts_cam): assert ts < list_ts_cam[k+1]
+
+    for idx_chunk, df_chunk in df.groupby('chunk'):
+        frames = load_recording_chunk(str(tmp_path), 'rec', int(idx_chunk))
+        assert len(frames) == len(df_chunk)
+        for (_, row), frame in zip(df_chunk.iterrows(), frames):
+            assert int(frame[0,0,0]) + 256*int(frame[0,0,1]) == row['frame']
+            assert np.array_equal(frame[1:], cam._frame[1:])    # Lossless
+
+    # The coordinates are interpolated at the frame timestamps
+    for _, row in df.iloc[::5].iterrows():
+        coor = hub.get_coordinates_interpolate(int(row['timestamp_us']))
+        assert np.allclose((row['x_mm'], row['y_mm'], row['z_mm']), coor)
+    assert np.all(np.diff(df['x_mm']) >= -1e-9) and df['x_mm'].iloc[-1] == pytest.approx(0.3, abs=0.01)
+
+
+def test_slow_writer_bounded_memory(stage, tmp_path):
+    hub, _, _ = stage
+    buffer_frames, chunk_frames, num_frames = 8, 4, 150
+    frame_bytes = 320*240*3
+    recorder = _SlowRecorder(hub, str(tmp_path), 'slow', buffer_frames=buffer_frames, chunk_frames=chunk_frames)
+    recorder.start(acquire=False)
+    rng = np.random.default_rng(0)
+    tracemalloc.start()
+    try:
+        for i in range(num_frames):
+            frame = rng.integers(0, 256, (240, 320, 3), dtype=np.uint8)
+            frame[0,0,0] = i % 256
+            recorder.push_frame(get_timestamp_us_int(), frame)
+            time.sleep(0.002)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    report = recorder.stop()
+
+    # The buffer never exceeds its size, the oldest frames are dropped and reported
+    assert report.peak_buffered == buffer_frames
+    assert peak < 2*(buffer_frames + 2*chunk_frames)*frame_bytes < num_frames*frame_bytes/4  # Buffer, chunk and its file copy
+    assert report.num_dropped > num_frames//2
+    assert report.num_stored + report.num_dropped == report.num_frames == num_frames
+
+    df = load_recording_table(str(tmp_path), 'slow')
+    assert np.array_equal(df['frame'], np.arange(num_frames))
+    assert df.loc[df['dropped'], 'frame'].tolist() == report.list_dropped
+    assert (df.loc[df['dropped'], 'chunk'] == -1).all() and df[['x_mm','y_mm','z_mm']].notna().all().all()
+    df_stored = df[~df['dropped']]
+    frames = np.concatenate([load_recording_chunk(str(tmp_path), 'slow', i) for i in range(report.num_chunks)])
+    assert np.array_equal(frames[:,0,0,0], df_stored['frame'].to_numpy() % 256)
+
+
+def test_coordinates_located_on_arrival(stage, tmp_path):
+    # The coordinates are interpolated as the frames arrive, not when the (slow) writer gets to them
+    hub, _, _ = stage
+    list_delays = []
+    interpolate = hub.get_coordinates_interpolate
+    def get_coordinates_interpolate(timestamp:int):
+        list_delays.append((get_timestamp_us_int() - timestamp)/1e6)
+        return interpolate(timestamp)
+    hub.get_coordinates_interpolate = get_coordinates_interpolate
+
+    class _VerySlowRecorder(VideoRecorder_StageCam):
+        def _write_chunk_file(self, path, list_arr):
+            time.sleep(0.3)
+            super()._write_chunk_file(path, list_arr)
+
+    recorder = _VerySlowRecorder(hub, str(tmp_path), 'located', buffer_frames=64, chunk_frames=4)
+    recorder.start(acquire=False)
+    frame = np.zeros((24, 32, 3), dtype=np.uint8)
+    for _ in range(20):
+        recorder.push_frame(get_timestamp_us_int(), frame)
+        time.sleep(0.01)
+    report = recorder.stop()
+
+    assert report.num_stored == len(list_delays) == 20
+    assert max(list_delays) < 0.2   # The last chunks are written over a second after their frames arrived
+    df = load_recording_table(str(tmp_path), 'located')
+    assert df[['x_mm','y_mm','z_mm']].notna().all().all()
@@ -0,0 +1,107 @@
+"""
+Tests of the typed runtime configuration (iris.utils.config_schema): defaults, validation and the
+live reload into a running DataStreamer_StageCam
+"""
+import re
+import threading
+import time
+
+import pytest
+
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.multiprocessing import MPMeaHub_Config, MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.config_schema import ConfigValidationError, config_registry, load_config_section, reload_config
+
+
+def _set_entries(config_file:str, **entries) -> None:
+    """Overwrites the values of entries in a config file, keeping their comments"""
+    with open(config_file) as f: text = f.read()
+    for key, value in entries.items():
+        text, num = re.subn(rf'^{key} = [^\t\n]*', f'{key} = {value}', text, flags=re.MULTILINE)
+        assert num == 1
+    with open(config_file, 'w') as f: f.write(text)
+
+
+def test_defaults(tmp_path):
+    config_file = str(tmp_path/'config.ini')
+    config = load_config_section(MPMeaHub_Config, config_file)
+    assert config == MPMeaHub_Config()
+    assert isinstance(config.stagehub_request_interval, int) and isinstance(config.stagehub_time_offset_ms, float)
+    with open(config_file) as f: text = f.read()
+    assert '[STAGE AND RAMAN MEASUREMENT HUB PARAMETERS]' in text
+    assert 'stagehub_request_interval = 20\t; ' in text and 'Allowed: [1, 10000] ms' in text
+
+    # Backward compatible enum and integer-valued floats
+    assert MPMeaHubEnum.STAGEHUB_REQUEST_INTERVAL.value == config_registry.get(MPMeaHub_Config).stagehub_request_interval
+    _set_entries(config_file, stagehub_time_offset_ms=60, stagehub_maxstorage='1000.0')
+    config = load_config_section(MPMeaHub_Config, config_file)
+    assert config.stagehub_time_offset_ms == 60.0 and config.stagehub_maxstorage == 1000
+
+
+def test_invalid_values(tmp_path):
+    config_file = str(tmp_path/'config.ini')
+    load_config_section(MPMeaHub_Config, config_file)
+    _set_entries(config_file, stagehub_request_interval=0, ramanhub_maxstorage='many', stagehub_time_offset_ms=12.5)
+    with pytest.raises(ConfigValidationError) as excinfo:
+        load_config_section(MPMeaHub_Config, config_file)
+    error = excinfo.value
+    assert error.section == MPMeaHub_Config.SECTION and len(error.list_errors) == 2
+    assert "stagehub_request_interval = 0: out of range, allowed [1, 10000] ms" in str(error)
+    assert "ramanhub_maxstorage = 'many': expected a int" in str(error)
+
+    with pytest.raises(ConfigValidationError):
+        MPMeaHub_Config.from_dict({'ramanhub_batch_maxframes': 2.5})
+    with pytest.raises(ConfigValidationError):
+        MPMeaHub_Config.from_dict({'stagehub_maxstorages': 100})
+
+
+def test_reload_running_stagehub(tmp_path):
+    num_requests = [0]
+    class XY_Counting(XYController_Dummy):
+        def get_coordinates(self):
+            num_requests[0] += 1
+            return super().get_coordinates()
+
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    hub = DataStreamer_StageCam(XY_Counting(), ZController_Dummy(), None, namespace)
+    thread = threading.Thread(target=hub._collect_coordinateAndImage)
+    config_before = config_registry.get(MPMeaHub_Config)
+    config_file = str(tmp_path/'config.ini')
+    try:
+        thread.start()
+        load_config_section(MPMeaHub_Config, config_file)
+        _set_entries(config_file, stagehub_request_interval=5, stagehub_time_offset_ms=40.5,
+                     stagehub_maxstorage=config_before.stagehub_maxstorage + 1)
+        dict_applied = reload_config(config_file)
+        assert sorted(dict_applied[MPMeaHub_Config]) == ['stagehub_request_interval', 'stagehub_time_offset_ms']
+        assert namespace.stage_request_interval_ms == 5 and namespace.stage_offset_ms == 40.5
+        config = config_registry.get(MPMeaHub_Config)
+        assert config.stagehub_maxstorage == config_before.stagehub_maxstorage    # Requires a restart
+        assert '* stagehub_time_offset_ms = 40.5 ms (live)' in config_registry.format_effective()
+
+        # A reload only pushes the changed entries: the offset set in the meantime is kept
+        hub.set_measurement_offset_ms(12.5)
+        _set_entries(config_file, stagehub_request_interval=4)
+        assert list(reload_config(config_file)[MPMeaHub_Config]) == ['stagehub_request_interval']
+        assert namespace.stage_request_interval_ms == 4 and namespace.stage_offset_ms == 12.5
+        config = config_registry.get(MPMeaHub_Config)
+
+        # The running hub polls the stage at the new interval
+        num_start = num_requests[0]
+        time.sleep(0.5)
+        assert num_requests[0] - num_start > 40
+
+        # An invalid reload is rejected as a whole
+        _set_entries(config_file, stagehub_request_interval=1, stagehub_time_offset_ms='fast')
+        with pytest.raises(ConfigValidationError):
+            reload_config(config_file)
+        assert config_registry.get(MPMeaHub_Config) == config and namespace.stage_request_interval_ms == 4
+    finally:
+        reload_config()     # Back to the registered config file
+        hub._flg_selfrunning.clear()
+        thread.join()
+    assert config_registry.get(MPMeaHub_Config) == config_before
@@ -0,0 +1,112 @@
+"""
+Offline tests of the unattended focus-map acquisition (iris.utils.focus_mapping) with the dummy
+stages and a synthetic camera whose sharpness depends on a known tilted surface
+"""
+import itertools
+import threading
+
+import cv2 as cv
+import numpy as np
+from PIL import Image
+
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.controllers.class_camera_controller import Class_CameraController
+from iris.data.measurement_coordinates import MeaCoor_mm
+from iris.utils.focus_mapping import (FocusMap_Job, FocusMap_Params, fit_focus_peak, generate_focus_sites,
+                                      optimise_visit_order, get_path_length)
+
+
+def _surface(x, y):
+    return 0.5 + 0.02*x - 0.01*y
+
+
+class Camera_Synthetic(Class_CameraController):
+    """Textured sample, defocused by the distance to the focus surface, blank within the hole"""
+    def __init__(self, ctrl_xy:XYController_Dummy, ctrl_z:ZController_Dummy, hole_xy:tuple[float,float]|None=None):
+        self._ctrl_xy = ctrl_xy
+        self._ctrl_z = ctrl_z
+        self._hole_xy = hole_xy
+        rng = np.random.default_rng(0)
+        self._texture = cv.resize(rng.uniform(0, 255, (24, 24)).astype(np.float32), (96, 96), interpolation=cv.INTER_NEAREST)
+        self._rng = np.random.default_rng(1)
+        self.num_frames = 0
+
+    def img_capture(self) -> Image.Image:
+        x, y = self._ctrl_xy.get_coordinates()
+        defocus = abs(self._ctrl_z.get_coordinates() - _surface(x, y))
+        if self._hole_xy is not None and np.hypot(x - self._hole_xy[0], y - self._hole_xy[1]) < 0.1:
+            frame = np.full((96, 96), 128, dtype=np.float32)
+        else:
+            frame = cv.GaussianBlur(self._texture, (0, 0), 0.5 + 200*defocus)
+        frame = frame + self._rng.normal(0, 2, frame.shape)
+        self.num_frames += 1
+        return Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8)).convert('RGB')
+
+
+def _region(extent:float=2.0, num:int=21) -> MeaCoor_mm:
+    xs = np.linspace(0, extent, num)
+    return MeaCoor_mm('region', [(float(x), float(y), 0.0) for x, y in itertools.product(xs, xs)])
+
+
+def test_visit_order():
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        sites = rng.uniform(0, 10, (7, 2))
+        order = optimise_visit_order(sites, (0, 0))
+        assert sorted(order) == list(range(7))
+        optimum = min(get_path_length(sites, list(perm), (0, 0)) for perm in itertools.permutations(range(7)))
+        assert get_path_length(sites, order, (0, 0)) <= 1.1 * optimum
+
+    sites = generate_focus_sites(_region(), 3, 3)
+    assert sites.shape == (9, 2)
+    order = optimise_visit_order(sites, (0, 0))
+    assert get_path_length(sites, order, (0, 0)) <= get_path_length(sites, np.arange(9), (0, 0)) + 1e-9
+
+
+def test_fit_focus_peak():
+    z = np.linspace(-0.05, 0.05, 21)
+    peak = fit_focus_peak(z, 10*np.exp(-(z - 0.012)**2/(2*0.01**2)) + 2)
+    assert abs(peak.z_mm - 0.012) < 1e-6 and peak.r_squared > 0.99 and peak.in_range
+    assert abs(peak.contrast - 10/12) < 1e-3
+    assert not fit_focus_peak(z, 10*np.exp(-(z - 0.2)**2/(2*0.05**2))).in_range
+    flat = fit_focus_peak(z, 2 + np.random.default_rng(0).normal(0, 0.1, len(z)))
+    assert flat is None or flat.r_squared < 0.8 or flat.contrast < 0.2
+
+
+def test_focus_map_job():
+    ctrl_xy, ctrl_z = XYController_Dummy(), ZController_Dummy()
+    ctrl_z.move_direct(0.5)
+    camera = Camera_Synthetic(ctrl_xy, ctrl_z, hole_xy=(2.0, 2.0))
+    params = FocusMap_Params(num_sites_x=3, num_sites_y=3, z_range_mm=0.08, z_step_mm=0.004, surface_method='plane')
+    list_progress = []
+    job = FocusMap_Job(ctrl_xy, ctrl_z, camera, params, callback_progress=lambda i, n, site: list_progress.append((i, n)))
+
+    region = _region()
+    result = job.run(region)
+    assert len(result.sites) == 9 and list_progress[-1] == (8, 9)
+    assert camera.num_frames == 9 * 21
+
+    # The blank site is rejected, the others are on the surface
+    rejected = [site for site in result.sites if not site.accepted]
+    assert [(site.x_mm, site.y_mm) for site in rejected] == [(2.0, 2.0)]
+    refs = result.get_references()
+    np.testing.assert_allclose(refs[:, 2], _surface(refs[:, 0], refs[:, 1]), atol=2e-3)
+
+    # The surface applies to any mapping coordinates, also outside the region
+    target = MeaCoor_mm('target', [(0.3, 0.7, 0.0), (1.5, 1.9, 0.0), (3.0, -1.0, 0.0)])
+    applied = result.apply(target)
+    assert applied.mappingUnit_name == 'target_focusMap'
+    coor = np.array(applied.mapping_coordinates)
+    np.testing.assert_allclose(coor[:, 2], _surface(coor[:, 0], coor[:, 1]), atol=2e-3)
+    assert len(result.to_reference_MeaCoor('refs').mapping_coordinates) == 8
+
+
+def test_focus_map_job_stop():
+    ctrl_xy, ctrl_z = XYController_Dummy(), ZController_Dummy()
+    camera = Camera_Synthetic(ctrl_xy, ctrl_z)
+    flg_stop = threading.Event()
+    job = FocusMap_Job(ctrl_xy, ctrl_z, camera, FocusMap_Params(num_sites_x=3, num_sites_y=3), flg_stop=flg_stop,
+                       callback_progress=lambda i, n, site: flg_stop.set() if i == 1 else None)
+    result = job.run(_region(), z_start_mm=0.5)
+    assert len(result.sites) == 2 and result.surface is None
@@ -0,0 +1,177 @@
+"""
+Tests of the pipelined image tiling (iris.utils.tiling_pipeline) with the dummy stages and camera:
+serpentine ordering, settle detection and the tile set and time against the serial acquisition
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from iris.controllers import ControllerConfigEnum
+from iris.controllers.camera_controller_dummy import CameraController_Dummy
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.data.calibration_objective import ImgMea_Cal
+from iris.data.measurement_image import MeaImg_Unit
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.general import get_timestamp_us_int, get_timestamp_us_str
+from iris.utils.tiling_pipeline import TilingPipeline, calculate_travel_mm, order_serpentine, wait_stage_settled
+
+STEP_MM = 0.3
+CROP_PX = 20
+
+
+def _grid(num_x:int, num_y:int) -> list[tuple[float,float,float]]:
+    """Grid in the order of the tiling coordinate generator: x outer, y inner"""
+    return [(0.2 + i*STEP_MM, 0.1 + j*STEP_MM, 0.05) for i in range(num_x) for j in range(num_y)]
+
+
+class _Rig():
+    """Dummy stages and camera, the camera images depend on the stage position"""
+    def __init__(self):
+        self.ctrl_xy, self.ctrl_z, self.cam = XYController_Dummy(), ZController_Dummy(), CameraController_Dummy()
+        self.cam.set_exposure_time_us(20e3)
+        cal = ImgMea_Cal('tiling')
+        cal.set_calibration_params(1000.0, 1000.0, 0.0, 0.0, 0.0, flip_y=1)
+        self.unit = MeaImg_Unit(get_timestamp_us_str(), cal)
+
+    def get_coor(self) -> tuple[float,float,float]:
+        time.sleep(0.002)   # Stage hub polling interval
+        return (*self.ctrl_xy.get_coordinates(), self.ctrl_z.get_coordinates())
+
+    def start_move(self, coor) -> list[threading.Thread]:
+        list_threads = [threading.Thread(target=self.ctrl_xy.move_direct, args=(coor[:2],)),
+                        threading.Thread(target=self.ctrl_z.move_direct, args=(coor[2],))]
+        for thread in list_threads: thread.start()
+        return list_threads
+
+    def capture(self) -> Image.Image:
+        self.cam.frame_capture()
+        x, y, _ = self.get_coor()
+        rng = np.random.default_rng(int(round(x*100))*1000 + int(round(y*100)))
+        return Image.fromarray(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8))
+
+    def process(self, coor, img:Image.Image, timestamp:str) -> None:
+        img = img.crop((CROP_PX, CROP_PX, img.size[0] - CROP_PX, img.size[1] - CROP_PX))
+        self.unit.add_measurement(timestamp, float(coor[0]), float(coor[1]), float(coor[2]), img)
+
+    def get_tiles(self) -> dict[tuple[float,float],bytes]:
+        dict_mea = self.unit.get_dict_measurement()
+        return {(round(x, 6), round(y, 6)): img.tobytes()
+                for x, y, img in zip(dict_mea['coor_x'], dict_mea['coor_y'], dict_mea['image'])}
+
+
+def _acquire_serial(rig:_Rig, list_coor) -> None:
+    """The previous acquisition: in the given order, a fixed settle time after every move, then the processing"""
+    settle_sec = ControllerConfigEnum.STAGE_TILING_SETTLE_SEC.value
+    for coor in list_coor:
+        for thread in rig.start_move(coor): thread.join()
+        time_change, last = time.time(), rig.get_coor()
+        while time.time() - time_change < settle_sec:
+            new = rig.get_coor()
+            if not np.allclose(new, last, atol=0.001): time_change = time.time()
+            last = new
+            time.sleep(0.01)
+        rig.process(coor, rig.capture(), get_timestamp_us_str())
+        rig.unit.get_image_all_stitched(low_res=True)
+
+
+def test_order_serpentine():
+    list_coor = _grid(4, 5)
+    order = order_serpentine(list_coor)
+    assert sorted(order) == list(range(len(list_coor)))
+    # Every move is a single step, the rows along the longest axis (y, 5 tiles)
+    steps = np.linalg.norm(np.diff(np.array(list_coor)[order, :2], axis=0), axis=1)
+    assert np.allclose(steps, STEP_MM)
+    assert calculate_travel_mm(list_coor, order) < 0.7*calculate_travel_mm(list_coor)
+
+
+def test_wait_stage_settled():
+    rig = _Rig()
+    rig.ctrl_xy.set_vel_acc_relative(vel_move=20)
+    list_threads = rig.start_move((1.0, 0.5, 0.0))
+    assert wait_stage_settled(rig.get_coor, (1.0, 0.5, None),
+                              getter_moving=lambda: any(t.is_alive() for t in list_threads))
+    assert np.allclose(rig.get_coor()[:2], (1.0, 0.5), atol=0.002)
+
+    # Stationary off the target: settled after the settle time
+    start = time.perf_counter()
+    assert wait_stage_settled(rig.get_coor, (2.0, 0.5, None), settle_sec=0.1)
+    assert 0.1 <= time.perf_counter() - start < 1.0
+
+
+def test_wait_stage_settled_stagehub():
+    # Through a running stage hub, sampling the stage every STAGEHUB_REQUEST_INTERVAL: a moving stage
+    # must not be taken for a stationary one by reading the same sample repeatedly
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    ctrl_xy = XYController_Dummy()
+    hub = DataStreamer_StageCam(ctrl_xy, ZController_Dummy(), None, namespace)
+    thread_hub = threading.Thread(target=hub._collect_coordinateAndImage)
+    try:
+        thread_hub.start()
+        getter_coor = lambda: hub.get_coordinates_closest(get_timestamp_us_int())
+        assert wait_stage_settled(getter_coor)
+
+        # No target nor move command: only the samples tell whether the stage is moving
+        ctrl_xy.set_vel_acc_relative(vel_move=0.1)   # About 1 um/ms
+        thread_move = threading.Thread(target=ctrl_xy.move_direct, args=((0.6, 0.3),))
+        thread_move.start()
+        time.sleep(0.2)     # Moving in the hub samples
+        assert wait_stage_settled(getter_coor, settle_sec=0)
+        assert not thread_move.is_alive()
+        assert np.allclose(getter_coor()[:2], (0.6, 0.3), atol=0.002)
+    finally:
+        hub._flg_selfrunning.clear()
+        thread_hub.join()
+
+
+def test_pipeline_against_serial():
+    list_coor = _grid(4, 5)
+
+    rig_serial = _Rig()
+    start = time.perf_counter()
+    _acquire_serial(rig_serial, list_coor)
+    time_serial = time.perf_counter() - start
+
+    rig = _Rig()
+    def move(coor) -> bool:
+        list_threads = rig.start_move(coor)
+        return wait_stage_settled(rig.get_coor, coor, getter_moving=lambda: any(t.is_alive() for t in list_threads))
+    def process(coor, img, timestamp) -> None:
+        rig.process(coor, img, timestamp)
+        if pipeline.get_num_pending() == 0: rig.unit.get_image_all_stitched(low_res=True)
+    pipeline = TilingPipeline(move, rig.capture, process)
+    list_progress = []
+    start = time.perf_counter()
+    num_captured = pipeline.run(list_coor, callback_progress=lambda i, n: list_progress.append((i, n)))
+    time_pipelined = time.perf_counter() - start
+    print(f'\nTiling time of {len(list_coor)} tiles: serial {time_serial:.2f} s, pipelined {time_pipelined:.2f} s')
+
+    assert num_captured == len(list_coor) and list_progress[-1] == (len(list_coor) - 1, len(list_coor))
+    # Identical tile sets: same coordinates and images captured at the same positions
+    assert rig.get_tiles() == rig_serial.get_tiles()
+    assert len(rig.get_tiles()) == len(list_coor)
+    assert time_pipelined < 0.6*time_serial
+
+
+def test_pipeline_stop_and_error():
+    rig = _Rig()
+    flg_stop = threading.Event()
+    def process(coor, img, timestamp) -> None:
+        rig.process(coor, img, timestamp)
+        if len(rig.unit.get_dict_measurement()['image']) == 3: flg_stop.set()
+    pipeline = TilingPipeline(lambda coor: None, rig.capture, process, flg_stop=flg_stop, max_pending=1)
+    num_captured = pipeline.run(_grid(3, 3))
+    # Stopped within the pending images of the third one, all the captured images are processed
+    assert 3 <= num_captured <= 5
+    assert len(rig.unit.get_dict_measurement()['image']) == num_captured
+
+    def process_error(coor, img, timestamp) -> None: raise ValueError('processing failed')
+    pipeline = TilingPipeline(lambda coor: None, rig.capture, process_error)
+    with pytest.raises(ValueError, match='processing failed'):
+        pipeline.run(_grid(2, 2))
@@ -0,0 +1,162 @@
+"""
+Tests of the cross-process tracing (iris.utils.tracing) over a dummy-controller scan: Raman hub
+acquisition and calibration, stage hub polling and interpolation, storage and database saving, and
+spans from a child process
+"""
+import json
+import multiprocessing as mp
+import threading
+import time
+
+import pytest
+
+from iris.controllers.raman_spectrometer_controller_dummy import SpectrometerController_Dummy
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.calibration.calibration_generator import SpectrometerCalibrator
+from iris.data.measurement_Raman import MeaRaman
+from iris.data.measurement_RamanMap import MeaRMap_Hub, MeaRMap_Unit, MeaRMap_Handler
+from iris.multiprocessing import MPMeaHubEnum
+from iris.multiprocessing.basemanager import StageNamespace
+from iris.multiprocessing.dataStreamer_Raman import DataStreamer_Raman
+from iris.multiprocessing.dataStreamer_StageCam import DataStreamer_StageCam
+from iris.utils.general import get_timestamp_us_int
+from iris.utils.tracing import (trace_span, trace_instant, enable_tracing, disable_tracing, clear_trace,
+                                collect_trace_events, export_chrome_trace, close_tracing)
+
+
+def _child_work():
+    with trace_span('child.outer', cat='test'):
+        for i in range(3):
+            with trace_span('child.inner', cat='test', idx=i):
+                time.sleep(0.002)
+        trace_instant('child.done', cat='test')
+
+
+def _child_span(event_start):
+    event_start.wait()
+    with trace_span('child.concurrent', cat='test'): pass
+
+
+@pytest.fixture
+def tracing():
+    enable_tracing()
+    clear_trace()
+    yield
+    close_tracing()
+
+
+def _check_nesting(list_spans:list[dict]) -> None:
+    """Spans of a thread must be disjoint or nested"""
+    stack = []
+    for span in list_spans:
+        while stack and span['ts'] >= stack[-1]:
+            stack.pop()
+        end = span['ts'] + span['dur']
+        assert not stack or end <= stack[-1] + 1e-3, f"{span['name']} overlaps its enclosing span"
+        stack.append(end)
+
+
+def test_scan_trace(tracing, tmp_path):
+    # > Raman hub with its calibrator, in this process <
+    controller = SpectrometerController_Dummy()
+    controller.set_integration_time_us(2000)
+    raman = DataStreamer_Raman(controller, {'timestamp_us_int': [], 'raw_spectrum': [], 'integration_time_ms': [], 'flg_retrieved': []})
+    raman._calibrator = SpectrometerCalibrator(pipe_update=raman._pipe_cal_update_back, pipe_measurement=raman._pipe_cal_mea_back)
+    # > Stage hub <
+    namespace = StageNamespace()
+    namespace.stage_offset_ms = MPMeaHubEnum.STAGEHUB_TIME_OFFSET_MS.value
+    ctrl_xy = XYController_Dummy()
+    stage = DataStreamer_StageCam(ctrl_xy, ZController_Dummy(), None, namespace)
+
+    list_threads = [threading.Thread(target=raman._auto_collect_measurement, name='raman_collector'),
+                    threading.Thread(target=raman._auto_update_measurements, name='raman_updater'),
+                    threading.Thread(target=stage._collect_coordinateAndImage, name='stage_collector')]
+    for thread in list_threads: thread.start()
+    child = mp.get_context('spawn').Process(target=_child_work, name='child_process')
+    try:
+        raman.resume_auto_measurement()
+        trace_instant('test.child_start', cat='test')
+        child.start()
+        unit = MeaRMap_Unit(unit_name='scan')
+        for i in range(10):
+            ctrl_xy.move_direct((0.01*i, 0.0))
+            ts = get_timestamp_us_int()
+            coor = stage.get_coordinates_interpolate(ts)
+            mea = MeaRaman(reconstruct=True)
+            mea.test_generate_dummy()
+            unit.append_ramanmeasurement_data(timestamp=ts, coor=coor, measurement=mea)
+        child.join()
+        trace_instant('test.child_joined', cat='test')
+        hub = MeaRMap_Hub()
+        hub.append_mapping_unit(unit)
+        MeaRMap_Handler().save_MappingHub_database(hub, str(tmp_path), 'scan').join()
+    finally:
+        raman.pause_auto_measurement()
+        raman._flg_process_measurement.clear()
+        raman._flg_process_updater.clear()
+        stage._flg_selfrunning.clear()
+        for thread in list_threads: thread.join()
+        raman._calibrator.terminate()
+    assert child.exitcode == 0
+
+    filepath = str(tmp_path/'trace.json')
+    num_events = export_chrome_trace(filepath)
+    with open(filepath) as f: trace = json.load(f)
+    list_events = trace['traceEvents']
+    list_timed = [event for event in list_events if event['ph'] != 'M']
+    assert num_events == len(list_timed) > 0
+
+    # Well formed
+    for event in list_timed:
+        assert {'name', 'cat', 'ph', 'ts', 'pid', 'tid', 'args'} <= set(event)
+        if event['ph'] == 'X': assert event['dur'] >= 0
+    dict_names = {event['args']['name'] for event in list_events if event['ph'] == 'M' and event['name'] == 'thread_name'}
+    assert {'raman_collector', 'raman_updater', 'stage_collector'} <= dict_names
+    assert any(event['name'] == 'process_name' and event['args']['name'] == 'child_process' for event in list_events)
+
+    # Every instrumented path, from both processes
+    names = {event['name'] for event in list_timed}
+    assert {'raman.measure_batch', 'raman.calibrate', 'stage.poll', 'stage.interpolate', 'mapunit.append',
+            'db.save_metadata', 'db.save_measurements', 'child.outer', 'child.inner', 'child.done'} <= names
+    assert len({event['pid'] for event in list_timed}) == 2
+
+    # Correctly ordered and nested
+    list_ts = [event['ts'] for event in list_timed]
+    assert list_ts == sorted(list_ts) and list_ts[0] == 0
+    for key in {(event['pid'], event['tid']) for event in list_timed}:
+        _check_nesting([event for event in list_timed if event['ph'] == 'X' and (event['pid'], event['tid']) == key])
+    outer = next(event for event in list_timed if event['name'] == 'child.outer')
+    inner = [event for event in list_timed if event['name'] == 'child.inner']
+    assert [event['args']['idx'] for event in inner] == [0, 1, 2]
+    assert all(outer['ts'] <= event['ts'] and event['ts'] + event['dur'] <= outer['ts'] + outer['dur'] + 1e-3 for event in inner)
+    # The child ran between its start and join, on the same (aligned) clock
+    ts_start, ts_joined = (next(event['ts'] for event in list_timed if event['name'] == name)
+                           for name in ['test.child_start', 'test.child_joined'])
+    assert ts_start < outer['ts'] and outer['ts'] + outer['dur'] < ts_joined
+
+
+def test_runtime_switch(tracing):
+    with trace_span('recorded'): pass
+    disable_tracing()
+    with trace_span('ignored'): pass
+    enable_tracing()
+    with trace_span('recorded_again') as span: span.set_arg('result', 3)
+    events = [event for event in collect_trace_events() if event['ph'] == 'X']
+    assert [event['name'] for event in events] == ['recorded', 'recorded_again']
+    assert events[1]['args'] == {'result': 3}
+
+    clear_trace()
+    assert [event for event in collect_trace_events() if event['ph'] != 'M'] == []
+
+
+def test_concurrent_processes(tracing):
+    # Processes starting to trace at the same time each claim their own slot
+    ctx = mp.get_context('spawn')
+    event_start = ctx.Event()
+    list_procs = [ctx.Process(target=_child_span, args=(event_start,)) for _ in range(4)]
+    for proc in list_procs: proc.start()
+    event_start.set()
+    for proc in list_procs: proc.join(30)
+    pids = {event['pid'] for event in collect_trace_events() if event['name'] == 'child.concurrent'}
+    assert pids == {proc.pid for proc in list_procs}
@@ -0,0 +1,100 @@
+"""
+Tests of the feed-forward Z tracking (iris.utils.z_tracking) along scan lines with the dummy stages
+and a tilted-plane sample
+"""
+import threading
+import time
+
+import numpy as np
+
+from iris.controllers.xy_stage_controller_dummy import XYController_Dummy
+from iris.controllers.z_stage_controller_dummy import ZController_Dummy
+from iris.data.focus_surface import fit_focus_surface
+from iris.utils.z_tracking import FeedForward_ZController
+
+
+def _plane(x, y):
+    return 0.5 + 0.01*x + 0.005*y
+
+
+def _scan_line(ctrl_xy:XYController_Dummy, ctrl_z:ZController_Dummy, end_xy:tuple[float,float],
+               tracker:FeedForward_ZController|None) -> np.ndarray:
+    """Moves along a line while sampling the XYZ position, returns the (N, 3) samples"""
+    list_samples = []
+    flg_done = threading.Event()
+    def sample():
+        while not flg_done.is_set():
+            list_samples.append((*ctrl_xy.get_coordinates(), ctrl_z.get_coordinates()))
+            time.sleep(0.005)
+    thread = threading.Thread(target=sample)
+    thread.start()
+    if tracker is not None: tracker.start()
+    ctrl_xy.move_direct(end_xy)
+    if tracker is not None: tracker.stop()
+    flg_done.set()
+    thread.join()
+    return np.array(list_samples)
+
+
+def test_tracking_tilted_plane():
+    ctrl_xy, ctrl_z = XYController_Dummy(), ZController_Dummy()
+    ctrl_xy.set_vel_acc_relative(vel_move=0.1)     # ~1 mm/s
+    surface = fit_focus_surface([(0, 0, _plane(0, 0)), (1, 0, _plane(1, 0)), (0, 1, _plane(0, 1))], 'plane')
+    tracker = FeedForward_ZController(surface, ctrl_xy.get_coordinates, ctrl_z, latency_sec=0.05,
+                                      max_update_hz=20, deadband_mm=0.0005)
+    ctrl_z.move_direct(tracker.get_target_z(0, 0))
+
+    # Snake: forward and backward lines
+    for end_xy in [(1.0, 0.0), (1.0, 0.2), (0.0, 0.2)]:
+        flg_line = end_xy != (1.0, 0.2)
+        samples = _scan_line(ctrl_xy, ctrl_z, end_xy, tracker if flg_line else None)
+        if not flg_line:
+            ctrl_z.move_direct(tracker.get_target_z(*end_xy))
+            continue
+        error = samples[:, 2] - _plane(samples[:, 0], samples[:, 1])
+        assert len(samples) > 50
+        assert np.abs(error).max() < 0.002     # Within 2 um along the line
+
+    # The commands respect the maximum update rate
+    times = np.array([t for t, _ in tracker.get_commands()])
+    assert len(times) > 5
+    assert np.all(np.diff(times) >= 1/20 - 1e-3)
+
+
+def test_no_tracking_drifts():
+    ctrl_xy, ctrl_z = XYController_Dummy(), ZController_Dummy()
+    ctrl_xy.set_vel_acc_relative(vel_move=0.2)
+    ctrl_z.move_direct(_plane(0, 0))
+    samples = _scan_line(ctrl_xy, ctrl_z, (1.0, 0.0), None)
+    error = samples[:, 2] - _plane(samples[:, 0], samples[:, 1])
+    assert np.abs(error).max() > 0.008     # Out of focus by the end of the line
+
+
+def test_prediction_and_deadband():
+    class Stage_Linear:
+        """XY position moving at a constant 2 mm/s along X"""
+        def __init__(self): self.time_start = time.perf_counter()
+        def get_coordinates(self): return (2.0 * (time.perf_counter() - self.time_start), 0.0)
+
+    class Z_Recorder:
+        def __init__(self): self.list_z = []
+        def move_direct(self, z): self.list_z.append(z)
+
+    surface = fit_focus_surface([(0, 0, 0), (1, 0, 0.01), (0, 1, 0)], 'plane')
+    stage, ctrl_z = Stage_Linear(), Z_Recorder()
+    tracker = FeedForward_ZController(surface, stage.get_coordinates, ctrl_z, latency_sec=0.1,
+                                      max_update_hz=1000, deadband_mm=0.0)
+    for _ in range(3):
+        tracker.update()
+        time.sleep(0.01)
+    # The command leads the position by the latency: 2 mm/s * 0.1 s * 0.01 = 2 um
+    x_now = stage.get_coordinates()[0]
+    assert abs(ctrl_z.list_z[-1] - 0.01*(x_now + 0.2)) < 3e-4
+
+    # Stationary stage: no command within the deadband
+    tracker = FeedForward_ZController(surface, lambda: (0.5, 0.0), ctrl_z, max_update_hz=1000, deadband_mm=0.001)
+    num_commands = len(ctrl_z.list_z)
+    for _ in range(5):
+        tracker.update()
+        time.sleep(0.002)
+    assert len(ctrl_z.list_z) == num_commands + 1